@@ -60,6 +60,16 @@ sealed interface InputAction {
         }
     }
 
+    /**
+     * Plays back a sequence recorded on the PC (see the server's macro_recorder.py)
+     * with its original timing. Only the recording's name travels over the network.
+     */
+    @Serializable
+    @SerialName("recorded_macro")
+    data class RecordedMacro(
+        val name: String
+    ) : InputAction
+
 }
 
 /**
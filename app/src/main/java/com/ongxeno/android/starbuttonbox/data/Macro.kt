@@ -89,6 +89,10 @@ fun InputAction?.toSimplifiedString(): String {
             parts.add("Scroll: ${this.direction.name}")
             pressTypeString = "(${this.clicks} click${if (this.clicks > 1) "s" else ""})"
         }
+        is InputAction.RecordedMacro -> {
+            parts.add("Recording: ${this.name}")
+            pressTypeString = "(Play)"
+        }
     }
     return parts.joinToString(" + ") + " " + pressTypeString
 }
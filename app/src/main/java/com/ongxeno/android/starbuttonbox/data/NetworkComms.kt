@@ -13,9 +13,16 @@ enum class UdpPacketType {
     HEALTH_CHECK_PONG, // Server to App
     MACRO_COMMAND,     // App to Server
     MACRO_ACK,         // Server to App
+    MACRO_NACK,        // Server to App - Command received but shed because the server's macro queue was full
+    MACRO_REPEAT,      // App to Server - Start/stop server-side auto-repeat of a macro, acknowledged with MACRO_ACK
     TRIGGER_IMPORT_BROWSER, // App to Server
     CAPTURE_MOUSE_POSITION, // App to Server - New for Auto Drag
-    AUTO_DRAG_LOOP_COMMAND  // App to Server - New for Auto Drag
+    AUTO_DRAG_LOOP_COMMAND, // App to Server - New for Auto Drag
+    CLOCK_SYNC_REPORT,      // App to Server - Timestamps of the last PING/PONG exchange, for clock offset estimation
+    ACK_MODE,               // Both ways - App requests batched acknowledgements, server replies with the accepted mode
+    ACK_BATCH,              // Server to App - Several acknowledgements in one packet (after ACK_MODE BATCHED)
+    MOUSE_MOVE,             // App to Server - Relative mouse movement stream, never acknowledged
+    AXIS_UPDATE             // App to Server - Analog axis values (throttle, strafe, ...), newest wins, never acknowledged
     // Optional: AUTO_DRAG_STATUS_UPDATE (Server to App) - Can be added later
 }
 
@@ -27,9 +34,15 @@ enum class UdpPacketType {
  * @param type The type of the packet, indicating its purpose.
  * @param payload The actual data being sent, typically a JSON string.
  * For MACRO_COMMAND, this will be the serialized InputAction.
+ * For MACRO_REPEAT, this will be the serialized MacroRepeatPayload.
  * For TRIGGER_IMPORT_BROWSER, this will be the serialized TriggerImportPayload.
  * For CAPTURE_MOUSE_POSITION, this will be the serialized CaptureMousePayload.
  * For AUTO_DRAG_LOOP_COMMAND, this will be the serialized AutoDragLoopPayload.
+ * For HEALTH_CHECK_PONG, this is the serialized PongTimestamps.
+ * For CLOCK_SYNC_REPORT, this will be the serialized ClockSyncReport.
+ * For ACK_MODE, this will be the serialized AckModePayload; for ACK_BATCH, the serialized AckBatchPayload.
+ * For MOUSE_MOVE, this is the plain string "<sequence>,<dx>,<dy>" (not JSON, so the server can parse it cheaply).
+ * For AXIS_UPDATE, this is the plain string "<sequence>;<axis>=<value>;..." with values in [-1, 1].
  * For PING/PONG/ACK, this might be empty or contain minimal info.
  */
 @Serializable
@@ -93,3 +106,80 @@ data class CaptureMousePayload(
 data class AutoDragLoopPayload(
     val action: String // "START" or "STOP"
 )
+
+// --- Server-side auto-repeat ---
+
+/**
+ * Payload for the MACRO_REPEAT packet. START makes the server tap the macro at rateHz
+ * until STOP with the same repeatId, or until the server's safety timeout (timeoutMs
+ * if shorter). Sending START again with the same repeatId and macro extends the timeout.
+ *
+ * @param action "START" or "STOP".
+ * @param repeatId Identifies the repeat, e.g. the button's ID; unique per device.
+ * @param macro The serialized InputAction to repeat (START only). A HOLD press is held for its duration in each period.
+ * @param rateHz Taps per second, 0.5 to 50 (START only).
+ * @param timeoutMs Optional shorter safety timeout (START only).
+ */
+@Serializable
+data class MacroRepeatPayload(
+    val action: String,
+    val repeatId: String,
+    val macro: String? = null,
+    val rateHz: Double? = null,
+    val timeoutMs: Long? = null
+)
+
+// --- Clock synchronization ---
+
+/**
+ * Payload of HEALTH_CHECK_PONG: when the server received the PING and sent the PONG,
+ * in milliseconds on the server clock (fractional).
+ */
+@Serializable
+data class PongTimestamps(
+    val rx: Double,
+    val tx: Double
+)
+
+/**
+ * Payload for the CLOCK_SYNC_REPORT packet, sent after every PONG so the server can
+ * estimate this device's clock offset and one-way latency (NTP-style).
+ *
+ * @param t1 When the PING was sent (device clock).
+ * @param t2 When the server received it (server clock).
+ * @param t3 When the server sent the PONG (server clock).
+ * @param t4 When the PONG was received (device clock).
+ */
+@Serializable
+data class ClockSyncReport(
+    val t1: Long,
+    val t2: Double,
+    val t3: Double,
+    val t4: Long
+)
+
+// --- Acknowledgement mode ---
+
+/**
+ * Payload for the ACK_MODE packet.
+ *
+ * @param mode "PER_PACKET" (one MACRO_ACK per command, the default) or "BATCHED".
+ * @param windowMs How long the server may hold acknowledgements to batch them. The reply carries the accepted value.
+ */
+@Serializable
+data class AckModePayload(
+    val mode: String,
+    val windowMs: Double = 0.0
+)
+
+/**
+ * Payload of the ACK_BATCH packet: the packet IDs acknowledged together.
+ *
+ * @param ackType The acknowledgement each ID stands for, e.g. "MACRO_ACK".
+ * @param ids The acknowledged packet IDs.
+ */
+@Serializable
+data class AckBatchPayload(
+    val ackType: String,
+    val ids: List<String>
+)
@@ -2,10 +2,15 @@ package com.ongxeno.android.starbuttonbox.datasource
 
 import android.content.Context
 import android.util.Log
+import com.ongxeno.android.starbuttonbox.data.AckBatchPayload
+import com.ongxeno.android.starbuttonbox.data.AckModePayload
 import com.ongxeno.android.starbuttonbox.data.AutoDragLoopPayload
 import com.ongxeno.android.starbuttonbox.data.CaptureMousePayload
+import com.ongxeno.android.starbuttonbox.data.ClockSyncReport
 import com.ongxeno.android.starbuttonbox.data.ConnectionStatus
+import com.ongxeno.android.starbuttonbox.data.MacroRepeatPayload
 import com.ongxeno.android.starbuttonbox.data.NetworkConfig
+import com.ongxeno.android.starbuttonbox.data.PongTimestamps
 import com.ongxeno.android.starbuttonbox.data.TriggerImportPayload
 import com.ongxeno.android.starbuttonbox.data.UdpPacket
 import com.ongxeno.android.starbuttonbox.data.UdpPacketType
@@ -20,8 +25,10 @@ import java.net.DatagramSocket
 import java.net.InetAddress
 import java.net.SocketException
 import java.net.SocketTimeoutException
+import java.util.Locale
 import java.util.UUID
 import java.util.concurrent.ConcurrentHashMap
+import java.util.concurrent.atomic.AtomicLong
 import javax.inject.Inject
 import javax.inject.Singleton
 import kotlin.math.roundToLong
@@ -34,6 +41,8 @@ private const val MAX_FAILED_HEALTH_CHECKS = 3    // Threshold to declare connec
 private const val MIN_SUCCESSFUL_HEALTH_CHECKS_FOR_CONNECTED = 2 // Threshold to declare connected
 private const val UDP_RECEIVE_BUFFER_SIZE = 2048  // Buffer size for incoming packets
 private const val RESPONSE_TIME_WINDOW_SIZE = 5 // Number of latency samples to average
+private const val ACK_BATCH_WINDOW_MS = 2.0     // How long the server may hold MACRO_ACKs to send them together
+private const val ACK_MODE_BATCHED = "BATCHED"
 
 @Singleton
 class ConnectionManager @Inject constructor(
@@ -65,6 +74,9 @@ class ConnectionManager @Inject constructor(
 
     private val pendingPings = ConcurrentHashMap<String, Long>()
     private val pendingMacroAcks = ConcurrentHashMap<String, Long>()
+    @Volatile private var batchedAcksConfirmed = false // Set once the server answered our ACK_MODE request
+    private val mouseMoveSequence = AtomicLong(0)
+    private val axisSequence = AtomicLong(0)
 
     init {
         Log.d(TAG, "Initializing ConnectionManager.")
@@ -163,6 +175,7 @@ class ConnectionManager @Inject constructor(
         ackTimeoutJob = null
         pendingPings.clear()
         pendingMacroAcks.clear()
+        batchedAcksConfirmed = false
         _consecutiveFailedHealthChecks.value = 0
         _consecutiveSuccessfulHealthChecks.value = 0
         _lastSuccessfulHealthCheckTime.value = null
@@ -214,7 +227,17 @@ class ConnectionManager @Inject constructor(
             UdpPacketType.HEALTH_CHECK_PONG -> {
                 val pingSendTime = pendingPings.remove(packet.packetId)
                 if (pingSendTime != null) {
-                    val rtt = clientReceiveTime - pingSendTime
+                    val serverTimes = packet.payload?.let {
+                        try {
+                            json.decodeFromString<PongTimestamps>(it)
+                        } catch (e: Exception) {
+                            Log.w(TAG, "Could not parse PONG timestamps for ID ${packet.packetId}: ${e.message}")
+                            null
+                        }
+                    }
+                    // Leave out the time the PONG spent on the server when it says how long that was
+                    val serverHoldTime = serverTimes?.let { (it.tx - it.rx).roundToLong().coerceAtLeast(0L) } ?: 0L
+                    val rtt = clientReceiveTime - pingSendTime - serverHoldTime
                     val oneWayLatency = (rtt.toDouble() / 2.0).roundToLong()
                     if (oneWayLatency >= 0) {
                         updateAverageResponseTime(oneWayLatency)
@@ -222,6 +245,13 @@ class ConnectionManager @Inject constructor(
                     } else {
                         Log.w(TAG, "Calculated negative latency for PONG ID ${packet.packetId} ($oneWayLatency ms). PONG_ts: ${packet.timestamp}, PING_ts: $pingSendTime. Not updating response time.")
                     }
+                    if (serverTimes != null) {
+                        sendClockSyncReport(ClockSyncReport(pingSendTime, serverTimes.rx, serverTimes.tx, clientReceiveTime))
+                    }
+                    if (!batchedAcksConfirmed) {
+                        // Also retried here because the request may be lost, or the server may have restarted
+                        requestBatchedAcks()
+                    }
                     _lastSuccessfulHealthCheckTime.value = clientReceiveTime
                     _consecutiveFailedHealthChecks.value = 0
                     _consecutiveSuccessfulHealthChecks.value = (_consecutiveSuccessfulHealthChecks.value + 1).coerceAtMost(MIN_SUCCESSFUL_HEALTH_CHECKS_FOR_CONNECTED + 1)
@@ -235,46 +265,86 @@ class ConnectionManager @Inject constructor(
                     Log.w(TAG, "Received PONG for unknown or timed-out PING ID: ${packet.packetId}")
                 }
             }
-            UdpPacketType.MACRO_ACK -> {
-                val commandSendTime = pendingMacroAcks.remove(packet.packetId)
-                if (commandSendTime != null) {
-                    val rtt = clientReceiveTime - commandSendTime
-                    val oneWayLatency = (rtt.toDouble() / 2.0).roundToLong()
-                    if (oneWayLatency >= 0) {
-                        updateAverageResponseTime(oneWayLatency)
-                        Log.i(TAG, "MACRO_ACK received for ID: ${packet.packetId}. Latency (ACK): $oneWayLatency ms (ACK_ts: ${packet.timestamp}, CMD_ts: $commandSendTime)")
-                    } else {
-                        Log.w(TAG, "Calculated negative latency for ACK ID ${packet.packetId} ($oneWayLatency ms). ACK_ts: ${packet.timestamp}, CMD_ts: $commandSendTime. Not updating response time.")
-                    }
+            UdpPacketType.MACRO_ACK -> handleMacroAck(packet.packetId, packet.timestamp, clientReceiveTime)
+            UdpPacketType.ACK_BATCH -> {
+                val batch = try {
+                    json.decodeFromString<AckBatchPayload>(packet.payload ?: "")
+                } catch (e: Exception) {
+                    Log.w(TAG, "Could not parse ACK_BATCH ${packet.packetId}: ${e.message}")
+                    null
+                }
+                if (batch != null && batch.ackType == UdpPacketType.MACRO_ACK.name) {
+                    Log.d(TAG, "ACK_BATCH received with ${batch.ids.size} MACRO_ACK(s).")
+                    batch.ids.forEach { handleMacroAck(it, packet.timestamp, clientReceiveTime) }
+                }
+            }
+            UdpPacketType.ACK_MODE -> {
+                val accepted = try {
+                    json.decodeFromString<AckModePayload>(packet.payload ?: "")
+                } catch (e: Exception) {
+                    Log.w(TAG, "Could not parse ACK_MODE reply ${packet.packetId}: ${e.message}")
+                    null
+                }
+                if (accepted != null) {
+                    batchedAcksConfirmed = true
+                    Log.i(TAG, "Server acknowledgement mode: ${accepted.mode} (window ${accepted.windowMs} ms)")
+                }
+            }
+            UdpPacketType.MACRO_NACK -> {
+                // The server is reachable but overloaded: the command was received and deliberately not executed.
+                if (pendingMacroAcks.remove(packet.packetId) != null) {
+                    Log.w(TAG, "MACRO_NACK received for ID: ${packet.packetId}. Server shed the command (macro queue full).")
                     _lastSuccessfulHealthCheckTime.value = System.currentTimeMillis()
                     _consecutiveFailedHealthChecks.value = 0
-                    _consecutiveSuccessfulHealthChecks.value = (_consecutiveSuccessfulHealthChecks.value + 1).coerceAtMost(MIN_SUCCESSFUL_HEALTH_CHECKS_FOR_CONNECTED + 1)
-                    if (pendingMacroAcks.isEmpty()) {
-                        if (_connectionStatus.value == ConnectionStatus.SENDING_PENDING_ACK || _connectionStatus.value == ConnectionStatus.CONNECTING) {
-                            Log.i(TAG, "All MACRO_ACKs received or single ACK restored connection. Status -> CONNECTED")
-                            _connectionStatus.value = ConnectionStatus.CONNECTED
-                        }
-                    } else {
-                        if (_connectionStatus.value == ConnectionStatus.CONNECTING) {
-                            _connectionStatus.value = ConnectionStatus.SENDING_PENDING_ACK
-                        }
-                        Log.d(TAG, "${pendingMacroAcks.size} MACRO_ACKs still pending.")
-                    }
                 } else {
-                    Log.w(TAG, "Received ACK for unknown or timed-out MACRO_COMMAND ID: ${packet.packetId}")
+                    Log.w(TAG, "Received NACK for unknown or timed-out MACRO_COMMAND ID: ${packet.packetId}")
                 }
             }
             // Client should not typically receive these from the server, but log if it does.
             UdpPacketType.HEALTH_CHECK_PING,
             UdpPacketType.MACRO_COMMAND,
+            UdpPacketType.MACRO_REPEAT,
             UdpPacketType.TRIGGER_IMPORT_BROWSER,
             UdpPacketType.CAPTURE_MOUSE_POSITION,
-            UdpPacketType.AUTO_DRAG_LOOP_COMMAND -> {
+            UdpPacketType.AUTO_DRAG_LOOP_COMMAND,
+            UdpPacketType.CLOCK_SYNC_REPORT,
+            UdpPacketType.MOUSE_MOVE,
+            UdpPacketType.AXIS_UPDATE -> {
                  Log.d(TAG, "Received unexpected packet type ${packet.type} from server (ID: ${packet.packetId}). Ignoring.")
             }
         }
     }
 
+    private fun handleMacroAck(packetId: String, ackTimestamp: Long, clientReceiveTime: Long) {
+        val commandSendTime = pendingMacroAcks.remove(packetId)
+        if (commandSendTime != null) {
+            val rtt = clientReceiveTime - commandSendTime
+            val oneWayLatency = (rtt.toDouble() / 2.0).roundToLong()
+            if (oneWayLatency >= 0) {
+                updateAverageResponseTime(oneWayLatency)
+                Log.i(TAG, "MACRO_ACK received for ID: $packetId. Latency (ACK): $oneWayLatency ms (ACK_ts: $ackTimestamp, CMD_ts: $commandSendTime)")
+            } else {
+                Log.w(TAG, "Calculated negative latency for ACK ID $packetId ($oneWayLatency ms). ACK_ts: $ackTimestamp, CMD_ts: $commandSendTime. Not updating response time.")
+            }
+            _lastSuccessfulHealthCheckTime.value = System.currentTimeMillis()
+            _consecutiveFailedHealthChecks.value = 0
+            _consecutiveSuccessfulHealthChecks.value = (_consecutiveSuccessfulHealthChecks.value + 1).coerceAtMost(MIN_SUCCESSFUL_HEALTH_CHECKS_FOR_CONNECTED + 1)
+            if (pendingMacroAcks.isEmpty()) {
+                if (_connectionStatus.value == ConnectionStatus.SENDING_PENDING_ACK || _connectionStatus.value == ConnectionStatus.CONNECTING) {
+                    Log.i(TAG, "All MACRO_ACKs received or single ACK restored connection. Status -> CONNECTED")
+                    _connectionStatus.value = ConnectionStatus.CONNECTED
+                }
+            } else {
+                if (_connectionStatus.value == ConnectionStatus.CONNECTING) {
+                    _connectionStatus.value = ConnectionStatus.SENDING_PENDING_ACK
+                }
+                Log.d(TAG, "${pendingMacroAcks.size} MACRO_ACKs still pending.")
+            }
+        } else {
+            Log.w(TAG, "Received ACK for unknown or timed-out MACRO_COMMAND ID: $packetId")
+        }
+    }
+
     private fun startHealthChecks() {
         if (healthCheckJob?.isActive == true) return
         Log.d(TAG, "Starting health check job with dynamic interval.")
@@ -324,6 +394,46 @@ class ConnectionManager @Inject constructor(
         }
     }
 
+    /**
+     * Asks the server to batch MACRO_ACKs (ACK_BATCH) for this socket. Servers that do not
+     * support it ignore the request and keep sending one MACRO_ACK per command, which is still handled.
+     */
+    private fun requestBatchedAcks() {
+        val config = currentNetworkConfig ?: return
+        val socket = udpSocket ?: return
+        val port = config.port ?: return
+        appScope.launch(Dispatchers.IO) {
+            try {
+                val payload = json.encodeToString(AckModePayload(ACK_MODE_BATCHED, ACK_BATCH_WINDOW_MS))
+                val dataBytes = json.encodeToString(UdpPacket(type = UdpPacketType.ACK_MODE, payload = payload)).toByteArray(Charsets.UTF_8)
+                socket.send(DatagramPacket(dataBytes, dataBytes.size, InetAddress.getByName(config.ip), port))
+                Log.d(TAG, "Sent ACK_MODE request ($ACK_MODE_BATCHED, $ACK_BATCH_WINDOW_MS ms)")
+            } catch (e: Exception) {
+                Log.w(TAG, "Error sending ACK_MODE request: ${e.message}")
+            }
+        }
+    }
+
+    /**
+     * Returns the timestamps of a completed PING/PONG exchange to the server, which uses
+     * them to estimate this device's clock offset. Fire-and-forget: no reply is expected.
+     */
+    private fun sendClockSyncReport(report: ClockSyncReport) {
+        val config = currentNetworkConfig ?: return
+        val socket = udpSocket ?: return
+        val port = config.port ?: return
+        appScope.launch(Dispatchers.IO) {
+            try {
+                val reportPacket = UdpPacket(type = UdpPacketType.CLOCK_SYNC_REPORT, payload = json.encodeToString(report))
+                val dataBytes = json.encodeToString(reportPacket).toByteArray(Charsets.UTF_8)
+                socket.send(DatagramPacket(dataBytes, dataBytes.size, InetAddress.getByName(config.ip), port))
+                Log.v(TAG, "Sent CLOCK_SYNC_REPORT $report")
+            } catch (e: Exception) {
+                Log.w(TAG, "Error sending CLOCK_SYNC_REPORT: ${e.message}")
+            }
+        }
+    }
+
     private fun startPingTimeoutChecker() {
         if (pingTimeoutJob?.isActive == true) return
         Log.d(TAG, "Starting PING timeout checker job.")
@@ -433,6 +543,55 @@ class ConnectionManager @Inject constructor(
         }
     }
 
+    /**
+     * Starts server-side auto-repeat of a macro: one packet instead of one MACRO_COMMAND per tap.
+     * Call [stopMacroRepeat] with the same repeatId on release. Acknowledged like MACRO_COMMAND.
+     *
+     * @return True if the command was queued for sending.
+     */
+    fun startMacroRepeat(repeatId: String, inputActionJson: String, rateHz: Double, timeoutMs: Long? = null): Boolean =
+        sendMacroRepeat(MacroRepeatPayload(action = "START", repeatId = repeatId, macro = inputActionJson, rateHz = rateHz, timeoutMs = timeoutMs))
+
+    /** Stops the auto-repeat started with [startMacroRepeat]. */
+    fun stopMacroRepeat(repeatId: String): Boolean =
+        sendMacroRepeat(MacroRepeatPayload(action = "STOP", repeatId = repeatId))
+
+    private fun sendMacroRepeat(payload: MacroRepeatPayload): Boolean {
+        val config = currentNetworkConfig ?: run {
+            Log.w(TAG, "Cannot send MACRO_REPEAT ${payload.action}, network config missing.")
+            _connectionStatus.value = ConnectionStatus.NO_CONFIG
+            return false
+        }
+        val socket = udpSocket ?: run {
+            Log.e(TAG, "Cannot send MACRO_REPEAT ${payload.action}, UDP socket is null.")
+            _connectionStatus.value = ConnectionStatus.CONNECTION_LOST
+            if (config.ip != null && config.port != null) restartSocketAndJobs()
+            return false
+        }
+        val port = config.port ?: return false
+        val repeatPacket = UdpPacket(
+            type = UdpPacketType.MACRO_REPEAT,
+            payload = json.encodeToString(payload),
+            timestamp = System.currentTimeMillis()
+        )
+        val packetId = repeatPacket.packetId
+        appScope.launch(Dispatchers.IO) {
+            try {
+                val dataBytes = json.encodeToString(repeatPacket).toByteArray(Charsets.UTF_8)
+                socket.send(DatagramPacket(dataBytes, dataBytes.size, InetAddress.getByName(config.ip), port))
+                pendingMacroAcks[packetId] = repeatPacket.timestamp
+                Log.i(TAG, "Sent MACRO_REPEAT ${payload.action} (ID: $packetId, Repeat: ${payload.repeatId}) to ${config.ip}:$port")
+                if (_connectionStatus.value == ConnectionStatus.CONNECTED || _connectionStatus.value == ConnectionStatus.CONNECTING) {
+                    _connectionStatus.value = ConnectionStatus.SENDING_PENDING_ACK
+                }
+            } catch (e: Exception) {
+                Log.e(TAG, "Error sending MACRO_REPEAT ${payload.action} (ID: $packetId): ${e.message}", e)
+                handleMacroAckTimeout(packetId, isSendFailure = true)
+            }
+        }
+        return true
+    }
+
     fun sendTriggerImportBrowser(url: String): Boolean {
         val config = currentNetworkConfig ?: run {
             Log.w(TAG, "Cannot send TRIGGER_IMPORT_BROWSER, network config missing.")
@@ -592,6 +751,64 @@ class ConnectionManager @Inject constructor(
     }
 
 
+    /**
+     * Streams a relative mouse movement (e.g. from a touchpad area), typically at 250-1000 Hz.
+     * Loss-tolerant: nothing is acknowledged or retried, the server counts gaps in the sequence.
+     *
+     * @return True if the packet was queued for sending.
+     */
+    fun sendMouseMove(dx: Int, dy: Int): Boolean {
+        if (dx == 0 && dy == 0) return false
+        val config = currentNetworkConfig ?: return false
+        val socket = udpSocket ?: return false
+        val port = config.port ?: return false
+        if (_connectionStatus.value == ConnectionStatus.NO_CONFIG || _connectionStatus.value == ConnectionStatus.CONNECTION_LOST) {
+            return false
+        }
+        val movePacket = UdpPacket(type = UdpPacketType.MOUSE_MOVE, payload = "${mouseMoveSequence.getAndIncrement()},$dx,$dy")
+        appScope.launch(Dispatchers.IO) {
+            try {
+                val dataBytes = json.encodeToString(movePacket).toByteArray(Charsets.UTF_8)
+                socket.send(DatagramPacket(dataBytes, dataBytes.size, InetAddress.getByName(config.ip), port))
+            } catch (e: Exception) {
+                Log.v(TAG, "Error sending MOUSE_MOVE: ${e.message}")
+            }
+        }
+        return true
+    }
+
+    /**
+     * Sends the current values of analog axes (e.g. a throttle slider), each clamped to [-1, 1].
+     * Only the newest values matter: nothing is acknowledged or retried, and the server
+     * discards packets that arrive after a newer one. Resend every few hundred milliseconds
+     * while an axis is deflected, since the server centres axes it has not heard from.
+     *
+     * @return True if the packet was queued for sending.
+     */
+    fun sendAxisValues(values: Map<String, Float>): Boolean {
+        if (values.isEmpty()) return false
+        val config = currentNetworkConfig ?: return false
+        val socket = udpSocket ?: return false
+        val port = config.port ?: return false
+        if (_connectionStatus.value == ConnectionStatus.NO_CONFIG || _connectionStatus.value == ConnectionStatus.CONNECTION_LOST) {
+            return false
+        }
+        val payload = buildString {
+            append(axisSequence.getAndIncrement())
+            values.forEach { (axis, value) -> append(';').append(axis).append('=').append("%.3f".format(Locale.US, value.coerceIn(-1f, 1f))) }
+        }
+        val axisPacket = UdpPacket(type = UdpPacketType.AXIS_UPDATE, payload = payload)
+        appScope.launch(Dispatchers.IO) {
+            try {
+                val dataBytes = json.encodeToString(axisPacket).toByteArray(Charsets.UTF_8)
+                socket.send(DatagramPacket(dataBytes, dataBytes.size, InetAddress.getByName(config.ip), port))
+            } catch (e: Exception) {
+                Log.v(TAG, "Error sending AXIS_UPDATE: ${e.message}")
+            }
+        }
+        return true
+    }
+
     fun getCurrentConnectionStatus(): ConnectionStatus = _connectionStatus.value
 
     override fun toString(): String {
@@ -11,6 +11,7 @@ a = Analysis(
         # Add data files here. Format: ('source_path_on_your_system', 'destination_folder_in_bundle')
         # The destination '.' means the root of the bundled app directory.
         ('tray_icon.png', '.'),
+        ('default_macros_sc_411.json', '.'), # Validated by macro_compiler at server start
         # If you have other assets, like a default config (though yours is created in APPDATA):
         # ('default_server_settings.json', '.')
     ],
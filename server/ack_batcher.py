@@ -0,0 +1,122 @@
+# ack_batcher.py
+# Optional cumulative acknowledgements. A client that negotiated ACK_MODE "BATCHED"
+# gets its acknowledgements collected for a short window and sent as one ACK_BATCH
+# packet listing the acknowledged packetIds, instead of one ACK datagram per command.
+# A 20-press burst then costs one or two replies and JSON encodes instead of 20,
+# and the phone's radio wakes up once per burst instead of once per press.
+#
+# Clients that never send ACK_MODE keep getting one ACK per packet, so older apps are
+# unaffected. The mode is kept per client address: the app renegotiates whenever it
+# opens a new socket.
+#
+# A window of 0 flushes as soon as the receive loop has drained the socket, so only
+# packets that actually arrived together share a batch.
+#
+# Receive thread only: dispatch() queues ACKs and the server loop flushes them.
+
+import json
+import math
+import time
+import uuid
+import logging
+
+import config
+
+logger = logging.getLogger("StarButtonBoxServer.AckBatcher")
+
+MODE_PER_PACKET = "PER_PACKET"
+MODE_BATCHED = "BATCHED"
+
+DEFAULT_WINDOW_MS = 2.0
+MAX_WINDOW_MS = 50.0     # Longer windows would eat into the app's 2 s ACK timeout budget for nothing
+MAX_IDS_PER_BATCH = 32   # Keeps an ACK_BATCH well under the app's 2048-byte receive buffer
+MAX_BATCHED_CLIENTS = 64 # Oldest negotiations are forgotten beyond this
+
+_windows_ns = {} # addr -> batching window (ns) for clients in MODE_BATCHED, oldest first
+_pending = {}    # addr -> [sock, ack_type, [packet ids], flush deadline (perf_counter_ns)]
+_counters = {"acks": 0, "batches": 0}
+
+def negotiate(addr, mode, window_ms=None):
+    """Applies an ACK_MODE request from addr. Returns the accepted (mode, window_ms)."""
+    if mode != MODE_BATCHED:
+        flush_client(addr)
+        _windows_ns.pop(addr, None)
+        return MODE_PER_PACKET, 0.0
+    if not isinstance(window_ms, (int, float)) or isinstance(window_ms, bool) or not math.isfinite(window_ms):
+        window_ms = DEFAULT_WINDOW_MS
+    window_ms = min(max(float(window_ms), 0.0), MAX_WINDOW_MS)
+    _windows_ns.pop(addr, None)
+    _windows_ns[addr] = int(window_ms * 1_000_000)
+    while len(_windows_ns) > MAX_BATCHED_CLIENTS:
+        oldest = next(iter(_windows_ns))
+        flush_client(oldest)
+        del _windows_ns[oldest]
+    logger.info(f"Client {addr[0]}:{addr[1]} switched to batched ACKs ({window_ms:.1f} ms window).")
+    return MODE_BATCHED, window_ms
+
+def add(ctx, ack_type):
+    """Queues the acknowledgement for ctx if its client batches ACKs. Returns False if it must be sent directly."""
+    window_ns = _windows_ns.get(ctx.addr)
+    if window_ns is None:
+        return False
+    entry = _pending.get(ctx.addr)
+    if entry is not None and (entry[0] is not ctx.sock or entry[1] != ack_type):
+        flush_client(ctx.addr)
+        entry = None
+    if entry is None:
+        entry = _pending[ctx.addr] = [ctx.sock, ack_type, [], time.perf_counter_ns() + window_ns]
+    entry[2].append(ctx.packet_id)
+    if len(entry[2]) >= MAX_IDS_PER_BATCH:
+        flush_client(ctx.addr)
+    return True
+
+def has_pending():
+    return bool(_pending)
+
+def next_timeout(default_sec):
+    """Select timeout that wakes the receive loop in time for the earliest pending batch."""
+    if not _pending:
+        return default_sec
+    earliest_ns = min(entry[3] for entry in _pending.values())
+    return min(max((earliest_ns - time.perf_counter_ns()) / 1e9, 0.0), default_sec)
+
+def flush_due():
+    """Sends every batch whose window has elapsed."""
+    now_ns = time.perf_counter_ns()
+    for addr in [addr for addr, entry in _pending.items() if entry[3] <= now_ns]:
+        flush_client(addr)
+
+def flush_all():
+    for addr in list(_pending):
+        flush_client(addr)
+
+def flush_client(addr):
+    entry = _pending.pop(addr, None)
+    if not entry:
+        return
+    sock, ack_type, packet_ids, _ = entry
+    packet = {
+        "packetId": str(uuid.uuid4()), "timestamp": int(time.time() * 1000),
+        "type": config.PACKET_TYPE_ACK_BATCH,
+        "payload": json.dumps({"ackType": ack_type, "ids": packet_ids}, separators=(',', ':')),
+    }
+    try:
+        sock.sendto(json.dumps(packet, separators=(',', ':')).encode('utf-8'), addr)
+    except Exception as send_e:
+        logger.error(f"Error sending {config.PACKET_TYPE_ACK_BATCH} of {len(packet_ids)} {ack_type}(s): {send_e}")
+        return
+    _counters["acks"] += len(packet_ids)
+    _counters["batches"] += 1
+
+def get_counters(reset=False):
+    """Returns {"acks": acknowledgements sent in batches, "batches": ACK_BATCH packets sent, "clients": batching clients}."""
+    counters = dict(_counters, clients=len(_windows_ns))
+    if reset:
+        _counters["acks"] = _counters["batches"] = 0
+    return counters
+
+def reset():
+    """Forgets all negotiations and drops unsent batches (server start)."""
+    _windows_ns.clear()
+    _pending.clear()
+    _counters["acks"] = _counters["batches"] = 0
@@ -0,0 +1,119 @@
+# ack_benchmark.py
+# Compares per-packet MACRO_ACKs with negotiated batched ACKs (see ack_batcher).
+# Starts the UDP server in-process (mDNS disabled, input only recorded), sends bursts
+# of MACRO_COMMANDs the way a fast-tapping phone does, and reports reply datagrams,
+# reply packets per second and how often the phone's radio would have to wake up to
+# receive them (a reply arriving more than --radio-tail-ms after the previous one).
+#
+# Usage: python ack_benchmark.py [--bursts 20] [--burst-size 20] [--press-interval-ms 1]
+#                                [--window-ms 2] [--radio-tail-ms 10] [--port 58129]
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import socket
+import sys
+import time
+import uuid
+
+import ack_batcher
+import config
+import input_backend
+import server as server_control
+
+_KEYS = ["f1", "f2", "f3", "f4", "f5", "f6", "f7", "f8"] # Distinct keys so admission does not coalesce the taps
+
+def _packet(packet_type, payload):
+    return json.dumps({"packetId": str(uuid.uuid4()), "timestamp": int(time.time() * 1000),
+                       "type": packet_type, "payload": payload}, separators=(',', ':'))
+
+def _receive(sock, until, arrivals):
+    """Collects (perf_counter, decoded packet) replies until the given perf_counter time."""
+    while True:
+        remaining = until - time.perf_counter()
+        if remaining <= 0:
+            return
+        sock.settimeout(remaining)
+        try:
+            data, _ = sock.recvfrom(config.BUFFER_SIZE)
+        except socket.timeout:
+            return
+        arrivals.append((time.perf_counter(), json.loads(data.decode('utf-8'))))
+
+def run_benchmark(port, bursts, burst_size, press_interval_ms, burst_gap_ms, window_ms, radio_tail_ms):
+    """Runs one mode (window_ms None = per-packet ACKs). Returns the result line, or None if negotiation failed."""
+    server_control.start_server(port, False, None, None)
+    time.sleep(0.5) # Let the socket bind
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = ('127.0.0.1', port)
+    try:
+        arrivals = []
+        if window_ms is not None:
+            sock.sendto(_packet(config.PACKET_TYPE_ACK_MODE, json.dumps(
+                {"mode": ack_batcher.MODE_BATCHED, "windowMs": window_ms})).encode('utf-8'), target)
+            _receive(sock, time.perf_counter() + 0.5, arrivals)
+            if not arrivals or arrivals[0][1].get("type") != config.PACKET_TYPE_ACK_MODE:
+                return None
+            arrivals.clear()
+
+        sent_ids = set()
+        start = time.perf_counter()
+        for burst in range(bursts):
+            for press in range(burst_size):
+                action = json.dumps({"type": "key_event", "key": _KEYS[press % len(_KEYS)], "modifiers": [],
+                                     "pressType": {"type": "tap"}})
+                data = _packet(config.PACKET_TYPE_MACRO_COMMAND, action)
+                sent_ids.add(json.loads(data)["packetId"])
+                sock.sendto(data.encode('utf-8'), target)
+                _receive(sock, time.perf_counter() + press_interval_ms / 1000.0, arrivals)
+            _receive(sock, time.perf_counter() + burst_gap_ms / 1000.0, arrivals)
+        elapsed = time.perf_counter() - start
+
+        acked_ids = set()
+        for _, reply in arrivals:
+            if reply["type"] == config.PACKET_TYPE_MACRO_ACK:
+                acked_ids.add(reply["packetId"])
+            elif reply["type"] == config.PACKET_TYPE_ACK_BATCH:
+                acked_ids.update(json.loads(reply["payload"])["ids"])
+        wakeups = 0
+        previous = None
+        for arrival_time, _ in arrivals:
+            if previous is None or (arrival_time - previous) * 1000.0 > radio_tail_ms:
+                wakeups += 1
+            previous = arrival_time
+
+        label = "per-packet" if window_ms is None else f"batched {window_ms:g} ms"
+        return (f"{label:>16}: {len(acked_ids & sent_ids)}/{len(sent_ids)} acknowledged in {len(arrivals)} "
+                f"reply datagram(s), {len(arrivals) / elapsed:7.1f} replies/s, {wakeups} radio wakeup(s)")
+    finally:
+        sock.close()
+        server_control.stop_server()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox batched ACK benchmark")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=20, help="Macros per burst")
+    parser.add_argument("--press-interval-ms", type=float, default=1.0, help="Time between macros within a burst")
+    parser.add_argument("--burst-gap-ms", type=float, default=200.0, help="Pause after each burst")
+    parser.add_argument("--window-ms", type=float, default=ack_batcher.DEFAULT_WINDOW_MS)
+    parser.add_argument("--radio-tail-ms", type=float, default=10.0,
+                        help="Replies closer together than this share one radio wakeup")
+    parser.add_argument("--port", type=int, default=58129)
+    args = parser.parse_args()
+
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    input_backend.set_backend(input_backend.RecordingBackend()) # Never inject real key presses
+    print(f"{args.bursts} burst(s) x {args.burst_size} macro(s), {args.press_interval_ms:g} ms apart", file=sys.stderr)
+    ok = True
+    for window in (None, args.window_ms, 0.0):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # Per-macro console output
+            line = run_benchmark(args.port, args.bursts, args.burst_size, args.press_interval_ms,
+                                 args.burst_gap_ms, window, args.radio_tail_ms)
+        if line is None:
+            print(f"Server did not accept ACK_MODE with a {window:g} ms window", file=sys.stderr)
+            ok = False
+        else:
+            print(line)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,84 @@
+# actionmaps_benchmark.py
+# Measures actionmaps_importer on synthetic defaultProfile.xml files of growing size:
+# every action of the bundled macro table plus filler actions the table does not
+# know, spread over filler actionmaps, like a modded or future game profile.
+# Reports import time, throughput and peak Python memory (tracemalloc, separate run)
+# for the streaming importer next to a plain ElementTree.parse of the same file,
+# to show that the importer's memory stays flat as the file grows.
+#
+# Usage: python actionmaps_benchmark.py [--actions 5000,50000,500000] [--base default_macros_sc_411.json]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import actionmaps_importer
+
+_KEYS = "abcdefghijklmnopqrstuvwxyz0123456789"
+_MODIFIERS = ["", "lalt+", "ralt+", "lshift+", "lctrl+"]
+_MODES = ["press", "press", "press", "tap", "hold", "delayed_press"]
+_ACTIONS_PER_MAP = 50
+
+def _write_profile(path, base_records, filler_actions, seed=1):
+    rng = random.Random(seed)
+    by_category = {}
+    for record in base_records:
+        by_category.setdefault(record["xmlCategoryName"], []).append(record["xmlActionName"])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<profile version="1" optionsVersion="2" rebindVersion="2">\n')
+        categories = list(by_category.items())
+        categories += [(f"filler_map_{index}", [f"v_filler_{index}_{action}" for action in range(_ACTIONS_PER_MAP)])
+                       for index in range(filler_actions // _ACTIONS_PER_MAP)]
+        for category, actions in categories:
+            f.write(f' <actionmap name="{category}" version="1" UILabel="@ui_{category}" UICategory="@ui_CC">\n')
+            for action in actions:
+                binding = f"{rng.choice(_MODIFIERS)}{rng.choice(_KEYS)}" if rng.random() < 0.6 else " "
+                f.write(f'  <action name="{action}" activationMode="{rng.choice(_MODES)}" keyboard="{binding}" '
+                        f'UILabel="@ui_{action}" UIDescription="@ui_{action}_desc" optionGroup="default"/>\n')
+            f.write(' </actionmap>\n')
+        f.write('</profile>\n')
+
+def _dom_import(path):
+    """Baseline: the whole document in memory, then a walk over it."""
+    root = ET.parse(path).getroot()
+    return sum(1 for actionmap in root.iter("actionmap") for _ in actionmap.iter("action"))
+
+def _measure(function):
+    """Returns (seconds, peak MB) from a timed run and a separate tracemalloc run."""
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+if __name__ == '__main__':
+    default_base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "default_macros_sc_411.json")
+    parser = argparse.ArgumentParser(description="StarButtonBox actionmaps importer benchmark")
+    parser.add_argument("--actions", default="5000,50000,500000", help="Comma-separated filler action counts")
+    parser.add_argument("--base", default=default_base)
+    args = parser.parse_args()
+
+    base_records = actionmaps_importer.load_macro_table(args.base)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for filler in (int(count) for count in args.actions.split(',')):
+            path = os.path.join(tmp_dir, f"defaultProfile_{filler}.xml")
+            _write_profile(path, base_records, filler)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            result = actionmaps_importer.import_actionmaps(path, base_records)
+            stream_sec, stream_mb = _measure(lambda: actionmaps_importer.import_actionmaps(path, base_records))
+            dom_sec, dom_mb = _measure(lambda: _dom_import(path))
+            actions = result.stats["actions"]
+            print(f"{actions:>8} actions, {size_mb:6.1f} MB: streaming import {stream_sec * 1000:8.1f} ms "
+                  f"({actions / stream_sec / 1000:6.0f}k actions/s), peak {stream_mb:6.1f} MB | "
+                  f"ElementTree.parse walk {dom_sec * 1000:8.1f} ms, peak {dom_mb:7.1f} MB")
+            print(f"{'':>26}{len(result.diff['changed'])} changed, {result.stats['bound']} bound, "
+                  f"{result.stats['not_in_table']} not in the table, {len(result.stats['errors'])} error(s)",
+                  file=sys.stderr)
@@ -0,0 +1,288 @@
+# actionmaps_importer.py
+# Imports Star Citizen key bindings into the macro table format of
+# default_macros_sc_411.json (records keyed by xmlCategoryName/xmlActionName).
+#
+# Two kinds of files are understood:
+#   defaultProfile.xml  the game's full action list with default bindings
+#                       (<profile><actionmap name=..><action name=.. keyboard="lalt+g" activationMode=../>)
+#   actionmaps.xml      a user profile that only lists rebinds
+#                       (<ActionMaps>...<actionmap name=..><action name=..><rebind input="kb1_lalt+g"/>)
+# A defaultProfile replaces the bindings of every action it lists; an actionmaps file
+# is laid over the base table, so actions it does not rebind keep their binding.
+#
+# The file is read with an incremental iterparse and every finished <action> and
+# <actionmap> is detached from the tree straight away, so memory use depends on the
+# size of the macro table, not on the size of the XML. The same pass builds the
+# records, the diff against the base table and the compiled lookup index
+# ((category, action) -> macro_compiler tuple) used to validate every binding.
+#
+# Existing records keep their title, label and description. An inputAction that
+# binds the same input as the base table is kept verbatim, so hand-tuned hold
+# durations survive a re-import.
+#
+# Usage: python actionmaps_importer.py PROFILE.xml [--base default_macros_sc_411.json]
+#                                      [--output FILE] [--add-new] [--drop-removed]
+
+import json
+import logging
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import key_codes
+import macro_compiler
+
+logger = logging.getLogger("StarButtonBoxActionmapsImporter")
+
+DEFAULT_HOLD_MS = 500
+LONG_HOLD_MS = 1500
+
+# Star Citizen input token -> key name understood by key_codes (tokens not listed are tried as-is)
+_SC_KEY_NAMES = {
+    "lalt": "altleft", "ralt": "altright", "lshift": "shiftleft", "rshift": "shiftright",
+    "lctrl": "ctrlleft", "rctrl": "ctrlright", "pgup": "pageup", "pgdn": "pagedown",
+    "minus": "-", "equals": "=", "lbracket": "[", "rbracket": "]", "semicolon": ";",
+    "apostrophe": "'", "comma": ",", "period": ".", "slash": "/", "backslash": "\\", "grave": "`",
+    "np_add": "add", "np_subtract": "subtract", "np_multiply": "multiply", "np_divide": "divide",
+    "np_period": "decimal", "np_enter": "numpadenter", "print": "printscreen",
+}
+_SC_KEY_NAMES.update({f"np_{digit}": f"num{digit}" for digit in range(10)})
+_SC_MODIFIERS = frozenset(("lalt", "ralt", "lshift", "rshift", "lctrl", "rctrl"))
+_SC_MOUSE_BUTTONS = {"mouse1": "LEFT", "mouse2": "RIGHT", "mouse3": "MIDDLE"}
+_SC_WHEEL = {"mwheel_up": "UP", "mwheel_down": "DOWN"}
+
+# activationMode values that need the input held; everything else is sent as a tap
+_HOLD_MODES = {"hold": DEFAULT_HOLD_MS, "delayed_hold": DEFAULT_HOLD_MS, "hold_no_retrigger": DEFAULT_HOLD_MS,
+               "delayed_hold_no_retrigger": DEFAULT_HOLD_MS, "delayed_hold_long": LONG_HOLD_MS,
+               "smart_toggle": DEFAULT_HOLD_MS}
+
+# Words kept upper case when generating titles for actions the base table does not know
+_ACRONYMS = frozenset(("ui", "ifcs", "mfd", "eva", "pit", "hud", "ads", "esp", "vtol", "qt", "atc", "fov", "ir", "emp"))
+
+ImportResult = namedtuple("ImportResult", [
+    "records",  # Macro records in table order, base records first
+    "index",    # (xmlCategoryName, xmlActionName) -> compiled action tuple, bound actions only
+    "diff",     # {"changed": [(category, action, old, new)], "added": [(category, action)], "removed": [...]}
+    "stats",    # {"actions", "bound", "not_in_table" (bound actions skipped without add_new), "errors": [...], "full_profile"}
+])
+
+def _json(data):
+    return json.dumps(data, separators=(',', ':'))
+
+def _input_action(sc_input, activation_mode):
+    """
+    Converts a keyboard/mouse input string ("lalt+g", "mouse2", "mwheel_up") into an
+    InputAction dict, or None for an unbound input. Raises ValueError for unknown tokens.
+    """
+    tokens = [token for token in sc_input.strip().lower().split('+') if token]
+    if not tokens:
+        return None
+    *modifier_tokens, main = tokens
+    modifiers = []
+    for token in modifier_tokens:
+        if token not in _SC_MODIFIERS:
+            raise ValueError(f"unsupported modifier '{token}' in '{sc_input}'")
+        modifiers.append(_SC_KEY_NAMES[token])
+    hold_ms = _HOLD_MODES.get(activation_mode)
+    press_type = {"type": "hold", "durationMs": hold_ms} if hold_ms else {"type": "tap"}
+    if main in _SC_WHEEL:
+        return {"type": "mouse_scroll", "direction": _SC_WHEEL[main], "clicks": 1, "modifiers": modifiers}
+    if main in _SC_MOUSE_BUTTONS:
+        return {"type": "mouse_event", "button": _SC_MOUSE_BUTTONS[main], "modifiers": modifiers, "pressType": press_type}
+    key = _SC_KEY_NAMES.get(main, main)
+    if key_codes.resolve_key(key) is None:
+        raise ValueError(f"unsupported key '{main}' in '{sc_input}'")
+    return {"type": "key_event", "key": key, "modifiers": modifiers, "pressType": press_type}
+
+def _same_input(old_action_str, new_action):
+    """True if the base table's inputAction binds the same input as new_action (press type aside)."""
+    try:
+        old_action = json.loads(old_action_str)
+    except (TypeError, json.JSONDecodeError):
+        return False
+    fields = ("type", "key", "button", "direction", "modifiers")
+    return isinstance(old_action, dict) and all(old_action.get(f) == new_action.get(f) for f in fields)
+
+def _binding(action_elem, device_prefixed):
+    """
+    Returns (input string, activation mode) for the keyboard/mouse binding in an <action>
+    element, or None if it has no keyboard or mouse binding at all (e.g. joystick only).
+    An empty input string means the action is explicitly unbound.
+    """
+    mode = action_elem.get("activationMode", "")
+    if device_prefixed: # actionmaps.xml: <rebind input="kb1_lalt+g"/> / "mo1_mouse1"
+        for rebind in action_elem.iter("rebind"):
+            device, _, value = rebind.get("input", "").partition('_')
+            if device[:2] in ("kb", "mo"):
+                return value, rebind.get("activationMode", mode)
+        return None
+    for device in ("keyboard", "mouse"): # defaultProfile.xml attributes, or <keyboard><inputdata input=../>
+        value = action_elem.get(device)
+        if value is None:
+            child = action_elem.find(device)
+            if child is not None:
+                data = child.find("inputdata")
+                value = (data if data is not None else child).get("input")
+        if value is not None and (value.strip() or device == "mouse"):
+            return value, mode
+    return ("", mode) if action_elem.get("keyboard") is not None else None
+
+def _words(name, drop_prefix=False):
+    parts = [part for part in name.split('_') if part]
+    if drop_prefix and len(parts) > 1 and parts[0] in ("v", "pc"):
+        parts = parts[1:]
+    return [part.upper() if part.lower() in _ACRONYMS else part.capitalize() for part in parts]
+
+def _new_record(category, action, input_action_str, game_id):
+    label_words = _words(action, drop_prefix=True)
+    return {
+        "xmlCategoryName": category,
+        "xmlActionName": action,
+        "title": f"{' '.join(_words(category))}: {' '.join(label_words)}",
+        "label": ' '.join(label_words).upper()[:10].rstrip(),
+        "description": "",
+        "inputAction": input_action_str,
+        "gameId": game_id,
+    }
+
+def import_actionmaps(source, base_records=(), game_id=None, add_new=False, drop_removed=False):
+    """
+    Stream-parses a defaultProfile.xml or actionmaps.xml (path or file object) against
+    base_records (the current macro table). Returns an ImportResult.
+    add_new: also create records for actions the base table does not have (defaultProfile only).
+    drop_removed: leave out base records a defaultProfile no longer lists.
+    """
+    records = [dict(record) for record in base_records]
+    by_key = {(r.get("xmlCategoryName"), r.get("xmlActionName")): r for r in records}
+    if game_id is None:
+        game_id = records[0].get("gameId", "star_citizen") if records else "star_citizen"
+    diff = {"changed": [], "added": [], "removed": []}
+    stats = {"actions": 0, "bound": 0, "not_in_table": 0, "errors": [], "full_profile": False}
+    index = {}
+    seen = set() # Base table keys the file mentioned; nothing per unknown action is kept
+
+    def index_record(key, input_action_str):
+        if not input_action_str:
+            return
+        try:
+            index[key] = macro_compiler.compile_payload(input_action_str)
+            stats["bound"] += 1
+        except macro_compiler.MacroCompileError as e:
+            stats["errors"].append(f"{key[0]}/{key[1]}: {e}")
+
+    stack = []     # Open elements, so finished ones can be detached from their parent
+    category = None
+    device_prefixed = False
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if not stack:
+                stats["full_profile"] = elem.tag == "profile"
+                device_prefixed = not stats["full_profile"]
+            elif elem.tag == "actionmap":
+                category = elem.get("name")
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == "action" and category:
+            stats["actions"] += 1
+            key = (category, elem.get("name"))
+            binding = _binding(elem, device_prefixed)
+            record = by_key.get(key)
+            if record is not None:
+                seen.add(key)
+            if binding is not None and (record is not None or add_new):
+                try:
+                    new_action = _input_action(*binding)
+                except ValueError as e:
+                    stats["errors"].append(f"{key[0]}/{key[1]}: {e}")
+                    new_action = False
+                if new_action is not False:
+                    old_str = record.get("inputAction", "") if record is not None else None
+                    if new_action is None:
+                        new_str = ""
+                    elif old_str and _same_input(old_str, new_action):
+                        new_str = old_str
+                    else:
+                        new_str = _json(new_action)
+                    if record is None:
+                        record = by_key[key] = _new_record(key[0], key[1], new_str, game_id)
+                        records.append(record)
+                        seen.add(key)
+                        diff["added"].append(key)
+                    elif new_str != old_str:
+                        diff["changed"].append((key[0], key[1], old_str, new_str))
+                        record["inputAction"] = new_str
+            elif binding is not None:
+                stats["not_in_table"] += 1
+            if record is not None:
+                index_record(key, record.get("inputAction"))
+        elif elem.tag == "actionmap":
+            category = None
+        else:
+            continue # <rebind>, <keyboard> etc. are read through their <action>
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem) # Earlier siblings are already gone, so this is O(1)
+
+    for key, record in by_key.items(): # Base records the file did not mention
+        if key in seen:
+            continue
+        if stats["full_profile"]:
+            diff["removed"].append(key)
+            if drop_removed:
+                continue
+        index_record(key, record.get("inputAction"))
+    if stats["full_profile"] and drop_removed and diff["removed"]:
+        removed = set(diff["removed"])
+        records = [r for r in records if (r.get("xmlCategoryName"), r.get("xmlActionName")) not in removed]
+    return ImportResult(records, index, diff, stats)
+
+def load_macro_table(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_macro_table(records, file_path):
+    """Writes records in the layout of default_macros_sc_411.json (4-space indent, no trailing newline)."""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(records, indent=4))
+
+def format_diff(diff, limit=None):
+    """Human readable diff lines."""
+    lines = [f"~ {category}/{action}: {old or '(unbound)'} -> {new or '(unbound)'}"
+             for category, action, old, new in diff["changed"]]
+    lines += [f"+ {category}/{action}" for category, action in diff["added"]]
+    lines += [f"- {category}/{action} (no longer in the profile)" for category, action in diff["removed"]]
+    return lines if limit is None else lines[:limit]
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+    import time
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(levelname)s - %(message)s')
+    default_base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "default_macros_sc_411.json")
+    parser = argparse.ArgumentParser(description="Import Star Citizen key bindings into the StarButtonBox macro table")
+    parser.add_argument("profile", help="defaultProfile.xml or actionmaps.xml")
+    parser.add_argument("--base", default=default_base, help="Macro table to compare against and update")
+    parser.add_argument("--output", help="Write the updated macro table here")
+    parser.add_argument("--game-id", help="gameId for added records (default: taken from the base table)")
+    parser.add_argument("--add-new", action="store_true", help="Add records for actions the base table lacks")
+    parser.add_argument("--drop-removed", action="store_true", help="Drop records a defaultProfile no longer lists")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = import_actionmaps(args.profile, load_macro_table(args.base), args.game_id, args.add_new, args.drop_removed)
+    elapsed = time.perf_counter() - start
+    stats, diff = result.stats, result.diff
+    print(f"{'defaultProfile' if stats['full_profile'] else 'actionmaps'}: {stats['actions']} action(s) read in "
+          f"{elapsed * 1000:.1f} ms; {len(result.records)} record(s), {stats['bound']} bound and compiled")
+    print(f"{len(diff['changed'])} changed, {len(diff['added'])} added, {len(diff['removed'])} removed, "
+          f"{stats['not_in_table']} not in the table (use --add-new), {len(stats['errors'])} error(s)")
+    for line in format_diff(diff):
+        print(f"  {line}")
+    for error in stats["errors"]:
+        print(f"  ! {error}")
+    if args.output:
+        save_macro_table(result.records, args.output)
+        print(f"Wrote {args.output}")
+    sys.exit(1 if stats["errors"] else 0)
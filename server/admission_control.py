@@ -0,0 +1,104 @@
+# admission_control.py
+# Bounded admission in front of the macro worker pool. ThreadPoolExecutor queues
+# without limit, so when injection slows down (focus changes, long holds) macros
+# would pile up and fire seconds late. Each macro is admitted on the receive thread
+# and checked again when a worker picks it up, according to the policies of its
+# action type:
+#   POLICY_COALESCE    an identical macro from the same client still waiting absorbs the new one
+#   POLICY_DROP_STALE  dropped at execution if it waited longer than stale_ms since receipt
+#                      (since its due time when playout_scheduler held it on purpose)
+#   POLICY_NACK        when the queue is full, the sender gets a NACK instead of an ACK
+# A full queue always rejects; without POLICY_NACK the packet is still ACKed and silently shed.
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger("StarButtonBoxServer.Admission")
+
+POLICY_COALESCE = "coalesce"
+POLICY_DROP_STALE = "drop_stale"
+POLICY_NACK = "nack"
+
+DEFAULT_CAPACITY = 32
+DEFAULT_STALE_MS = 500
+
+class AdmissionQueue:
+    """Admission bookkeeping for one dispatcher handler (see packet_dispatcher.HandlerSpec.admission)."""
+
+    def __init__(self, policy_for, capacity=DEFAULT_CAPACITY, stale_ms=DEFAULT_STALE_MS, nack_enabled=False):
+        """policy_for(payload) returns the collection of POLICY_* that apply to a parsed payload."""
+        self.policy_for = policy_for
+        self.capacity = capacity
+        self.stale_ms = stale_ms
+        self.nack_enabled = nack_enabled
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pending_keys = {} # (client ip, payload) -> waiting count, for coalescing policies only
+        self._counters = {"admitted": 0, "coalesced": 0, "stale": 0, "rejected": 0, "nacked": 0}
+
+    def configure(self, capacity=None, stale_ms=None, nack_enabled=None):
+        with self._lock:
+            if capacity is not None:
+                self.capacity = max(int(capacity), 1)
+            if stale_ms is not None:
+                self.stale_ms = max(float(stale_ms), 0.0)
+            if nack_enabled is not None:
+                self.nack_enabled = bool(nack_enabled)
+
+    def admit(self, ctx, payload):
+        """
+        Called on the receive thread before the job is queued.
+        Returns (admitted, send_nack).
+        """
+        policies = self.policy_for(payload)
+        key = (ctx.addr[0], payload) if POLICY_COALESCE in policies else None
+        with self._lock:
+            if key is not None and self._pending_keys.get(key):
+                self._counters["coalesced"] += 1
+                return False, False
+            if self._pending >= self.capacity:
+                self._counters["rejected"] += 1
+                send_nack = self.nack_enabled and POLICY_NACK in policies
+                if send_nack:
+                    self._counters["nacked"] += 1
+                return False, send_nack
+            self._pending += 1
+            if key is not None:
+                self._pending_keys[key] = self._pending_keys.get(key, 0) + 1
+            self._counters["admitted"] += 1
+        return True, False
+
+    def begin(self, ctx, payload):
+        """Called on the worker before the handler runs. Returns False if the job must be dropped."""
+        policies = self.release(ctx, payload)
+        ready_ns = ctx.scheduled_time_ns or ctx.received_time_ns
+        if POLICY_DROP_STALE in policies and ready_ns:
+            waited_ms = (time.perf_counter_ns() - ready_ns) / 1_000_000.0
+            if waited_ms > self.stale_ms:
+                with self._lock:
+                    self._counters["stale"] += 1
+                logger.warning(f"Dropped stale {ctx.packet_type} (ID: {ctx.packet_id}) after waiting {waited_ms:.0f} ms.")
+                return False
+        return True
+
+    def release(self, ctx, payload):
+        """Frees the queue slot taken by admit(). Returns the payload's policies."""
+        policies = self.policy_for(payload)
+        with self._lock:
+            self._pending -= 1
+            if POLICY_COALESCE in policies:
+                key = (ctx.addr[0], payload)
+                remaining = self._pending_keys.get(key, 0) - 1
+                if remaining > 0:
+                    self._pending_keys[key] = remaining
+                else:
+                    self._pending_keys.pop(key, None)
+        return policies
+
+    def get_counters(self):
+        """Returns the admission counters plus the number of jobs currently waiting."""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["pending"] = self._pending
+        return counters
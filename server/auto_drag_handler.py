@@ -1,12 +1,18 @@
 # auto_drag_handler.py
 # Handles capturing mouse positions and managing the auto drag-and-drop loop.
 
-import pyautogui
+try:
+    import pyautogui
+except Exception as e: # No display (e.g. replaying captures on Linux); mouse capture and drag are unavailable
+    pyautogui = None
+    _pyautogui_error = e
 import time
 import threading
 import sys
 import logging # Use logging instead of print for better control
 
+import precise_timing
+
 logger = logging.getLogger("StarButtonBoxAutoDrag") # Specific logger
 
 # --- Global variables to store state ---
@@ -17,6 +23,7 @@ auto_drag_thread = None  # To hold the reference to the drag loop thread
 
 # --- Configuration for drag operation (can be adjusted) ---
 DRAG_DURATION_SECONDS = 0.1  # Duration of the mouse movement during drag
+DRAG_STEP_SECONDS = 0.01 # Interval between intermediate positions during the drag movement
 POST_DRAG_SLEEP_SECONDS = 0.05 # Sleep after each drag action
 LOOP_WAIT_SECONDS = 0.1 # Sleep between drag iterations in the loop
 
@@ -27,6 +34,9 @@ def capture_mouse_position(purpose: str):
         purpose (str): "SRC" to store as source, "DES" to store as destination.
     """
     global captured_src_position, captured_dest_position
+    if pyautogui is None:
+        logger.error(f"Cannot capture mouse position: pyautogui unavailable ({_pyautogui_error}).")
+        return
     try:
         current_pos = pyautogui.position()
         if purpose == "SRC":
@@ -48,13 +58,25 @@ def _perform_single_drag(src_pos, dest_pos):
         src_pos (tuple): The (x, y) coordinates for the start of the drag.
         dest_pos (tuple): The (x, y) coordinates for the end of the drag.
     """
+    if pyautogui is None:
+        logger.error(f"Cannot drag: pyautogui unavailable ({_pyautogui_error}).")
+        return
     try:
         logger.debug(f"Dragging from {src_pos} to {dest_pos}...") # Changed to debug for less noise
         pyautogui.moveTo(src_pos[0], src_pos[1])
         pyautogui.mouseDown(button='left')
-        time.sleep(0.05) 
-        pyautogui.moveTo(dest_pos[0], dest_pos[1], duration=DRAG_DURATION_SECONDS)
-        time.sleep(POST_DRAG_SLEEP_SECONDS) 
+        precise_timing.sleep(0.05)
+        # Stepped on deadlines instead of moveTo(duration=...), whose tween sleeps per step and drifts
+        steps = max(int(DRAG_DURATION_SECONDS / DRAG_STEP_SECONDS), 1)
+        step_ns = int(DRAG_STEP_SECONDS * 1e9)
+        start_ns = time.perf_counter_ns()
+        for step in range(1, steps + 1):
+            x = src_pos[0] + (dest_pos[0] - src_pos[0]) * step / steps
+            y = src_pos[1] + (dest_pos[1] - src_pos[1]) * step / steps
+            pyautogui.moveTo(round(x), round(y), _pause=False)
+            if step < steps:
+                precise_timing.wait_until(start_ns + step * step_ns)
+        precise_timing.sleep(POST_DRAG_SLEEP_SECONDS)
         pyautogui.mouseUp(button='left')
         logger.debug(f"Drag complete.") # Changed to debug
     except Exception as e:
@@ -71,7 +93,7 @@ def _auto_drag_loop_task():
     while not stop_drag_loop_event.is_set():
         if captured_src_position is None or captured_dest_position is None:
             logger.warning("Source or Destination position not set. Auto drag loop waiting...")
-            time.sleep(1)
+            precise_timing.sleep(1, stop_drag_loop_event)
             continue
 
         _perform_single_drag(captured_src_position, captured_dest_position)
@@ -79,7 +101,7 @@ def _auto_drag_loop_task():
         if stop_drag_loop_event.is_set():
             break
         
-        time.sleep(LOOP_WAIT_SECONDS)
+        precise_timing.sleep(LOOP_WAIT_SECONDS, stop_drag_loop_event)
 
     logger.info("Auto drag loop task finished.")
 
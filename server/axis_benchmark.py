@@ -0,0 +1,102 @@
+# axis_benchmark.py
+# Shows that the axis channel's output does not depend on how fast the phone sends:
+# streams AXIS_UPDATE packets for a throttle (key_pwm) and a look axis (mouse_x) at
+# several rates and reports server CPU, output events per second, the measured PWM
+# duty cycle against the sent value, and the mouse distance against the expected one.
+# Starts the UDP server in-process (mDNS disabled, input only recorded).
+#
+# Usage: python axis_benchmark.py [--rates 50,250,1000,4000] [--seconds 3] [--value 0.4] [--port 58159]
+
+import argparse
+import json
+import logging
+import socket
+import sys
+import time
+import uuid
+
+import config
+import input_backend
+import key_codes
+import server as server_control
+
+_MAPPINGS = {
+    "throttle": {"mode": "key_pwm", "positive": "w", "negative": "s", "periodMs": 100},
+    "look_x": {"mode": "mouse_x", "speed": 500},
+}
+
+def _stream(port, rate_hz, duration_sec, value):
+    """Sends AXIS_UPDATE packets at rate_hz. Returns (packets sent, client CPU seconds)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    packet_id = str(uuid.uuid4())
+    interval_sec = 1.0 / rate_hz
+    sent = 0
+    cpu_start = time.thread_time()
+    next_send = time.perf_counter()
+    deadline = next_send + duration_sec
+    while next_send < deadline:
+        while time.perf_counter() < next_send:
+            pass
+        packet = {"packetId": packet_id, "timestamp": int(time.time() * 1000),
+                  "type": config.PACKET_TYPE_AXIS_UPDATE, "payload": f"{sent};throttle={value:.3f};look_x={value:.3f}"}
+        sock.sendto(json.dumps(packet, separators=(',', ':')).encode('utf-8'), ('127.0.0.1', port))
+        sent += 1
+        next_send += interval_sec
+    cpu = time.thread_time() - cpu_start
+    sock.close()
+    return sent, cpu
+
+def _key_held_fraction(batches, code, start_ns, end_ns):
+    """Fraction of [start_ns, end_ns] during which the key was down, from recorded batches."""
+    held_ns, down_since = 0, None
+    for batch_ns, batch in batches:
+        for kind, event_code, is_down in batch:
+            if kind != input_backend.EVENT_KEY or event_code != code:
+                continue
+            if is_down and down_since is None:
+                down_since = max(batch_ns, start_ns)
+            elif not is_down and down_since is not None:
+                held_ns += max(min(batch_ns, end_ns) - down_since, 0)
+                down_since = None
+    if down_since is not None:
+        held_ns += max(end_ns - down_since, 0)
+    return held_ns / max(end_ns - start_ns, 1)
+
+def run_benchmark(port, rate_hz, duration_sec, value):
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    server_control.start_server(port, False, None, None)
+    server_control.axis_output.configure(mappings=_MAPPINGS)
+    time.sleep(0.5) # Let the socket bind
+    server_control.axis_output.get_stats(reset=True)
+
+    cpu_start = time.process_time()
+    wall_start_ns = time.perf_counter_ns()
+    sent, client_cpu = _stream(port, rate_hz, duration_sec, value)
+    wall_end_ns = time.perf_counter_ns()
+    server_cpu = max(time.process_time() - cpu_start - client_cpu, 1e-9)
+    stats = server_control.axis_output.get_stats()
+    server_control.stop_server()
+
+    elapsed = (wall_end_ns - wall_start_ns) / 1e9
+    duty = _key_held_fraction(backend.batches, key_codes.resolve_key("w"), wall_start_ns, wall_end_ns)
+    moved = sum(event[1] for batch_ns, batch in backend.batches if batch_ns <= wall_end_ns
+                for event in batch if event[0] == input_backend.EVENT_MOUSE_MOVE)
+    print(f"{rate_hz:6.0f} packets/s: {stats['packets']} received ({stats['stale']} stale), "
+          f"{stats['events'] / elapsed:6.1f} output events/s, server CPU {server_cpu / elapsed * 100:5.1f}% of one core")
+    print(f"{'':>15}  throttle duty {duty:.3f} (sent {value:g}), look_x moved {moved} px "
+          f"(expected ~{value * _MAPPINGS['look_x']['speed'] * elapsed:.0f})")
+    return sent
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox axis channel benchmark")
+    parser.add_argument("--rates", default="50,250,1000,4000", help="Comma-separated AXIS_UPDATE send rates")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--value", type=float, default=0.4, help="Axis value sent for both axes")
+    parser.add_argument("--port", type=int, default=58159)
+    args = parser.parse_args()
+
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    print(f"Streaming throttle/look_x = {args.value:g} for {args.seconds:g}s per rate", file=sys.stderr)
+    for rate in (float(r) for r in args.rates.split(',')):
+        run_benchmark(args.port, rate, args.seconds, args.value)
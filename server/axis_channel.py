@@ -0,0 +1,226 @@
+# axis_channel.py
+# Analog axes (throttle, strafe, ... sliders on the phone) streamed as AXIS_UPDATE
+# packets. Only the newest value of each axis matters: the receive thread overwrites
+# it in place and drops packets older than the newest one seen from that client, so
+# memory and CPU stay constant however fast the phone sends. An output thread turns
+# the current values into input at a fixed rate through input_backend:
+#   key_pwm  the positive or negative key is held for |value| of each PWM period
+#            (fully held at +-1, released at 0), like feathering W/S by hand
+#   mouse_x  / mouse_y  relative mouse movement of value * speed pixels per second
+# An axis that has not been updated for timeout_ms falls back to 0, so a phone that
+# drops off Wi-Fi never leaves a key held.
+#
+# Wire format (plain string payload, parsed without JSON):
+#   {"packetId":"<id>","timestamp":<ms>,"type":"AXIS_UPDATE","payload":"<seq>;<axis>=<value>;..."}
+# with values in [-1, 1].
+
+import math
+import threading
+import time
+import logging
+
+import config
+import input_backend
+import key_codes
+import precise_timing
+
+logger = logging.getLogger("StarButtonBoxServer.Axis")
+
+MODE_KEY_PWM = "key_pwm"
+MODE_MOUSE_X = "mouse_x"
+MODE_MOUSE_Y = "mouse_y"
+
+DEFAULT_OUTPUT_RATE_HZ = 100.0
+DEFAULT_TIMEOUT_MS = 500.0
+DEFAULT_PWM_PERIOD_MS = 100.0
+MIN_PWM_PERIOD_MS = 10.0    # Shorter periods cannot be resolved at the output rate anyway
+DEFAULT_MOUSE_SPEED = 800.0 # Pixels per second at full deflection
+DEADZONE = 0.02
+SEQUENCE_RESET_GAP = 1000   # A sequence this far behind the newest means the phone restarted its stream
+
+_TYPE_MARKER = b'"type":"' + config.PACKET_TYPE_AXIS_UPDATE.encode('utf-8') + b'"'
+_PAYLOAD_PREFIX = b'"payload":"'
+
+def parse_payload(payload):
+    """Parses "<seq>;<axis>=<value>;..." (str or bytes) into (seq, [(axis, value), ...]). Raises ValueError."""
+    if isinstance(payload, bytes):
+        payload = payload.decode('ascii')
+    parts = payload.split(';')
+    seq = int(parts[0])
+    values = []
+    for part in parts[1:]:
+        name, _, value = part.partition('=')
+        number = float(value)
+        if not math.isfinite(number): # NaN would pass the clamp and poison the mouse remainder
+            raise ValueError(f"axis '{name}' value is not finite: {value}")
+        values.append((name, min(max(number, -1.0), 1.0)))
+    return seq, values
+
+def extract_fast(data_bytes):
+    """Returns the parsed payload if data_bytes is an AXIS_UPDATE in the app's wire layout, otherwise None."""
+    if _TYPE_MARKER not in data_bytes:
+        return None
+    start = data_bytes.find(_PAYLOAD_PREFIX)
+    if start < 0:
+        return None
+    start += len(_PAYLOAD_PREFIX)
+    try:
+        return parse_payload(data_bytes[start:data_bytes.find(b'"', start)])
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+class _Axis:
+    """Mapping plus current value and output state of one axis."""
+    __slots__ = ("name", "mode", "positive_code", "negative_code", "period_ns", "speed",
+                 "value", "updated_ns", "held_code", "remainder")
+
+    def __init__(self, name, mapping):
+        self.name = name
+        self.mode = mapping.get("mode")
+        self.positive_code = self.negative_code = None
+        if self.mode == MODE_KEY_PWM:
+            self.positive_code = key_codes.resolve_key(mapping.get("positive", ""))
+            self.negative_code = key_codes.resolve_key(mapping.get("negative", ""))
+            if self.positive_code is None or self.negative_code is None:
+                raise ValueError(f"unknown key in {mapping}")
+        elif self.mode not in (MODE_MOUSE_X, MODE_MOUSE_Y):
+            raise ValueError(f"unknown mode '{self.mode}'")
+        period_ms = float(mapping.get("periodMs", DEFAULT_PWM_PERIOD_MS))
+        if not math.isfinite(period_ms) or period_ms <= 0:
+            raise ValueError(f"periodMs must be a positive number, got {mapping.get('periodMs')!r}")
+        self.period_ns = int(max(period_ms, MIN_PWM_PERIOD_MS) * 1_000_000)
+        self.speed = float(mapping.get("speed", DEFAULT_MOUSE_SPEED))
+        if not math.isfinite(self.speed):
+            raise ValueError(f"speed must be a finite number, got {mapping.get('speed')!r}")
+        self.value = 0.0
+        self.updated_ns = 0
+        self.held_code = None # Key currently held down by PWM
+        self.remainder = 0.0  # Sub-pixel mouse movement carried to the next tick
+
+class AxisChannel:
+    """Latest-value-wins axis state with a fixed-rate output thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._axes = {}      # axis name -> _Axis
+        self._sequences = {} # addr -> newest sequence seen
+        self.output_rate_hz = DEFAULT_OUTPUT_RATE_HZ
+        self.timeout_ns = int(DEFAULT_TIMEOUT_MS * 1_000_000)
+        self._counters = {"packets": 0, "stale": 0, "unknown_axes": 0, "ticks": 0, "events": 0}
+        self._stop_event = None # Per output thread, so a restart never revives a stopping thread
+        self._thread = None
+
+    def configure(self, mappings=None, output_rate_hz=None, timeout_ms=None):
+        if output_rate_hz is not None:
+            self.output_rate_hz = min(max(float(output_rate_hz), 10.0), 1000.0)
+        if timeout_ms is not None:
+            self.timeout_ns = int(max(float(timeout_ms), 50.0) * 1_000_000)
+        if mappings is None:
+            return
+        axes = {}
+        for name, mapping in (mappings.items() if isinstance(mappings, dict) else ()):
+            try:
+                axes[name] = _Axis(name, mapping if isinstance(mapping, dict) else {})
+            except (ValueError, TypeError) as e:
+                logger.error(f"Ignoring axis mapping '{name}': {e}")
+        with self._lock:
+            released = [axis.held_code for axis in self._axes.values() if axis.held_code is not None]
+            self._axes = axes
+        if released:
+            input_backend.send([input_backend.key_up(code) for code in released])
+        logger.info(f"Axis mappings: {', '.join(f'{n} ({a.mode})' for n, a in axes.items()) or 'none'}")
+
+    def update(self, addr, seq, values, received_time_ns):
+        """Called on the receive thread for every AXIS_UPDATE packet."""
+        with self._lock:
+            self._counters["packets"] += 1
+            newest = self._sequences.get(addr)
+            if newest is not None and newest - SEQUENCE_RESET_GAP < seq <= newest:
+                self._counters["stale"] += 1
+                return
+            self._sequences[addr] = seq
+            for name, value in values:
+                axis = self._axes.get(name)
+                if axis is None:
+                    self._counters["unknown_axes"] += 1
+                    continue
+                axis.value = value
+                axis.updated_ns = received_time_ns
+            if self._thread is None:
+                self._stop_event = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop_event,), name="AxisOutput", daemon=True)
+                self._thread.start()
+
+    def _tick(self, now_ns, tick_sec):
+        events = []
+        with self._lock:
+            for axis in self._axes.values():
+                value = axis.value
+                if abs(value) < DEADZONE or now_ns - axis.updated_ns > self.timeout_ns:
+                    value = 0.0
+                if axis.mode == MODE_KEY_PWM:
+                    wanted = None
+                    if value:
+                        duty = abs(value)
+                        if duty >= 1.0 - DEADZONE or (now_ns % axis.period_ns) < duty * axis.period_ns:
+                            wanted = axis.positive_code if value > 0 else axis.negative_code
+                    if wanted != axis.held_code:
+                        if axis.held_code is not None:
+                            events.append(input_backend.key_up(axis.held_code))
+                        if wanted is not None:
+                            events.append(input_backend.key_down(wanted))
+                        axis.held_code = wanted
+                else:
+                    axis.remainder += value * axis.speed * tick_sec
+                    step = int(axis.remainder)
+                    if step:
+                        axis.remainder -= step
+                        events.append(input_backend.mouse_move(step, 0) if axis.mode == MODE_MOUSE_X
+                                      else input_backend.mouse_move(0, step))
+                    elif not value:
+                        axis.remainder = 0.0
+            self._counters["ticks"] += 1
+            self._counters["events"] += len(events)
+        if events:
+            input_backend.send(events)
+
+    def _run(self, stop_event):
+        tick_ns = int(1e9 / self.output_rate_hz)
+        next_tick_ns = time.perf_counter_ns()
+        while not stop_event.is_set():
+            try:
+                self._tick(next_tick_ns, tick_ns / 1e9)
+            except Exception as e:
+                logger.error(f"Axis output failed: {e}", exc_info=True)
+            tick_ns = int(1e9 / self.output_rate_hz)
+            next_tick_ns += tick_ns
+            delay_ns = next_tick_ns - time.perf_counter_ns()
+            if delay_ns < -tick_ns: # Fell behind (e.g. suspended); do not try to catch up
+                next_tick_ns = time.perf_counter_ns()
+            elif delay_ns > 0:
+                precise_timing.wait_until(next_tick_ns, stop_event)
+
+    def get_stats(self, reset=False):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["values"] = {name: axis.value for name, axis in self._axes.items()}
+            if reset:
+                for key in self._counters:
+                    self._counters[key] = 0
+        return stats
+
+    def stop(self):
+        """Stops the output thread and releases any key held by PWM (server stop)."""
+        with self._lock:
+            thread, stop_event = self._thread, self._stop_event
+            self._thread = self._stop_event = None
+            self._sequences.clear()
+        if thread is not None:
+            stop_event.set()
+            thread.join(timeout=1.0)
+        with self._lock:
+            released = [axis.held_code for axis in self._axes.values() if axis.held_code is not None]
+            for axis in self._axes.values():
+                axis.value, axis.held_code, axis.remainder = 0.0, None, 0.0
+        if released:
+            input_backend.send([input_backend.key_up(code) for code in released])
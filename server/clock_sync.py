@@ -0,0 +1,189 @@
+# clock_sync.py
+# NTP-style estimation of each phone's clock offset and drift against the server,
+# so the phone's packet timestamps can be placed on the server timeline and one-way
+# latency (phone send -> server receive -> input injected) measured per macro.
+#
+# Every PONG carries the server receive (t2) and transmit (t3) times. The phone adds
+# its own send (t1) and receive (t4) times and returns all four in a CLOCK_SYNC_REPORT:
+#   offset = ((t1 - t2) + (t4 - t3)) / 2     phone clock minus server clock
+#   delay  = (t4 - t1) - (t3 - t2)           network round trip without server time
+# As in NTP's clock filter, the offset of the lowest-delay sample among the last few
+# is used, since queuing only ever adds delay. Drift is a least-squares fit of the
+# filtered offsets over a longer window, so the offset stays accurate between PINGs.
+#
+# Server times are perf_counter based, anchored to the wall clock once at import, so
+# they are comparable with received_time_ns and the inject times without jumping when
+# Windows adjusts its clock. All times are in milliseconds.
+
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger("StarButtonBoxServer.ClockSync")
+
+FILTER_WINDOW = 8            # Samples considered by the clock filter
+DRIFT_WINDOW = 32            # Filtered offsets used for the drift fit
+MIN_DRIFT_SPAN_MS = 60_000.0 # Filtered offsets must span this long before drift is applied
+MAX_DRIFT_PPM = 500.0        # Larger fits are treated as noise (phone crystals are within ~100 ppm)
+MAX_SAMPLE_DELAY_MS = 1000.0 # Exchanges slower than this say nothing useful about the offset
+STEP_THRESHOLD_MS = 500.0    # A larger jump means the phone clock was set; history is discarded
+LATENCY_WINDOW = 256         # One-way latency samples kept per client for the percentiles
+MAX_CLIENTS = 64             # Phones that synced least recently are forgotten beyond this
+
+_WALL_ANCHOR_NS = time.time_ns()
+_PERF_ANCHOR_NS = time.perf_counter_ns()
+
+def server_time_ms(perf_ns=None):
+    """Server time in ms since the epoch for a perf_counter_ns() value (default: now)."""
+    if perf_ns is None:
+        perf_ns = time.perf_counter_ns()
+    return (_WALL_ANCHOR_NS + (perf_ns - _PERF_ANCHOR_NS)) / 1_000_000.0
+
+def perf_ns_for_server_ms(server_ms):
+    """Inverse of server_time_ms(): the perf_counter_ns() value at which the server clock reads server_ms."""
+    return int(server_ms * 1_000_000) - _WALL_ANCHOR_NS + _PERF_ANCHOR_NS
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+class ClientClock:
+    """Offset/drift state and one-way latency samples for one phone."""
+
+    def __init__(self):
+        self.samples = []           # (server time, offset, delay), newest last, at most FILTER_WINDOW
+        self.filtered = []          # (server time, offset) chosen by the clock filter, at most DRIFT_WINDOW
+        self.offset_ms = None
+        self.reference_ms = 0.0     # Server time offset_ms applies to
+        self.drift_ppm = 0.0
+        self.delay_ms = None
+        self.steps = 0
+        self.one_way = {"network": [], "inject": []}
+
+    def add_exchange(self, t1, t2, t3, t4):
+        """Adds one PING/PONG exchange. Returns False if it was unusable."""
+        if not all(isinstance(t, (int, float)) and not isinstance(t, bool) and math.isfinite(t) and t >= 0
+                   for t in (t1, t2, t3, t4)):
+            return False # One NaN would poison the filter and the drift fit for good
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < -1.0 or delay > MAX_SAMPLE_DELAY_MS: # The phone clock only has ms resolution
+            return False
+        delay = max(delay, 0.0)
+        offset = ((t1 - t2) + (t4 - t3)) / 2.0
+        sample_time = (t2 + t3) / 2.0
+
+        if self.offset_ms is not None and abs(offset - self.offset_at(sample_time)) > STEP_THRESHOLD_MS + delay:
+            logger.info(f"Phone clock stepped by {offset - self.offset_at(sample_time):+.0f} ms; restarting estimate.")
+            self.samples.clear()
+            self.filtered.clear()
+            self.drift_ppm = 0.0
+            self.steps += 1
+
+        self.samples.append((sample_time, offset, delay))
+        del self.samples[:-FILTER_WINDOW]
+        best_time, best_offset, best_delay = min(reversed(self.samples), key=lambda s: s[2]) # Newest on ties
+        if not self.filtered or self.filtered[-1][0] != best_time: # Each sample enters the fit once, at its own time
+            self.filtered.append((best_time, best_offset))
+            del self.filtered[:-DRIFT_WINDOW]
+        self.delay_ms = best_delay
+        self._fit()
+        return True
+
+    def _fit(self):
+        times = [t for t, _ in self.filtered]
+        offsets = [o for _, o in self.filtered]
+        mean_t = sum(times) / len(times)
+        mean_o = sum(offsets) / len(offsets)
+        self.offset_ms, self.reference_ms, self.drift_ppm = mean_o, mean_t, 0.0
+        if len(times) < 3 or times[-1] - times[0] < MIN_DRIFT_SPAN_MS:
+            self.offset_ms, self.reference_ms = offsets[-1], times[-1]
+            return
+        var_t = sum((t - mean_t) ** 2 for t in times)
+        slope = sum((t - mean_t) * (o - mean_o) for t, o in zip(times, offsets)) / var_t
+        if abs(slope) * 1e6 <= MAX_DRIFT_PPM:
+            self.drift_ppm = slope * 1e6
+
+    def offset_at(self, server_ms):
+        return self.offset_ms + self.drift_ppm * 1e-6 * (server_ms - self.reference_ms)
+
+    def to_server_ms(self, phone_ms):
+        """Converts a phone timestamp to server time, or None before the first exchange."""
+        if self.offset_ms is None:
+            return None
+        # Offset is a function of server time; one refinement step is plenty at ppm drift
+        estimate = phone_ms - self.offset_ms
+        return phone_ms - self.offset_at(estimate)
+
+    def add_one_way(self, kind, latency_ms):
+        values = self.one_way[kind]
+        values.append(latency_ms)
+        del values[:-LATENCY_WINDOW]
+
+    def stats(self):
+        result = {"offset_ms": self.offset_ms, "drift_ppm": self.drift_ppm, "delay_ms": self.delay_ms,
+                  "samples": len(self.filtered), "steps": self.steps}
+        for kind, values in self.one_way.items():
+            if values:
+                ordered = sorted(values)
+                result[kind] = {"count": len(ordered), "p50": _percentile(ordered, 0.5),
+                                "p99": _percentile(ordered, 0.99), "max": ordered[-1]}
+        return result
+
+_lock = threading.Lock()
+_clients = {} # client IP -> ClientClock (the port changes whenever the app recreates its socket), least recently synced first
+
+def record_exchange(addr, t1, t2, t3, t4):
+    """Feeds one CLOCK_SYNC_REPORT from addr. Returns False if the sample was rejected."""
+    with _lock:
+        clock = _clients.pop(addr[0], None)
+        if clock is None:
+            clock = ClientClock()
+        _clients[addr[0]] = clock
+        while len(_clients) > MAX_CLIENTS:
+            del _clients[next(iter(_clients))]
+        return clock.add_exchange(t1, t2, t3, t4)
+
+def to_server_ms(addr, phone_ms):
+    """Converts a timestamp from addr's clock to server time, or None while its offset is unknown."""
+    with _lock:
+        clock = _clients.get(addr[0])
+        return clock.to_server_ms(phone_ms) if clock is not None else None
+
+def record_one_way(addr, phone_timestamp_ms, received_time_ns, inject_start_ns=0):
+    """
+    Records phone send -> server receive ("network") and phone send -> injection start
+    ("inject") latency for one packet. Does nothing until the client's offset is known.
+    """
+    if not isinstance(phone_timestamp_ms, (int, float)) or not received_time_ns:
+        return
+    with _lock:
+        clock = _clients.get(addr[0])
+        if clock is None or clock.offset_ms is None:
+            return
+        sent_ms = clock.to_server_ms(phone_timestamp_ms)
+        clock.add_one_way("network", server_time_ms(received_time_ns) - sent_ms)
+        if inject_start_ns:
+            clock.add_one_way("inject", server_time_ms(inject_start_ns) - sent_ms)
+
+def get_client_stats():
+    """Returns {client IP: estimator state and one-way latency percentiles (ms)}."""
+    with _lock:
+        return {ip: clock.stats() for ip, clock in _clients.items()}
+
+def reset_latency_windows():
+    with _lock:
+        for clock in _clients.values():
+            for values in clock.one_way.values():
+                values.clear()
+
+def format_client_stats(ip, stats):
+    """One readable line for a client from get_client_stats()."""
+    if stats["offset_ms"] is None:
+        return f"{ip}: no clock estimate yet"
+    line = (f"{ip}: offset {stats['offset_ms']:+.1f} ms, drift {stats['drift_ppm']:+.1f} ppm, "
+            f"rtt {stats['delay_ms']:.1f} ms")
+    for kind in ("network", "inject"):
+        if kind in stats:
+            s = stats[kind]
+            line += f"; one-way {kind} p50 {s['p50']:.1f}/p99 {s['p99']:.1f}/max {s['max']:.1f} ms (n={s['count']})"
+    return line
@@ -15,9 +15,28 @@ PACKET_TYPE_HEALTH_CHECK_PING = "HEALTH_CHECK_PING"
 PACKET_TYPE_HEALTH_CHECK_PONG = "HEALTH_CHECK_PONG"
 PACKET_TYPE_MACRO_COMMAND = "MACRO_COMMAND"
 PACKET_TYPE_MACRO_ACK = "MACRO_ACK"
+PACKET_TYPE_MACRO_NACK = "MACRO_NACK" # Sent instead of MACRO_ACK when a full macro queue sheds the command
+# Server-side auto-repeat, acknowledged with MACRO_ACK. Payload: {"action": "START" | "STOP", "repeatId": str,
+# "macro": InputAction JSON, "rateHz": number, "timeoutMs": optional number} (see turbo_repeat)
+PACKET_TYPE_MACRO_REPEAT = "MACRO_REPEAT"
 PACKET_TYPE_TRIGGER_IMPORT_BROWSER = "TRIGGER_IMPORT_BROWSER"
 
 # --- New Packet Types for Auto Drag and Drop ---
 PACKET_TYPE_CAPTURE_MOUSE_POSITION = "CAPTURE_MOUSE_POSITION"
 PACKET_TYPE_AUTO_DRAG_LOOP_COMMAND = "AUTO_DRAG_LOOP_COMMAND"
+# --- Diagnostics ---
+# Payload: {"action": "START" | "STOP", "durationSec": optional number}
+PACKET_TYPE_PROFILE_CONTROL = "PROFILE_CONTROL"
+# Payload: {"t1": PING sent, "t2": server received, "t3": PONG sent, "t4": PONG received} (ms, see clock_sync)
+PACKET_TYPE_CLOCK_SYNC_REPORT = "CLOCK_SYNC_REPORT"
+# --- Streams (never acknowledged) ---
+# Relative mouse movement. Payload: "<seq>,<dx>,<dy>" (plain string, see mouse_stream)
+PACKET_TYPE_MOUSE_MOVE = "MOUSE_MOVE"
+# Analog axis values, newest wins. Payload: "<seq>;<axis>=<value>;..." with values in [-1, 1] (see axis_channel)
+PACKET_TYPE_AXIS_UPDATE = "AXIS_UPDATE"
+# --- Acknowledgement mode (see ack_batcher) ---
+# Payload both ways: {"mode": "PER_PACKET" | "BATCHED", "windowMs": number}; the reply carries what was accepted
+PACKET_TYPE_ACK_MODE = "ACK_MODE"
+# Server to app. Payload: {"ackType": "MACRO_ACK", "ids": [packetId, ...]}
+PACKET_TYPE_ACK_BATCH = "ACK_BATCH"
 # Optional: PACKET_TYPE_AUTO_DRAG_STATUS_UPDATE = "AUTO_DRAG_STATUS_UPDATE" # For server to send status back
@@ -2,11 +2,19 @@
 # Handles loading and saving server configurations from/to a JSON file,
 # and manages Windows auto-start registry settings.
 
+import copy
 import json
 import os
+import queue
 import sys
+import time
+import atexit
+import threading
 import config # For default values
-import winreg # For Windows registry operations
+try:
+    import winreg # For Windows registry operations
+except ImportError: # Not on Windows (e.g. replaying captures on Linux); autostart is unavailable
+    winreg = None
 import logging
 
 logger = logging.getLogger("StarButtonBoxServerConfig")
@@ -51,6 +59,9 @@ APP_SETTINGS_DIR = get_app_data_dir()
 SETTINGS_FILE_NAME = "server_settings.json"
 SETTINGS_FILE_PATH = os.path.join(APP_SETTINGS_DIR, SETTINGS_FILE_NAME)
 LOG_FILE_PATH = os.path.join(APP_SETTINGS_DIR, "server.log") # Define log file path here
+TRACE_FILE_PATH = os.path.join(APP_SETTINGS_DIR, "macro_trace.sbbtrace") # Ring file written by trace_recorder
+CAPTURE_DIR = os.path.join(APP_SETTINGS_DIR, "captures") # Raw packet captures written by packet_capture
+RECORDINGS_DIR = os.path.join(APP_SETTINGS_DIR, "recordings") # Key/mouse recordings written by macro_recorder
 
 # --- Default Settings ---
 DEFAULT_SETTINGS = {
@@ -59,7 +70,39 @@ DEFAULT_SETTINGS = {
     "autostart_enabled": False,
     "executable_path_for_autostart": "",
     "minimize_to_tray_on_exit": False,
-    "start_minimized_to_tray": False
+    "start_minimized_to_tray": False,
+    "input_event_spacing_ms": 0, # Delay between injected events in a batch; 0 sends each batch as one SendInput call
+    "timer_high_resolution_enabled": True, # Raise the Windows timer resolution to 1 ms while the server runs (less spinning in timed waits)
+    "macro_worker_count": 10, # Macro injection threads; applied to a running server without restart
+    "macro_queue_capacity": 32, # Macros waiting for a worker before new ones are shed
+    "macro_stale_ms": 500, # Macros that waited longer than this since receipt are dropped instead of run late
+    "macro_nack_enabled": False, # Answer shed macros with MACRO_NACK (needs an app version that knows it)
+    "scheduled_execution_enabled": False, # Run macros at their send time + playout delay instead of on arrival
+    "playout_delay_ms": 30, # Fixed delay that absorbs network jitter in scheduled execution
+    "recording_toggle_key": "scroll lock", # Starts and saves an armed macro recording (keyboard library key name)
+    "repeat_timeout_ms": 10000, # Longest a MACRO_REPEAT keeps tapping without a STOP or a renewed START
+    "late_policy": "execute", # Scheduled macros arriving after their due time: "execute" at once or "drop"
+    "mouse_move_frame_ms": 4, # Streamed mouse deltas arriving within one frame are injected as a single move
+    "axis_output_rate_hz": 100, # How often the current axis values are turned into key/mouse output
+    "axis_timeout_ms": 500, # An axis not updated for this long is treated as centred
+    "axis_mappings": { # Axis name -> output; key_pwm holds positive/negative for |value| of each period
+        "throttle": {"mode": "key_pwm", "positive": "w", "negative": "s", "periodMs": 100},
+        "strafe": {"mode": "key_pwm", "positive": "d", "negative": "a", "periodMs": 100},
+        "look_x": {"mode": "mouse_x", "speed": 800},
+        "look_y": {"mode": "mouse_y", "speed": 800}
+    },
+    "relay_enabled": False, # Forward routed macros to other StarButtonBox servers (see relay_forwarder)
+    "relay_targets": {}, # Target name -> "host:port", e.g. {"pc2": "192.168.1.12:58009"}
+    "relay_routes": [], # First matching rule wins, e.g. {"keys": ["f1"], "targets": ["pc2"], "local": false}
+    "relay_ack_timeout_ms": 250, # Hops silent for this long no longer hold back the phone's ACK
+    "trace_recording_enabled": False, # Per-packet timing trace (see trace_recorder / trace_analysis.py)
+    "trace_capacity_records": 65536, # Records kept in the trace ring file (48 bytes each)
+    "packet_capture_enabled": False, # Raw datagram capture for packet_replay.py; a new file per server start
+    "packet_capture_max_mb": 64, # Capture stops once the file reaches this size
+    "log_max_mb": 10, # server.log is rotated (and gzip-compressed) at this size...
+    "log_rotate_hours": 24, # ...or after this long, whichever comes first
+    "log_backup_count": 5, # Compressed segments kept (server.log.1.gz ... server.log.N.gz)
+    "log_packet_sample_rate": 20 # Only one in N per-packet log lines is written to the file
 }
 
 # --- Registry Settings for Auto-Start ---
@@ -67,75 +110,254 @@ AUTOSTART_REG_KEY_PATH = r"Software\Microsoft\Windows\CurrentVersion\Run"
 AUTOSTART_APP_NAME = "StarButtonBoxServer"
 
 
-def load_settings():
+# --- Settings store ---
+WRITE_BEHIND_DELAY_SECONDS = 0.5 # Debounce for writing changes back to disk
+MTIME_CHECK_INTERVAL_SECONDS = 1.0 # How often reads check the file for external edits
+
+class SettingsStore:
     """
-    Loads settings from the JSON file in the application data directory.
+    Process-wide settings, loaded from disk once and served from memory.
+    Changes are pushed to subscribers and written back after a short debounce,
+    atomically (temp file + rename). Edits made to the file by something else
+    are picked up by comparing its mtime, at most once per MTIME_CHECK_INTERVAL_SECONDS.
+    Subscribers are called in order on one notifier thread, never on the thread that
+    happened to read or write the settings (e.g. the receive loop noticing an external edit).
     """
-    if os.path.exists(SETTINGS_FILE_PATH):
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._settings = None
+        self._file_mtime = None
+        self._last_mtime_check = 0.0
+        self._dirty = False
+        self._write_failed = False # Last write-behind failed; pending changes stay dirty until one succeeds
+        self._save_timer = None
+        self._subscribers = []
+        self._notify_queue = queue.Queue()
+        self._notifier_thread = None
+
+    # --- Loading ---
+    def _read_file(self):
+        """Reads settings from disk merged over the defaults."""
+        if not os.path.exists(self.file_path):
+            logger.info(f"Settings file '{self.file_path}' not found. Using default settings and creating it.")
+            self._write_file(DEFAULT_SETTINGS.copy()) # Create with defaults
+            return DEFAULT_SETTINGS.copy()
         try:
-            with open(SETTINGS_FILE_PATH, 'r') as f:
+            with open(self.file_path, 'r') as f:
                 content = f.read()
-                if not content.strip():
-                    logger.info(f"Settings file '{SETTINGS_FILE_PATH}' is empty. Using defaults.")
-                    return DEFAULT_SETTINGS.copy()
-                # f.seek(0) # Not needed if reading all content first
-                settings_from_file = json.loads(content) # Use content directly
-                loaded_settings = DEFAULT_SETTINGS.copy()
-                loaded_settings.update(settings_from_file)
-                return loaded_settings
+            if not content.strip():
+                logger.info(f"Settings file '{self.file_path}' is empty. Using defaults.")
+                return DEFAULT_SETTINGS.copy()
+            loaded_settings = DEFAULT_SETTINGS.copy()
+            loaded_settings.update(json.loads(content))
+            return loaded_settings
         except json.JSONDecodeError:
-            logger.error(f"Could not decode JSON from '{SETTINGS_FILE_PATH}'. Using default settings.")
-            return DEFAULT_SETTINGS.copy()
+            logger.error(f"Could not decode JSON from '{self.file_path}'. Using default settings.")
         except Exception as e:
-            logger.error(f"Could not read settings file '{SETTINGS_FILE_PATH}': {e}. Using default settings.")
-            return DEFAULT_SETTINGS.copy()
-    else:
-        logger.info(f"Settings file '{SETTINGS_FILE_PATH}' not found. Using default settings and creating it.")
-        _save_settings_to_file(DEFAULT_SETTINGS.copy()) # Create with defaults
+            logger.error(f"Could not read settings file '{self.file_path}': {e}. Using default settings.")
         return DEFAULT_SETTINGS.copy()
 
+    def _current_mtime(self):
+        try:
+            return os.stat(self.file_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _ensure_loaded(self):
+        """Loads on first use, then reloads if the file was changed externally. Caller holds the lock."""
+        if self._settings is None:
+            self._settings = self._read_file()
+            self._file_mtime = self._current_mtime()
+            self._last_mtime_check = time.monotonic()
+            return {}
+        now = time.monotonic()
+        if self._dirty or now - self._last_mtime_check < MTIME_CHECK_INTERVAL_SECONDS:
+            return {}
+        self._last_mtime_check = now
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._file_mtime:
+            return {}
+        logger.info(f"Settings file '{self.file_path}' changed externally. Reloading.")
+        new_settings = self._read_file()
+        self._file_mtime = mtime
+        changed = {key: value for key, value in new_settings.items() if self._settings.get(key) != value}
+        self._settings = new_settings
+        return changed
+
+    # --- Reading ---
+    def get(self, key, default_value=None):
+        with self._lock:
+            changed = self._ensure_loaded()
+            value = self._settings.get(key, default_value if default_value is not None else DEFAULT_SETTINGS.get(key))
+        self._notify(changed)
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value # Callers must not mutate the store
+
+    def get_int(self, key):
+        try:
+            return int(self.get(key))
+        except (TypeError, ValueError):
+            logger.warning(f"Setting '{key}' is not an integer. Using default.")
+            return int(DEFAULT_SETTINGS[key])
+
+    def get_float(self, key):
+        try:
+            return float(self.get(key))
+        except (TypeError, ValueError):
+            logger.warning(f"Setting '{key}' is not a number. Using default.")
+            return float(DEFAULT_SETTINGS[key])
+
+    def get_bool(self, key):
+        return bool(self.get(key))
+
+    def get_str(self, key):
+        value = self.get(key)
+        return "" if value is None else str(value)
+
+    def snapshot(self):
+        """Returns a copy of all settings."""
+        with self._lock:
+            changed = self._ensure_loaded()
+            settings_copy = copy.deepcopy(self._settings)
+        self._notify(changed)
+        return settings_copy
+
+    # --- Writing ---
+    def update(self, **changes):
+        """
+        Applies changes in memory, notifies subscribers and schedules a write-behind.
+        Returns False if the last write to the settings file failed (the changes are kept
+        and written with the next attempt); flush() reports whether this write worked.
+        """
+        with self._lock:
+            external_changes = self._ensure_loaded()
+            changed = {key: value for key, value in changes.items() if self._settings.get(key) != value}
+            if changed:
+                self._settings.update(changed)
+                self._dirty = True
+                self._schedule_save()
+            write_failed = self._write_failed
+        external_changes.update(changed)
+        self._notify(external_changes)
+        return not write_failed
+
+    def _schedule_save(self):
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+        self._save_timer = threading.Timer(WRITE_BEHIND_DELAY_SECONDS, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def flush(self):
+        """Writes pending changes to disk now. Returns False if the write failed."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return True
+            if not self._write_file(self._settings):
+                self._write_failed = True
+                return False
+            self._write_failed = False
+            self._dirty = False
+            self._file_mtime = self._current_mtime()
+            return True
+
+    def _write_file(self, settings_dict):
+        """Writes the settings atomically: a temp file in the same directory replaces the real one."""
+        temp_path = self.file_path + ".tmp"
+        try:
+            settings_dir = os.path.dirname(self.file_path)
+            # Ensure directory exists before trying to write
+            if not os.path.exists(settings_dir):
+                logger.info(f"Settings directory {settings_dir} does not exist. Attempting to create.")
+                os.makedirs(settings_dir)
+
+            with open(temp_path, 'w') as f:
+                json.dump(settings_dict, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.file_path)
+            logger.info(f"Settings saved to '{self.file_path}'")
+            return True
+        except Exception as e:
+            logger.error(f"Could not save settings to '{self.file_path}': {e}")
+            try:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+    # --- Change notifications ---
+    def subscribe(self, callback):
+        """Registers callback(changed_settings_dict), called after in-memory or external changes."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def _notify(self, changed):
+        """Queues changed settings for the notifier thread."""
+        if not changed:
+            return
+        with self._lock:
+            self._notify_queue.put(copy.deepcopy(changed))
+            if self._notifier_thread is None:
+                self._notifier_thread = threading.Thread(target=self._run_notifier, name="SettingsNotifier", daemon=True)
+                self._notifier_thread.start()
+
+    def _run_notifier(self):
+        while True:
+            changed = self._notify_queue.get()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                try:
+                    callback(copy.deepcopy(changed))
+                except Exception as e:
+                    logger.error(f"Settings subscriber {callback} failed: {e}", exc_info=True)
+
+settings = SettingsStore(SETTINGS_FILE_PATH)
+atexit.register(settings.flush) # Don't lose a pending write-behind on exit
+
+
+def load_settings():
+    """
+    Returns a copy of the current settings (loaded from disk on first use).
+    """
+    return settings.snapshot()
+
 def save_settings(port=None, mdns_enabled=None, autostart_enabled=None, executable_path=None,
                   minimize_to_tray_on_exit=None, start_minimized_to_tray=None):
     """
-    Saves the provided settings to the JSON file in the application data directory.
+    Updates the given settings. They are written to the settings file shortly afterwards
+    (settings.flush() writes them at once and reports whether that worked).
+    Returns False if the settings file could not be written the last time it was tried.
     """
-    current_settings = load_settings() # Load current or defaults
-
+    changes = {}
     if port is not None:
-        current_settings["server_port"] = int(port)
+        changes["server_port"] = int(port)
     if mdns_enabled is not None:
-        current_settings["mdns_enabled"] = bool(mdns_enabled)
+        changes["mdns_enabled"] = bool(mdns_enabled)
     if autostart_enabled is not None:
-        current_settings["autostart_enabled"] = bool(autostart_enabled)
+        changes["autostart_enabled"] = bool(autostart_enabled)
     if executable_path is not None: # Should be the full path to the installed .exe
-        current_settings["executable_path_for_autostart"] = str(executable_path)
+        changes["executable_path_for_autostart"] = str(executable_path)
     if minimize_to_tray_on_exit is not None:
-        current_settings["minimize_to_tray_on_exit"] = bool(minimize_to_tray_on_exit)
+        changes["minimize_to_tray_on_exit"] = bool(minimize_to_tray_on_exit)
     if start_minimized_to_tray is not None:
-        current_settings["start_minimized_to_tray"] = bool(start_minimized_to_tray)
-
-    return _save_settings_to_file(current_settings)
+        changes["start_minimized_to_tray"] = bool(start_minimized_to_tray)
 
-def _save_settings_to_file(settings_dict):
-    """Internal helper to write the settings dictionary to the file."""
-    try:
-        # Ensure directory exists before trying to write
-        if not os.path.exists(APP_SETTINGS_DIR):
-            logger.info(f"Settings directory {APP_SETTINGS_DIR} does not exist. Attempting to create.")
-            os.makedirs(APP_SETTINGS_DIR)
-
-        with open(SETTINGS_FILE_PATH, 'w') as f:
-            json.dump(settings_dict, f, indent=4)
-        logger.info(f"Settings saved to '{SETTINGS_FILE_PATH}'")
-        return True
-    except Exception as e:
-        logger.error(f"Could not save settings to '{SETTINGS_FILE_PATH}': {e}")
-        return False
+    return settings.update(**changes)
 
 def get_setting(key, default_value=None):
     """Helper to get a specific setting."""
-    settings = load_settings()
-    return settings.get(key, default_value if default_value is not None else DEFAULT_SETTINGS.get(key))
+    return settings.get(key, default_value)
 
 
 def set_autostart_in_registry(enable: bool, executable_path_for_autostart: str):
@@ -143,6 +365,9 @@ def set_autostart_in_registry(enable: bool, executable_path_for_autostart: str):
     Configures the application to start with Windows.
     The executable_path_for_autostart should be the full path to the installed EXE.
     """
+    if winreg is None:
+        logger.warning("Autostart is only supported on Windows.")
+        return False
     if enable and not executable_path_for_autostart:
         logger.error("Cannot enable autostart: executable_path_for_autostart is missing.")
         return False
@@ -160,9 +385,7 @@ def set_autostart_in_registry(enable: bool, executable_path_for_autostart: str):
             # Example: "C:\Program Files (x86)\StarButtonBox Server\StarButtonBoxServer.exe" --start-minimized
             path_to_register = f'"{os.path.normpath(executable_path_for_autostart)}"'
             
-            # Load current settings to check start_minimized_to_tray
-            current_settings = load_settings()
-            if current_settings.get("start_minimized_to_tray", False):
+            if settings.get_bool("start_minimized_to_tray"):
                 path_to_register += " --start-minimized"
                 
             winreg.SetValueEx(key, AUTOSTART_APP_NAME, 0, winreg.REG_SZ, path_to_register)
@@ -193,14 +416,15 @@ if __name__ == '__main__':
     print("Settings File Path:", SETTINGS_FILE_PATH)
     print("Log File Path:", LOG_FILE_PATH)
 
-    settings = load_settings()
-    print(f"\nInitial/Loaded settings: {settings}")
+    current_settings = load_settings()
+    print(f"\nInitial/Loaded settings: {current_settings}")
 
     save_settings(port=5056, mdns_enabled=False)
-    settings = load_settings()
-    print(f"Modified settings: {settings}")
-    assert settings["server_port"] == 5056
-    assert settings["mdns_enabled"] is False
+    settings.flush()
+    current_settings = load_settings()
+    print(f"Modified settings: {current_settings}")
+    assert current_settings["server_port"] == 5056
+    assert current_settings["mdns_enabled"] is False
 
     # Test autostart (this will write to the current user's registry)
     # For a real test, you'd need a dummy executable path.
@@ -209,7 +433,7 @@ if __name__ == '__main__':
     print(f"\nTesting autostart with executable: {test_exe_path_for_autostart}")
     if set_autostart_in_registry(True, test_exe_path_for_autostart):
         print("  Autostart (likely) enabled. Check registry.")
-        settings = load_settings() # reload to see if executable_path_for_autostart was updated by save_settings
+        current_settings = load_settings() # reload to see if executable_path_for_autostart was updated by save_settings
         # Note: set_autostart_in_registry itself doesn't call save_settings for executable_path_for_autostart
         # That's typically handled by the GUI when the checkbox is toggled.
         # For this test, we'd manually save it if we wanted that field updated in JSON.
@@ -1,8 +1,8 @@
 # dialog_handler.py
 # Handles triggering the browser opening for the PC import feature.
 # Uses console output as the primary notification method.
+# Runs on the server's isolated worker, so it may block without stalling packet receipt.
 
-import threading
 import webbrowser
 import sys
 
@@ -27,11 +27,8 @@ def _open_browser_task(url):
         sys.stdout.flush()
 
 def trigger_pc_browser(url):
-    """Prints instructions and opens the browser in a separate thread."""
+    """Prints instructions and opens the browser. Blocks until webbrowser.open() returns."""
     print(f"  -> Triggering PC browser import process for URL: {url}")
     sys.stdout.flush()
-    # Run the browser opening in a separate thread to avoid blocking UDP listener
-    # Although webbrowser.open is often non-blocking, doing it in a thread is safer.
-    browser_thread = threading.Thread(target=_open_browser_task, args=(url,), name="BrowserOpenThread", daemon=True)
-    browser_thread.start()
+    _open_browser_task(url)
 
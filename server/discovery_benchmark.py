@@ -0,0 +1,99 @@
+# discovery_benchmark.py
+# Measures discovery-to-first-PONG time the way the phone sees it.
+# Starts the UDP server in-process with mDNS enabled, browses for the service
+# with a separate local Zeroconf resolver, then PINGs every advertised address
+# and reports how long resolution and the first PONG took.
+#
+# Usage: python discovery_benchmark.py [--port 58119] [--timeout 10]
+
+import argparse
+import json
+import logging
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from zeroconf import IPVersion, ServiceBrowser, ServiceListener, Zeroconf
+
+import config
+import server as server_control
+
+class _FirstServiceListener(ServiceListener):
+    """Remembers the first StarButtonBox service name seen by the browser."""
+    def __init__(self):
+        self.found_event = threading.Event()
+        self.name = None
+
+    def add_service(self, zc, type_, name):
+        if self.name is None:
+            self.name = name
+            self.found_event.set()
+
+    def update_service(self, zc, type_, name):
+        self.add_service(zc, type_, name)
+
+    def remove_service(self, zc, type_, name):
+        pass
+
+def _time_first_pong(ip, port, timeout_sec):
+    """Returns seconds until the first PONG from ip:port, or None on timeout."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout_sec)
+    packet = {"packetId": str(uuid.uuid4()), "timestamp": int(time.time() * 1000),
+              "type": config.PACKET_TYPE_HEALTH_CHECK_PING, "payload": None}
+    start = time.perf_counter()
+    try:
+        sock.sendto(json.dumps(packet, separators=(',', ':')).encode('utf-8'), (ip, port))
+        while True:
+            data, _ = sock.recvfrom(config.BUFFER_SIZE)
+            if json.loads(data.decode('utf-8')).get("packetId") == packet["packetId"]:
+                return time.perf_counter() - start
+    except (socket.timeout, OSError):
+        return None
+    finally:
+        sock.close()
+
+def run_benchmark(port, timeout_sec):
+    server_control.start_server(port, True, None, None)
+    resolver = Zeroconf(ip_version=IPVersion.V4Only)
+    listener = _FirstServiceListener()
+    try:
+        start = time.perf_counter()
+        browser = ServiceBrowser(resolver, config.MDNS_SERVICE_TYPE, listener)
+        if not listener.found_event.wait(timeout_sec):
+            print(f"Service not discovered within {timeout_sec:.0f}s", file=sys.stderr)
+            return False
+        browsed = time.perf_counter()
+        info = resolver.get_service_info(config.MDNS_SERVICE_TYPE, listener.name, timeout=int(timeout_sec * 1000))
+        resolved = time.perf_counter()
+        browser.cancel()
+        if info is None:
+            print(f"'{listener.name}' could not be resolved", file=sys.stderr)
+            return False
+
+        addresses = info.parsed_addresses()
+        print(f"Discovered '{listener.name}' in {(browsed - start) * 1000:.1f} ms, "
+              f"resolved in {(resolved - browsed) * 1000:.1f} ms")
+        print(f"Advertised {len(addresses)} address(es) on port {info.port}")
+        for ip in addresses:
+            pong_sec = _time_first_pong(ip, info.port, 2.0)
+            if pong_sec is None:
+                print(f"  {ip:>15}: no PONG")
+            else:
+                total_ms = (resolved - start + pong_sec) * 1000
+                print(f"  {ip:>15}: first PONG {pong_sec * 1000:6.2f} ms, discovery-to-PONG {total_ms:7.1f} ms")
+        return True
+    finally:
+        resolver.close()
+        server_control.stop_server()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox discovery-to-first-PONG benchmark")
+    parser.add_argument("--port", type=int, default=58119)
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for discovery")
+    args = parser.parse_args()
+
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    sys.exit(0 if run_benchmark(args.port, args.timeout) else 1)
@@ -0,0 +1,266 @@
+# input_backend.py
+# Low-level input injection backends used by input_simulator.
+# Events are submitted in batches so that a whole chord (modifiers down,
+# key down/up, modifiers up) reaches the OS as one SendInput array instead of
+# one pydirectinput call (and one PAUSE delay) per event.
+
+import ctypes
+import sys
+import time
+import threading
+import logging
+
+import key_codes
+import precise_timing
+
+logger = logging.getLogger("StarButtonBoxInputBackend")
+
+# --- Event representation ---
+# Each event is a small tuple: (kind, code, value)
+#   EVENT_KEY:          (EVENT_KEY, key_codes code, is_down)
+#   EVENT_MOUSE_BUTTON: (EVENT_MOUSE_BUTTON, macro_compiler.MOUSE_* id, is_down)
+#   EVENT_MOUSE_SCROLL: (EVENT_MOUSE_SCROLL, None, +1 / -1 wheel notch)
+#   EVENT_MOUSE_MOVE:   (EVENT_MOUSE_MOVE, dx, dy) relative movement in mickeys
+#   EVENT_MOUSE_MOVE_TO: (EVENT_MOUSE_MOVE_TO, x, y) absolute cursor position in virtual desktop pixels
+EVENT_KEY = 0
+EVENT_MOUSE_BUTTON = 1
+EVENT_MOUSE_SCROLL = 2
+EVENT_MOUSE_MOVE = 3
+EVENT_MOUSE_MOVE_TO = 4
+
+def key_down(code):
+    return (EVENT_KEY, code, True)
+
+def key_up(code):
+    return (EVENT_KEY, code, False)
+
+def mouse_down(button):
+    return (EVENT_MOUSE_BUTTON, button, True)
+
+def mouse_up(button):
+    return (EVENT_MOUSE_BUTTON, button, False)
+
+def mouse_move(dx, dy):
+    return (EVENT_MOUSE_MOVE, dx, dy)
+
+def mouse_move_to(x, y):
+    return (EVENT_MOUSE_MOVE_TO, x, y)
+
+def scroll(clicks):
+    """Returns one wheel event per notch, matching how pydirectinput scrolls."""
+    direction = 1 if clicks > 0 else -1
+    return [(EVENT_MOUSE_SCROLL, None, direction)] * abs(clicks)
+
+# --- Win32 SendInput structures ---
+INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
+KEYEVENTF_EXTENDEDKEY = 0x0001
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_SCANCODE = 0x0008
+MOUSEEVENTF_MOVE = 0x0001
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_RIGHTDOWN = 0x0008
+MOUSEEVENTF_RIGHTUP = 0x0010
+MOUSEEVENTF_MIDDLEDOWN = 0x0020
+MOUSEEVENTF_MIDDLEUP = 0x0040
+MOUSEEVENTF_WHEEL = 0x0800
+MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_ABSOLUTE = 0x8000
+WHEEL_DELTA = 120
+SM_XVIRTUALSCREEN = 76 # GetSystemMetrics indices of the virtual desktop (all monitors) rectangle
+SM_YVIRTUALSCREEN = 77
+SM_CXVIRTUALSCREEN = 78
+SM_CYVIRTUALSCREEN = 79
+
+# Indexed by macro_compiler.MOUSE_LEFT / MOUSE_RIGHT / MOUSE_MIDDLE
+MOUSE_BUTTON_FLAGS = (
+    (MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP),
+    (MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP),
+    (MOUSEEVENTF_MIDDLEDOWN, MOUSEEVENTF_MIDDLEUP),
+)
+
+class _KeyBdInput(ctypes.Structure):
+    _fields_ = [("wVk", ctypes.c_ushort), ("wScan", ctypes.c_ushort), ("dwFlags", ctypes.c_ulong),
+                ("time", ctypes.c_ulong), ("dwExtraInfo", ctypes.c_void_p)]
+
+class _HardwareInput(ctypes.Structure):
+    _fields_ = [("uMsg", ctypes.c_ulong), ("wParamL", ctypes.c_short), ("wParamH", ctypes.c_ushort)]
+
+class _MouseInput(ctypes.Structure):
+    _fields_ = [("dx", ctypes.c_long), ("dy", ctypes.c_long), ("mouseData", ctypes.c_ulong),
+                ("dwFlags", ctypes.c_ulong), ("time", ctypes.c_ulong), ("dwExtraInfo", ctypes.c_void_p)]
+
+class _InputUnion(ctypes.Union):
+    _fields_ = [("ki", _KeyBdInput), ("mi", _MouseInput), ("hi", _HardwareInput)]
+
+class _Input(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_ulong), ("ii", _InputUnion)]
+
+
+class SendInputBackend:
+    """
+    Injects events through user32.SendInput.
+    With event_spacing_ms == 0 a batch is submitted as a single INPUT array (one syscall).
+    Games that drop events delivered in the same frame can set a spacing, in which
+    case events are submitted one at a time with that delay between them.
+    """
+    def __init__(self, event_spacing_ms=0.0):
+        self._send_input = ctypes.windll.user32.SendInput
+        self._get_system_metrics = ctypes.windll.user32.GetSystemMetrics
+        self.event_spacing_ms = event_spacing_ms
+
+    def _normalize(self, x, y):
+        """Maps virtual desktop pixels to the 0..65535 range of MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK."""
+        left, top = self._get_system_metrics(SM_XVIRTUALSCREEN), self._get_system_metrics(SM_YVIRTUALSCREEN)
+        width, height = self._get_system_metrics(SM_CXVIRTUALSCREEN), self._get_system_metrics(SM_CYVIRTUALSCREEN)
+        nx = (x - left) * 65535 // max(width - 1, 1)
+        ny = (y - top) * 65535 // max(height - 1, 1)
+        return min(max(nx, 0), 65535), min(max(ny, 0), 65535)
+
+    def _to_input(self, event):
+        kind, code, value = event
+        if kind == EVENT_KEY:
+            flags = KEYEVENTF_SCANCODE
+            if key_codes.is_extended(code):
+                flags |= KEYEVENTF_EXTENDEDKEY
+            if not value:
+                flags |= KEYEVENTF_KEYUP
+            return _Input(INPUT_KEYBOARD, _InputUnion(ki=_KeyBdInput(0, key_codes.scancode_of(code), flags, 0, None)))
+        if kind == EVENT_MOUSE_BUTTON:
+            down_flag, up_flag = MOUSE_BUTTON_FLAGS[code]
+            flags = down_flag if value else up_flag
+            return _Input(INPUT_MOUSE, _InputUnion(mi=_MouseInput(0, 0, 0, flags, 0, None)))
+        if kind == EVENT_MOUSE_SCROLL:
+            wheel = ctypes.c_ulong(WHEEL_DELTA * value).value # Negative deltas wrap as DWORD
+            return _Input(INPUT_MOUSE, _InputUnion(mi=_MouseInput(0, 0, wheel, MOUSEEVENTF_WHEEL, 0, None)))
+        if kind == EVENT_MOUSE_MOVE:
+            # Relative: subject to the user's pointer speed/acceleration, like a physical mouse
+            return _Input(INPUT_MOUSE, _InputUnion(mi=_MouseInput(code, value, 0, MOUSEEVENTF_MOVE, 0, None)))
+        if kind == EVENT_MOUSE_MOVE_TO:
+            # Absolute: lands exactly where requested, whatever the pointer speed/acceleration
+            nx, ny = self._normalize(code, value)
+            flags = MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK
+            return _Input(INPUT_MOUSE, _InputUnion(mi=_MouseInput(nx, ny, 0, flags, 0, None)))
+        raise ValueError(f"Unknown input event kind {kind}")
+
+    def _submit(self, inputs):
+        count = len(inputs)
+        array = (_Input * count)(*inputs)
+        inserted = self._send_input(count, array, ctypes.sizeof(_Input))
+        if inserted != count:
+            logger.warning(f"SendInput inserted {inserted}/{count} events (input blocked by another thread?)")
+
+    def send(self, events):
+        """Submits a batch of events in order."""
+        if not events:
+            return
+        inputs = [self._to_input(event) for event in events]
+        if self.event_spacing_ms <= 0:
+            self._submit(inputs)
+            return
+        spacing_ns = int(self.event_spacing_ms * 1_000_000)
+        start_ns = time.perf_counter_ns()
+        for index, single_input in enumerate(inputs):
+            if index:
+                precise_timing.wait_until(start_ns + index * spacing_ns) # From the first event, so delays do not add up
+            self._submit([single_input])
+
+
+class RecordingBackend:
+    """
+    Backend that records batches instead of injecting them.
+    Used for measurements and for running the server on machines without SendInput.
+    """
+    def __init__(self, event_spacing_ms=0.0):
+        self.event_spacing_ms = event_spacing_ms
+        self._lock = threading.Lock()
+        self.batches = [] # List of (perf_counter_ns, tuple_of_events)
+
+    def send(self, events):
+        if not events:
+            return
+        if self.event_spacing_ms > 0 and len(events) > 1:
+            precise_timing.sleep(self.event_spacing_ms * (len(events) - 1) / 1000.0)
+        with self._lock:
+            self.batches.append((time.perf_counter_ns(), tuple(events)))
+
+    @property
+    def call_count(self):
+        return len(self.batches)
+
+    @property
+    def event_count(self):
+        return sum(len(events) for _, events in self.batches)
+
+    def reset(self):
+        with self._lock:
+            self.batches.clear()
+
+
+# --- Active backend ---
+_active_backend = None
+_backend_lock = threading.Lock()
+
+def _create_default_backend(event_spacing_ms=0.0):
+    if sys.platform == "win32":
+        try:
+            return SendInputBackend(event_spacing_ms)
+        except Exception as e:
+            logger.error(f"Could not initialize SendInput backend: {e}. Falling back to recording backend.")
+    else:
+        logger.warning("SendInput is only available on Windows. Input will be recorded, not injected.")
+    return RecordingBackend(event_spacing_ms)
+
+def get_backend():
+    """Returns the active backend, creating the platform default on first use."""
+    global _active_backend
+    if _active_backend is None:
+        with _backend_lock:
+            if _active_backend is None:
+                _active_backend = _create_default_backend()
+    return _active_backend
+
+def set_backend(backend):
+    """Replaces the active backend (e.g. with a RecordingBackend for measurements)."""
+    global _active_backend
+    with _backend_lock:
+        _active_backend = backend
+
+def configure(event_spacing_ms=None):
+    """Applies tunables to the active backend."""
+    backend = get_backend()
+    if event_spacing_ms is not None:
+        backend.event_spacing_ms = max(0.0, float(event_spacing_ms))
+        logger.info(f"Input event spacing set to {backend.event_spacing_ms} ms.")
+
+def send(events):
+    get_backend().send(events)
+
+if __name__ == '__main__':
+    # Measures a two-modifier tap through input_simulator with the recording backend
+    # and compares it against one pydirectinput call per event.
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    import input_backend # input_simulator sees the imported module, not __main__
+    import input_simulator
+    import macro_compiler
+
+    PYDIRECTINPUT_PAUSE_SECONDS = 0.1 # pydirectinput.PAUSE default, applied after every call
+    recorder = input_backend.RecordingBackend()
+    input_backend.set_backend(recorder)
+
+    action = macro_compiler.compile_payload(
+        '{"type":"key_event","key":"y","modifiers":["altright","shiftleft"],"pressType":{"type":"tap"}}')
+    iterations = 200
+    start_ns = time.perf_counter_ns()
+    for i in range(iterations):
+        input_simulator.process_macro_in_thread(action, f"bench-{i}", time.perf_counter_ns())
+    elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000.0
+
+    calls_per_macro = recorder.call_count / iterations
+    events_per_macro = recorder.event_count / iterations
+    print(f"\nBatched: {calls_per_macro:.1f} SendInput call(s), {events_per_macro:.1f} events per macro, "
+          f"{elapsed_ms / iterations:.3f} ms per macro (including logging)")
+    print(f"Per-call pydirectinput (one call per event): {events_per_macro:.0f} calls per macro, "
+          f">= {events_per_macro * PYDIRECTINPUT_PAUSE_SECONDS * 1000:.0f} ms per macro in PAUSE delays alone")
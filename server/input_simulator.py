@@ -1,204 +1,316 @@
 # input_simulator.py
-# Functions for simulating keyboard and mouse input using pydirectinput.
-# Now includes the function to process macro commands in a thread
+# Functions for simulating keyboard and mouse input through input_backend.
+# Executes macro commands compiled by macro_compiler in a worker thread
 # and logs server-side processing latency.
 
-import pydirectinput
 import time
 import sys
-import json 
+import threading
+
+import input_backend
+import key_codes
+import macro_compiler
+import macro_recorder
+import precise_timing
+
+# --- Shared modifier state ---
+# Macros run concurrently on the executor, so two of them may hold the same
+# modifier (e.g. 'shiftleft') at once. Each modifier is reference counted:
+# it goes down for the first user and only comes up when the last user releases it.
+# Counts are updated under _modifier_lock, but batches are sent after releasing it,
+# so a spaced batch (input_event_spacing_ms) never holds up other macros. Batches
+# that press or release a modifier take a ticket under the lock and are sent in
+# ticket order, so modifier downs/ups still reach the OS in the order the counts
+# were updated; batches without modifier transitions are sent right away.
+_modifier_lock = threading.Lock()
+_modifier_refcounts = {}
+_next_ticket = 0 # Guarded by _modifier_lock
+_send_order = threading.Condition()
+_serving_ticket = 0 # Guarded by _send_order
+
+# Modifier keys in recorded macros share the reference counts above, so a playback
+# releasing shift does not lift it under a macro that is holding it, and vice versa
+_RECORDED_MODIFIERS = frozenset(key_codes.KEY_CODES[name] for name in (
+    "shiftleft", "shiftright", "ctrlleft", "ctrlright", "altleft", "altright", "winleft", "winright"))
+
+_playback_stop_event = None # Set by the server when it stops; aborts recorded macro playback
+
+def set_playback_stop_event(stop_event):
+    """Registers the event that aborts recorded macros still playing (the server's stop event)."""
+    global _playback_stop_event
+    _playback_stop_event = stop_event
+
+def _acquire_modifier_events(modifiers):
+    """
+    Takes a reference on each modifier. Must be called with _modifier_lock held.
+    Returns (held_modifiers, events) where events only contains key downs for
+    modifiers that were not already held by another macro.
+    """
+    held = []
+    events = []
+    for mod_key in modifiers:
+        count = _modifier_refcounts.get(mod_key, 0)
+        if count == 0:
+            events.append(input_backend.key_down(mod_key))
+        _modifier_refcounts[mod_key] = count + 1
+        held.append(mod_key)
+    return held, events
+
+def _release_modifier_events(held_modifiers):
+    """
+    Drops references taken by _acquire_modifier_events(), in reverse order.
+    Must be called with _modifier_lock held. Returns key ups for modifiers whose count reached zero.
+    """
+    events = []
+    for mod_key in reversed(held_modifiers):
+        count = _modifier_refcounts.get(mod_key, 0) - 1
+        if count > 0:
+            _modifier_refcounts[mod_key] = count
+            continue
+        _modifier_refcounts.pop(mod_key, None)
+        events.append(input_backend.key_up(mod_key))
+    return events
+
+def _take_ticket(transitions):
+    """Returns a send ticket if the batch changes modifier state, else None. Must be called with _modifier_lock held."""
+    global _next_ticket
+    if not transitions:
+        return None
+    ticket = _next_ticket
+    _next_ticket += 1
+    return ticket
+
+def _send_in_order(events, ticket):
+    """Sends a batch; one with a ticket waits until every batch with an earlier ticket was sent."""
+    global _serving_ticket
+    if ticket is None:
+        input_backend.send(events)
+        return
+    with _send_order:
+        _send_order.wait_for(lambda: _serving_ticket == ticket)
+    try:
+        input_backend.send(events)
+    finally:
+        with _send_order:
+            _serving_ticket += 1
+            _send_order.notify_all()
+
+def _send_action(modifiers, action_events):
+    """Sends modifiers down, the action and modifiers up as a single batch (taps, clicks, scrolls)."""
+    with _modifier_lock:
+        held, downs = _acquire_modifier_events(modifiers)
+        ups = _release_modifier_events(held)
+        ticket = _take_ticket(downs or ups)
+    _send_in_order(downs + list(action_events) + ups, ticket)
+
+def _begin_action(modifiers, action_events):
+    """
+    Sends modifiers down plus the start of a held action as one batch.
+    Returns the held modifiers, which must be passed to _end_action().
+    """
+    with _modifier_lock:
+        held, downs = _acquire_modifier_events(modifiers)
+        ticket = _take_ticket(downs)
+    try:
+        _send_in_order(downs + list(action_events), ticket)
+    except Exception:
+        with _modifier_lock:
+            _release_modifier_events(held) # Nothing was pressed, just drop the references
+        raise
+    return held
+
+def _end_action(held_modifiers, action_events):
+    """Sends the end of a held action plus the matching modifier ups as one batch."""
+    with _modifier_lock:
+        ups = _release_modifier_events(held_modifiers)
+        ticket = _take_ticket(ups)
+    _send_in_order(list(action_events) + ups, ticket)
+
+# --- Single presses for timeline-driven callers (turbo_repeat) ---
+# Run on the caller's thread and print nothing, so a repeat at 20 Hz does not log every tap.
+
+def _press_events(compiled):
+    """Returns (down events, up events) of a compiled action; a scroll is all 'down'. Raises ValueError for other kinds."""
+    kind, code = compiled[0], compiled[1]
+    if kind == macro_compiler.ACTION_KEY_EVENT:
+        return [input_backend.key_down(code)], [input_backend.key_up(code)]
+    if kind == macro_compiler.ACTION_MOUSE_EVENT:
+        return [input_backend.mouse_down(code)], [input_backend.mouse_up(code)]
+    if kind == macro_compiler.ACTION_MOUSE_SCROLL:
+        return input_backend.scroll(code), []
+    raise ValueError(f"action kind {kind} cannot be tapped or pressed singly")
+
+def tap(compiled):
+    """Sends one tap of a compiled action, modifiers included, as a single batch (its press kind is ignored)."""
+    down, up = _press_events(compiled)
+    _send_action(compiled[2], down + up)
+
+def press(compiled):
+    """Presses a compiled key or mouse action with its modifiers. Returns the held modifiers for release()."""
+    down, _ = _press_events(compiled)
+    return _begin_action(compiled[2], down)
+
+def release(compiled, held_modifiers):
+    """Ends a press() of the same compiled action."""
+    _, up = _press_events(compiled)
+    _end_action(held_modifiers, up)
+
+def _recorded_sender():
+    """
+    Returns send(batch) for one playback of a recorded macro. Modifier downs and ups take and
+    drop references like macro modifiers do; downs of a modifier the playback already holds
+    (keyboard auto-repeat) and ups of one it never pressed are left out.
+    """
+    held = [] # Modifiers this playback holds a reference on
+
+    def send(events):
+        batch = []
+        transitions = False
+        with _modifier_lock:
+            for event in events:
+                kind, code, is_down = event
+                if kind != input_backend.EVENT_KEY or code not in _RECORDED_MODIFIERS:
+                    batch.append(event)
+                elif is_down and code not in held:
+                    taken, downs = _acquire_modifier_events([code])
+                    held.extend(taken)
+                    batch.extend(downs)
+                    transitions = transitions or bool(downs)
+                elif not is_down and code in held:
+                    held.remove(code)
+                    ups = _release_modifier_events([code])
+                    batch.extend(ups)
+                    transitions = transitions or bool(ups)
+            ticket = _take_ticket(transitions)
+        _send_in_order(batch, ticket)
+    return send
 
 def _log_server_latency(event_type, packet_id, packet_decoded_time_ns, action_execution_start_time_ns):
     """Helper function to log the calculated server-side processing latency."""
     if packet_decoded_time_ns is None or action_execution_start_time_ns is None:
         print(f"    -> THREAD (ID: {packet_id}): Latency timing data incomplete for {event_type}.", file=sys.stderr)
         return
-    
+
     processing_latency_ms = (action_execution_start_time_ns - packet_decoded_time_ns) / 1_000_000.0
     print(f"    -> THREAD (ID: {packet_id}): Server-side latency for {event_type} to action start: {processing_latency_ms:.3f} ms")
     sys.stdout.flush()
 
-def execute_key_event(data, packet_decoded_time_ns, packet_id_for_log):
-    """Handles 'key_event' actions from the parsed JSON data."""
-    key = data.get('key')
-    modifiers = data.get('modifiers', [])
-    press_type_data = data.get('pressType', {})
-    press_type = press_type_data.get('type', 'tap')
-    duration_ms = press_type_data.get('durationMs')
-
-    if not key:
-        print("    -> Error (input_simulator): 'key' field missing.", file=sys.stderr)
-        sys.stdout.flush()
-        return
-
-    # Press modifiers down (these are preparatory, not the primary action for latency timing)
-    for mod_key in modifiers:
-        try:
-            pydirectinput.keyDown(mod_key)
-        except Exception as mod_e:
-            print(f"    -> Warning (input_simulator): Failed modifier down '{mod_key}': {mod_e}", file=sys.stderr)
-            sys.stdout.flush()
+def execute_key_event(compiled, packet_decoded_time_ns, packet_id_for_log):
+    """Handles compiled 'key_event' actions. Returns the perf_counter_ns() time injection started, or None on error."""
+    _, key_code, modifiers, press_kind, duration_ms = compiled
+    description = macro_compiler.describe(compiled)
     try:
         # Execute main key action
         action_execution_start_time_ns = time.perf_counter_ns()
-        _log_server_latency(f"key_event ({press_type} '{key}')", packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
+        _log_server_latency(description, packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
 
-        if press_type == 'tap':
-            print(f"    -> Simulating key tap: '{key}' mods {modifiers}")
-            sys.stdout.flush()
-            pydirectinput.press(key)
-        elif press_type == 'hold' and duration_ms is not None:
-            duration_sec = duration_ms / 1000.0
-            if duration_sec <= 0:
-                print(f"    -> Warning (input_simulator): Invalid hold duration ({duration_ms}ms). Tapping.", file=sys.stderr)
-                sys.stdout.flush()
-                pydirectinput.press(key) # Fallback to tap
-            else:
-                print(f"    -> Simulating key hold: '{key}' for {duration_sec:.2f}s mods {modifiers}")
-                sys.stdout.flush()
-                pydirectinput.keyDown(key)
-                time.sleep(duration_sec)
-                pydirectinput.keyUp(key)
-        else:
-            print(f"    -> Warning (input_simulator): Invalid pressType/duration for key. Tapping.", file=sys.stderr)
-            sys.stdout.flush()
-            pydirectinput.press(key) # Fallback to tap
-    except Exception as action_e:
-        print(f"    -> Error (input_simulator): executing key action '{key}': {action_e}", file=sys.stderr)
+        print(f"    -> Simulating {description}")
         sys.stdout.flush()
-    finally:
-        # Release modifiers in reverse order
-        for mod_key in reversed(modifiers):
+        if press_kind == macro_compiler.PRESS_HOLD:
+            held_modifiers = _begin_action(modifiers, [input_backend.key_down(key_code)])
             try:
-                pydirectinput.keyUp(mod_key)
-            except Exception as mod_e:
-                print(f"    -> Warning (input_simulator): Failed modifier up '{mod_key}': {mod_e}", file=sys.stderr)
-                sys.stdout.flush()
-
-def execute_mouse_event(data, packet_decoded_time_ns, packet_id_for_log):
-    """Handles 'mouse_event' actions from the parsed JSON data."""
-    button_str = data.get('button')
-    press_type_data = data.get('pressType', {})
-    press_type = press_type_data.get('type', 'tap')
-    duration_ms = press_type_data.get('durationMs')
-    modifiers = data.get('modifiers', [])
-    button_map = {"LEFT": "left", "RIGHT": "right", "MIDDLE": "middle"}
-    button = button_map.get(button_str)
-
-    if not button:
-        print(f"    -> Error (input_simulator): Invalid mouse button '{button_str}'", file=sys.stderr)
+                precise_timing.sleep(duration_ms / 1000.0)
+            finally:
+                _end_action(held_modifiers, [input_backend.key_up(key_code)])
+        else:
+            _send_action(modifiers, [input_backend.key_down(key_code), input_backend.key_up(key_code)])
+        return action_execution_start_time_ns
+    except Exception as action_e:
+        print(f"    -> Error (input_simulator): executing {description}: {action_e}", file=sys.stderr)
         sys.stdout.flush()
-        return
 
-    # Press modifiers down
-    for mod_key in modifiers:
-        try:
-            pydirectinput.keyDown(mod_key)
-        except Exception as mod_e:
-            print(f"    -> Warning (input_simulator): Failed modifier down '{mod_key}': {mod_e}", file=sys.stderr)
-            sys.stdout.flush()
+def execute_mouse_event(compiled, packet_decoded_time_ns, packet_id_for_log):
+    """Handles compiled 'mouse_event' actions. Returns the perf_counter_ns() time injection started, or None on error."""
+    _, button, modifiers, press_kind, duration_ms = compiled
+    description = macro_compiler.describe(compiled)
     try:
         # Execute main mouse action
         action_execution_start_time_ns = time.perf_counter_ns()
-        _log_server_latency(f"mouse_event ({press_type} '{button}')", packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
-        
-        if press_type == 'tap':
-            print(f"    -> Simulating mouse click: '{button}' mods {modifiers}")
-            sys.stdout.flush()
-            pydirectinput.click(button=button)
-        elif press_type == 'hold' and duration_ms is not None:
-            duration_sec = duration_ms / 1000.0
-            if duration_sec <= 0:
-                 print(f"    -> Warning (input_simulator): Invalid hold duration ({duration_ms}ms). Clicking.", file=sys.stderr)
-                 sys.stdout.flush()
-                 pydirectinput.click(button=button) # Fallback to click
-            else:
-                print(f"    -> Simulating mouse hold: '{button}' for {duration_sec:.2f}s mods {modifiers}")
-                sys.stdout.flush()
-                pydirectinput.mouseDown(button=button)
-                time.sleep(duration_sec)
-                pydirectinput.mouseUp(button=button)
-        else:
-             print(f"    -> Warning (input_simulator): Invalid pressType/duration for mouse. Clicking.", file=sys.stderr)
-             sys.stdout.flush()
-             pydirectinput.click(button=button) # Fallback to click
-    except Exception as mouse_e:
-        print(f"    -> Error (input_simulator): executing mouse action '{button}': {mouse_e}", file=sys.stderr)
+        _log_server_latency(description, packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
+
+        print(f"    -> Simulating {description}")
         sys.stdout.flush()
-    finally:
-        # Release modifiers in reverse order
-        for mod_key in reversed(modifiers):
+        if press_kind == macro_compiler.PRESS_HOLD:
+            held_modifiers = _begin_action(modifiers, [input_backend.mouse_down(button)])
             try:
-                pydirectinput.keyUp(mod_key)
-            except Exception as mod_e:
-                print(f"    -> Warning (input_simulator): Failed modifier up '{mod_key}': {mod_e}", file=sys.stderr)
-                sys.stdout.flush()
-
-def execute_mouse_scroll(data, packet_decoded_time_ns, packet_id_for_log):
-    """Handles 'mouse_scroll' actions from the parsed JSON data."""
-    direction = data.get('direction')
-    clicks = data.get('clicks', 1)
-    modifiers = data.get('modifiers', [])
-    scroll_amount = clicks if direction == "UP" else -clicks if direction == "DOWN" else 0
-
-    if scroll_amount == 0:
-        print(f"    -> Error (input_simulator): Invalid scroll direction '{direction}'", file=sys.stderr)
+                precise_timing.sleep(duration_ms / 1000.0)
+            finally:
+                _end_action(held_modifiers, [input_backend.mouse_up(button)])
+        else:
+            _send_action(modifiers, [input_backend.mouse_down(button), input_backend.mouse_up(button)])
+        return action_execution_start_time_ns
+    except Exception as mouse_e:
+        print(f"    -> Error (input_simulator): executing {description}: {mouse_e}", file=sys.stderr)
         sys.stdout.flush()
-        return
 
-    # Press modifiers down
-    for mod_key in modifiers:
-        try:
-            pydirectinput.keyDown(mod_key)
-        except Exception as mod_e:
-            print(f"    -> Warning (input_simulator): Failed modifier down '{mod_key}': {mod_e}", file=sys.stderr)
-            sys.stdout.flush()
+def execute_mouse_scroll(compiled, packet_decoded_time_ns, packet_id_for_log):
+    """Handles compiled 'mouse_scroll' actions. Returns the perf_counter_ns() time injection started, or None on error."""
+    _, scroll_amount, modifiers, _, _ = compiled
+    description = macro_compiler.describe(compiled)
     try:
         # Execute scroll action
         action_execution_start_time_ns = time.perf_counter_ns()
-        _log_server_latency(f"mouse_scroll (dir '{direction}')", packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
+        _log_server_latency(description, packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
 
-        print(f"    -> Simulating mouse scroll: dir '{direction}', clicks {clicks} mods {modifiers}")
+        print(f"    -> Simulating {description}")
         sys.stdout.flush()
-        pydirectinput.scroll(scroll_amount)
+        _send_action(modifiers, input_backend.scroll(scroll_amount))
+        return action_execution_start_time_ns
     except Exception as scroll_e:
-        print(f"    -> Error (input_simulator): executing mouse scroll: {scroll_e}", file=sys.stderr)
+        print(f"    -> Error (input_simulator): executing {description}: {scroll_e}", file=sys.stderr)
         sys.stdout.flush()
-    finally:
-        # Release modifiers in reverse order
-        for mod_key in reversed(modifiers):
-            try:
-                pydirectinput.keyUp(mod_key)
-            except Exception as mod_e:
-                print(f"    -> Warning (input_simulator): Failed modifier up '{mod_key}': {mod_e}", file=sys.stderr)
-                sys.stdout.flush()
 
-def process_macro_in_thread(action_data_str, packet_id_for_log, packet_decoded_time_ns):
+def execute_recorded_macro(compiled, packet_decoded_time_ns, packet_id_for_log):
+    """Handles compiled 'recorded_macro' actions (see macro_recorder). Returns as the other executors."""
+    name = compiled[1]
+    try:
+        action_execution_start_time_ns = time.perf_counter_ns()
+        _log_server_latency(f"recording '{name}'", packet_id_for_log, packet_decoded_time_ns, action_execution_start_time_ns)
+
+        print(f"    -> Playing recording '{name}'")
+        sys.stdout.flush()
+        result = macro_recorder.play(name, _playback_stop_event, _recorded_sender())
+        if result["aborted"]:
+            print(f"    -> Stopped playing '{name}' (server stopping)")
+            sys.stdout.flush()
+            return action_execution_start_time_ns
+        print(f"    -> Played '{name}': {result['events']} event(s) in {result['batches']} batch(es), "
+              f"late avg {result['avg_late_us']:.0f}/p99 {result['p99_late_us']:.0f}/max {result['max_late_us']:.0f} us, "
+              f"drift {result['drift_us']:+.0f} us")
+        return action_execution_start_time_ns
+    except FileNotFoundError:
+        print(f"    -> Error (input_simulator): no recording named '{name}'", file=sys.stderr)
+    except Exception as play_e:
+        print(f"    -> Error (input_simulator): playing recording '{name}': {play_e}", file=sys.stderr)
+    sys.stdout.flush()
+
+_EXECUTORS = {
+    macro_compiler.ACTION_KEY_EVENT: execute_key_event,
+    macro_compiler.ACTION_MOUSE_EVENT: execute_mouse_event,
+    macro_compiler.ACTION_MOUSE_SCROLL: execute_mouse_scroll,
+    macro_compiler.ACTION_RECORDED_MACRO: execute_recorded_macro,
+}
+
+def process_macro_in_thread(compiled_action, packet_id_for_log, packet_decoded_time_ns):
     """
-    Processes and executes the macro command in a separate thread.
+    Executes a compiled macro command (see macro_compiler) in a worker thread.
     Receives the initial packet_decoded_time_ns from the main server thread.
+    Returns (inject_start_ns, inject_end_ns), or None if the action failed.
     """
+    action_subtype = macro_compiler.ACTION_KIND_NAMES[compiled_action[0]]
     try:
-        action_data = json.loads(action_data_str) 
-        action_subtype = action_data.get('type')
         # Log when thread starts processing, not the latency yet
         print(f"    THREAD (ID: {packet_id_for_log}): Starting processing of {action_subtype}")
         sys.stdout.flush()
 
-        if action_subtype == 'key_event':
-            execute_key_event(action_data, packet_decoded_time_ns, packet_id_for_log)
-        elif action_subtype == 'mouse_event':
-            execute_mouse_event(action_data, packet_decoded_time_ns, packet_id_for_log)
-        elif action_subtype == 'mouse_scroll':
-            execute_mouse_scroll(action_data, packet_decoded_time_ns, packet_id_for_log)
-        else:
-            print(f"    THREAD (ID: {packet_id_for_log}): Warning: Unknown action subtype '{action_subtype}'...", file=sys.stderr)
-        
+        inject_start_ns = _EXECUTORS[compiled_action[0]](compiled_action, packet_decoded_time_ns, packet_id_for_log)
+        inject_end_ns = time.perf_counter_ns()
+
         print(f"    THREAD (ID: {packet_id_for_log}): Finished processing of {action_subtype}")
         sys.stdout.flush()
-
-    except json.JSONDecodeError as e:
-        print(f"    THREAD (ID: {packet_id_for_log}): Error decoding action_data in thread: {e}", file=sys.stderr)
+        if inject_start_ns is not None:
+            return inject_start_ns, inject_end_ns
     except Exception as e:
         print(f"    THREAD (ID: {packet_id_for_log}): Error during input simulation in thread: {e}", file=sys.stderr)
     sys.stdout.flush()
+    return None
@@ -0,0 +1,102 @@
+# isolated_worker.py
+# A persistent single-thread worker for handlers that call into the GUI, the browser
+# or the OS (webbrowser.open, pyautogui, ...), kept apart from the receive loop and
+# the macro injection pool. A watchdog enforces a per-job timeout: a job that runs
+# longer is abandoned (its thread is left to finish on its own and then exits) and a
+# fresh worker thread takes over the rest of the queue, so one hung OS call cannot
+# block every later request.
+#
+# A thread is used rather than a process because these handlers share state with the
+# server (captured mouse positions, the auto drag loop thread).
+
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger("StarButtonBoxServer.Isolated")
+
+DEFAULT_TIMEOUT_SECONDS = 10.0
+WATCHDOG_INTERVAL_SECONDS = 0.5
+
+class IsolatedWorker:
+    """Runs submitted callables one at a time on a replaceable worker thread. submit() mirrors ThreadPoolExecutor."""
+
+    def __init__(self, name="IsolatedWorker", timeout_sec=DEFAULT_TIMEOUT_SECONDS):
+        self.name = name
+        self.timeout_sec = timeout_sec
+        self.timeouts = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._worker_count = 0
+        self._running = None # (job description, monotonic start, retire event) of the current job
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._start_worker()
+        self._watchdog = threading.Thread(target=self._watchdog_task, name=f"{name}Watchdog", daemon=True)
+        self._watchdog.start()
+
+    def _start_worker(self):
+        """Must be called with _lock held (or from __init__)."""
+        self._worker_count += 1
+        retired = threading.Event()
+        self._thread = threading.Thread(target=self._worker_task, args=(retired,),
+                                        name=f"{self.name}_{self._worker_count}", daemon=True)
+        self._thread.start()
+
+    def _worker_task(self, retired):
+        while True:
+            item = self._queue.get()
+            if item is None: # Shutdown sentinel
+                return
+            fn, args = item
+            with self._lock:
+                self._running = (getattr(fn, "__name__", repr(fn)), time.monotonic(), retired)
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Isolated job {getattr(fn, '__name__', fn)} failed: {e}", exc_info=True)
+            with self._lock:
+                if self._running and self._running[2] is retired:
+                    self._running = None
+                if retired.is_set():
+                    return # A replacement worker already owns the queue
+
+    def _watchdog_task(self):
+        while not self._stop_event.wait(WATCHDOG_INTERVAL_SECONDS):
+            with self._lock:
+                if not self._running or self._shutdown:
+                    continue
+                job_name, started, retired = self._running
+                elapsed = time.monotonic() - started
+                if elapsed < self.timeout_sec:
+                    continue
+                retired.set()
+                self._running = None
+                self.timeouts += 1
+                self._start_worker()
+            logger.error(f"Isolated job {job_name} exceeded {self.timeout_sec:.1f}s. Abandoned it and started a new worker.")
+
+    def submit(self, fn, *args):
+        if self._shutdown:
+            raise RuntimeError("cannot schedule new jobs after shutdown")
+        self._queue.put((fn, args))
+
+    def qsize(self):
+        """Jobs waiting, not counting the one running."""
+        return self._queue.qsize()
+
+    def shutdown(self, wait=True):
+        """Stops after the queued jobs. With wait, blocks for at most the job timeout."""
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            thread = self._thread
+        self._queue.put(None)
+        self._stop_event.set()
+        if wait and thread is not threading.current_thread():
+            thread.join(timeout=self.timeout_sec)
+            if thread.is_alive():
+                logger.warning(f"{self.name} did not finish its queue within {self.timeout_sec:.1f}s.")
@@ -0,0 +1,70 @@
+# key_codes.py
+# Key name -> hardware scancode table (scan code set 1) used for input injection.
+# Names follow the pydirectinput naming the Android app sends (e.g. "shiftleft", "altright").
+# Extended keys (sent with an E0 prefix) carry EXTENDED_FLAG in the high byte.
+
+EXTENDED_FLAG = 0xE000
+
+def is_extended(code):
+    return (code & EXTENDED_FLAG) == EXTENDED_FLAG
+
+def scancode_of(code):
+    return code & 0xFF
+
+_BASE_KEYS = {
+    "escape": 0x01, "esc": 0x01,
+    "1": 0x02, "2": 0x03, "3": 0x04, "4": 0x05, "5": 0x06,
+    "6": 0x07, "7": 0x08, "8": 0x09, "9": 0x0A, "0": 0x0B,
+    "-": 0x0C, "=": 0x0D, "backspace": 0x0E, "tab": 0x0F,
+    "q": 0x10, "w": 0x11, "e": 0x12, "r": 0x13, "t": 0x14,
+    "y": 0x15, "u": 0x16, "i": 0x17, "o": 0x18, "p": 0x19,
+    "[": 0x1A, "]": 0x1B, "enter": 0x1C, "return": 0x1C,
+    "ctrl": 0x1D, "ctrlleft": 0x1D,
+    "a": 0x1E, "s": 0x1F, "d": 0x20, "f": 0x21, "g": 0x22,
+    "h": 0x23, "j": 0x24, "k": 0x25, "l": 0x26,
+    ";": 0x27, "'": 0x28, "`": 0x29,
+    "shift": 0x2A, "shiftleft": 0x2A, "\\": 0x2B,
+    "z": 0x2C, "x": 0x2D, "c": 0x2E, "v": 0x2F, "b": 0x30, "n": 0x31, "m": 0x32,
+    ",": 0x33, ".": 0x34, "/": 0x35, "shiftright": 0x36,
+    "multiply": 0x37, "alt": 0x38, "altleft": 0x38, "space": 0x39, " ": 0x39,
+    "capslock": 0x3A,
+    "f1": 0x3B, "f2": 0x3C, "f3": 0x3D, "f4": 0x3E, "f5": 0x3F,
+    "f6": 0x40, "f7": 0x41, "f8": 0x42, "f9": 0x43, "f10": 0x44,
+    "numlock": 0x45, "scrolllock": 0x46,
+    "num7": 0x47, "num8": 0x48, "num9": 0x49, "subtract": 0x4A,
+    "num4": 0x4B, "num5": 0x4C, "num6": 0x4D, "add": 0x4E,
+    "num1": 0x4F, "num2": 0x50, "num3": 0x51, "num0": 0x52, "decimal": 0x53,
+    "f11": 0x57, "f12": 0x58,
+    "f13": 0x64, "f14": 0x65, "f15": 0x66,
+}
+
+_EXTENDED_KEYS = {
+    "numpadenter": 0x1C, "ctrlright": 0x1D, "divide": 0x35,
+    "printscreen": 0x37, "prtsc": 0x37, "prtscr": 0x37, "prntscrn": 0x37,
+    "altright": 0x38, "home": 0x47, "up": 0x48, "pageup": 0x49, "pgup": 0x49,
+    "left": 0x4B, "right": 0x4D, "end": 0x4F, "down": 0x50,
+    "pagedown": 0x51, "pgdn": 0x51, "insert": 0x52, "delete": 0x53, "del": 0x53,
+    "win": 0x5B, "winleft": 0x5B, "winright": 0x5C, "apps": 0x5D,
+}
+
+KEY_CODES = dict(_BASE_KEYS)
+KEY_CODES.update({name: EXTENDED_FLAG | code for name, code in _EXTENDED_KEYS.items()})
+# pydirectinput also accepts "numpad0".."numpad9"
+KEY_CODES.update({f"numpad{digit}": KEY_CODES[f"num{digit}"] for digit in range(10)})
+
+# First name listed for each code, used when logging compiled actions
+KEY_NAMES = {}
+for _name, _code in KEY_CODES.items():
+    KEY_NAMES.setdefault(_code, _name)
+
+def resolve_key(name):
+    """Returns the code for a key name, or None if the name is unknown."""
+    if not isinstance(name, str):
+        return None
+    code = KEY_CODES.get(name)
+    if code is None:
+        code = KEY_CODES.get(name.lower())
+    return code
+
+def key_name(code):
+    return KEY_NAMES.get(code, f"0x{code:04X}")
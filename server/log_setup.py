@@ -0,0 +1,177 @@
+# log_setup.py
+# File logging for the server: size- and time-based rotation with gzip-compressed
+# old segments, one JSON object per line, and sampling of per-packet lines.
+# Loggers only put records on a queue; a QueueListener thread formats and writes
+# them, so the receive loop and workers never wait on disk I/O. The file is flushed
+# when the queue runs empty, or at least every FLUSH_INTERVAL_SECONDS under load.
+#
+# Per-packet log calls pass extra={"per_packet": True, ...}. Only one in
+# packet_sample_rate of them reaches the file; warnings and errors always do.
+# Any other `extra` fields are written as JSON keys.
+
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+
+FLUSH_INTERVAL_SECONDS = 1.0 # Longest time records stay buffered while the queue never runs empty
+
+# Attributes every LogRecord has; anything else came from `extra`
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS and key != "per_packet":
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class PacketSampleFilter(logging.Filter):
+    """Passes one in `rate` records marked per_packet; all other records pass."""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(int(rate), 1)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "per_packet", False) or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            self._count += 1
+            keep = self._count >= self.rate
+            if keep:
+                self._count = 0
+        if keep:
+            record.sampled_one_in = self.rate
+        return keep
+
+class _PreparingQueueHandler(logging.handlers.QueueHandler):
+    """Keeps the traceback separate from the message so the JSON formatter can put it in its own field."""
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates when the file exceeds max_bytes or has been written to for rotate_seconds,
+    gzip-compressing old segments (server.log.1.gz ... server.log.N.gz).
+    Writes are buffered; see flush_now().
+    """
+    def __init__(self, filename, max_bytes, backup_count, rotate_seconds):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_seconds = rotate_seconds
+        self._segment_started = self._existing_segment_started()
+        self._last_flush = 0.0
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._gzip_rotator
+
+    def _existing_segment_started(self):
+        """
+        When the current segment was started: the log file's creation time if it already
+        exists (so daily restarts don't reset the rotate_seconds clock), otherwise now.
+        Where creation time is unknown (Linux), its mtime is used, which is never earlier.
+        """
+        try:
+            stat = os.stat(self.baseFilename)
+        except OSError:
+            return time.time()
+        created = getattr(stat, "st_birthtime", None)
+        if created is None:
+            created = stat.st_ctime if os.name == "nt" else stat.st_mtime
+        return min(created, time.time())
+
+    @staticmethod
+    def _gzip_rotator(source, dest):
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() - self._segment_started >= self.rotate_seconds:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._segment_started = time.time()
+
+    def flush(self):
+        # StreamHandler.emit() flushes after every record; only do it periodically
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL_SECONDS:
+            self.flush_now()
+
+    def flush_now(self):
+        self._last_flush = time.monotonic()
+        super().flush()
+
+    def close(self):
+        self.flush_now()
+        super().close()
+
+class _FlushingQueueListener(logging.handlers.QueueListener):
+    """Flushes the handlers whenever the queue has been drained."""
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                if isinstance(handler, CompressingRotatingFileHandler):
+                    handler.flush_now()
+
+_listener = None
+
+def configure_file_logging(log_file_path, max_bytes, backup_count, rotate_seconds, packet_sample_rate,
+                           level=logging.INFO):
+    """
+    Routes the root logger through a queue to a rotating JSON-lines file.
+    Returns the QueueListener (already started and stopped at exit).
+    """
+    global _listener
+    file_handler = CompressingRotatingFileHandler(log_file_path, max_bytes, backup_count, rotate_seconds)
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    queue_handler = _PreparingQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(PacketSampleFilter(packet_sample_rate)) # Dropped records are never queued
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(queue_handler)
+
+    _listener = _FlushingQueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_file_logging)
+    return _listener
+
+def stop_file_logging():
+    """Writes out queued records and closes the file."""
+    global _listener
+    if _listener is not None:
+        listener = _listener
+        _listener = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
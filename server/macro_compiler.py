@@ -0,0 +1,193 @@
+# macro_compiler.py
+# Validates InputAction JSON (as sent by the Android app) and compiles it into
+# small int tuples that input_simulator can execute without further lookups.
+# Unknown keys, modifiers or buttons are rejected here, at parse time,
+# instead of failing silently during injection.
+
+import json
+import logging
+import math
+
+import key_codes
+import macro_recorder
+
+logger = logging.getLogger("StarButtonBoxMacroCompiler")
+
+# --- Compiled action layout ---
+# (kind, code, modifiers, press_kind, duration_ms)
+#   kind:        ACTION_KEY_EVENT | ACTION_MOUSE_EVENT | ACTION_MOUSE_SCROLL | ACTION_RECORDED_MACRO
+#   code:        scancode for keys, MOUSE_* id for mouse buttons, signed wheel clicks for scrolls,
+#                recording name for recorded macros (see macro_recorder)
+#   modifiers:   tuple of modifier scancodes, in press order
+#   press_kind:  PRESS_TAP | PRESS_HOLD
+#   duration_ms: hold duration (0 for taps)
+ACTION_KEY_EVENT = 0
+ACTION_MOUSE_EVENT = 1
+ACTION_MOUSE_SCROLL = 2
+ACTION_RECORDED_MACRO = 3
+
+PRESS_TAP = 0
+PRESS_HOLD = 1
+
+MOUSE_LEFT = 0
+MOUSE_RIGHT = 1
+MOUSE_MIDDLE = 2
+MOUSE_BUTTONS = {"LEFT": MOUSE_LEFT, "RIGHT": MOUSE_RIGHT, "MIDDLE": MOUSE_MIDDLE}
+MOUSE_BUTTON_NAMES = ("left", "right", "middle")
+
+ACTION_KIND_NAMES = ("key_event", "mouse_event", "mouse_scroll", "recorded_macro")
+
+_CACHE_MAX_ENTRIES = 512
+
+class MacroCompileError(ValueError):
+    """Raised when an InputAction cannot be compiled (bad JSON, unknown key, etc.)."""
+    pass
+
+def _resolve_key_or_raise(name, role):
+    code = key_codes.resolve_key(name)
+    if code is None:
+        raise MacroCompileError(f"Unknown {role} '{name}'")
+    return code
+
+def _compile_modifiers(action_data):
+    modifiers = action_data.get('modifiers') or []
+    if not isinstance(modifiers, list):
+        raise MacroCompileError(f"'modifiers' must be a list, got {type(modifiers).__name__}")
+    return tuple(_resolve_key_or_raise(mod_key, "modifier") for mod_key in modifiers)
+
+def _compile_press_type(action_data):
+    """Returns (press_kind, duration_ms). Holds of 0 ms fall back to taps."""
+    press_type_data = action_data.get('pressType') or {}
+    if not isinstance(press_type_data, dict):
+        raise MacroCompileError(f"'pressType' must be an object, got {type(press_type_data).__name__}")
+    press_type = press_type_data.get('type', 'tap')
+    if press_type == 'tap':
+        return PRESS_TAP, 0
+    if press_type == 'hold':
+        duration_ms = press_type_data.get('durationMs')
+        if (isinstance(duration_ms, bool) or not isinstance(duration_ms, (int, float))
+                or not math.isfinite(duration_ms) or duration_ms < 0):
+            raise MacroCompileError(f"Invalid hold duration '{duration_ms}'")
+        if duration_ms > 0:
+            return PRESS_HOLD, int(duration_ms)
+        logger.debug("Hold of 0 ms. Compiling as tap.")
+        return PRESS_TAP, 0
+    raise MacroCompileError(f"Unknown pressType '{press_type}'")
+
+def compile_action(action_data):
+    """
+    Compiles a parsed InputAction dict into a compiled action tuple.
+    Raises MacroCompileError if any name cannot be resolved.
+    """
+    if not isinstance(action_data, dict):
+        raise MacroCompileError("InputAction must be a JSON object")
+    action_subtype = action_data.get('type')
+
+    if action_subtype == 'key_event':
+        key = action_data.get('key')
+        if not key:
+            raise MacroCompileError("'key' field missing")
+        code = _resolve_key_or_raise(key, "key")
+        press_kind, duration_ms = _compile_press_type(action_data)
+        return (ACTION_KEY_EVENT, code, _compile_modifiers(action_data), press_kind, duration_ms)
+
+    if action_subtype == 'mouse_event':
+        button_str = action_data.get('button')
+        button = MOUSE_BUTTONS.get(button_str)
+        if button is None:
+            raise MacroCompileError(f"Invalid mouse button '{button_str}'")
+        press_kind, duration_ms = _compile_press_type(action_data)
+        return (ACTION_MOUSE_EVENT, button, _compile_modifiers(action_data), press_kind, duration_ms)
+
+    if action_subtype == 'mouse_scroll':
+        direction = action_data.get('direction')
+        clicks = action_data.get('clicks', 1)
+        if not isinstance(clicks, int) or clicks <= 0:
+            raise MacroCompileError(f"Invalid scroll clicks '{clicks}'")
+        if direction == "UP":
+            scroll_amount = clicks
+        elif direction == "DOWN":
+            scroll_amount = -clicks
+        else:
+            raise MacroCompileError(f"Invalid scroll direction '{direction}'")
+        return (ACTION_MOUSE_SCROLL, scroll_amount, _compile_modifiers(action_data), PRESS_TAP, 0)
+
+    if action_subtype == 'recorded_macro':
+        # Only the name is checked here; the recording may be made after the button
+        try:
+            name = macro_recorder.validate_name(action_data.get('name'))
+        except ValueError as e:
+            raise MacroCompileError(str(e)) from e
+        return (ACTION_RECORDED_MACRO, name, (), PRESS_TAP, 0)
+
+    raise MacroCompileError(f"Unknown action subtype '{action_subtype}'")
+
+_compiled_cache = {}
+
+def compile_payload(action_data_str):
+    """
+    Parses and compiles an InputAction JSON string.
+    The Android app resends identical payload strings for the same button,
+    so results are cached by the raw string.
+    """
+    compiled = _compiled_cache.get(action_data_str)
+    if compiled is not None:
+        return compiled
+    try:
+        action_data = json.loads(action_data_str)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise MacroCompileError(f"Invalid InputAction JSON: {e}") from e
+    compiled = compile_action(action_data)
+    if len(_compiled_cache) >= _CACHE_MAX_ENTRIES:
+        _compiled_cache.clear()
+    _compiled_cache[action_data_str] = compiled
+    return compiled
+
+def describe(compiled):
+    """Human readable form of a compiled action for log lines."""
+    kind, code, modifiers, press_kind, duration_ms = compiled
+    if kind == ACTION_KEY_EVENT:
+        target = f"'{key_codes.key_name(code)}'"
+    elif kind == ACTION_MOUSE_EVENT:
+        target = f"'{MOUSE_BUTTON_NAMES[code]}'"
+    elif kind == ACTION_RECORDED_MACRO:
+        return f"{ACTION_KIND_NAMES[kind]} '{code}'"
+    else:
+        target = f"{'UP' if code > 0 else 'DOWN'} x{abs(code)}"
+    mods = [key_codes.key_name(mod_code) for mod_code in modifiers]
+    press = f"hold {duration_ms}ms" if press_kind == PRESS_HOLD else "tap"
+    return f"{ACTION_KIND_NAMES[kind]} {press} {target} mods {mods}"
+
+def validate_macro_file(file_path):
+    """
+    Compiles every inputAction in a macro table file (e.g. default_macros_sc_411.json).
+    Entries without an inputAction are unbound and skipped.
+    Returns (compiled_count, errors) where errors is a list of "category/action: message" strings.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        macros = json.load(f)
+
+    compiled_count = 0
+    errors = []
+    for macro in macros:
+        action_data_str = macro.get('inputAction')
+        if not action_data_str:
+            continue
+        try:
+            compile_payload(action_data_str)
+            compiled_count += 1
+        except MacroCompileError as e:
+            errors.append(f"{macro.get('xmlCategoryName')}/{macro.get('xmlActionName')}: {e}")
+    return compiled_count, errors
+
+if __name__ == '__main__':
+    import os
+    import sys
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    macro_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "default_macros_sc_411.json")
+    count, problems = validate_macro_file(macro_file)
+    logger.info(f"Compiled {count} actions from '{macro_file}', {len(problems)} error(s).")
+    for problem in problems:
+        logger.error(f"  {problem}")
+    sys.exit(1 if problems else 0)
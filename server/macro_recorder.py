@@ -0,0 +1,438 @@
+# macro_recorder.py
+# Records key and mouse sequences on the PC and plays them back as one macro, e.g.
+# triggered from the phone with {"type": "recorded_macro", "name": "<name>"}.
+#
+# Recording: arm_recording(name) installs a keyboard hook (keyboard library) and a
+# mouse poller (cursor position and buttons, MOUSE_POLL_HZ). Nothing is kept until
+# the toggle key (recording_toggle_key, e.g. "scroll lock") is pressed; pressing it
+# again saves the recording. The toggle key itself is never recorded, and the
+# timeline starts at the first recorded event, so there is no lead-in to sit through.
+# Mouse movement is the change of the cursor position between polls, so it is
+# clipped at the screen edges like the cursor itself.
+#
+# Storage (<name>.sbbrec): a header (magic, version, event count, total duration)
+# followed by fixed 10-byte records
+#   delta_us (uint32)  time since the previous event
+#   kind (uint8)       REC_KEY | REC_MOUSE_BUTTON | REC_MOUSE_MOVE
+#   flags (uint8)      FLAG_DOWN, FLAG_EXTENDED (keys)
+#   a, b (int16)       scancode / button / dx, dy
+# Loading reads the file and checks the header; records are only decoded while
+# playing (struct.iter_unpack), so even hour-long recordings load at once.
+#
+# Playback keeps a monotonic timeline: every event is due at start + the sum of all
+# deltas before it and is waited for with precise_timing, so a late event never
+# delays the ones after it (no drift). Events with the same timestamp go out as one
+# batch. Keys and buttons still down at the end (or on abort) are released.
+# Mouse movement was recorded as cursor positions, so it is replayed as absolute
+# moves from the cursor's position at the start: relative moves would be scaled by
+# the pointer speed and acceleration and end up somewhere else. Where the cursor
+# cannot be read, relative moves are the fallback.
+
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import logging
+
+try:
+    import keyboard
+except Exception as e: # Not installed, or no permission to hook (e.g. non-root on Linux)
+    keyboard = None
+    _keyboard_error = e
+
+import input_backend
+import key_codes
+import precise_timing
+
+logger = logging.getLogger("StarButtonBoxServer.Recorder")
+
+FILE_EXTENSION = ".sbbrec"
+MAGIC = b"SBBREC"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<6sHIQ") # magic, version, event count, duration (us)
+_RECORD = struct.Struct("<IBBhh")  # delta_us, kind, flags, a, b
+
+REC_KEY = 0
+REC_MOUSE_BUTTON = 1
+REC_MOUSE_MOVE = 2
+FLAG_DOWN = 0x01
+FLAG_EXTENDED = 0x02
+
+DEFAULT_TOGGLE_KEY = "scroll lock"
+MOUSE_POLL_HZ = 500.0
+MAX_RECORDING_SECONDS = 600.0
+MAX_DELTA_US = 0xFFFFFFFF
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+
+# Scancodes shared by an extended key and a keypad key (keyboard reports is_keypad)
+_NAV_SCANCODES = range(0x47, 0x54)    # Home..Delete vs. numpad 7..decimal
+_KEYPAD_EXTENDED = (0x1C, 0x35)       # Numpad enter and divide
+_ALWAYS_EXTENDED = (0x5B, 0x5C, 0x5D) # Windows keys, apps
+
+recordings_dir = None
+_cache = {} # name -> (mtime_ns, size, Recording)
+_cache_lock = threading.Lock()
+_session_lock = threading.Lock()
+_session = None
+
+def configure(directory):
+    global recordings_dir
+    recordings_dir = directory
+
+def validate_name(name):
+    """Returns name if it can be used as a recording name, otherwise raises ValueError."""
+    if not isinstance(name, str) or not _NAME_PATTERN.match(name):
+        raise ValueError(f"invalid recording name {name!r} (letters, digits, '_' and '-', up to 64)")
+    return name
+
+def recording_path(name):
+    if recordings_dir is None:
+        raise RuntimeError("recordings directory not configured")
+    return os.path.join(recordings_dir, validate_name(name) + FILE_EXTENSION)
+
+def list_recordings():
+    if recordings_dir is None or not os.path.isdir(recordings_dir):
+        return []
+    return sorted(f[:-len(FILE_EXTENSION)] for f in os.listdir(recordings_dir) if f.endswith(FILE_EXTENSION))
+
+# --- Storage ---
+
+class Recording:
+    """A loaded recording: the raw record bytes plus what the header says about them."""
+    __slots__ = ("name", "count", "duration_us", "body")
+
+    def __init__(self, name, count, duration_us, body):
+        self.name = name
+        self.count = count
+        self.duration_us = duration_us
+        self.body = body
+
+    def events(self):
+        """Yields (delta_us, kind, flags, a, b) for every recorded event."""
+        return _RECORD.iter_unpack(self.body)
+
+def encode(records):
+    """Packs (delta_us, kind, flags, a, b) tuples into file contents."""
+    body = bytearray()
+    duration_us = 0
+    for record in records:
+        body += _RECORD.pack(*record)
+        duration_us += record[0]
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, len(body) // _RECORD.size, duration_us) + body
+
+def decode(name, data):
+    """Returns a Recording for file contents. Raises ValueError if they are not a valid recording."""
+    if len(data) < _HEADER.size:
+        raise ValueError("file too short")
+    magic, version, count, duration_us = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"not a version {FORMAT_VERSION} recording")
+    body = memoryview(data)[_HEADER.size:]
+    if len(body) != count * _RECORD.size:
+        raise ValueError(f"truncated: {len(body)} bytes for {count} events")
+    return Recording(name, count, duration_us, body)
+
+def save(name, records):
+    """Writes a recording atomically. Returns its path."""
+    path = recording_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(encode(records))
+    os.replace(temp_path, path)
+    with _cache_lock:
+        _cache.pop(name, None)
+    return path
+
+def load(name):
+    """Returns the Recording called name, reusing the cached one while the file is unchanged."""
+    path = recording_path(name)
+    stat = os.stat(path)
+    with _cache_lock:
+        cached = _cache.get(name)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+    with open(path, 'rb') as f:
+        recording = decode(name, f.read())
+    with _cache_lock:
+        _cache[name] = (stat.st_mtime_ns, stat.st_size, recording)
+    return recording
+
+# --- Playback ---
+
+def _to_input_event(kind, flags, a, b):
+    down = bool(flags & FLAG_DOWN)
+    if kind == REC_KEY:
+        code = (a & 0xFF) | (key_codes.EXTENDED_FLAG if flags & FLAG_EXTENDED else 0)
+        return input_backend.key_down(code) if down else input_backend.key_up(code)
+    if kind == REC_MOUSE_BUTTON:
+        return input_backend.mouse_down(a) if down else input_backend.mouse_up(a)
+    return input_backend.mouse_move(a, b)
+
+def play(name, stop_event=None, send=None):
+    """
+    Plays a recording on the calling thread; stop_event aborts it. send(batch) injects a
+    batch (input_backend.send by default). Returns {"events", "batches", "avg_late_us",
+    "p99_late_us", "max_late_us", "drift_us", "aborted"}; late is send time - due time per batch,
+    drift how much longer the playback took than recorded.
+    """
+    recording = load(name)
+    send = send or input_backend.send
+    read_mouse = _mouse_reader()
+    cursor = read_mouse()[:2] if read_mouse is not None else None
+    pressed = {} # (kind, code) -> release event
+    late_ns = []
+    batch = []
+    aborted = False
+    start_ns = due_ns = time.perf_counter_ns()
+
+    def flush():
+        late_ns.append(time.perf_counter_ns() - due_ns)
+        send(batch)
+
+    try:
+        for delta_us, kind, flags, a, b in recording.events():
+            if delta_us:
+                if batch:
+                    flush()
+                    batch = []
+                due_ns += delta_us * 1000
+                if precise_timing.wait_until(due_ns, stop_event) is None:
+                    aborted = True
+                    break
+            if kind == REC_MOUSE_MOVE and cursor is not None:
+                cursor = (cursor[0] + a, cursor[1] + b)
+                batch.append(input_backend.mouse_move_to(*cursor))
+                continue
+            event = _to_input_event(kind, flags, a, b)
+            if kind != REC_MOUSE_MOVE:
+                key = (kind, event[1])
+                if flags & FLAG_DOWN:
+                    pressed[key] = _to_input_event(kind, flags & ~FLAG_DOWN, a, b)
+                else:
+                    pressed.pop(key, None)
+            batch.append(event)
+        if batch and not aborted:
+            flush()
+    finally:
+        if pressed: # Recording ended (or playback stopped) with something held
+            send(list(pressed.values()))
+    ordered = sorted(late_ns)
+    return {
+        "events": recording.count,
+        "batches": len(ordered),
+        "avg_late_us": sum(ordered) / len(ordered) / 1000.0 if ordered else 0.0,
+        "p99_late_us": ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] / 1000.0 if ordered else 0.0,
+        "max_late_us": ordered[-1] / 1000.0 if ordered else 0.0,
+        "drift_us": (time.perf_counter_ns() - start_ns) / 1000.0 - recording.duration_us if not aborted else 0.0,
+        "aborted": aborted,
+    }
+
+# --- Recording ---
+
+def _code_of(event):
+    """Returns (scancode, extended) for a keyboard library event."""
+    scancode = event.scan_code & 0xFF
+    name = event.name or ""
+    if scancode in _NAV_SCANCODES:
+        extended = not event.is_keypad
+    elif scancode in _KEYPAD_EXTENDED:
+        extended = bool(event.is_keypad)
+    elif scancode in (0x1D, 0x38): # Ctrl, Alt
+        extended = name.startswith("right") or name == "alt gr"
+    elif scancode == 0x37:
+        extended = name == "print screen"
+    else:
+        extended = scancode in _ALWAYS_EXTENDED
+    return scancode, extended
+
+def _mouse_reader():
+    """Returns a callable giving (x, y, (left, right, middle)) or None if the mouse cannot be polled."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        point = wintypes.POINT()
+        buttons = (0x01, 0x02, 0x04) # VK_LBUTTON, VK_RBUTTON, VK_MBUTTON
+
+        def read():
+            user32.GetCursorPos(ctypes.byref(point))
+            return point.x, point.y, tuple(bool(user32.GetAsyncKeyState(vk) & 0x8000) for vk in buttons)
+        return read
+    try:
+        import pyautogui
+    except Exception:
+        return None
+    return lambda: (*pyautogui.position(), (False, False, False)) # Buttons cannot be polled here
+
+class _Session:
+    """One armed or running recording."""
+
+    def __init__(self, name, toggle_key, on_finished):
+        self.name = name
+        self.toggle_key = toggle_key
+        self.on_finished = on_finished
+        self.lock = threading.Lock()
+        self.records = [] # (delta_us, kind, flags, a, b)
+        self.recording = False
+        self.last_ns = 0
+        self.started_ns = 0
+        self.stop_event = threading.Event()
+        self.hook = None
+        self.poller = None
+
+    def add(self, now_ns, kind, flags, a, b):
+        """Appends one event. Must be called with lock held, now_ns taken while holding it (keeps deltas >= 0)."""
+        delta_us = min(max(now_ns - self.last_ns, 0) // 1000, MAX_DELTA_US) if self.records else 0
+        self.records.append((delta_us, kind, flags, a, b))
+        self.last_ns = now_ns
+
+    def on_key(self, event):
+        if event.name == self.toggle_key:
+            if event.event_type == "down":
+                if not self.recording:
+                    with self.lock:
+                        self.recording = True
+                        self.started_ns = time.perf_counter_ns()
+                    logger.info(f"Recording '{self.name}' started. Press '{self.toggle_key}' again to save it.")
+                else:
+                    threading.Thread(target=finish, name="RecordingSave", daemon=True).start() # Not on the hook thread
+            return
+        scancode, extended = _code_of(event)
+        flags = (FLAG_DOWN if event.event_type == "down" else 0) | (FLAG_EXTENDED if extended else 0)
+        with self.lock:
+            if self.recording:
+                self.add(time.perf_counter_ns(), REC_KEY, flags, scancode, 0)
+
+    def poll_mouse(self, read):
+        x, y, buttons = read()
+        interval_ns = int(1e9 / MOUSE_POLL_HZ)
+        next_ns = time.perf_counter_ns()
+        while True:
+            next_ns += interval_ns
+            if precise_timing.wait_until(next_ns, self.stop_event) is None:
+                return
+            new_x, new_y, new_buttons = read()
+            with self.lock:
+                now_ns = time.perf_counter_ns() # Under the lock, so key events from the hook thread stay in order
+                if not self.recording:
+                    x, y, buttons = new_x, new_y, new_buttons
+                    continue
+                dx, dy = new_x - x, new_y - y
+                while dx or dy:
+                    step_x, step_y = max(min(dx, 32767), -32768), max(min(dy, 32767), -32768)
+                    self.add(now_ns, REC_MOUSE_MOVE, 0, step_x, step_y)
+                    dx, dy = dx - step_x, dy - step_y
+                for button, (was_down, is_down) in enumerate(zip(buttons, new_buttons)):
+                    if was_down != is_down:
+                        self.add(now_ns, REC_MOUSE_BUTTON, FLAG_DOWN if is_down else 0, button, 0)
+                x, y, buttons = new_x, new_y, new_buttons
+                too_long = now_ns - self.started_ns > MAX_RECORDING_SECONDS * 1e9
+            if too_long:
+                logger.warning(f"Recording '{self.name}' reached {MAX_RECORDING_SECONDS:.0f} s. Saving it.")
+                threading.Thread(target=finish, name="RecordingSave", daemon=True).start()
+                return
+
+def arm_recording(name, toggle_key=DEFAULT_TOGGLE_KEY, on_finished=None):
+    """
+    Installs the hooks for a new recording; recording starts and ends with toggle_key.
+    on_finished(path or None) is called once it is saved or cancelled. Returns False if it cannot start.
+    """
+    global _session
+    validate_name(name)
+    if keyboard is None:
+        logger.error(f"Cannot record: keyboard library unavailable ({_keyboard_error}).")
+        return False
+    with _session_lock:
+        if _session is not None:
+            logger.warning(f"Recording '{_session.name}' is still armed or running.")
+            return False
+        session = _Session(name, toggle_key, on_finished)
+        try:
+            session.hook = keyboard.hook(session.on_key)
+        except Exception as e:
+            logger.error(f"Cannot record: keyboard hook failed: {e}")
+            return False
+        read = _mouse_reader()
+        if read is None:
+            logger.warning("Mouse cannot be polled here; recording the keyboard only.")
+        else:
+            session.poller = threading.Thread(target=session.poll_mouse, args=(read,), name="RecordingMousePoll", daemon=True)
+            session.poller.start()
+        _session = session
+    logger.info(f"Recording '{name}' armed. Press '{toggle_key}' to start.")
+    return True
+
+def finish(save_recording=True):
+    """Ends the armed or running recording, saving what was recorded. Returns the saved path or None."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is None:
+        return None
+    session.stop_event.set()
+    try:
+        keyboard.unhook(session.hook)
+    except Exception as e:
+        logger.warning(f"Removing the keyboard hook failed: {e}")
+    if session.poller is not None:
+        session.poller.join(timeout=1.0)
+    with session.lock:
+        session.recording = False
+        records = session.records
+    path = None
+    if save_recording and records:
+        try:
+            path = save(session.name, records)
+            duration_sec = sum(record[0] for record in records) / 1e6
+            logger.info(f"Recording '{session.name}' saved: {len(records)} event(s), {duration_sec:.2f} s, "
+                        f"{os.path.getsize(path)} bytes.")
+        except (OSError, RuntimeError, struct.error) as e:
+            logger.error(f"Saving recording '{session.name}' failed: {e}")
+    else:
+        logger.info(f"Recording '{session.name}' ended without saving ({len(records)} event(s)).")
+    if session.on_finished:
+        session.on_finished(path)
+    return path
+
+def recording_state():
+    """Returns (name, "armed" | "recording") for the current session, or None."""
+    session = _session
+    if session is None:
+        return None
+    return session.name, "recording" if session.recording else "armed"
+
+if __name__ == '__main__':
+    import argparse
+    import config_manager
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="StarButtonBox macro recorder")
+    parser.add_argument("command", choices=["list", "record", "play", "info"])
+    parser.add_argument("name", nargs="?")
+    parser.add_argument("--toggle-key", default=DEFAULT_TOGGLE_KEY)
+    parser.add_argument("--delay", type=float, default=3.0, help="Seconds before playback starts")
+    args = parser.parse_args()
+    configure(config_manager.RECORDINGS_DIR)
+
+    if args.command == "list":
+        for recording_name in list_recordings():
+            print(recording_name)
+        sys.exit(0)
+    if not args.name:
+        parser.error(f"{args.command} needs a recording name")
+    if args.command == "info":
+        loaded = load(args.name)
+        print(f"{loaded.name}: {loaded.count} event(s), {loaded.duration_us / 1e6:.3f} s")
+    elif args.command == "play":
+        time.sleep(args.delay) # Time to switch to the game window
+        print(play(args.name))
+    else:
+        done = threading.Event()
+        if arm_recording(args.name, args.toggle_key, on_finished=lambda path: done.set()):
+            try:
+                done.wait()
+            except KeyboardInterrupt:
+                finish()
@@ -1,18 +1,50 @@
 # mdns_handler.py
 # Handles mDNS service registration/unregistration using Zeroconf.
 
+# The service is advertised on every usable IPv4 interface address and a watcher
+# thread updates the record in place when interfaces come and go.
+
 import socket
 import sys
+import threading
 # import ipaddress # Not strictly needed here anymore, but good practice
+import ifaddr
 from zeroconf import ServiceInfo, Zeroconf, IPVersion
 import config # Import constants from config.py
 import logging
 
 logger = logging.getLogger("StarButtonBoxMDNS") # Specific logger for this module
 
+ADDRESS_WATCH_INTERVAL_SECONDS = 5.0 # How often interface addresses are re-scanned while registered
+
 # --- Module-level variables for Zeroconf instance and service info ---
 _zeroconf_instance = None
 _service_info_instance = None
+_advertised_addresses = [] # IPv4 strings currently in the service record
+_watcher_thread = None
+_watcher_stop_event = threading.Event()
+_record_lock = threading.Lock() # Guards _service_info_instance/_advertised_addresses against the watcher
+
+def get_local_ips():
+    """
+    Returns every usable IPv4 address of this PC, sorted, skipping loopback and
+    link-local (169.254.x.x) addresses. Falls back to [get_local_ip()] if none are found.
+    """
+    addresses = set()
+    try:
+        for adapter in ifaddr.get_adapters():
+            for adapter_ip in adapter.ips:
+                if not adapter_ip.is_IPv4:
+                    continue
+                ip = adapter_ip.ip
+                if ip.startswith("127.") or ip.startswith("169.254."):
+                    continue
+                addresses.add(ip)
+    except Exception as e:
+        logger.error(f"get_local_ips: Could not enumerate network interfaces: {e}")
+    if not addresses:
+        return [get_local_ip()]
+    return sorted(addresses, key=socket.inet_aton)
 
 def get_local_ip():
     """Attempts to find a non-loopback local IPv4 address."""
@@ -50,12 +82,65 @@ def get_local_ip():
     logger.warning("Could not determine a preferred non-loopback IP address. Using 127.0.0.1 as last resort.")
     return "127.0.0.1" # Last resort
 
+def _build_service_info(name, server, ips, port):
+    return ServiceInfo(
+        type_=config.MDNS_SERVICE_TYPE,
+        name=name,
+        addresses=[socket.inet_aton(ip) for ip in ips],
+        port=port,
+        properties={}, # Empty properties for now
+        server=server,
+    )
+
+def _refresh_advertised_addresses():
+    """Re-scans interfaces and updates the registered record in place if the address set changed."""
+    global _service_info_instance, _advertised_addresses
+    with _record_lock:
+        if not _zeroconf_instance or not _service_info_instance:
+            return False
+        local_ips = get_local_ips()
+        if local_ips == _advertised_addresses:
+            return False
+        old_info = _service_info_instance
+        new_info = _build_service_info(old_info.name, old_info.server, local_ips, old_info.port)
+        try:
+            _zeroconf_instance.update_service(new_info)
+        except Exception as e:
+            logger.error(f"Error updating mDNS addresses: {e}", exc_info=True)
+            return False
+        logger.info(f"mDNS addresses changed: {', '.join(_advertised_addresses)} -> {', '.join(local_ips)}")
+        _service_info_instance = new_info
+        _advertised_addresses = local_ips
+        return True
+
+def _address_watcher_task():
+    while not _watcher_stop_event.wait(ADDRESS_WATCH_INTERVAL_SECONDS):
+        _refresh_advertised_addresses()
+
+def _start_address_watcher():
+    global _watcher_thread
+    _watcher_stop_event.clear()
+    _watcher_thread = threading.Thread(target=_address_watcher_task, name="MDNSAddressWatcher", daemon=True)
+    _watcher_thread.start()
+
+def _stop_address_watcher():
+    global _watcher_thread
+    _watcher_stop_event.set()
+    if _watcher_thread and _watcher_thread is not threading.current_thread():
+        _watcher_thread.join(timeout=2.0)
+    _watcher_thread = None
+
+def get_advertised_addresses():
+    """Returns the IPv4 addresses in the current service record (empty if not registered)."""
+    with _record_lock:
+        return list(_advertised_addresses)
+
 def register_mdns_service(actual_port: int): # <<< MODIFIED: Accept actual_port
     """
     Registers the StarButtonBox service using Zeroconf.
     Uses the actual_port the server is listening on.
     """
-    global _zeroconf_instance, _service_info_instance
+    global _zeroconf_instance, _service_info_instance, _advertised_addresses
     if _zeroconf_instance:
         logger.warning("mDNS service already registered or registration in progress.")
         # Optionally, unregister and re-register if port changed,
@@ -65,7 +150,7 @@ def register_mdns_service(actual_port: int): # <<< MODIFIED: Accept actual_port
     try:
         # Force IPv4 for Zeroconf to align with typical local network discovery needs
         _zeroconf_instance = Zeroconf(ip_version=IPVersion.V4Only)
-        local_ip = get_local_ip()
+        local_ips = get_local_ips()
 
         # Ensure hostname doesn't have problematic characters for mDNS
         host_name_raw = socket.gethostname().split('.')[0]
@@ -77,22 +162,17 @@ def register_mdns_service(actual_port: int): # <<< MODIFIED: Accept actual_port
         server_identifier = f"{host_name}.local."
 
 
-        _service_info_instance = ServiceInfo(
-            type_=config.MDNS_SERVICE_TYPE,
-            name=service_name_str,
-            addresses=[socket.inet_aton(local_ip)], 
-            port=actual_port, # <<< MODIFIED: Use actual_port
-            properties={}, # Empty properties for now
-            server=server_identifier, 
-        )
+        _service_info_instance = _build_service_info(service_name_str, server_identifier, local_ips, actual_port)
+        _advertised_addresses = local_ips
         logger.info(f"Registering mDNS service:")
         logger.info(f"  Name: {service_name_str}")
         logger.info(f"  Type: {config.MDNS_SERVICE_TYPE}")
-        logger.info(f"  Address: {local_ip}")
+        logger.info(f"  Addresses: {', '.join(local_ips)}")
         logger.info(f"  Port: {actual_port}") # <<< Log actual_port
         
         _zeroconf_instance.register_service(_service_info_instance)
         logger.info("mDNS service registered successfully.")
+        _start_address_watcher()
         return True
     except Exception as e:
         logger.error(f"Error registering mDNS service: {e}", exc_info=True)
@@ -103,11 +183,13 @@ def register_mdns_service(actual_port: int): # <<< MODIFIED: Accept actual_port
                 logger.error(f"Error closing Zeroconf instance during register_mdns_service error handling: {close_e}")
         _zeroconf_instance = None
         _service_info_instance = None
+        _advertised_addresses = []
         return False
 
 def unregister_mdns_service():
     """Unregisters the mDNS service and closes Zeroconf."""
-    global _zeroconf_instance, _service_info_instance
+    global _zeroconf_instance, _service_info_instance, _advertised_addresses
+    _stop_address_watcher()
     if _zeroconf_instance and _service_info_instance:
         logger.info("Unregistering mDNS service...")
         try:
@@ -129,8 +211,10 @@ def unregister_mdns_service():
         except Exception as e:
             logger.error(f"Error closing Zeroconf (when service_info was None): {e}", exc_info=True)
 
-    _zeroconf_instance = None
-    _service_info_instance = None
+    with _record_lock:
+        _zeroconf_instance = None
+        _service_info_instance = None
+        _advertised_addresses = []
 
 if __name__ == '__main__':
     # Setup basic console logging for testing this module directly
@@ -0,0 +1,196 @@
+# mouse_stream.py
+# Relative mouse movement streamed from a touchpad area on the phone.
+# MOUSE_MOVE packets arrive at 250-1000 Hz, are never acknowledged and carry a
+# per-client sequence number so duplicates can be discarded and losses counted.
+# A late (reordered) packet is still applied: deltas are relative, so their order
+# within a frame does not matter, only that each one is applied exactly once. One
+# more than SEQUENCE_WINDOW behind can no longer be told from a duplicate and is
+# dropped as "late"; it stays counted as lost, since it was never applied.
+#
+# The receive thread only adds deltas to an accumulator. A mover thread injects the
+# sum as one move: immediately if the previous move is at least one frame old,
+# otherwise at the start of the next frame, so a burst of packets costs one
+# SendInput per frame while a single flick is not delayed at all.
+#
+# Wire format (payload is a plain string so the fast path can split it without JSON):
+#   {"packetId":"<id>","timestamp":<ms>,"type":"MOUSE_MOVE","payload":"<seq>,<dx>,<dy>"}
+
+import threading
+import time
+import logging
+
+import config
+import input_backend
+import precise_timing
+
+logger = logging.getLogger("StarButtonBoxServer.MouseStream")
+
+DEFAULT_FRAME_MS = 4.0
+MAX_DELTA = 10_000          # Per packet; anything larger is treated as garbage
+SEQUENCE_WINDOW = 64        # Reordered packets up to this far behind the newest are still applied, older ones are late
+SEQUENCE_RESET_GAP = 1000   # A sequence this far behind the newest means the phone restarted its stream
+LATENCY_WINDOW = 1024
+
+_TYPE_MARKER = b'"type":"' + config.PACKET_TYPE_MOUSE_MOVE.encode('utf-8') + b'"'
+_PAYLOAD_PREFIX = b'"payload":"'
+
+def parse_payload(payload):
+    """Parses "<seq>,<dx>,<dy>" (str or bytes). Raises ValueError if malformed."""
+    seq, dx, dy = (int(part) for part in payload.split(b',' if isinstance(payload, bytes) else ','))
+    if abs(dx) > MAX_DELTA or abs(dy) > MAX_DELTA or seq < 0:
+        raise ValueError(f"delta out of range ({dx}, {dy}) or negative sequence")
+    return seq, dx, dy
+
+def extract_fast(data_bytes):
+    """Returns (seq, dx, dy) if data_bytes is a MOUSE_MOVE in the app's wire layout, otherwise None."""
+    if _TYPE_MARKER not in data_bytes:
+        return None
+    start = data_bytes.find(_PAYLOAD_PREFIX)
+    if start < 0:
+        return None
+    start += len(_PAYLOAD_PREFIX)
+    end = data_bytes.find(b'"', start)
+    try:
+        return parse_payload(data_bytes[start:end])
+    except ValueError:
+        return None
+
+class _SequenceTracker:
+    """Duplicate detection and loss counting for one client's sequence numbers."""
+    __slots__ = ("highest", "seen_mask")
+
+    def __init__(self):
+        self.highest = -1
+        self.seen_mask = 0 # Bit i set: sequence (highest - i) has been applied
+
+    def accept(self, seq, counters):
+        if self.highest < 0 or seq < self.highest - SEQUENCE_RESET_GAP:
+            self.highest, self.seen_mask = seq, 1
+            return True
+        if seq > self.highest:
+            gap = seq - self.highest
+            if gap > SEQUENCE_RESET_GAP: # The phone restarted its stream further ahead; nothing in between was sent
+                self.highest, self.seen_mask = seq, 1
+                return True
+            counters["lost"] += gap - 1 # Provisionally; late arrivals within the window give it back
+            self.seen_mask = ((self.seen_mask << gap) | 1) & ((1 << SEQUENCE_WINDOW) - 1) if gap < SEQUENCE_WINDOW else 1
+            self.highest = seq
+            return True
+        behind = self.highest - seq
+        if behind >= SEQUENCE_WINDOW: # Most likely a packet already counted as lost; too old to apply safely
+            counters["late"] += 1
+            return False
+        if self.seen_mask & (1 << behind):
+            counters["duplicates"] += 1
+            return False
+        self.seen_mask |= 1 << behind
+        if counters["lost"] > 0: # Its loss may have been counted before the last stats reset
+            counters["lost"] -= 1
+        counters["reordered"] += 1
+        return True
+
+class MouseStream:
+    """Accumulates streamed deltas and injects them at most once per frame."""
+
+    def __init__(self, frame_ms=DEFAULT_FRAME_MS):
+        self.frame_ns = int(frame_ms * 1_000_000)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dx = 0
+        self._dy = 0
+        self._first_pending_ns = 0 # Receive time of the oldest delta not yet injected
+        self._last_move_ns = 0
+        self._trackers = {} # addr -> _SequenceTracker
+        self._latencies_us = []
+        self._counters = {"packets": 0, "moves": 0, "lost": 0, "duplicates": 0, "reordered": 0, "late": 0}
+        self._stop_event = None # Per mover thread, so a restart never revives a stopping thread
+        self._thread = None     # Kept until the thread has actually exited
+
+    def configure(self, frame_ms=None):
+        if frame_ms is not None:
+            self.frame_ns = int(min(max(float(frame_ms), 0.0), 50.0) * 1_000_000)
+
+    def add(self, addr, seq, dx, dy, received_time_ns):
+        """Called on the receive thread for every MOUSE_MOVE packet."""
+        with self._lock:
+            tracker = self._trackers.get(addr)
+            if tracker is None:
+                tracker = self._trackers[addr] = _SequenceTracker()
+            self._counters["packets"] += 1
+            if not tracker.accept(seq, self._counters) or not (dx or dy):
+                return
+            if not self._first_pending_ns:
+                self._first_pending_ns = received_time_ns
+            self._dx += dx
+            self._dy += dy
+            if self._thread is None:
+                self._stop_event = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop_event,), name="MouseMover", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self, stop_event):
+        try:
+            self._move_loop(stop_event)
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _move_loop(self, stop_event):
+        while True:
+            self._wake.wait()
+            if stop_event.is_set():
+                return
+            frame_start_ns = self._last_move_ns + self.frame_ns
+            if frame_start_ns > time.perf_counter_ns():
+                precise_timing.wait_until(frame_start_ns) # Let the rest of this frame's deltas accumulate
+            with self._lock:
+                dx, dy, first_ns = self._dx, self._dy, self._first_pending_ns
+                self._dx = self._dy = self._first_pending_ns = 0
+                self._wake.clear()
+            if not (dx or dy):
+                continue
+            try:
+                input_backend.send([input_backend.mouse_move(dx, dy)])
+            except Exception as e:
+                logger.error(f"Mouse move ({dx}, {dy}) failed: {e}")
+            now_ns = time.perf_counter_ns()
+            self._last_move_ns = now_ns
+            with self._lock:
+                self._counters["moves"] += 1
+                self._latencies_us.append((now_ns - first_ns) // 1000)
+                del self._latencies_us[:-LATENCY_WINDOW]
+
+    def get_stats(self, reset=False):
+        """Counters plus input-to-move latency (ms, from the oldest delta in each move) over the recent window."""
+        with self._lock:
+            stats = dict(self._counters)
+            ordered = sorted(self._latencies_us)
+            if reset:
+                self._latencies_us.clear()
+                for key in self._counters:
+                    self._counters[key] = 0
+        if ordered:
+            stats["latency_p50_ms"] = ordered[len(ordered) // 2] / 1000.0
+            stats["latency_p99_ms"] = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] / 1000.0
+            stats["latency_max_ms"] = ordered[-1] / 1000.0
+        return stats
+
+    def stop(self):
+        """Drops pending movement and ends the mover thread (server stop). The stream restarts on the next packet."""
+        with self._lock:
+            thread, stop_event = self._thread, self._stop_event
+            self._dx = self._dy = self._first_pending_ns = 0
+            self._trackers.clear()
+        if thread is None:
+            return
+        stop_event.set()
+        self._wake.set()
+        thread.join(timeout=1.0)
+        if thread.is_alive(): # Stuck in SendInput; it exits on its own and no second mover starts meanwhile
+            logger.warning("Mouse mover thread did not stop within 1 s.")
+            return
+        with self._lock:
+            if self._thread is None:
+                self._wake.clear()
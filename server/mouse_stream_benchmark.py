@@ -0,0 +1,84 @@
+# mouse_stream_benchmark.py
+# Measures the MOUSE_MOVE stream: server CPU per packet, how many packets are
+# coalesced into each injected move, input-to-move latency, and that no movement
+# is lost. Starts the UDP server in-process (mDNS disabled, input only recorded)
+# and streams deltas the way the phone's touchpad does.
+#
+# Usage: python mouse_stream_benchmark.py [--rate 1000] [--seconds 5] [--frame-ms 4] [--port 58149]
+
+import argparse
+import json
+import logging
+import socket
+import sys
+import time
+import uuid
+
+import config
+import input_backend
+import server as server_control
+
+def _stream(port, rate_hz, duration_sec):
+    """Sends MOUSE_MOVE packets at rate_hz. Returns (packets sent, sum dx, sum dy, client CPU seconds)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    packet_id = str(uuid.uuid4())
+    interval_sec = 1.0 / rate_hz
+    sent = total_dx = total_dy = 0
+    cpu_start = time.thread_time()
+    next_send = time.perf_counter()
+    deadline = next_send + duration_sec
+    while next_send < deadline:
+        while time.perf_counter() < next_send:
+            pass
+        dx, dy = 3 + sent % 5, -(sent % 3)
+        packet = {"packetId": packet_id, "timestamp": int(time.time() * 1000),
+                  "type": config.PACKET_TYPE_MOUSE_MOVE, "payload": f"{sent},{dx},{dy}"}
+        sock.sendto(json.dumps(packet, separators=(',', ':')).encode('utf-8'), ('127.0.0.1', port))
+        sent += 1
+        total_dx += dx
+        total_dy += dy
+        next_send += interval_sec
+    cpu = time.thread_time() - cpu_start
+    sock.close()
+    return sent, total_dx, total_dy, cpu
+
+def run_benchmark(port, rate_hz, duration_sec, frame_ms):
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    server_control.start_server(port, False, None, None)
+    server_control.mouse_mover.configure(frame_ms=frame_ms)
+    time.sleep(0.5) # Let the socket bind
+    server_control.mouse_mover.get_stats(reset=True)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    sent, total_dx, total_dy, client_cpu = _stream(port, rate_hz, duration_sec)
+    time.sleep(0.2) # Let the last frame go out
+    wall_elapsed = time.perf_counter() - wall_start
+    server_cpu = max(time.process_time() - cpu_start - client_cpu, 1e-9)
+    stats = server_control.mouse_mover.get_stats()
+    server_control.stop_server()
+
+    moved_dx = sum(event[1] for _, batch in backend.batches for event in batch if event[0] == input_backend.EVENT_MOUSE_MOVE)
+    moved_dy = sum(event[2] for _, batch in backend.batches for event in batch if event[0] == input_backend.EVENT_MOUSE_MOVE)
+    print(f"frame {frame_ms:g} ms: {sent} packets at {sent / duration_sec:.0f}/s -> {stats['moves']} moves "
+          f"({stats['packets'] / max(stats['moves'], 1):.1f} packets/move), {stats['lost']} lost")
+    print(f"  movement sent ({total_dx}, {total_dy}), injected ({moved_dx}, {moved_dy})")
+    if "latency_p50_ms" in stats:
+        print(f"  input-to-move latency p50 {stats['latency_p50_ms']:.2f} ms, p99 {stats['latency_p99_ms']:.2f} ms, "
+              f"max {stats['latency_max_ms']:.2f} ms")
+    print(f"  server CPU {server_cpu * 1000:.1f} ms ({server_cpu / wall_elapsed * 100:.1f}% of one core), "
+          f"{server_cpu * 1_000_000 / max(sent, 1):.1f} us per packet")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox mouse stream benchmark")
+    parser.add_argument("--rate", type=float, default=1000.0, help="MOUSE_MOVE packets per second")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--frame-ms", type=float, default=4.0, help="Coalescing frame (0 injects every packet)")
+    parser.add_argument("--port", type=int, default=58149)
+    args = parser.parse_args()
+
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    print(f"Streaming {args.rate:.0f} Hz for {args.seconds:g}s", file=sys.stderr)
+    run_benchmark(args.port, args.rate, args.seconds, args.frame_ms)
+    run_benchmark(args.port, args.rate, args.seconds, 0.0)
@@ -0,0 +1,131 @@
+# packet_capture.py
+# Optional capture of every raw datagram the server receives, with its arrival
+# time, so real sessions can be replayed deterministically with packet_replay.py.
+#
+# File layout (little endian):
+#   header: magic, version, epoch_offset_ns
+#   records: arrival_ns (perf_counter_ns), client_ip, client_port, length, then `length` bytes of datagram
+# Add epoch_offset_ns to an arrival time to get Unix time in ns.
+
+import os
+import socket
+import struct
+import threading
+import time
+import logging
+
+logger = logging.getLogger("StarButtonBoxServer.Capture")
+
+CAPTURE_MAGIC = b"SBBCAPT1"
+CAPTURE_VERSION = 1
+CAPTURE_FILE_EXTENSION = ".sbbcap"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024 # Capturing stops once a file reaches this size
+
+_HEADER = struct.Struct("<8sIq")
+_RECORD = struct.Struct("<QIHH")
+
+class PacketCapture:
+    """Appends raw datagrams to a capture file. Thread safe."""
+
+    def __init__(self, file_path, max_bytes=DEFAULT_MAX_BYTES):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.packet_count = 0
+        self._lock = threading.Lock()
+        self._client_ids = {}
+        self._file = open(file_path, "wb")
+        self._bytes_written = _HEADER.size
+        self._file.write(_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, time.time_ns() - time.perf_counter_ns()))
+
+    def write(self, arrival_ns, addr, data_bytes):
+        client = self._client_ids.get(addr)
+        if client is None:
+            client = self._client_ids[addr] = (int.from_bytes(socket.inet_aton(addr[0]), 'big'), addr[1])
+        record_size = _RECORD.size + len(data_bytes)
+        with self._lock:
+            if self._file is None:
+                return
+            if self._bytes_written + record_size > self.max_bytes:
+                logger.warning(f"Capture file '{self.file_path}' reached {self.max_bytes} bytes. Capture stopped.")
+                self._close_locked()
+                return
+            self._file.write(_RECORD.pack(arrival_ns, client[0], client[1], len(data_bytes)))
+            self._file.write(data_bytes)
+            self._bytes_written += record_size
+            self.packet_count += 1
+
+    def _close_locked(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+# --- Module-level capture used by the receive loop ---
+# `active` is checked on the receive thread so a disabled capture costs one attribute read.
+active = False
+_capture = None
+_capture_lock = threading.Lock()
+
+def new_capture_path(directory):
+    return os.path.join(directory, time.strftime("capture_%Y%m%d_%H%M%S") + CAPTURE_FILE_EXTENSION)
+
+def configure(enabled, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Starts a new capture file in directory, or stops capturing. Returns True if capturing afterwards."""
+    global active, _capture
+    with _capture_lock:
+        if not enabled:
+            if _capture:
+                active = False
+                _capture.close()
+                logger.info(f"Packet capture stopped ({_capture.packet_count} packets in '{_capture.file_path}').")
+                _capture = None
+            return False
+        if _capture:
+            return True
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _capture = PacketCapture(new_capture_path(directory), max_bytes)
+        except Exception as e:
+            logger.error(f"Could not start packet capture in '{directory}': {e}")
+            return False
+        active = True
+        logger.info(f"Capturing received packets to '{_capture.file_path}'.")
+        return True
+
+def close():
+    configure(False)
+
+def capture(arrival_ns, addr, data_bytes):
+    current = _capture
+    if current is not None:
+        current.write(arrival_ns, addr, data_bytes)
+
+def read_capture(file_path):
+    """
+    Reads a capture file. Returns (epoch_offset_ns, packets) where packets is a list of
+    (arrival_ns, (ip, port), data_bytes) in arrival order. A truncated last record is ignored.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError(f"'{file_path}' is too short to be a capture file")
+    magic, version, epoch_offset_ns = _HEADER.unpack_from(data, 0)
+    if magic != CAPTURE_MAGIC:
+        raise ValueError(f"'{file_path}' is not a capture file")
+    if version != CAPTURE_VERSION:
+        raise ValueError(f"Unsupported capture version {version}")
+
+    packets = []
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(data):
+        arrival_ns, ip_u32, port, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if offset + length > len(data):
+            break
+        addr = (socket.inet_ntoa(ip_u32.to_bytes(4, 'big')), port)
+        packets.append((arrival_ns, addr, data[offset:offset + length]))
+        offset += length
+    return epoch_offset_ns, packets
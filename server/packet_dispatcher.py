@@ -0,0 +1,262 @@
+# packet_dispatcher.py
+# Table-driven routing of decoded UDP packets to their handlers.
+# Handlers register themselves per packet type together with where they run
+# and what their payload must look like. The receive loop only calls dispatch().
+#
+# Handler classes:
+#   inline    runs on the receive thread; only for replies that never block (PING)
+#   injector  fast path for input injection, on the macro worker pool
+#   isolated  anything touching the GUI, browser or OS, on an IsolatedWorker with a timeout
+# The receive thread itself never waits on the injector or isolated classes.
+
+import json
+import threading
+import time
+import logging
+from collections import namedtuple
+
+import ack_batcher
+import trace_recorder
+
+# Child of the server logger so rejections also reach the GUI log handler
+logger = logging.getLogger("StarButtonBoxServer.Dispatcher")
+
+# --- Execution modes ---
+MODE_INLINE = "inline"         # Runs on the receive thread. Must be fast and never block.
+MODE_INJECTOR = "injector"     # Runs on the macro injection pool (input simulation).
+MODE_ISOLATED = "isolated"     # Runs on the isolated worker (GUI, browser, OS calls), subject to its timeout.
+
+HandlerSpec = namedtuple("HandlerSpec", [
+    "packet_type",
+    "handler",            # handler(ctx, payload)
+    "mode",
+    "payload_schema",     # None (no payload used) or {field_name: type or tuple of types} of required fields
+    "payload_parser",     # Optional callable(raw_payload_str) -> payload, replaces JSON parsing + schema check
+    "requires_packet_id",
+    "ack_type",           # Packet type to acknowledge with before the handler runs, or None
+    "admission",          # Optional admission_control.AdmissionQueue bounding queued jobs
+    "nack_type",          # Packet type sent instead of ack_type when admission rejects with a NACK
+    "scheduler",          # Optional playout_scheduler.PlayoutScheduler that may hold the job until its due time
+])
+
+_handlers = {}
+_executors = {MODE_INJECTOR: None, MODE_ISOLATED: None}
+_max_queue_depths = {MODE_INJECTOR: 0, MODE_ISOLATED: 0} # Highest depth seen at submit since the last reset
+
+_stats_lock = threading.Lock()
+_handler_stats = {} # packet_type -> [count, total_ns, max_ns, errors]
+
+class PacketContext:
+    """Per-packet information handed to handlers, plus a way to reply to the sender."""
+    __slots__ = ("sock", "addr", "packet_type", "packet_id", "timestamp", "received_time_ns",
+                 "dispatch_time_ns", "inject_start_ns", "inject_end_ns", "action_id", "scheduled_time_ns",
+                 "ack_hook")
+
+    def __init__(self, sock, addr, packet_type, packet_id, timestamp, received_time_ns):
+        self.sock = sock
+        self.addr = addr
+        self.packet_type = packet_type
+        self.packet_id = packet_id
+        self.timestamp = timestamp
+        self.received_time_ns = received_time_ns
+        # Timing for trace_recorder. Handlers that inject input set the inject_* times and
+        # action_id themselves; otherwise the handler's own run time is recorded.
+        self.dispatch_time_ns = 0
+        self.inject_start_ns = 0
+        self.inject_end_ns = 0
+        self.action_id = 0
+        self.scheduled_time_ns = 0 # Due time when a playout scheduler held the packet, else 0
+        self.ack_hook = None # Optional callable(ctx, reply_type) taking over ACK/NACK replies (see relay_forwarder)
+
+    def reply(self, packet_type, payload=None):
+        """Sends a packet with this packet's ID back to the sender."""
+        packet = {
+            "packetId": self.packet_id, "timestamp": int(time.time() * 1000),
+            "type": packet_type, "payload": payload
+        }
+        self.sock.sendto(json.dumps(packet).encode('utf-8'), self.addr)
+
+def register_handler(packet_type, mode=MODE_INLINE, payload_schema=None, payload_parser=None,
+                     requires_packet_id=False, ack_type=None, admission=None, nack_type=None, scheduler=None):
+    """Decorator registering handler(ctx, payload) for packet_type."""
+    def decorator(handler):
+        if packet_type in _handlers:
+            logger.warning(f"Handler for '{packet_type}' replaced by {handler.__name__}.")
+        _handlers[packet_type] = HandlerSpec(packet_type, handler, mode, payload_schema, payload_parser,
+                                             requires_packet_id, ack_type, admission, nack_type, scheduler)
+        return handler
+    return decorator
+
+def get_handler_spec(packet_type):
+    """Returns the HandlerSpec registered for packet_type, or None."""
+    return _handlers.get(packet_type)
+
+def set_executors(injector_executor, isolated_worker):
+    """Sets the ThreadPoolExecutor used for MODE_INJECTOR and the IsolatedWorker used for MODE_ISOLATED (None while stopped)."""
+    _executors[MODE_INJECTOR] = injector_executor
+    _executors[MODE_ISOLATED] = isolated_worker
+
+def _queue_depth(executor):
+    if executor is None:
+        return 0
+    if hasattr(executor, "qsize"):
+        return executor.qsize()
+    return executor._work_queue.qsize() # ThreadPoolExecutor
+
+def _parse_payload(spec, raw_payload):
+    """Returns the parsed payload. Raises ValueError with a readable message if it does not match the spec."""
+    if spec.payload_parser is not None:
+        if not raw_payload:
+            raise ValueError("missing payload")
+        return spec.payload_parser(raw_payload)
+    if spec.payload_schema is None:
+        return None
+    if not raw_payload:
+        raise ValueError("missing payload")
+    try:
+        payload = json.loads(raw_payload)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid payload JSON: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be a JSON object")
+    for field, expected_type in spec.payload_schema.items():
+        value = payload.get(field)
+        if value is None:
+            raise ValueError(f"missing '{field}' in payload")
+        if not isinstance(value, expected_type):
+            raise ValueError(f"'{field}' has unexpected type {type(value).__name__}")
+    return payload
+
+def _send_reply(ctx, reply_type):
+    if ctx.ack_hook is not None:
+        ctx.ack_hook(ctx, reply_type)
+        return
+    try:
+        ctx.reply(reply_type)
+    except Exception as send_e:
+        logger.error(f"Error sending {reply_type} for {ctx.packet_type} (ID: {ctx.packet_id}): {send_e}")
+
+def _send_ack(ctx, ack_type):
+    """Acknowledges directly, or through ack_batcher for clients that negotiated batched ACKs."""
+    if ctx.ack_hook is not None or not ack_batcher.add(ctx, ack_type):
+        _send_reply(ctx, ack_type)
+
+def _run_timed(spec, ctx, payload):
+    if spec.admission is not None and not spec.admission.begin(ctx, payload):
+        return # Dropped by admission policy (e.g. stale)
+    start_ns = time.perf_counter_ns()
+    failed = False
+    try:
+        spec.handler(ctx, payload)
+    except Exception as e:
+        failed = True
+        logger.error(f"Handler for {spec.packet_type} (ID: {ctx.packet_id}) failed: {e}", exc_info=True)
+    end_ns = time.perf_counter_ns()
+    elapsed_ns = end_ns - start_ns
+    if trace_recorder.active:
+        ctx.dispatch_time_ns = start_ns
+        if not ctx.inject_start_ns:
+            ctx.inject_start_ns, ctx.inject_end_ns = start_ns, end_ns
+        trace_recorder.record_packet(ctx, failed)
+    with _stats_lock:
+        stats = _handler_stats.get(spec.packet_type)
+        if stats is None:
+            stats = _handler_stats[spec.packet_type] = [0, 0, 0, 0]
+        stats[0] += 1
+        stats[1] += elapsed_ns
+        if elapsed_ns > stats[2]:
+            stats[2] = elapsed_ns
+        if failed:
+            stats[3] += 1
+
+def dispatch(ctx, raw_payload):
+    """
+    Routes one decoded packet to its registered handler.
+    Returns False if the packet was dropped (unknown type, missing ID, bad payload, refused admission or no pool).
+    """
+    spec = _handlers.get(ctx.packet_type)
+    if spec is None:
+        logger.warning(f"Unknown packet type '{ctx.packet_type}'.")
+        return False
+    if spec.requires_packet_id and not ctx.packet_id:
+        logger.warning(f"{ctx.packet_type} missing packetId. Cannot acknowledge or process.")
+        return False
+
+    try:
+        payload = _parse_payload(spec, raw_payload)
+    except ValueError as e:
+        if spec.ack_type:
+            _send_ack(ctx, spec.ack_type) # Received, even though it cannot be executed
+        logger.error(f"Rejected {ctx.packet_type} (ID: {ctx.packet_id}): {e}")
+        return False
+
+    if spec.admission is not None:
+        admitted, send_nack = spec.admission.admit(ctx, payload)
+        if not admitted:
+            if send_nack and spec.nack_type:
+                _send_reply(ctx, spec.nack_type) # Never batched, the client acts on it
+            elif spec.ack_type:
+                _send_ack(ctx, spec.ack_type)
+            return False
+    if spec.ack_type:
+        _send_ack(ctx, spec.ack_type)
+
+    if spec.mode == MODE_INLINE:
+        _run_timed(spec, ctx, payload)
+        return True
+    if spec.scheduler is not None:
+        try:
+            if spec.scheduler.schedule(ctx, lambda: _submit(spec, ctx, payload), lambda: _release(spec, ctx, payload)):
+                return True
+        except Exception as e: # Neither job nor cancel will run; free the admission slot here
+            _release(spec, ctx, payload)
+            logger.error(f"Could not schedule {ctx.packet_type} (ID: {ctx.packet_id}): {e}", exc_info=True)
+            return False
+    return _submit(spec, ctx, payload)
+
+def _release(spec, ctx, payload):
+    if spec.admission is not None:
+        spec.admission.release(ctx, payload)
+
+def _submit(spec, ctx, payload):
+    """Queues the handler on its pool. Called from dispatch() or, for held packets, the scheduler thread."""
+    executor = _executors.get(spec.mode)
+    try:
+        if executor is None:
+            raise RuntimeError("not running")
+        executor.submit(_run_timed, spec, ctx, payload)
+    except RuntimeError as e:
+        _release(spec, ctx, payload)
+        logger.error(f"No {spec.mode} pool available for {ctx.packet_type} (ID: {ctx.packet_id}): {e}")
+        return False
+    depth = _queue_depth(executor)
+    if depth > _max_queue_depths[spec.mode]:
+        _max_queue_depths[spec.mode] = depth
+    return True
+
+def get_queue_depths(reset_max=False):
+    """Returns {mode: {"current": jobs waiting now, "max": most waiting at any submit since the last reset}}."""
+    depths = {mode: {"current": _queue_depth(_executors[mode]), "max": _max_queue_depths[mode]}
+              for mode in _max_queue_depths}
+    if reset_max:
+        for mode in _max_queue_depths:
+            _max_queue_depths[mode] = 0
+    return depths
+
+def get_handler_stats():
+    """Returns {packet_type: {"count", "avg_ms", "max_ms", "errors"}} for every handler that has run."""
+    with _stats_lock:
+        snapshot = {packet_type: list(stats) for packet_type, stats in _handler_stats.items()}
+    return {
+        packet_type: {
+            "count": count,
+            "avg_ms": (total_ns / count) / 1_000_000.0 if count else 0.0,
+            "max_ms": max_ns / 1_000_000.0,
+            "errors": errors,
+        }
+        for packet_type, (count, total_ns, max_ns, errors) in snapshot.items()
+    }
+
+def reset_handler_stats():
+    with _stats_lock:
+        _handler_stats.clear()
@@ -0,0 +1,177 @@
+# packet_replay.py
+# Replays a capture written by packet_capture through the server's own receive path
+# (server._handle_datagram -> packet_dispatcher) against input_backend.RecordingBackend,
+# so ordering bugs and throughput/latency regressions from real sessions can be
+# reproduced on any machine, including Linux. Nothing is sent to the network or the OS:
+# replies are collected by a stand-in socket and injected input is only recorded.
+#
+# Isolated handlers (browser, mouse capture, auto drag) have side effects on the
+# replaying machine and are skipped unless --include-isolated is given.
+# With --workers 1 the injected event sequence is deterministic, so its digest can be
+# compared between runs and code versions.
+#
+# Usage: python packet_replay.py capture.sbbcap [--fast | --speed 2.0] [--workers 10]
+#                                [--trace out.sbbtrace] [--events-out events.txt] [--include-isolated]
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ack_batcher
+import input_backend
+import key_codes
+import packet_capture
+import packet_dispatcher
+import precise_timing
+import server as server_control
+import trace_recorder
+from isolated_worker import IsolatedWorker
+
+
+class ReplySink:
+    """Stands in for the server socket and keeps every reply sent through it."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.replies = [] # (perf_counter_ns, addr, data_bytes)
+
+    def sendto(self, data_bytes, addr):
+        with self._lock:
+            self.replies.append((time.perf_counter_ns(), addr, bytes(data_bytes)))
+        return len(data_bytes)
+
+def _packet_type(data_bytes):
+    try:
+        return json.loads(data_bytes.decode('utf-8')).get('type')
+    except (UnicodeDecodeError, ValueError, AttributeError):
+        return None
+
+def _wait_until(target_ns):
+    """Returns how late (ns) the target time was reached."""
+    return precise_timing.wait_until(target_ns)
+
+def format_event(event):
+    kind, code, value = event
+    if kind == input_backend.EVENT_KEY:
+        return f"key {key_codes.key_name(code)} {'down' if value else 'up'}"
+    if kind == input_backend.EVENT_MOUSE_BUTTON:
+        return f"mouse {code} {'down' if value else 'up'}"
+    if kind == input_backend.EVENT_MOUSE_MOVE:
+        return f"move {code:+d} {value:+d}"
+    if kind == input_backend.EVENT_MOUSE_MOVE_TO:
+        return f"move to {code} {value}"
+    return f"scroll {value:+d}"
+
+def replay(packets, speed=1.0, fast=False, workers=10, include_isolated=False):
+    """
+    Feeds captured packets to the dispatcher. Returns a dict with the replay results.
+    speed scales the original inter-arrival times; fast ignores them.
+    """
+    backend = input_backend.RecordingBackend()
+    previous_backend = input_backend.get_backend()
+    input_backend.set_backend(backend)
+    sink = ReplySink()
+    injector = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='MacroWorker')
+    isolated = IsolatedWorker()
+    packet_dispatcher.set_executors(injector, isolated)
+    packet_dispatcher.reset_handler_stats()
+    ack_batcher.reset()
+
+    replayed = 0
+    skipped = 0
+    max_late_ns = 0
+    first_arrival_ns = packets[0][0] if packets else 0
+    start_ns = time.perf_counter_ns()
+    try:
+        for arrival_ns, addr, data_bytes in packets:
+            if not include_isolated:
+                spec = packet_dispatcher.get_handler_spec(_packet_type(data_bytes))
+                if spec is not None and spec.mode == packet_dispatcher.MODE_ISOLATED:
+                    skipped += 1
+                    continue
+            if not fast:
+                late_ns = _wait_until(start_ns + int((arrival_ns - first_arrival_ns) / speed))
+                if late_ns > max_late_ns:
+                    max_late_ns = late_ns
+            server_control._handle_datagram(sink, data_bytes, addr, time.perf_counter_ns())
+            ack_batcher.flush_due()
+            replayed += 1
+        ack_batcher.flush_all()
+        feed_done_ns = time.perf_counter_ns()
+    finally:
+        injector.shutdown(wait=True)
+        isolated.shutdown(wait=True)
+        packet_dispatcher.set_executors(None, None)
+        input_backend.set_backend(previous_backend)
+    end_ns = time.perf_counter_ns()
+
+    return {
+        "replayed": replayed,
+        "skipped": skipped,
+        "original_duration_s": ((packets[-1][0] - first_arrival_ns) / 1e9) if packets else 0.0,
+        "feed_duration_s": (feed_done_ns - start_ns) / 1e9,
+        "total_duration_s": (end_ns - start_ns) / 1e9,
+        "max_late_ms": max_late_ns / 1e6,
+        "replies": sink.replies,
+        "batches": backend.batches,
+        "handler_stats": packet_dispatcher.get_handler_stats(),
+    }
+
+def print_report(results):
+    print(f"Replayed {results['replayed']} packet(s), skipped {results['skipped']} isolated packet(s)")
+    print(f"Original span {results['original_duration_s']:.3f}s, fed in {results['feed_duration_s']:.3f}s "
+          f"(max scheduling lateness {results['max_late_ms']:.3f} ms), done in {results['total_duration_s']:.3f}s")
+    if results['feed_duration_s'] > 0:
+        print(f"Throughput {results['replayed'] / results['feed_duration_s']:.0f} packets/s")
+
+    reply_counts = {}
+    for _, _, data_bytes in results["replies"]:
+        reply_type = _packet_type(data_bytes)
+        reply_counts[reply_type] = reply_counts.get(reply_type, 0) + 1
+    print("Replies: " + (", ".join(f"{t}={n}" for t, n in sorted(reply_counts.items(), key=str)) or "none"))
+
+    events = [event for _, batch in results["batches"] for event in batch]
+    digest = hashlib.sha256("\n".join(format_event(e) for e in events).encode('utf-8')).hexdigest()[:16]
+    print(f"Injected {len(events)} event(s) in {len(results['batches'])} batch(es), sequence digest {digest}")
+
+    for packet_type, stats in sorted(results["handler_stats"].items()):
+        print(f"  {packet_type}: {stats['count']} run(s), avg {stats['avg_ms']:.3f} ms, "
+              f"max {stats['max_ms']:.3f} ms, {stats['errors']} error(s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox packet capture replay")
+    parser.add_argument("capture_file")
+    parser.add_argument("--fast", action="store_true", help="Ignore the original timing and feed packets back to back")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time scale for the original inter-arrival times")
+    parser.add_argument("--workers", type=int, default=10, help="Macro worker threads (1 gives a deterministic event order)")
+    parser.add_argument("--include-isolated", action="store_true", help="Also run browser/mouse capture/auto drag handlers")
+    parser.add_argument("--trace", help="Write a trace_recorder file for trace_analysis.py")
+    parser.add_argument("--events-out", help="Write the injected event sequence, one event per line")
+    parser.add_argument("--verbose", action="store_true", help="Keep per-macro console output")
+    args = parser.parse_args()
+
+    try:
+        _, captured_packets = packet_capture.read_capture(args.capture_file)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.trace:
+        trace_recorder.configure(True, args.trace, max(len(captured_packets), 1))
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        replay_results = replay(captured_packets, args.speed, args.fast, max(args.workers, 1), args.include_isolated)
+    trace_recorder.close()
+
+    print_report(replay_results)
+    if args.events_out:
+        with open(args.events_out, 'w', encoding='utf-8') as f:
+            for batch_time_ns, batch in replay_results["batches"]:
+                for event in batch:
+                    f.write(f"{batch_time_ns} {format_event(event)}\n")
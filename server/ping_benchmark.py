@@ -0,0 +1,94 @@
+# ping_benchmark.py
+# Measures server CPU cost per HEALTH_CHECK_PING with and without the fast path.
+# Starts the UDP server in-process (mDNS disabled), floods it with PINGs from
+# several simulated phones and reports answered PINGs per CPU second.
+#
+# Usage: python ping_benchmark.py [--clients 4] [--rate 500] [--seconds 5] [--port 58109]
+
+import argparse
+import json
+import logging
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import config
+import server as server_control
+
+def _client_task(port, rate_hz, duration_sec, results, index):
+    """Sends PINGs at rate_hz and counts PONGs received. Records its own CPU time."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.0)
+    interval_sec = 1.0 / rate_hz
+    sent = 0
+    received = 0
+    cpu_start = time.thread_time()
+    deadline = time.perf_counter() + duration_sec
+    next_send = time.perf_counter()
+    while time.perf_counter() < deadline:
+        now = time.perf_counter()
+        if now >= next_send:
+            packet = {"packetId": str(uuid.uuid4()), "timestamp": int(time.time() * 1000),
+                      "type": config.PACKET_TYPE_HEALTH_CHECK_PING, "payload": None}
+            sock.sendto(json.dumps(packet, separators=(',', ':')).encode('utf-8'), ('127.0.0.1', port))
+            sent += 1
+            next_send += interval_sec
+        try:
+            while True:
+                sock.recvfrom(config.BUFFER_SIZE)
+                received += 1
+        except (BlockingIOError, socket.timeout):
+            pass
+        time.sleep(0.0005)
+    time.sleep(0.2) # Drain late PONGs
+    try:
+        while True:
+            sock.recvfrom(config.BUFFER_SIZE)
+            received += 1
+    except (BlockingIOError, socket.timeout):
+        pass
+    results[index] = (sent, received, time.thread_time() - cpu_start)
+    sock.close()
+
+def run_benchmark(port, clients, rate_hz, duration_sec, fast_path):
+    server_control.PING_FAST_PATH_ENABLED = fast_path
+    server_control.start_server(port, False, None, None)
+    time.sleep(0.5) # Let the socket bind
+
+    results = [None] * clients
+    threads = [threading.Thread(target=_client_task, args=(port, rate_hz, duration_sec, results, i), daemon=True)
+               for i in range(clients)]
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_elapsed = time.perf_counter() - wall_start
+    process_cpu = time.process_time() - cpu_start
+
+    server_control.stop_server()
+
+    sent = sum(r[0] for r in results)
+    received = sum(r[1] for r in results)
+    client_cpu = sum(r[2] for r in results)
+    server_cpu = max(process_cpu - client_cpu, 1e-9)
+    label = "fast path" if fast_path else "full parse"
+    print(f"{label:>10}: {sent / wall_elapsed:8.0f} PING/s sent, {received}/{sent} answered, "
+          f"server CPU {server_cpu * 1000:7.1f} ms ({server_cpu / wall_elapsed * 100:5.1f}% of one core), "
+          f"{server_cpu * 1_000_000 / max(received, 1):6.1f} us CPU per PING")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox PING fast path benchmark")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=500.0, help="PINGs per second per client")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=58109)
+    args = parser.parse_args()
+
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.INFO)
+    print(f"{args.clients} client(s) x {args.rate:.0f} PING/s for {args.seconds:.0f}s", file=sys.stderr)
+    run_benchmark(args.port, args.clients, args.rate, args.seconds, fast_path=False)
+    run_benchmark(args.port, args.clients, args.rate, args.seconds, fast_path=True)
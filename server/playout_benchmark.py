@@ -0,0 +1,129 @@
+# playout_benchmark.py
+# Measures how much of the network jitter scheduled execution removes.
+# Starts the UDP server in-process (mDNS disabled, input only recorded), syncs the
+# clock with a few PING/PONG/CLOCK_SYNC_REPORT exchanges like the app does, then
+# sends taps stamped at an even interval but delayed by a random amount before
+# sending, to mimic Wi-Fi jitter. Reports the spread of the tap intervals as sent
+# (intended), as received, and as injected, with and without scheduling.
+#
+# Usage: python playout_benchmark.py [--taps 200] [--interval-ms 40] [--jitter-ms 15]
+#                                    [--playout-ms 30] [--port 58139]
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import config
+import input_backend
+import playout_scheduler
+import server as server_control
+
+_TAP = json.dumps({"type": "key_event", "key": "f9", "modifiers": [], "pressType": {"type": "tap"}})
+
+def _packet(packet_type, payload, timestamp_ms):
+    return json.dumps({"packetId": str(uuid.uuid4()), "timestamp": timestamp_ms,
+                       "type": packet_type, "payload": payload}, separators=(',', ':')).encode('utf-8')
+
+def _sync_clock(sock, target, exchanges=8):
+    """Runs PING/PONG exchanges and reports their timestamps the way the app does."""
+    sock.settimeout(1.0)
+    for _ in range(exchanges):
+        t1 = int(time.time() * 1000)
+        sock.sendto(_packet(config.PACKET_TYPE_HEALTH_CHECK_PING, None, t1), target)
+        pong = json.loads(sock.recvfrom(config.BUFFER_SIZE)[0].decode('utf-8'))
+        t4 = int(time.time() * 1000)
+        server_times = json.loads(pong["payload"])
+        report = json.dumps({"t1": t1, "t2": server_times["rx"], "t3": server_times["tx"], "t4": t4})
+        sock.sendto(_packet(config.PACKET_TYPE_CLOCK_SYNC_REPORT, report, t4), target)
+        time.sleep(0.02)
+
+def _drain(sock, stop_event):
+    sock.settimeout(0.1)
+    while not stop_event.is_set():
+        try:
+            sock.recvfrom(config.BUFFER_SIZE)
+        except (socket.timeout, OSError):
+            pass
+
+def _interval_spread(times_ms, interval_ms):
+    """Returns (max abs deviation, standard deviation) of consecutive intervals from interval_ms."""
+    deviations = [(b - a) - interval_ms for a, b in zip(times_ms, times_ms[1:])]
+    if not deviations:
+        return 0.0, 0.0
+    mean_sq = sum(d * d for d in deviations) / len(deviations)
+    return max(abs(d) for d in deviations), mean_sq ** 0.5
+
+def run_benchmark(port, taps, interval_ms, jitter_ms, playout_ms, scheduled, seed):
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    server_control.start_server(port, False, None, None)
+    server_control.macro_scheduler.configure(enabled=scheduled, playout_delay_ms=playout_ms,
+                                             late_policy=playout_scheduler.LATE_EXECUTE)
+    time.sleep(0.5) # Let the socket bind
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = ('127.0.0.1', port)
+    stop_event = threading.Event()
+    try:
+        _sync_clock(sock, target)
+        server_control.macro_scheduler.get_stats(reset=True)
+        drainer = threading.Thread(target=_drain, args=(sock, stop_event), daemon=True)
+        drainer.start()
+
+        rng = random.Random(seed)
+        start_ms = time.time() * 1000 + 50
+        intended, received = [], []
+        for index in range(taps):
+            stamp_ms = start_ms + index * interval_ms
+            send_at = stamp_ms + rng.uniform(0, jitter_ms)
+            while time.time() * 1000 < send_at:
+                time.sleep(0.0002)
+            intended.append(stamp_ms)
+            received.append(time.time() * 1000)
+            sock.sendto(_packet(config.PACKET_TYPE_MACRO_COMMAND, _TAP, int(round(stamp_ms))), target)
+        time.sleep((playout_ms + 200) / 1000.0)
+        stats = server_control.macro_scheduler.get_stats()
+    finally:
+        stop_event.set()
+        server_control.stop_server()
+        sock.close()
+
+    injected = [batch_ns / 1e6 for batch_ns, batch in backend.batches if batch and batch[0][2]] # Key-down batches
+    return {
+        "sent": _interval_spread(received, interval_ms),
+        "injected": _interval_spread(injected, interval_ms),
+        "injected_count": len(injected),
+        "stats": stats,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox scheduled execution jitter benchmark")
+    parser.add_argument("--taps", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=40.0, help="Intended spacing between taps")
+    parser.add_argument("--jitter-ms", type=float, default=15.0, help="Random extra send delay per tap (0..N ms)")
+    parser.add_argument("--playout-ms", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=58139)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    print(f"{args.taps} taps every {args.interval_ms:g} ms with 0-{args.jitter_ms:g} ms send jitter", file=sys.stderr)
+    for scheduled in (False, True):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # Per-macro console output
+            results = run_benchmark(args.port, args.taps, args.interval_ms, args.jitter_ms, args.playout_ms,
+                                    scheduled, args.seed)
+        label = f"scheduled +{args.playout_ms:g} ms" if scheduled else "on arrival"
+        stats = results["stats"]
+        print(f"{label:>18}: interval error sent max {results['sent'][0]:6.2f} / rms {results['sent'][1]:5.2f} ms, "
+              f"injected max {results['injected'][0]:6.2f} / rms {results['injected'][1]:5.2f} ms "
+              f"({results['injected_count']} taps)")
+        if scheduled:
+            print(f"{'':>18}  scheduler: {stats['scheduled']} scheduled, {stats['late_executed']} late; "
+                  f"input jitter sd {stats['input_jitter_ms']:.2f} ms, output jitter sd {stats['output_jitter_ms']:.2f} ms")
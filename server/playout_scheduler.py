@@ -0,0 +1,190 @@
+# playout_scheduler.py
+# Timestamp-scheduled execution (opt-in). Wi-Fi delivers evenly tapped inputs
+# unevenly; with scheduling on, each macro runs at the moment the phone sent it plus
+# a fixed playout delay, on the server timeline, instead of whenever it arrived:
+#   due = clock_sync.to_server_ms(packet timestamp) + playout_delay_ms
+# so the spacing between taps is reproduced as long as the network jitter stays
+# below the playout delay. A packet that arrives after its due time is late and,
+# depending on late_policy, is executed at once ("execute") or dropped ("drop").
+# Clients without a clock estimate yet (see clock_sync) are executed on arrival.
+#
+# One scheduler thread keeps the timeline: it sleeps until just before the earliest
+# due time (precise_timing's margin), spins the rest of the way, then hands the job
+# to the macro worker pool.
+#
+# Jitter is measured both ways: input jitter is the spread of (arrival - send time),
+# output jitter the spread of (injection start - due time) for the same packets.
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import logging
+
+import clock_sync
+import precise_timing
+
+logger = logging.getLogger("StarButtonBoxServer.Playout")
+
+LATE_EXECUTE = "execute"
+LATE_DROP = "drop"
+
+DEFAULT_PLAYOUT_DELAY_MS = 30.0
+MAX_PLAYOUT_DELAY_MS = 500.0
+MAX_SCHEDULE_AHEAD_MS = 2000.0 # Further in the future means a bad clock estimate; executed on arrival instead
+JITTER_WINDOW = 512            # Samples kept for the jitter statistics
+
+def _spread(values):
+    """Returns (standard deviation, p99 - p1) of values in ms."""
+    if len(values) < 2:
+        return 0.0, 0.0
+    mean = sum(values) / len(values)
+    stdev = math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+    ordered = sorted(values)
+    low = ordered[int(len(ordered) * 0.01)]
+    high = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+    return stdev, high - low
+
+class PlayoutScheduler:
+    """Holds dispatcher jobs until their due time (see packet_dispatcher.HandlerSpec.scheduler)."""
+
+    def __init__(self, name="PlayoutScheduler"):
+        self.name = name
+        self.enabled = False
+        self.playout_delay_ms = DEFAULT_PLAYOUT_DELAY_MS
+        self.late_policy = LATE_EXECUTE
+        self._cond = threading.Condition()
+        self._heap = [] # (due perf_counter_ns, sequence, job, cancel)
+        self._sequence = itertools.count()
+        self._thread = None
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+        self._input_offsets = []  # arrival - intended send time (ms), scheduled packets only
+        self._output_offsets = [] # injection start - due time (ms)
+        self._counters = {"scheduled": 0, "late_executed": 0, "late_dropped": 0, "unsynced": 0}
+
+    def configure(self, enabled=None, playout_delay_ms=None, late_policy=None):
+        if playout_delay_ms is not None:
+            self.playout_delay_ms = min(max(float(playout_delay_ms), 0.0), MAX_PLAYOUT_DELAY_MS)
+        if late_policy is not None:
+            if late_policy not in (LATE_EXECUTE, LATE_DROP):
+                logger.warning(f"Unknown late policy '{late_policy}'. Using '{LATE_EXECUTE}'.")
+                late_policy = LATE_EXECUTE
+            self.late_policy = late_policy
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    def schedule(self, ctx, job, cancel):
+        """
+        Called on the receive thread. Returns False if the packet should run immediately
+        (scheduling off, or no usable send time); otherwise job() or cancel() will be called.
+        """
+        if not self.enabled or not isinstance(ctx.timestamp, (int, float)):
+            return False
+        sent_ms = clock_sync.to_server_ms(ctx.addr, ctx.timestamp)
+        if sent_ms is None:
+            with self._stats_lock:
+                self._counters["unsynced"] += 1
+            return False
+        due_ms = sent_ms + self.playout_delay_ms
+        due_ns = clock_sync.perf_ns_for_server_ms(due_ms)
+        arrival_ms = clock_sync.server_time_ms(ctx.received_time_ns)
+        if due_ms - arrival_ms > MAX_SCHEDULE_AHEAD_MS:
+            logger.warning(f"{ctx.packet_type} (ID: {ctx.packet_id}) due {due_ms - arrival_ms:.0f} ms ahead. Running it now.")
+            return False
+        with self._cond:
+            if self._stopping: # Stopping: left to the dispatcher, and kept out of the counters
+                return False
+
+        late_ms = (time.perf_counter_ns() - due_ns) / 1_000_000.0
+        if late_ms > 0:
+            self._count_scheduled(arrival_ms - sent_ms, "late_dropped" if self.late_policy == LATE_DROP else "late_executed")
+            if self.late_policy == LATE_DROP:
+                logger.warning(f"Dropped late {ctx.packet_type} (ID: {ctx.packet_id}), {late_ms:.1f} ms past its due time.")
+                cancel()
+                return True
+            ctx.scheduled_time_ns = due_ns
+            job()
+            return True
+
+        with self._cond:
+            if self._stopping:
+                return False
+            ctx.scheduled_time_ns = due_ns
+            heapq.heappush(self._heap, (due_ns, next(self._sequence), job, cancel))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        self._count_scheduled(arrival_ms - sent_ms)
+        return True
+
+    def _count_scheduled(self, input_offset_ms, late_counter=None):
+        """Counts a packet the scheduler took over (input jitter sample included)."""
+        with self._stats_lock:
+            self._counters["scheduled"] += 1
+            if late_counter is not None:
+                self._counters[late_counter] += 1
+            self._input_offsets.append(input_offset_ms)
+            del self._input_offsets[:-JITTER_WINDOW]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due_ns = self._heap[0][0]
+                wake_ns = due_ns - precise_timing.margin_ns(event=True)
+                remaining_ns = wake_ns - time.perf_counter_ns()
+                if remaining_ns > 0:
+                    self._cond.wait(remaining_ns / 1e9)
+                    precise_timing.observe_wake(wake_ns)
+                    continue
+                _, _, job, _ = heapq.heappop(self._heap)
+            precise_timing.spin_until(due_ns)
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Scheduled job failed to start: {e}", exc_info=True)
+
+    def record_output(self, ctx):
+        """Called after a scheduled packet was injected, with ctx.inject_start_ns set."""
+        if not ctx.scheduled_time_ns or not ctx.inject_start_ns:
+            return
+        with self._stats_lock:
+            self._output_offsets.append((ctx.inject_start_ns - ctx.scheduled_time_ns) / 1_000_000.0)
+            del self._output_offsets[:-JITTER_WINDOW]
+
+    def get_stats(self, reset=False):
+        """Returns counters plus input/output jitter (stdev and p99-p1 spread, ms) over the recent window."""
+        with self._stats_lock:
+            stats = dict(self._counters)
+            stats["input_jitter_ms"], stats["input_spread_ms"] = _spread(self._input_offsets)
+            stats["output_jitter_ms"], stats["output_spread_ms"] = _spread(self._output_offsets)
+            stats["samples"] = len(self._output_offsets)
+            if reset:
+                self._input_offsets.clear()
+                self._output_offsets.clear()
+                for key in self._counters:
+                    self._counters[key] = 0
+        return stats
+
+    def stop(self):
+        """Cancels everything still waiting (server stop). Scheduling can start again afterwards."""
+        with self._cond:
+            self._stopping = True
+            pending = self._heap
+            self._heap = []
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout=1.0)
+        for _, _, _, cancel in pending:
+            cancel()
+        with self._cond:
+            self._stopping = False
+            self._thread = None
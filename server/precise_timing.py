@@ -0,0 +1,179 @@
+# precise_timing.py
+# Deadline-based waits for everything that paces input (holds, event spacing, drag
+# steps, mouse frames, axis ticks, the playout scheduler, capture replay).
+#
+# time.sleep() and Event.wait() only promise to wait at least as long as asked; how
+# much longer depends on the OS timer (up to 15.6 ms on Windows at the default timer
+# resolution, ~0.1 ms elsewhere). wait_until() sleeps coarsely until a safety margin
+# before the deadline, then spins on perf_counter_ns for the rest. The margin adapts
+# to the oversleep actually observed: it jumps up as soon as a coarse wait overshoots
+# it and decays slowly back towards twice the typical overshoot, so the spin stays
+# short (and cheap) on a quiet machine without making waits late on a busy one.
+# A wait shorter than the margin has no coarse part to measure, so it decays the
+# margin instead; otherwise one late wake-up could leave a periodic waiter spinning
+# for good. Most of the spin yields the GIL so the receive loop keeps running.
+#
+# acquire_high_resolution() raises the system timer resolution to 1 ms where that is
+# possible (timeBeginPeriod on Windows), which shrinks the margin and with it the
+# CPU spent spinning. It is reference counted; the server holds it while running.
+# Elsewhere it is a no-op, the default timers are already fine-grained.
+
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger("StarButtonBoxServer.Timing")
+
+MIN_MARGIN_NS = 200_000      # Never trust a coarse wait closer than this
+MAX_MARGIN_NS = 20_000_000   # Beyond this the coarse wait is hopeless anyway (and spinning too costly)
+_DEFAULT_MARGIN_NS = 16_000_000 if sys.platform == "win32" else 1_000_000
+_HIGH_RESOLUTION_MARGIN_NS = 2_000_000 # Starting margin once the timer runs at 1 ms
+_DECAY_SHIFT = 4             # Margin moves 1/16 of the way towards its target per wait
+_YIELD_UNTIL_NS = 100_000    # Spin without yielding the GIL only for this last stretch
+
+class _Margin:
+    """Adaptive coarse-wait margin for one waiting primitive (sleep or Event/Condition wait)."""
+    __slots__ = ("ns",)
+
+    def __init__(self):
+        self.ns = _DEFAULT_MARGIN_NS
+
+    def update(self, overshoot_ns):
+        if overshoot_ns > self.ns:
+            self.ns = min(overshoot_ns + overshoot_ns // 4, MAX_MARGIN_NS)
+        else:
+            target = max(2 * overshoot_ns, MIN_MARGIN_NS)
+            self.ns += (target - self.ns) >> _DECAY_SHIFT
+
+    def decay(self):
+        self.ns -= (self.ns - MIN_MARGIN_NS) >> _DECAY_SHIFT
+
+_sleep_margin = _Margin()
+_event_margin = _Margin()
+_stats_lock = threading.Lock()
+_stats = {"waits": 0, "late_ns": 0, "max_late_ns": 0, "spin_ns": 0}
+
+def margin_ns(event=False):
+    """Current coarse/spin boundary for sleeps, or for Event/Condition waits with event=True."""
+    return (_event_margin if event else _sleep_margin).ns
+
+def observe_wake(wake_ns, event=True):
+    """
+    Feeds a coarse wait done outside wait_until() (e.g. a Condition.wait with a timeout
+    aimed at wake_ns) into the margin. Early wake-ups (notified) carry no information.
+    """
+    overshoot_ns = time.perf_counter_ns() - wake_ns
+    if overshoot_ns >= 0:
+        (_event_margin if event else _sleep_margin).update(overshoot_ns)
+
+def spin_until(deadline_ns):
+    """Busy-waits until deadline_ns (perf_counter_ns). Returns how late it was reached (ns)."""
+    now = time.perf_counter_ns()
+    while now < deadline_ns - _YIELD_UNTIL_NS:
+        time.sleep(0) # Releases the GIL for other threads without giving up the CPU to the OS timer
+        now = time.perf_counter_ns()
+    while now < deadline_ns:
+        now = time.perf_counter_ns()
+    return now - deadline_ns
+
+def _record(late_ns, spin_ns):
+    with _stats_lock:
+        _stats["waits"] += 1
+        _stats["late_ns"] += late_ns
+        _stats["spin_ns"] += spin_ns
+        if late_ns > _stats["max_late_ns"]:
+            _stats["max_late_ns"] = late_ns
+
+def wait_until(deadline_ns, event=None):
+    """
+    Waits until deadline_ns (perf_counter_ns). Returns how late it was reached (ns), or
+    None if event (a threading.Event) was set first; without event the wait cannot be cut short.
+    """
+    margin = _event_margin if event is not None else _sleep_margin
+    wake_ns = deadline_ns - margin.ns
+    remaining_ns = wake_ns - time.perf_counter_ns()
+    if remaining_ns > 0:
+        if event is not None:
+            if event.wait(remaining_ns / 1e9):
+                return None
+        else:
+            time.sleep(remaining_ns / 1e9)
+        woke_ns = time.perf_counter_ns()
+        margin.update(woke_ns - wake_ns)
+    else:
+        margin.decay()
+        if event is not None and event.is_set():
+            return None
+    spin_start_ns = time.perf_counter_ns()
+    late_ns = spin_until(deadline_ns)
+    _record(late_ns, max(deadline_ns - spin_start_ns, 0))
+    return late_ns
+
+def sleep(seconds, event=None):
+    """Drop-in for time.sleep(seconds) with wait_until()'s precision. Returns as wait_until()."""
+    return wait_until(time.perf_counter_ns() + int(seconds * 1e9), event)
+
+def get_stats(reset=False):
+    """Returns {"waits", "avg_late_us", "max_late_us", "spin_ms", "sleep_margin_us", "event_margin_us"}."""
+    with _stats_lock:
+        stats = dict(_stats)
+        if reset:
+            for key in _stats:
+                _stats[key] = 0
+    waits = stats["waits"]
+    return {
+        "waits": waits,
+        "avg_late_us": stats["late_ns"] / waits / 1000.0 if waits else 0.0,
+        "max_late_us": stats["max_late_ns"] / 1000.0,
+        "spin_ms": stats["spin_ns"] / 1_000_000.0,
+        "sleep_margin_us": _sleep_margin.ns / 1000.0,
+        "event_margin_us": _event_margin.ns / 1000.0,
+    }
+
+# --- System timer resolution ---
+_resolution_lock = threading.Lock()
+_resolution_users = 0
+_winmm = None
+
+def _load_winmm():
+    global _winmm
+    if _winmm is None and sys.platform == "win32":
+        try:
+            import ctypes
+            _winmm = ctypes.WinDLL("winmm")
+        except OSError as e:
+            logger.warning(f"winmm unavailable, timer resolution stays at the default: {e}")
+            _winmm = False
+    return _winmm or None
+
+def acquire_high_resolution():
+    """Raises the system timer resolution to 1 ms (Windows). Returns True if it is raised."""
+    global _resolution_users
+    with _resolution_lock:
+        winmm = _load_winmm()
+        if winmm is None:
+            return False
+        if _resolution_users == 0:
+            if winmm.timeBeginPeriod(1) != 0: # TIMERR_NOERROR
+                logger.warning("timeBeginPeriod(1) was refused. Timer resolution stays at the default.")
+                return False
+            for margin in (_sleep_margin, _event_margin): # Let the spin start short instead of decaying there
+                margin.ns = min(margin.ns, _HIGH_RESOLUTION_MARGIN_NS)
+            logger.info("System timer resolution raised to 1 ms.")
+        _resolution_users += 1
+        return True
+
+def release_high_resolution():
+    """Undoes one successful acquire_high_resolution()."""
+    global _resolution_users
+    with _resolution_lock:
+        if _resolution_users == 0:
+            return
+        _resolution_users -= 1
+        if _resolution_users == 0 and _winmm:
+            _winmm.timeEndPeriod(1)
+            logger.info("System timer resolution restored.")
+
+def high_resolution_active():
+    return _resolution_users > 0
@@ -0,0 +1,104 @@
+# recording_benchmark.py
+# Measures macro_recorder storage and playback on synthetic recordings (mouse moves
+# every 2 ms, i.e. a 500 Hz poll, with a key press now and then):
+#   storage   file size and load time of the .sbbrec format next to the same events
+#             as a JSON list, for recordings of growing length
+#   playback  lateness per batch and total drift of macro_recorder.play() next to
+#             a naive loop that time.sleep()s each delta, input only recorded
+#
+# Usage: python recording_benchmark.py [--sizes 10000,100000,1000000] [--play-seconds 5]
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import input_backend
+import macro_recorder
+import precise_timing
+
+def _synthetic(count):
+    """Returns count (delta_us, kind, flags, a, b) records, ~2 ms apart."""
+    records = []
+    for index in range(count):
+        if index % 100 == 50:
+            records.append((0, macro_recorder.REC_KEY, macro_recorder.FLAG_DOWN, 0x11, 0)) # W
+        elif index % 100 == 90:
+            records.append((0, macro_recorder.REC_KEY, 0, 0x11, 0))
+        else:
+            records.append((random.randint(1900, 2100), macro_recorder.REC_MOUSE_MOVE, 0,
+                            random.randint(-5, 5), random.randint(-5, 5)))
+    return records
+
+def _load_time_ms(load, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load()
+        elapsed = (time.perf_counter() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _storage(directory, count):
+    records = _synthetic(count)
+    path = macro_recorder.save(f"bench{count}", records)
+    json_path = os.path.join(directory, f"bench{count}.json")
+    with open(json_path, 'w') as f:
+        json.dump([list(record) for record in records], f, separators=(',', ':'))
+
+    def load_binary():
+        macro_recorder._cache.clear()
+        for _ in macro_recorder.load(f"bench{count}").events(): # Decode too, as playback would
+            pass
+
+    def load_json():
+        with open(json_path) as f:
+            json.load(f)
+
+    print(f"{count:8} events: sbbrec {os.path.getsize(path) / 1024:9.1f} KiB, load+decode "
+          f"{_load_time_ms(load_binary):8.1f} ms | JSON {os.path.getsize(json_path) / 1024:9.1f} KiB, "
+          f"load {_load_time_ms(load_json):8.1f} ms")
+
+def _naive_play(name):
+    """Per-event time.sleep(delta), as a simple player would do it."""
+    start_ns = due_ns = time.perf_counter_ns()
+    late_ns = []
+    for delta_us, kind, flags, a, b in macro_recorder.load(name).events():
+        if delta_us:
+            time.sleep(delta_us / 1e6)
+            due_ns += delta_us * 1000
+        late_ns.append(time.perf_counter_ns() - due_ns)
+        input_backend.send([macro_recorder._to_input_event(kind, flags, a, b)])
+    return late_ns, (time.perf_counter_ns() - start_ns) / 1000.0 - macro_recorder.load(name).duration_us
+
+def _playback(seconds):
+    macro_recorder.save("benchplay", _synthetic(int(seconds * 500)))
+    input_backend.set_backend(input_backend.RecordingBackend())
+    late_ns, drift_us = _naive_play("benchplay")
+    ordered = sorted(late_ns)
+    print(f"   naive sleep: late avg {sum(ordered) / len(ordered) / 1000.0:9.0f}/p99 "
+          f"{ordered[int(len(ordered) * 0.99)] / 1000.0:9.0f}/max {ordered[-1] / 1000.0:9.0f} us, drift {drift_us:+9.0f} us")
+    result = macro_recorder.play("benchplay")
+    print(f"macro_recorder: late avg {result['avg_late_us']:9.0f}/p99 {result['p99_late_us']:9.0f}/max "
+          f"{result['max_late_us']:9.0f} us, drift {result['drift_us']:+9.0f} us")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox macro recording benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated event counts")
+    parser.add_argument("--play-seconds", type=float, default=5.0, help="Length of the played recording")
+    args = parser.parse_args()
+
+    random.seed(1)
+    directory = tempfile.mkdtemp(prefix="sbb_recording_benchmark_")
+    macro_recorder.configure(directory)
+    precise_timing.acquire_high_resolution()
+    try:
+        for size in args.sizes.split(','):
+            _storage(directory, int(size))
+        _playback(args.play_seconds)
+    finally:
+        precise_timing.release_high_resolution()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,167 @@
+# relay_benchmark.py
+# Exercises relay mode on loopback: starts --downstream server processes (the "game
+# PCs"), runs the relay in-process, and sends MACRO_COMMANDs the way the phone does,
+# one at a time, waiting for each reply. f1-f4 are routed to the first downstream
+# server only, f5-f8 to every downstream server and the relay itself, anything else
+# stays local. Reports the phone-side ACK round trip per route next to a direct
+# (unrelayed) baseline, the relay's per-hop metrics, and whether every server
+# executed exactly what its route says. All input is only recorded.
+#
+# Usage: python relay_benchmark.py [--downstream 2] [--commands 400] [--interval-ms 5] [--port 58170]
+#        python relay_benchmark.py --serve PORT   (one downstream server; used internally)
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import config
+import input_backend
+import key_codes
+import server as server_control
+
+_KEYS = ["f1", "f2", "f3", "f4", "f5", "f6", "f7", "f8"] # Distinct keys so admission does not coalesce the taps
+_SINGLE_KEYS = _KEYS[:4]
+_ALL_KEYS = _KEYS[4:]
+
+def _key_down_counts(backend):
+    """Returns {key name: key-down events} recorded by backend."""
+    counts = {}
+    names = {key_codes.resolve_key(key): key for key in _KEYS + ["f9"]}
+    for _, batch in backend.batches:
+        for kind, code, is_down in batch:
+            if kind == input_backend.EVENT_KEY and is_down and code in names:
+                counts[names[code]] = counts.get(names[code], 0) + 1
+    return counts
+
+def serve(port):
+    """Downstream server: runs until stdin closes, then prints its key-down counts as JSON."""
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # Per-macro console output
+        server_control.start_server(port, False, None, None)
+        sys.stdin.read()
+        server_control.stop_server()
+    print(json.dumps(_key_down_counts(backend)), flush=True)
+
+def _send_and_wait(sock, target, key, timeout_sec=1.0):
+    """Sends one tap and returns (reply type or None, round trip ms)."""
+    packet_id = str(uuid.uuid4())
+    action = json.dumps({"type": "key_event", "key": key, "modifiers": [], "pressType": {"type": "tap"}})
+    data = json.dumps({"packetId": packet_id, "timestamp": int(time.time() * 1000),
+                       "type": config.PACKET_TYPE_MACRO_COMMAND, "payload": action}, separators=(',', ':'))
+    start = time.perf_counter()
+    sock.sendto(data.encode('utf-8'), target)
+    deadline = start + timeout_sec
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return None, None
+        sock.settimeout(remaining)
+        try:
+            reply = json.loads(sock.recvfrom(config.BUFFER_SIZE)[0].decode('utf-8'))
+        except socket.timeout:
+            return None, None
+        if reply.get("packetId") == packet_id:
+            return reply["type"], (time.perf_counter() - start) * 1000.0
+
+def _summary(label, round_trips, missing):
+    if not round_trips:
+        return f"{label:>22}: no replies ({missing} missing)"
+    ordered = sorted(round_trips)
+    return (f"{label:>22}: ACK round trip p50 {ordered[len(ordered) // 2]:.2f} ms, "
+            f"p99 {ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]:.2f} ms ({missing} missing)")
+
+def run_benchmark(port, downstream, commands, interval_ms):
+    ports = [port + 1 + index for index in range(downstream)]
+    children = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(p)],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for p in ports]
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    relay_target = ('127.0.0.1', port)
+    round_trips = {"direct": [], "relayed, one server": [], "relayed, all servers": []}
+    missing = dict.fromkeys(round_trips, 0)
+    try:
+        time.sleep(1.5) # Let the downstream servers bind
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            server_control.start_server(port, False, None, None)
+            names = [f"pc{index + 1}" for index in range(downstream)]
+            server_control.relay.configure(True, targets={name: f"127.0.0.1:{p}" for name, p in zip(names, ports)},
+                                           routes=[{"keys": _SINGLE_KEYS, "targets": names[:1], "local": False},
+                                                   {"keys": _ALL_KEYS, "targets": ["*"]}])
+            time.sleep(1.5) # Let the relay see a PONG from every target
+
+            for _ in range(commands // 4): # Baseline: straight to the first downstream server, no relay
+                reply, rtt = _send_and_wait(sock, ('127.0.0.1', ports[0]), "f9")
+                if reply == config.PACKET_TYPE_MACRO_ACK:
+                    round_trips["direct"].append(rtt)
+                else:
+                    missing["direct"] += 1
+                time.sleep(interval_ms / 1000.0)
+            server_control.relay.get_stats(reset=True)
+            for index in range(commands):
+                key = _KEYS[index % len(_KEYS)]
+                label = "relayed, one server" if key in _SINGLE_KEYS else "relayed, all servers"
+                reply, rtt = _send_and_wait(sock, relay_target, key)
+                if reply == config.PACKET_TYPE_MACRO_ACK:
+                    round_trips[label].append(rtt)
+                else:
+                    missing[label] += 1
+                time.sleep(interval_ms / 1000.0)
+            time.sleep(0.5) # Let the last taps finish
+            stats = server_control.relay.get_stats()
+    finally:
+        sock.close()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            server_control.stop_server()
+        results = []
+        for child in children:
+            out, _ = child.communicate(timeout=10)
+            results.append(json.loads(out.strip().splitlines()[-1]) if out.strip() else {})
+
+    for label, values in round_trips.items():
+        print(_summary(label, values, missing[label]))
+    print(f"Relay: {stats['relayed']} relayed, {stats['acked']} acked, {stats['partial']} partial, "
+          f"{stats['unanswered']} unanswered")
+    for line in server_control.relay_forwarder.format_stats(stats):
+        print(f"  hop {line}")
+
+    per_key = commands // len(_KEYS)
+    expected_single = {key: per_key for key in _SINGLE_KEYS}
+    expected_all = {key: per_key for key in _ALL_KEYS}
+    ok = True
+    executed = [("relay", _key_down_counts(backend), expected_all)]
+    for index, counts in enumerate(results):
+        counts.pop("f9", None) # Baseline taps
+        executed.append((f"pc{index + 1}", counts, {**expected_single, **expected_all} if index == 0 else expected_all))
+    for name, counts, expected in executed:
+        match = counts == expected
+        ok = ok and match
+        print(f"  {name} executed {sum(counts.values())} tap(s), expected {sum(expected.values())}: "
+              f"{'OK' if match else f'MISMATCH {counts}'}")
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox relay mode loopback benchmark")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--downstream", type=int, default=2, help="Downstream server processes")
+    parser.add_argument("--commands", type=int, default=400, help="Relayed commands (a multiple of 8)")
+    parser.add_argument("--interval-ms", type=float, default=5.0, help="Pause after each reply")
+    parser.add_argument("--port", type=int, default=58170, help="Relay port; downstream servers use the next ones")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        sys.exit(0)
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    print(f"Relay on {args.port} with {args.downstream} downstream server(s), {args.commands} command(s)", file=sys.stderr)
+    sys.exit(0 if run_benchmark(args.port, args.downstream, args.commands - args.commands % len(_KEYS),
+                                args.interval_ms) else 1)
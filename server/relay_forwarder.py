@@ -0,0 +1,408 @@
+# relay_forwarder.py
+# Relay mode for multibox setups: the phone talks to one server, which forwards
+# selected MACRO_COMMANDs to other StarButtonBox servers (one per game PC) and
+# answers the phone with a single acknowledgement for all of them.
+#
+# Targets are named "host:port" addresses. Each gets one UDP socket, connected once
+# at configuration time and reused for every forward and for a once-a-second PING
+# that measures the hop's round trip and tells whether the target is up. Forwarded
+# packets are sent byte for byte, packetId included, so the targets' ACKs can be
+# matched without any translation.
+#
+# Routing rules are tried in order; the first match decides:
+#   {"keys": ["f1", "f2"], "types": ["key_event"], "targets": ["pc2", "pc3"], "local": false}
+#   keys   InputAction key names (any key if omitted)
+#   types  InputAction types: key_event, mouse_event, mouse_scroll (any if omitted)
+#   targets target names, or ["*"] for all of them
+#   local  also execute on this server (default true)
+# A command no rule matches is executed locally only, as without relaying.
+#
+# The phone gets one reply per relayed command once every hop has answered:
+# MACRO_NACK if any hop shed it, otherwise MACRO_ACK. Hops still silent after
+# ack_timeout_ms are counted as timeouts; the phone then gets MACRO_ACK if at least
+# one hop acknowledged, and nothing if none did, so its own ACK timeout reports it.
+# Commands still waiting when relaying is stopped or reconfigured are answered at
+# once the same way, except that one no hop acknowledged gets MACRO_NACK.
+# The local hop answers through PacketContext.ack_hook when the dispatcher acks.
+#
+# Forwarded packetIds are remembered (the last MAX_RECENT_FORWARDED). A command
+# seen again, because two servers relay to each other or the phone retried it, is
+# acknowledged to whoever sent it but neither executed nor forwarded again, so a
+# misconfigured route cannot bounce it around forever.
+#
+# forward() runs on the receive thread; target replies, timeouts and PINGs are
+# handled on the RelayReceiver thread.
+
+import json
+import selectors
+import socket
+import threading
+import time
+import uuid
+import logging
+
+import config
+
+logger = logging.getLogger("StarButtonBoxServer.Relay")
+
+LOCAL = "local" # Hop name of this server in routes and statistics
+
+DEFAULT_ACK_TIMEOUT_MS = 250.0
+PING_INTERVAL_SECONDS = 1.0
+TARGET_DOWN_SECONDS = 3.0  # A target without a PONG for this long is reported down
+MAX_PENDING = 4096         # Commands awaiting hop replies; beyond this the phone is acked directly
+MAX_RECENT_FORWARDED = 4096 # Forwarded packetIds remembered to detect relay loops
+LATENCY_WINDOW = 512
+
+def _parse_address(address):
+    """Returns (host, port) for "host:port". Raises ValueError."""
+    host, sep, port = str(address).rpartition(':')
+    if not sep or not host:
+        raise ValueError(f"'{address}' is not host:port")
+    return host, int(port)
+
+def _percentiles(values_us):
+    """Returns (p50, p99) in ms, or (None, None) without samples."""
+    if not values_us:
+        return None, None
+    ordered = sorted(values_us)
+    return ordered[len(ordered) // 2] / 1000.0, ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] / 1000.0
+
+class _Route:
+    __slots__ = ("keys", "types", "targets", "local")
+
+    def __init__(self, rule, target_names):
+        keys = rule.get("keys")
+        types = rule.get("types")
+        self.keys = frozenset(str(k).lower() for k in keys) if keys else None
+        self.types = frozenset(types) if types else None
+        targets = rule.get("targets") or []
+        if "*" in targets:
+            targets = list(target_names)
+        unknown = [name for name in targets if name not in target_names]
+        if unknown:
+            raise ValueError(f"unknown target(s) {', '.join(map(str, unknown))}")
+        self.targets = tuple(targets)
+        self.local = bool(rule.get("local", True))
+
+    def matches(self, action):
+        if self.types is not None and action.get("type") not in self.types:
+            return False
+        if self.keys is not None and str(action.get("key", "")).lower() not in self.keys:
+            return False
+        return True
+
+class _Target:
+    """One downstream server: its connected socket plus per-hop metrics."""
+
+    def __init__(self, name, host, port):
+        self.name = name
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(self.address) # Resolved once; replies from anyone else are filtered by the OS
+        self.sock.setblocking(False)
+        self.ping_id = None
+        self.ping_sent_ns = 0
+        self.last_pong_ns = 0
+        self.rtt_ms = None
+        self.counters = {"forwarded": 0, "acked": 0, "nacked": 0, "timeouts": 0, "send_errors": 0}
+        self.ack_latencies_us = []
+
+    def send(self, data_bytes):
+        try:
+            self.sock.send(data_bytes)
+            return True
+        except OSError as e:
+            self.counters["send_errors"] += 1
+            logger.debug(f"Relay send to {self.name} failed: {e}")
+            return False
+
+class _Pending:
+    __slots__ = ("ctx", "waiting", "acked", "nacked", "sent_ns", "deadline_ns")
+
+    def __init__(self, ctx, hops, sent_ns, deadline_ns):
+        self.ctx = ctx
+        self.waiting = set(hops)
+        self.acked = 0
+        self.nacked = False
+        self.sent_ns = sent_ns
+        self.deadline_ns = deadline_ns
+
+class RelayForwarder:
+    """Forwards routed MACRO_COMMANDs to downstream servers and aggregates their ACKs."""
+
+    def __init__(self):
+        self.enabled = False
+        self.ack_timeout_ns = int(DEFAULT_ACK_TIMEOUT_MS * 1_000_000)
+        self._lock = threading.Lock()
+        self._targets = {}  # name -> _Target
+        self._routes = []
+        self._pending = {}  # packet id -> _Pending, oldest first (all share one timeout)
+        self._recent = {}   # packet id -> None for the last MAX_RECENT_FORWARDED forwarded commands, oldest first
+        self._latencies_us = [] # Receipt at this server -> aggregated reply to the phone
+        self._counters = {"relayed": 0, "acked": 0, "nacked": 0, "partial": 0, "unanswered": 0, "overflow": 0, "loops": 0}
+        self._stop_event = None
+        self._thread = None
+
+    def configure(self, enabled, targets=None, routes=None, ack_timeout_ms=None):
+        """(Re)builds targets and routes; commands still waiting for hops are dropped. Safe while running."""
+        self.stop()
+        if ack_timeout_ms is not None:
+            self.ack_timeout_ns = int(min(max(float(ack_timeout_ms), 10.0), 2000.0) * 1_000_000)
+        if not enabled:
+            return
+        new_targets = {}
+        for name, address in (targets.items() if isinstance(targets, dict) else ()):
+            if name == LOCAL:
+                logger.error(f"Relay target name '{LOCAL}' is reserved for this server.")
+                continue
+            try:
+                new_targets[name] = _Target(name, *_parse_address(address))
+            except (ValueError, OSError) as e:
+                logger.error(f"Ignoring relay target '{name}': {e}")
+        new_routes = []
+        for rule in (routes if isinstance(routes, list) else ()):
+            try:
+                new_routes.append(_Route(rule if isinstance(rule, dict) else {}, new_targets))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Ignoring relay route {rule}: {e}")
+        if not new_targets:
+            logger.warning("Relay mode enabled without usable targets. Commands are executed locally only.")
+            return
+        with self._lock:
+            self._targets = new_targets
+            self._routes = new_routes
+            self.enabled = True
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop_event, new_targets),
+                                            name="RelayReceiver", daemon=True)
+            self._thread.start()
+        logger.info(f"Relay mode: {', '.join(f'{t.name} ({t.address[0]}:{t.address[1]})' for t in new_targets.values())}; "
+                    f"{len(new_routes)} route(s)")
+
+    def forward(self, ctx, data_bytes, raw_payload):
+        """
+        Called on the receive thread for a MACRO_COMMAND. Forwards it to the targets its
+        route selects. Returns True if it should also be dispatched locally.
+        """
+        if not self.enabled or not ctx.packet_id:
+            return True
+        try:
+            action = json.loads(raw_payload) if raw_payload else None
+        except (json.JSONDecodeError, TypeError):
+            action = None
+        if not isinstance(action, dict):
+            return True # Local dispatch rejects it with the usual error
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            looped = ctx.packet_id in self._recent
+            if looped:
+                self._counters["loops"] += 1
+        if looped:
+            logger.warning(f"Relayed command {ctx.packet_id} came back from {ctx.addr[0]}:{ctx.addr[1]}; "
+                           f"the relay routes form a loop. Not executed again.")
+            self._send(ctx, config.PACKET_TYPE_MACRO_ACK) # Handled here already; spares the sending hop its timeout
+            return False
+        with self._lock: # configure() may swap or clear routes and targets meanwhile
+            route = next((r for r in self._routes if r.matches(action)), None) if self.enabled else None
+            if route is None or not route.targets:
+                return True
+            self._recent[ctx.packet_id] = None # forward() only runs on the receive thread, so nothing slips in between
+            while len(self._recent) > MAX_RECENT_FORWARDED:
+                del self._recent[next(iter(self._recent))]
+            hops = route.targets + ((LOCAL,) if route.local else ())
+            tracked = len(self._pending) < MAX_PENDING and ctx.packet_id not in self._pending
+            if tracked:
+                self._pending[ctx.packet_id] = _Pending(ctx, hops, now_ns, now_ns + self.ack_timeout_ns)
+            else:
+                self._counters["overflow"] += 1
+            self._counters["relayed"] += 1
+            for name in route.targets:
+                target = self._targets.get(name)
+                if target is None:
+                    continue
+                target.counters["forwarded"] += 1
+                target.send(data_bytes)
+        if tracked and route.local:
+            ctx.ack_hook = self._local_reply
+        elif not tracked:
+            self._send(ctx, config.PACKET_TYPE_MACRO_ACK) # Untracked: at least tell the phone it arrived
+        return route.local
+
+    def _local_reply(self, ctx, reply_type):
+        self._hop_reply(ctx.packet_id, LOCAL, reply_type == config.PACKET_TYPE_MACRO_ACK, time.perf_counter_ns())
+
+    def _hop_reply(self, packet_id, hop, acked, now_ns):
+        with self._lock:
+            pending = self._pending.get(packet_id)
+            if pending is None or hop not in pending.waiting:
+                return # Already answered or timed out
+            pending.waiting.discard(hop)
+            target = self._targets.get(hop)
+            if acked:
+                pending.acked += 1
+            else:
+                pending.nacked = True
+            if target is not None:
+                target.counters["acked" if acked else "nacked"] += 1
+                target.ack_latencies_us.append((now_ns - pending.sent_ns) // 1000)
+                del target.ack_latencies_us[:-LATENCY_WINDOW]
+            if pending.waiting:
+                return
+            del self._pending[packet_id]
+        self._answer(pending, now_ns)
+
+    def _answer(self, pending, now_ns, dropped=False):
+        """
+        Sends the aggregated reply for a command whose hops all answered or timed out.
+        A dropped command (relay stopped) that no hop acknowledged is NACKed instead of left unanswered.
+        """
+        if pending.nacked:
+            reply_type, counter = config.PACKET_TYPE_MACRO_NACK, "nacked"
+        elif pending.waiting:
+            if pending.acked:
+                reply_type, counter = config.PACKET_TYPE_MACRO_ACK, "partial"
+            else:
+                reply_type, counter = (config.PACKET_TYPE_MACRO_NACK if dropped else None), "unanswered"
+        else:
+            reply_type, counter = config.PACKET_TYPE_MACRO_ACK, "acked"
+        with self._lock:
+            self._counters[counter] += 1
+            if reply_type is not None:
+                self._latencies_us.append((now_ns - pending.ctx.received_time_ns) // 1000)
+                del self._latencies_us[:-LATENCY_WINDOW]
+        if reply_type is not None:
+            self._send(pending.ctx, reply_type)
+
+    @staticmethod
+    def _send(ctx, reply_type):
+        try:
+            ctx.reply(reply_type)
+        except Exception as e:
+            logger.error(f"Error sending relayed {reply_type} (ID: {ctx.packet_id}): {e}")
+
+    def _expire(self, now_ns):
+        expired = []
+        with self._lock:
+            while self._pending:
+                packet_id, pending = next(iter(self._pending.items()))
+                if pending.deadline_ns > now_ns:
+                    break
+                del self._pending[packet_id]
+                for hop in pending.waiting:
+                    target = self._targets.get(hop)
+                    if target is not None:
+                        target.counters["timeouts"] += 1
+                expired.append(pending)
+        for pending in expired:
+            logger.warning(f"Relayed command {pending.ctx.packet_id}: no reply from {', '.join(sorted(pending.waiting))}.")
+            self._answer(pending, now_ns)
+
+    def _ping(self, target, now_ns):
+        target.ping_id = str(uuid.uuid4())
+        target.ping_sent_ns = now_ns
+        target.send(json.dumps({"packetId": target.ping_id, "timestamp": int(time.time() * 1000),
+                                "type": config.PACKET_TYPE_HEALTH_CHECK_PING, "payload": None}).encode('utf-8'))
+
+    def _on_target_packet(self, target, data_bytes, now_ns):
+        try:
+            packet = json.loads(data_bytes.decode('utf-8'))
+            packet_type, packet_id = packet.get("type"), packet.get("packetId")
+        except (UnicodeDecodeError, json.JSONDecodeError, AttributeError):
+            logger.debug(f"Unreadable reply from relay target {target.name}.")
+            return
+        if packet_type in (config.PACKET_TYPE_MACRO_ACK, config.PACKET_TYPE_MACRO_NACK):
+            self._hop_reply(packet_id, target.name, packet_type == config.PACKET_TYPE_MACRO_ACK, now_ns)
+        elif packet_type == config.PACKET_TYPE_HEALTH_CHECK_PONG and packet_id == target.ping_id:
+            with self._lock:
+                target.rtt_ms = (now_ns - target.ping_sent_ns) / 1_000_000.0
+                target.last_pong_ns = now_ns
+            target.ping_id = None
+
+    def _run(self, stop_event, targets):
+        selector = selectors.DefaultSelector()
+        for target in targets.values():
+            selector.register(target.sock, selectors.EVENT_READ, target)
+        next_ping_ns = 0
+        try:
+            while not stop_event.is_set():
+                now_ns = time.perf_counter_ns()
+                if now_ns >= next_ping_ns:
+                    for target in targets.values():
+                        self._ping(target, now_ns)
+                    next_ping_ns = now_ns + int(PING_INTERVAL_SECONDS * 1e9)
+                with self._lock:
+                    first = next(iter(self._pending.values()), None)
+                    wake_ns = min(next_ping_ns, first.deadline_ns if first else now_ns + self.ack_timeout_ns // 2)
+                for key, _ in selector.select(max(wake_ns - now_ns, 0) / 1e9):
+                    target = key.data
+                    while True:
+                        try:
+                            data_bytes = target.sock.recv(config.BUFFER_SIZE)
+                        except BlockingIOError:
+                            break
+                        except OSError as e: # ICMP port unreachable surfaces here on a connected socket
+                            logger.debug(f"Relay target {target.name} unreachable: {e}")
+                            break
+                        self._on_target_packet(target, data_bytes, time.perf_counter_ns())
+                self._expire(time.perf_counter_ns())
+        except Exception as e:
+            logger.error(f"Relay receiver failed: {e}", exc_info=True)
+        finally:
+            selector.close()
+
+    def get_stats(self, reset=False):
+        """Relay counters and latency plus {"targets": {name: per-hop counters, ack latency and PING RTT}}."""
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending"] = len(self._pending)
+            stats["latency_p50_ms"], stats["latency_p99_ms"] = _percentiles(self._latencies_us)
+            stats["targets"] = {}
+            for name, target in self._targets.items():
+                hop = dict(target.counters)
+                hop["ack_p50_ms"], hop["ack_p99_ms"] = _percentiles(target.ack_latencies_us)
+                hop["rtt_ms"] = target.rtt_ms
+                hop["up"] = bool(target.last_pong_ns) and now_ns - target.last_pong_ns < TARGET_DOWN_SECONDS * 1e9
+                stats["targets"][name] = hop
+                if reset:
+                    target.ack_latencies_us.clear()
+                    for key in target.counters:
+                        target.counters[key] = 0
+            if reset:
+                self._latencies_us.clear()
+                for key in self._counters:
+                    self._counters[key] = 0
+        return stats
+
+    def stop(self):
+        """Stops the receiver and closes the target sockets. Commands still waiting are answered now."""
+        with self._lock:
+            self.enabled = False
+            thread, stop_event = self._thread, self._stop_event
+            self._thread = self._stop_event = None
+        if thread is not None:
+            stop_event.set()
+            thread.join(timeout=1.0)
+        with self._lock:
+            dropped = list(self._pending.values())
+            self._pending.clear()
+            targets, self._targets, self._routes = self._targets, {}, []
+        now_ns = time.perf_counter_ns()
+        for pending in dropped: # Spares the phone its ACK timeout and retries
+            self._answer(pending, now_ns, dropped=True)
+        for target in targets.values():
+            try:
+                target.sock.close()
+            except OSError:
+                pass
+
+def format_stats(stats):
+    """One log line per hop for the periodic summary."""
+    lines = []
+    for name, hop in stats["targets"].items():
+        ack = f"ack p50 {hop['ack_p50_ms']:.2f}/p99 {hop['ack_p99_ms']:.2f} ms" if hop["ack_p50_ms"] is not None else "no ACKs"
+        rtt = f"RTT {hop['rtt_ms']:.2f} ms" if hop["rtt_ms"] is not None else "no PONG yet"
+        lines.append(f"{name} {'up' if hop['up'] else 'DOWN'}: {hop['forwarded']} forwarded, {hop['acked']} acked, "
+                     f"{hop['nacked']} NACKed, {hop['timeouts']} timed out, {hop['send_errors']} send error(s); {ack}, {rtt}")
+    return lines
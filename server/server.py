@@ -7,20 +7,46 @@ import time
 import sys
 import signal
 import threading
+import os
+import queue
+import selectors
 import logging 
 from concurrent.futures import ThreadPoolExecutor
 
 import config
 import input_simulator
+import input_backend
+import macro_compiler
+import packet_dispatcher
+import packet_capture
+import trace_recorder
+import session_profiler
+from isolated_worker import IsolatedWorker
+import admission_control
+import ack_batcher
+import clock_sync
+import playout_scheduler
+import mouse_stream
+import axis_channel
+import relay_forwarder
+import turbo_repeat
+import macro_recorder
+import precise_timing
 import mdns_handler 
 import dialog_handler
 import auto_drag_handler
 import config_manager # Import config_manager to get the log path
+import log_setup
+
+DEFAULT_MACROS_FILE_NAME = "default_macros_sc_411.json"
 
 server_thread = None
 stop_server_event = threading.Event()
 server_socket = None 
 executor = None 
+isolated_worker = None # Runs handlers that call into the GUI, browser or OS (see isolated_worker)
+ISOLATED_JOB_TIMEOUT_SECONDS = 10.0
+RECV_DRAIN_LIMIT = 64 # Datagrams read per socket per wakeup, so one busy client cannot starve the loop
 
 # --- Logging Setup ---
 # Use the LOG_FILE_PATH from config_manager
@@ -33,11 +59,13 @@ try:
         os.makedirs(log_dir)
         print(f"Created log directory: {log_dir}") # Print for direct run scenario
     
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', # Changed from threadName for broader scope
-        filename=config_manager.LOG_FILE_PATH, 
-        filemode='a' 
+    # Rotating, gzip-compressed JSON lines written by a background thread (see log_setup)
+    log_setup.configure_file_logging(
+        config_manager.LOG_FILE_PATH,
+        max_bytes=config_manager.settings.get_int("log_max_mb") * 1024 * 1024,
+        backup_count=config_manager.settings.get_int("log_backup_count"),
+        rotate_seconds=config_manager.settings.get_float("log_rotate_hours") * 3600,
+        packet_sample_rate=config_manager.settings.get_int("log_packet_sample_rate")
     )
 except Exception as e:
     # Fallback logging to console if file setup fails
@@ -53,13 +81,518 @@ logger = logging.getLogger("StarButtonBoxServer") # Get logger instance
 log_to_gui_callback = None
 update_gui_status_callback = None
 
-# ... (rest of your server.py code remains the same) ...
-# Make sure to replace the old logging.basicConfig call with the block above.
+# --- Health check fast path ---
+# PINGs are by far the most frequent packet. The Android app serializes them as
+# {"packetId":"<uuid>","timestamp":<ms>,"type":"HEALTH_CHECK_PING","payload":null},
+# so they can be recognised and answered from the raw bytes without decoding or JSON parsing.
+# Anything that does not match this exact layout falls through to the normal path.
+# Every PONG carries the server receive and transmit times for clock_sync as its payload.
+PING_FAST_PATH_ENABLED = True
+_PING_TYPE_MARKER = b'"type":"' + config.PACKET_TYPE_HEALTH_CHECK_PING.encode('utf-8') + b'"'
+_PACKET_ID_PREFIX = b'{"packetId":"'
+_PONG_TEMPLATE = (b'{"packetId":"%s","timestamp":%d,"type":"'
+                  + config.PACKET_TYPE_HEALTH_CHECK_PONG.encode('utf-8') + b'","payload":"{\\"rx\\":%.3f,\\"tx\\":%.3f}"}')
+_ping_counts = {} # addr -> PINGs answered since the last summary (receive thread only)
+
+# Stats of every subsystem are logged as one block of summaries per interval instead of a line per event
+STATS_INTERVAL_SECONDS = 60.0
+_last_stats_time = time.monotonic()
+
+def _extract_fast_ping_id(data_bytes):
+    """Returns the packetId bytes if data_bytes is a PING in the app's wire layout, otherwise None."""
+    if _PING_TYPE_MARKER not in data_bytes or not data_bytes.startswith(_PACKET_ID_PREFIX):
+        return None
+    id_start = len(_PACKET_ID_PREFIX)
+    id_end = data_bytes.find(b'"', id_start)
+    if id_end <= id_start:
+        return None
+    packet_id = data_bytes[id_start:id_end]
+    if b'\\' in packet_id: # Escaped characters would need real JSON handling
+        return None
+    return packet_id
+
+def _record_ping(addr):
+    _ping_counts[addr] = _ping_counts.get(addr, 0) + 1
+
+def _log_ping_summary(elapsed):
+    """One aggregated line for all PINGs answered during the last interval."""
+    if not _ping_counts:
+        return
+    total = sum(_ping_counts.values())
+    per_client = ", ".join(f"{client[0]}:{client[1]}={count}" for client, count in _ping_counts.items())
+    logger.info(f"Answered {total} PINGs from {len(_ping_counts)} client(s) in the last {elapsed:.0f}s ({per_client})")
+    if log_to_gui_callback:
+        log_to_gui_callback(f"INFO: Answered {total} PINGs from {len(_ping_counts)} client(s) in the last {elapsed:.0f}s")
+    _ping_counts.clear()
+
+def _log_clock_sync_summary(elapsed):
+    for client_ip, stats in clock_sync.get_client_stats().items():
+        logger.info(f"Clock sync {clock_sync.format_client_stats(client_ip, stats)}")
+    clock_sync.reset_latency_windows()
+
+def _log_playout_summary(elapsed):
+    playout = macro_scheduler.get_stats(reset=True)
+    if playout["scheduled"] or playout["unsynced"]:
+        logger.info(f"Scheduled execution: {playout['scheduled']} scheduled ({playout['late_executed']} late run, "
+                    f"{playout['late_dropped']} late dropped, {playout['unsynced']} without clock sync); "
+                    f"jitter in {playout['input_jitter_ms']:.2f} ms sd/{playout['input_spread_ms']:.2f} ms spread, "
+                    f"out {playout['output_jitter_ms']:.2f} ms sd/{playout['output_spread_ms']:.2f} ms spread")
+
+def _log_turbo_summary(elapsed):
+    repeats = repeater.get_stats(reset=True)
+    if repeats["taps"] or repeats["started"]:
+        logger.info(f"Turbo repeat: {repeats['started']} started, {repeats['stopped']} stopped, {repeats['timed_out']} timed out, "
+                    f"{repeats['active']} active; {repeats['taps']} tap(s), {repeats['skipped']} skipped, "
+                    f"late avg {repeats['late_avg_ms']:.3f}/p99 {repeats['late_p99_ms']:.3f} ms, "
+                    f"interval error {repeats['interval_rms_ms']:.3f} ms rms")
+
+def _log_mouse_summary(elapsed):
+    mouse = mouse_mover.get_stats(reset=True)
+    if mouse["packets"]:
+        latency = (f", latency p50 {mouse['latency_p50_ms']:.2f}/p99 {mouse['latency_p99_ms']:.2f}/"
+                   f"max {mouse['latency_max_ms']:.2f} ms" if "latency_p50_ms" in mouse else "")
+        logger.info(f"Mouse stream: {mouse['packets']} packet(s) in {mouse['moves']} move(s), {mouse['lost']} lost, "
+                    f"{mouse['reordered']} reordered, {mouse['late']} late, {mouse['duplicates']} duplicate(s){latency}")
+
+def _log_axis_summary(elapsed):
+    axes = axis_output.get_stats(reset=True)
+    if axes["packets"]:
+        logger.info(f"Axis channel: {axes['packets']} update(s) ({axes['stale']} stale, {axes['unknown_axes']} unknown axis value(s)), "
+                    f"{axes['events']} output event(s) in {axes['ticks']} tick(s)")
+
+def _log_relay_summary(elapsed):
+    relayed = relay.get_stats(reset=True)
+    if relayed["relayed"] or relayed["loops"]:
+        latency = (f", phone ACK p50 {relayed['latency_p50_ms']:.2f}/p99 {relayed['latency_p99_ms']:.2f} ms"
+                   if relayed["latency_p50_ms"] is not None else "")
+        logger.info(f"Relay: {relayed['relayed']} relayed, {relayed['acked']} acked, {relayed['partial']} partially acked, "
+                    f"{relayed['nacked']} NACKed, {relayed['unanswered']} unanswered, {relayed['loops']} looped back{latency}")
+    for line in relay_forwarder.format_stats(relayed):
+        logger.info(f"Relay hop {line}")
+
+def _log_timing_summary(elapsed):
+    timing = precise_timing.get_stats(reset=True)
+    if timing["waits"]:
+        logger.info(f"Timed waits: {timing['waits']}, avg {timing['avg_late_us']:.0f} us/max {timing['max_late_us']:.0f} us late, "
+                    f"{timing['spin_ms']:.0f} ms spinning, margin {timing['sleep_margin_us']:.0f} us sleep/"
+                    f"{timing['event_margin_us']:.0f} us event")
+
+def _log_ack_summary(elapsed):
+    acks = ack_batcher.get_counters(reset=True)
+    if acks["batches"]:
+        logger.info(f"Batched ACKs: {acks['acks']} ACK(s) in {acks['batches']} packet(s) "
+                    f"for {acks['clients']} client(s) in the last {elapsed:.0f}s")
+
+def _maybe_log_periodic_stats():
+    """Called by the receive loop; every STATS_INTERVAL_SECONDS each _PERIODIC_SUMMARIES entry logs (and resets) its stats."""
+    global _last_stats_time
+    now = time.monotonic()
+    elapsed = now - _last_stats_time
+    if elapsed < STATS_INTERVAL_SECONDS:
+        return
+    for log_summary in _PERIODIC_SUMMARIES:
+        try:
+            log_summary(elapsed)
+        except Exception as e: # One broken summary must not take the receive loop down
+            logger.error(f"Periodic summary {log_summary.__name__} failed: {e}", exc_info=True)
+    _last_stats_time = now
+
+def _log_queue_depths(reset_max=False):
+    """Logs how many jobs the injector and isolated classes had waiting (inline work never queues)."""
+    admission = macro_admission.get_counters()
+    if admission["coalesced"] or admission["stale"] or admission["rejected"]:
+        logger.info(f"Macro admission: {admission['admitted']} admitted, {admission['coalesced']} coalesced, "
+                    f"{admission['stale']} dropped stale, {admission['rejected']} rejected "
+                    f"({admission['nacked']} NACKed), {admission['pending']} waiting")
+    depths = packet_dispatcher.get_queue_depths(reset_max=reset_max)
+    if not any(d["max"] or d["current"] for d in depths.values()):
+        return
+    summary = ", ".join(f"{mode} {d['current']} now/{d['max']} max" for mode, d in depths.items())
+    timeouts = isolated_worker.timeouts if isolated_worker else 0
+    logger.info(f"Queue depth: {summary}; isolated timeouts: {timeouts}")
+    if log_to_gui_callback:
+        log_to_gui_callback(f"INFO: Queue depth: {summary}")
+
+def _log_queue_summary(elapsed):
+    _log_queue_depths(reset_max=True)
+
+# Periodic summaries, in log order; a subsystem with stats worth logging adds its function here
+_PERIODIC_SUMMARIES = (_log_ping_summary, _log_clock_sync_summary, _log_playout_summary, _log_turbo_summary,
+                       _log_mouse_summary, _log_axis_summary, _log_relay_summary, _log_timing_summary,
+                       _log_ack_summary, _log_queue_summary)
+
+# --- Packet handlers ---
+# Registered with packet_dispatcher; adding a packet type only needs a new handler here.
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_HEALTH_CHECK_PING, requires_packet_id=True)
+def _handle_health_check_ping(ctx, payload):
+    # Only reached by PINGs that did not match the fast path layout
+    ctx.reply(config.PACKET_TYPE_HEALTH_CHECK_PONG, json.dumps({
+        "rx": round(clock_sync.server_time_ms(ctx.received_time_ns), 3),
+        "tx": round(clock_sync.server_time_ms(), 3)}))
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_CLOCK_SYNC_REPORT,
+                                    payload_schema={"t1": (int, float), "t2": (int, float),
+                                                    "t3": (int, float), "t4": (int, float)})
+def _handle_clock_sync_report(ctx, payload):
+    if not clock_sync.record_exchange(ctx.addr, payload["t1"], payload["t2"], payload["t3"], payload["t4"]):
+        logger.debug(f"Ignored clock sync sample from {ctx.addr[0]} (invalid times or delay out of range).")
+
+mouse_mover = mouse_stream.MouseStream()
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_MOUSE_MOVE, payload_parser=mouse_stream.parse_payload)
+def _handle_mouse_move(ctx, move):
+    # Only reached by packets that did not match the fast path layout
+    mouse_mover.add(ctx.addr, *move, ctx.received_time_ns)
+
+axis_output = axis_channel.AxisChannel()
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_AXIS_UPDATE, payload_parser=axis_channel.parse_payload)
+def _handle_axis_update(ctx, update):
+    # Only reached by packets that did not match the fast path layout
+    axis_output.update(ctx.addr, *update, ctx.received_time_ns)
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_ACK_MODE, requires_packet_id=True, payload_schema={"mode": str})
+def _handle_ack_mode(ctx, payload):
+    mode, window_ms = ack_batcher.negotiate(ctx.addr, payload["mode"], payload.get("windowMs"))
+    ctx.reply(config.PACKET_TYPE_ACK_MODE, json.dumps({"mode": mode, "windowMs": window_ms}))
+
+# Admission policies per (action kind, press kind). Repeated taps of a macro that is still
+# waiting are merged, as are repeated triggers of a recording; holds and scrolls are not,
+# since each one has its own effect.
+_MACRO_ADMISSION_POLICIES = {
+    (macro_compiler.ACTION_KEY_EVENT, macro_compiler.PRESS_TAP):
+        (admission_control.POLICY_COALESCE, admission_control.POLICY_DROP_STALE, admission_control.POLICY_NACK),
+    (macro_compiler.ACTION_KEY_EVENT, macro_compiler.PRESS_HOLD):
+        (admission_control.POLICY_DROP_STALE, admission_control.POLICY_NACK),
+    (macro_compiler.ACTION_MOUSE_EVENT, macro_compiler.PRESS_TAP):
+        (admission_control.POLICY_COALESCE, admission_control.POLICY_DROP_STALE, admission_control.POLICY_NACK),
+    (macro_compiler.ACTION_MOUSE_EVENT, macro_compiler.PRESS_HOLD):
+        (admission_control.POLICY_DROP_STALE, admission_control.POLICY_NACK),
+    (macro_compiler.ACTION_MOUSE_SCROLL, macro_compiler.PRESS_TAP):
+        (admission_control.POLICY_DROP_STALE, admission_control.POLICY_NACK),
+    (macro_compiler.ACTION_RECORDED_MACRO, macro_compiler.PRESS_TAP):
+        (admission_control.POLICY_COALESCE, admission_control.POLICY_DROP_STALE, admission_control.POLICY_NACK),
+}
+
+def _macro_admission_policies(compiled_action):
+    return _MACRO_ADMISSION_POLICIES.get((compiled_action[0], compiled_action[3]), ())
+
+macro_admission = admission_control.AdmissionQueue(_macro_admission_policies)
+macro_scheduler = playout_scheduler.PlayoutScheduler("MacroScheduler")
+relay = relay_forwarder.RelayForwarder() # Consulted by _handle_datagram before MACRO_COMMANDs are dispatched
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_MACRO_COMMAND, mode=packet_dispatcher.MODE_INJECTOR,
+                                    payload_parser=macro_compiler.compile_payload, requires_packet_id=True,
+                                    ack_type=config.PACKET_TYPE_MACRO_ACK, admission=macro_admission,
+                                    nack_type=config.PACKET_TYPE_MACRO_NACK, scheduler=macro_scheduler)
+def _handle_macro_command(ctx, compiled_action):
+    inject_times = input_simulator.process_macro_in_thread(compiled_action, ctx.packet_id, ctx.received_time_ns)
+    if inject_times:
+        ctx.inject_start_ns, ctx.inject_end_ns = inject_times
+    clock_sync.record_one_way(ctx.addr, ctx.timestamp, ctx.received_time_ns, ctx.inject_start_ns)
+    if ctx.scheduled_time_ns:
+        macro_scheduler.record_output(ctx)
+    ctx.action_id = trace_recorder.action_id(compiled_action)
+
+repeater = turbo_repeat.TurboRepeater()
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_MACRO_REPEAT, payload_parser=turbo_repeat.parse_payload,
+                                    requires_packet_id=True, ack_type=config.PACKET_TYPE_MACRO_ACK)
+def _handle_macro_repeat(ctx, command):
+    repeater.handle(ctx.addr, command, ctx.received_time_ns)
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_TRIGGER_IMPORT_BROWSER, mode=packet_dispatcher.MODE_ISOLATED,
+                                    payload_schema={"url": str})
+def _handle_trigger_import_browser(ctx, payload):
+    logger.info(f"Handling TRIGGER_IMPORT_BROWSER (ID: {ctx.packet_id})")
+    dialog_handler.trigger_pc_browser(payload["url"])
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_CAPTURE_MOUSE_POSITION, mode=packet_dispatcher.MODE_ISOLATED,
+                                    payload_schema={"purpose": str})
+def _handle_capture_mouse_position(ctx, payload):
+    logger.info(f"Handling CAPTURE_MOUSE_POSITION (ID: {ctx.packet_id})")
+    purpose = payload["purpose"]
+    if purpose in ["SRC", "DES"]:
+        auto_drag_handler.capture_mouse_position(purpose)
+    else:
+        logger.error(f"Invalid 'purpose' ('{purpose}') in CAPTURE_MOUSE_POSITION payload.")
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_AUTO_DRAG_LOOP_COMMAND, mode=packet_dispatcher.MODE_ISOLATED,
+                                    payload_schema={"action": str})
+def _handle_auto_drag_loop_command(ctx, payload):
+    logger.info(f"Handling AUTO_DRAG_LOOP_COMMAND (ID: {ctx.packet_id})")
+    action = payload["action"]
+    if action == "START":
+        auto_drag_handler.start_auto_drag_loop()
+    elif action == "STOP":
+        auto_drag_handler.stop_auto_drag_loop()
+    else:
+        logger.error(f"Invalid 'action' ('{action}') in AUTO_DRAG_LOOP_COMMAND payload.")
+
+@packet_dispatcher.register_handler(config.PACKET_TYPE_PROFILE_CONTROL, mode=packet_dispatcher.MODE_ISOLATED,
+                                    payload_schema={"action": str})
+def _handle_profile_control(ctx, payload):
+    logger.info(f"Handling PROFILE_CONTROL (ID: {ctx.packet_id})")
+    action = payload["action"]
+    if action == "START":
+        duration_sec = payload.get("durationSec")
+        start_profiling(duration_sec if isinstance(duration_sec, (int, float)) else session_profiler.DEFAULT_DURATION_SECONDS)
+    elif action == "STOP":
+        session_profiler.stop_profiling()
+    else:
+        logger.error(f"Invalid 'action' ('{action}') in PROFILE_CONTROL payload.")
+
+def _on_profiling_finished(report_path):
+    if log_to_gui_callback:
+        if report_path:
+            log_to_gui_callback(f"INFO: Profiling results written to {report_path}")
+        else:
+            log_to_gui_callback("ERROR: Profiling results could not be written. Check logs.")
+
+def start_profiling(duration_sec=session_profiler.DEFAULT_DURATION_SECONDS):
+    """Starts a time-boxed profiling session writing its results next to server.log."""
+    started = session_profiler.start_profiling(config_manager.APP_SETTINGS_DIR, duration_sec,
+                                               on_finished=_on_profiling_finished)
+    if log_to_gui_callback:
+        if started:
+            log_to_gui_callback(f"INFO: Profiling started for {min(duration_sec, session_profiler.MAX_DURATION_SECONDS):.0f}s.")
+        else:
+            log_to_gui_callback("WARN: Profiling is already running.")
+    return started
+
+macro_recorder.configure(config_manager.RECORDINGS_DIR) # Played by 'recorded_macro' actions
+input_simulator.set_playback_stop_event(stop_server_event) # Set before the pool shutdown waits for playing recordings
+
+def _on_recording_finished(path):
+    if log_to_gui_callback:
+        if path:
+            log_to_gui_callback(f"INFO: Recording saved to {path}")
+        else:
+            log_to_gui_callback("WARN: Recording ended without saving anything.")
+
+def start_macro_recording(name):
+    """Arms a key/mouse recording; the recording_toggle_key starts it and saves it."""
+    toggle_key = config_manager.settings.get_str("recording_toggle_key") or macro_recorder.DEFAULT_TOGGLE_KEY
+    try:
+        armed = macro_recorder.arm_recording(name, toggle_key, on_finished=_on_recording_finished)
+    except ValueError as e:
+        armed = False
+        logger.error(f"Cannot record: {e}")
+    if log_to_gui_callback:
+        if armed:
+            log_to_gui_callback(f"INFO: Recording '{name}' armed. Press '{toggle_key}' to start it, again to save it.")
+        else:
+            log_to_gui_callback("ERROR: Recording could not be armed. Check logs.")
+    return armed
+
+# --- Live configuration ---
+# The receive loop services every socket in _active_sockets. A port change binds a new
+# socket next to the old one; the old socket keeps receiving (and replying) for
+# PORT_CHANGE_GRACE_SECONDS so phones still on the old port lose nothing. Switching
+# back to a port within its grace period takes its still-open socket back into service.
+PORT_CHANGE_GRACE_SECONDS = 30.0
+_config_lock = threading.RLock() # Serializes reconfigure() calls; guards _retiring_sockets and _mdns_generation
+_pending_socket_changes = queue.Queue() # ("add", sock) for the loop thread
+_retiring_sockets = {} # port -> (socket, monotonic time it closes); closed by the loop thread
+current_port = None
+current_mdns_enabled = False
+_settings_subscribed = False
+_timer_resolution_held = False # Whether this server holds a precise_timing.acquire_high_resolution()
+_mdns_status_text = "mDNS Disabled"
+
+def _report_running_status():
+    if update_gui_status_callback:
+        update_gui_status_callback(f"Running on Port {current_port} ({_mdns_status_text})")
+
+def _apply_mdns_state(enabled, port):
+    """Registers or unregisters the mDNS service without touching sockets or executors."""
+    global _mdns_status_text
+    if not enabled:
+        mdns_handler.unregister_mdns_service()
+        logger.info("mDNS service is disabled by configuration.")
+        _mdns_status_text = "mDNS Disabled"
+        return
+    mdns_handler.unregister_mdns_service() # Re-register if it was advertising another port
+    if mdns_handler.register_mdns_service(port):
+        logger.info(f"mDNS service registered successfully for port {port}.")
+        _mdns_status_text = "mDNS Active"
+    else:
+        logger.warning("Failed to initialize mDNS. Server will run without mDNS.")
+        _mdns_status_text = "mDNS Failed"
+
+# mDNS registration (Zeroconf start-up, interface lookup, announcements) runs on its own
+# thread so it never delays binding the socket or answering the first PING.
+_mdns_lock = threading.Lock() # Held while a registration/unregistration is in progress
+_mdns_generation = 0 # Bumped by every request; a queued request that is no longer the latest is skipped
+
+def _apply_mdns_state_async(enabled, port):
+    """Starts _apply_mdns_state() on a background thread and reports the result through the GUI status callback."""
+    global _mdns_generation, _mdns_status_text
+    with _config_lock:
+        _mdns_generation += 1
+        generation = _mdns_generation
+    _mdns_status_text = "mDNS Registering..." if enabled else "mDNS Disabled"
+    threading.Thread(target=_mdns_registration_task, args=(enabled, port, generation),
+                     name="MDNSRegistrationThread", daemon=True).start()
+
+def _mdns_registration_task(enabled, port, generation):
+    with _mdns_lock:
+        with _config_lock:
+            superseded = generation != _mdns_generation
+        if superseded or stop_server_event.is_set():
+            return # Superseded by a newer request or the server is stopping
+        _apply_mdns_state(enabled, port)
+        if not stop_server_event.is_set():
+            _report_running_status()
+
+def _stop_mdns():
+    """Cancels pending registrations and unregisters, waiting for one in progress to finish first."""
+    global _mdns_generation
+    with _config_lock:
+        _mdns_generation += 1
+    with _mdns_lock:
+        mdns_handler.unregister_mdns_service()
+
+def _open_server_socket(port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(('0.0.0.0', port))
+        sock.setblocking(False)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+def _resize_executor(max_workers):
+    """
+    Swaps in a macro pool with a new worker count. The old pool is shut down without
+    waiting, so macros already queued or running on it still complete.
+    """
+    global executor
+    old_executor = executor
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='MacroWorker')
+    packet_dispatcher.set_executors(executor, isolated_worker)
+    if old_executor and not old_executor._shutdown:
+        old_executor.shutdown(wait=False)
+    logger.info(f"Macro worker pool resized to {max_workers} worker(s).")
+
+def _on_settings_changed(changed):
+    """Applies tunables from the settings store to the running server."""
+    if not (server_thread and server_thread.is_alive()):
+        return
+    if "input_event_spacing_ms" in changed:
+        input_backend.configure(event_spacing_ms=changed["input_event_spacing_ms"])
+    if "macro_worker_count" in changed:
+        reconfigure(max_workers=changed["macro_worker_count"])
+    if any(key in changed for key in ("macro_queue_capacity", "macro_stale_ms", "macro_nack_enabled")):
+        _configure_macro_admission()
+    if any(key in changed for key in ("scheduled_execution_enabled", "playout_delay_ms", "late_policy")):
+        _configure_macro_scheduler()
+    if "mouse_move_frame_ms" in changed:
+        mouse_mover.configure(frame_ms=changed["mouse_move_frame_ms"])
+    if any(key in changed for key in ("axis_output_rate_hz", "axis_timeout_ms", "axis_mappings")):
+        _configure_axis_channel()
+    if "repeat_timeout_ms" in changed:
+        repeater.configure(max_timeout_ms=changed["repeat_timeout_ms"])
+    if "timer_high_resolution_enabled" in changed:
+        _configure_timer_resolution()
+    if any(key in changed for key in ("relay_enabled", "relay_targets", "relay_routes", "relay_ack_timeout_ms")):
+        _configure_relay()
+    if "trace_recording_enabled" in changed or "trace_capacity_records" in changed:
+        _configure_trace_recording()
+    if "packet_capture_enabled" in changed:
+        _configure_packet_capture()
+
+def _configure_macro_admission():
+    macro_admission.configure(capacity=config_manager.settings.get_int("macro_queue_capacity"),
+                              stale_ms=config_manager.settings.get_float("macro_stale_ms"),
+                              nack_enabled=config_manager.settings.get_bool("macro_nack_enabled"))
+
+def _configure_macro_scheduler():
+    macro_scheduler.configure(enabled=config_manager.settings.get_bool("scheduled_execution_enabled"),
+                              playout_delay_ms=config_manager.settings.get_float("playout_delay_ms"),
+                              late_policy=config_manager.settings.get_str("late_policy"))
+
+def _configure_axis_channel():
+    axis_output.configure(mappings=config_manager.settings.get("axis_mappings"),
+                          output_rate_hz=config_manager.settings.get_float("axis_output_rate_hz"),
+                          timeout_ms=config_manager.settings.get_float("axis_timeout_ms"))
+
+def _configure_timer_resolution(enabled=None):
+    global _timer_resolution_held
+    if enabled is None:
+        enabled = config_manager.settings.get_bool("timer_high_resolution_enabled")
+    if enabled and not _timer_resolution_held:
+        _timer_resolution_held = precise_timing.acquire_high_resolution()
+    elif not enabled and _timer_resolution_held:
+        precise_timing.release_high_resolution()
+        _timer_resolution_held = False
+
+def _configure_relay():
+    relay.configure(config_manager.settings.get_bool("relay_enabled"),
+                    targets=config_manager.settings.get("relay_targets"),
+                    routes=config_manager.settings.get("relay_routes"),
+                    ack_timeout_ms=config_manager.settings.get_float("relay_ack_timeout_ms"))
+
+def _configure_trace_recording():
+    trace_recorder.configure(config_manager.settings.get_bool("trace_recording_enabled"),
+                             config_manager.TRACE_FILE_PATH,
+                             config_manager.settings.get_int("trace_capacity_records"))
+
+def _configure_packet_capture():
+    packet_capture.configure(config_manager.settings.get_bool("packet_capture_enabled"),
+                             config_manager.CAPTURE_DIR,
+                             config_manager.settings.get_int("packet_capture_max_mb") * 1024 * 1024)
+
+def reconfigure(port=None, mdns_enabled=None, max_workers=None):
+    """
+    Applies a new configuration to the running server without restarting it.
+    Returns False if the new port could not be bound (the old port keeps running).
+    """
+    global server_socket, current_port, current_mdns_enabled
+    with _config_lock:
+        if not (server_thread and server_thread.is_alive()):
+            logger.warning("reconfigure() called while the server is not running.")
+            return False
+
+        port_changed = port is not None and port != current_port
+        if port_changed:
+            if port in _retiring_sockets: # Still open from before the last change; keep using it
+                new_socket, _ = _retiring_sockets.pop(port)
+            else:
+                try:
+                    new_socket = _open_server_socket(port)
+                except Exception as e:
+                    logger.error(f"Could not bind new port {port}: {e}. Keeping port {current_port}.")
+                    if log_to_gui_callback:
+                        log_to_gui_callback(f"ERROR: Could not bind to port {port}: {e}")
+                    return False
+                _pending_socket_changes.put(("add", new_socket))
+            old_socket = server_socket
+            server_socket = new_socket
+            if old_socket:
+                _retiring_sockets[current_port] = (old_socket, time.monotonic() + PORT_CHANGE_GRACE_SECONDS)
+            logger.info(f"Now listening on port {port}. Port {current_port} stays open for {PORT_CHANGE_GRACE_SECONDS:.0f}s.")
+            if log_to_gui_callback:
+                log_to_gui_callback(f"INFO: Now listening on port {port} (port {current_port} closes in {PORT_CHANGE_GRACE_SECONDS:.0f}s).")
+            current_port = port
+
+        if mdns_enabled is not None and mdns_enabled != current_mdns_enabled:
+            current_mdns_enabled = mdns_enabled
+            _apply_mdns_state_async(current_mdns_enabled, current_port)
+        elif port_changed and current_mdns_enabled:
+            _apply_mdns_state_async(True, current_port)
+
+        if max_workers is not None and executor and max_workers != executor._max_workers:
+            _resize_executor(int(max_workers))
+
+        _report_running_status()
+        return True
 
-# Example of how _server_loop_task would look (no changes needed inside this function itself
-# regarding logging, as it uses the 'logger' instance which is now configured globally)
 def _server_loop_task(port_to_use, mdns_service_enabled):
     global server_socket, executor, log_to_gui_callback, update_gui_status_callback
+    global current_port, current_mdns_enabled
 
     if executor is None: 
         logger.error("ThreadPoolExecutor not initialized before server loop task.")
@@ -67,24 +600,11 @@ def _server_loop_task(port_to_use, mdns_service_enabled):
             update_gui_status_callback("Error: Executor not ready.")
         return
 
-    if mdns_service_enabled:
-        if not mdns_handler.register_mdns_service(port_to_use): 
-            logger.warning("Failed to initialize mDNS. Server will run without mDNS.")
-            if update_gui_status_callback:
-                update_gui_status_callback(f"Running on Port {port_to_use} (mDNS Failed)")
-        else:
-            logger.info(f"mDNS service registered successfully for port {port_to_use}.")
-            if update_gui_status_callback:
-                 update_gui_status_callback(f"Running on Port {port_to_use} (mDNS Active)")
-    else:
-        logger.info("mDNS service is disabled by configuration.")
-        if update_gui_status_callback:
-            update_gui_status_callback(f"Running on Port {port_to_use} (mDNS Disabled)")
+    current_port = port_to_use
+    current_mdns_enabled = mdns_service_enabled
 
     try:
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        server_socket.bind(('0.0.0.0', port_to_use))
-        server_socket.settimeout(1.0) 
+        server_socket = _open_server_socket(port_to_use)
         logger.info(f"UDP server listening on port {port_to_use}...")
         if log_to_gui_callback:
             log_to_gui_callback(f"INFO: UDP server listening on port {port_to_use}...")
@@ -95,141 +615,155 @@ def _server_loop_task(port_to_use, mdns_service_enabled):
             log_to_gui_callback(f"ERROR: Could not bind to port {port_to_use}: {e}")
         if update_gui_status_callback:
             update_gui_status_callback(f"Error: Port {port_to_use} in use?")
-        if mdns_service_enabled:
-            mdns_handler.unregister_mdns_service() 
         return
 
+    # The socket is ready; advertise it concurrently instead of before binding
+    _apply_mdns_state_async(mdns_service_enabled, port_to_use)
+    _report_running_status()
+
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ)
+
     while not stop_server_event.is_set():
-        try:
-            data_bytes, addr = server_socket.recvfrom(config.BUFFER_SIZE)
-            packet_received_time_ns = time.perf_counter_ns()
-            json_string = data_bytes.decode('utf-8').strip()
+        _maybe_log_periodic_stats()
 
+        # Socket changes requested by reconfigure()
+        while True:
             try:
-                packet_data = json.loads(json_string)
-            except json.JSONDecodeError as json_e:
-                logger.warning(f"Invalid JSON from {addr}: {json_e} - Data: '{json_string[:100]}'")
-                if log_to_gui_callback:
-                    log_to_gui_callback(f"WARN: Invalid JSON from {addr}: {json_e}")
-                continue
-
-            packet_type = packet_data.get('type')
-            packet_id = packet_data.get('packetId')
-            payload_str = packet_data.get('payload')
-            
-            gui_log_entry = f"RX: {packet_type} (ID: {packet_id})"
-            logger.info(f"Received packet: Type='{packet_type}', ID='{packet_id}', From={addr}, Payload='{str(payload_str)[:50]}...'")
-            if log_to_gui_callback:
-                log_to_gui_callback(f"INFO: {gui_log_entry}")
-
-            # ... (rest of packet handling logic) ...
-            if packet_type == config.PACKET_TYPE_HEALTH_CHECK_PING:
-                if packet_id:
-                    pong_timestamp = int(time.time() * 1000)
-                    pong_packet = {
-                        "packetId": packet_id, "timestamp": pong_timestamp,
-                        "type": config.PACKET_TYPE_HEALTH_CHECK_PONG, "payload": None
-                    }
-                    try:
-                        server_socket.sendto(json.dumps(pong_packet).encode('utf-8'), addr)
-                    except Exception as send_e:
-                        logger.error(f"Error sending PONG: {send_e}")
-                else:
-                    logger.warning("PING missing packetId.")
-
-            elif packet_type == config.PACKET_TYPE_MACRO_COMMAND:
-                if not packet_id:
-                    logger.warning("MACRO_COMMAND missing packetId. Cannot send ACK or process.")
-                    continue
-                ack_timestamp = int(time.time() * 1000)
-                ack_packet = {
-                    "packetId": packet_id, "timestamp": ack_timestamp,
-                    "type": config.PACKET_TYPE_MACRO_ACK, "payload": None
-                }
+                change = _pending_socket_changes.get_nowait()
+            except queue.Empty:
+                break
+            if change[0] == "add":
+                selector.register(change[1], selectors.EVENT_READ)
+        if _retiring_sockets:
+            now = time.monotonic()
+            with _config_lock: # reconfigure() may take a retiring socket back
+                expired = [(old_port, entry[0]) for old_port, entry in _retiring_sockets.items() if now >= entry[1]]
+                for old_port, _ in expired:
+                    del _retiring_sockets[old_port]
+            for old_port, old_socket in expired:
+                selector.unregister(old_socket)
+                old_socket.close()
+                logger.info(f"Closed previous server port {old_port} after grace period.")
+
+        for key, _ in selector.select(timeout=ack_batcher.next_timeout(0.5)):
+            sock = key.fileobj
+            # Drain everything that queued up, so a batched ACK covers the whole burst
+            for _ in range(RECV_DRAIN_LIMIT):
                 try:
-                    server_socket.sendto(json.dumps(ack_packet).encode('utf-8'), addr)
-                    logger.info(f"Sent ACK (ID: {packet_id})")
-                except Exception as send_e:
-                    logger.error(f"Error sending ACK for MACRO_COMMAND (ID: {packet_id}): {send_e}")
-
-                if payload_str and executor:
-                    executor.submit(input_simulator.process_macro_in_thread, payload_str, packet_id, packet_received_time_ns)
-                elif not payload_str:
-                    logger.warning(f"MACRO_COMMAND (ID: {packet_id}) missing payload.")
-                elif not executor:
-                    logger.error("Executor not available for MACRO_COMMAND.")
-
-
-            elif packet_type == config.PACKET_TYPE_TRIGGER_IMPORT_BROWSER:
-                logger.info(f"Handling TRIGGER_IMPORT_BROWSER (ID: {packet_id})")
-                if payload_str:
-                    try:
-                        trigger_data = json.loads(payload_str)
-                        url_to_open = trigger_data.get('url')
-                        if url_to_open:
-                            dialog_handler.trigger_pc_browser(url_to_open)
-                        else:
-                            logger.error("Missing 'url' in TRIGGER_IMPORT_BROWSER payload.")
-                    except Exception as e:
-                        logger.error(f"Error processing TRIGGER_IMPORT_BROWSER payload: {e}")
-                else:
-                    logger.warning(f"TRIGGER_IMPORT_BROWSER (ID: {packet_id}) missing payload.")
-
-            elif packet_type == config.PACKET_TYPE_CAPTURE_MOUSE_POSITION:
-                logger.info(f"Handling CAPTURE_MOUSE_POSITION (ID: {packet_id})")
-                if payload_str:
-                    try:
-                        capture_payload = json.loads(payload_str)
-                        purpose = capture_payload.get('purpose')
-                        if purpose in ["SRC", "DES"]:
-                            auto_drag_handler.capture_mouse_position(purpose)
-                        else:
-                            logger.error(f"Invalid 'purpose' ('{purpose}') in CAPTURE_MOUSE_POSITION payload.")
-                    except Exception as e:
-                        logger.error(f"Error processing CAPTURE_MOUSE_POSITION: {e}")
-                else:
-                    logger.warning(f"CAPTURE_MOUSE_POSITION (ID: {packet_id}) missing payload.")
-
-            elif packet_type == config.PACKET_TYPE_AUTO_DRAG_LOOP_COMMAND:
-                logger.info(f"Handling AUTO_DRAG_LOOP_COMMAND (ID: {packet_id})")
-                if payload_str:
-                    try:
-                        loop_payload = json.loads(payload_str)
-                        action = loop_payload.get('action')
-                        if action == "START":
-                            auto_drag_handler.start_auto_drag_loop()
-                        elif action == "STOP":
-                            auto_drag_handler.stop_auto_drag_loop()
-                        else:
-                            logger.error(f"Invalid 'action' ('{action}') in AUTO_DRAG_LOOP_COMMAND payload.")
-                    except Exception as e:
-                        logger.error(f"Error processing AUTO_DRAG_LOOP_COMMAND: {e}")
-                else:
-                    logger.warning(f"AUTO_DRAG_LOOP_COMMAND (ID: {packet_id}) missing payload.")
-            else:
-                logger.warning(f"Unknown packet type '{packet_type}'.")
-
-
-        except socket.timeout:
-            continue
-        except UnicodeDecodeError:
-            logger.error(f"Cannot decode UTF-8 from {addr if 'addr' in locals() else 'unknown sender'}.")
-        except Exception as loop_e:
-            logger.error(f"Error processing packet from {addr if 'addr' in locals() else 'unknown sender'}: {loop_e}", exc_info=True)
+                    data_bytes, addr = sock.recvfrom(config.BUFFER_SIZE)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError as recv_e:
+                    # e.g. WinError 10054 after an ICMP port unreachable for an earlier reply
+                    logger.debug(f"recvfrom failed: {recv_e}")
+                    break
+                packet_received_time_ns = time.perf_counter_ns()
+                if packet_capture.active:
+                    packet_capture.capture(packet_received_time_ns, addr, data_bytes)
+                _handle_datagram(sock, data_bytes, addr, packet_received_time_ns)
+        if ack_batcher.has_pending():
+            ack_batcher.flush_due()
+
+    ack_batcher.flush_all()
 
     logger.info("Server loop task stopping.")
-    if server_socket:
-        server_socket.close()
-        logger.info("Server socket closed in loop task.")
-    if mdns_service_enabled:
-        mdns_handler.unregister_mdns_service()
+    for registered_key in list(selector.get_map().values()):
+        try:
+            registered_key.fileobj.close()
+        except Exception:
+            pass
+    selector.close()
+    with _config_lock:
+        _retiring_sockets.clear()
+    logger.info("Server socket closed in loop task.")
+    if current_mdns_enabled:
+        _stop_mdns()
         logger.info("mDNS service unregistered in loop task.")
     if update_gui_status_callback:
         update_gui_status_callback("Server Stopped")
 
+def _handle_datagram(sock, data_bytes, addr, packet_received_time_ns):
+    """Decodes one datagram and hands it to the dispatcher (or handles it on the PING / stream fast paths)."""
+    try:
+        if PING_FAST_PATH_ENABLED:
+            fast_ping_id = _extract_fast_ping_id(data_bytes)
+            if fast_ping_id is not None:
+                try:
+                    sock.sendto(_PONG_TEMPLATE % (fast_ping_id, int(time.time() * 1000),
+                                                  clock_sync.server_time_ms(packet_received_time_ns),
+                                                  clock_sync.server_time_ms()), addr)
+                except Exception as send_e:
+                    logger.error(f"Error sending PONG: {send_e}")
+                _record_ping(addr)
+                return
+            mouse_move = mouse_stream.extract_fast(data_bytes)
+            if mouse_move is not None:
+                mouse_mover.add(addr, *mouse_move, packet_received_time_ns)
+                return
+            axis_update = axis_channel.extract_fast(data_bytes)
+            if axis_update is not None:
+                axis_output.update(addr, *axis_update, packet_received_time_ns)
+                return
+
+        json_string = data_bytes.decode('utf-8').strip()
+
+        try:
+            packet_data = json.loads(json_string)
+        except json.JSONDecodeError as json_e:
+            logger.warning(f"Invalid JSON from {addr}: {json_e} - Data: '{json_string[:100]}'")
+            if log_to_gui_callback:
+                log_to_gui_callback(f"WARN: Invalid JSON from {addr}: {json_e}")
+            return
+
+        packet_type = packet_data.get('type')
+        packet_id = packet_data.get('packetId')
+        payload_str = packet_data.get('payload')
+
+        if packet_type == config.PACKET_TYPE_HEALTH_CHECK_PING:
+            _record_ping(addr) # Summarised by _maybe_log_periodic_stats()
+        elif packet_type in (config.PACKET_TYPE_MOUSE_MOVE, config.PACKET_TYPE_AXIS_UPDATE):
+            pass # Hundreds per second; summarised by _maybe_log_periodic_stats()
+        else:
+            gui_log_entry = f"RX: {packet_type} (ID: {packet_id})"
+            logger.info(f"Received packet: Type='{packet_type}', ID='{packet_id}', From={addr}, Payload='{str(payload_str)[:50]}...'",
+                        extra={"per_packet": True, "packet_type": packet_type, "packet_id": packet_id,
+                               "client": f"{addr[0]}:{addr[1]}"})
+            if log_to_gui_callback:
+                log_to_gui_callback(f"INFO: {gui_log_entry}")
+
+        ctx = packet_dispatcher.PacketContext(sock, addr, packet_type, packet_id,
+                                              packet_data.get('timestamp'), packet_received_time_ns)
+        if packet_type == config.PACKET_TYPE_MACRO_COMMAND and relay.enabled and not relay.forward(ctx, data_bytes, payload_str):
+            return # Routed to other servers only
+        packet_dispatcher.dispatch(ctx, payload_str)
+
+    except UnicodeDecodeError:
+        logger.error(f"Cannot decode UTF-8 from {addr}.")
+    except Exception as loop_e:
+        logger.error(f"Error processing packet from {addr}: {loop_e}", exc_info=True)
+
+
+def _validate_default_macros():
+    """Resolves every key name in the bundled macro table up front so bad entries show up at startup."""
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    macro_file = os.path.join(base_path, DEFAULT_MACROS_FILE_NAME)
+    if not os.path.exists(macro_file):
+        logger.info(f"Default macro table '{macro_file}' not found. Skipping key validation.")
+        return
+    try:
+        compiled_count, errors = macro_compiler.validate_macro_file(macro_file)
+    except Exception as e:
+        logger.error(f"Could not validate default macro table '{macro_file}': {e}")
+        return
+    logger.info(f"Validated {compiled_count} default macro actions ({len(errors)} error(s)).")
+    for error in errors:
+        logger.error(f"Default macro rejected: {error}")
+        if log_to_gui_callback:
+            log_to_gui_callback(f"ERROR: Default macro rejected: {error}")
 
 def start_server(port, mdns_enabled, gui_log_cb, gui_status_cb):
-    global server_thread, stop_server_event, executor
+    global server_thread, stop_server_event, executor, isolated_worker, _settings_subscribed
     global log_to_gui_callback, update_gui_status_callback
 
     log_to_gui_callback = gui_log_cb
@@ -242,9 +776,30 @@ def start_server(port, mdns_enabled, gui_log_cb, gui_status_cb):
         return False
 
     if executor is None or executor._shutdown: 
-        executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix='MacroWorker')
+        executor = ThreadPoolExecutor(max_workers=config_manager.settings.get_int("macro_worker_count"), thread_name_prefix='MacroWorker')
         logger.info(f"ThreadPoolExecutor initialized/re-initialized with max_workers={executor._max_workers}")
-
+    if isolated_worker is None or isolated_worker._shutdown:
+        isolated_worker = IsolatedWorker("IsolatedWorker", ISOLATED_JOB_TIMEOUT_SECONDS)
+    packet_dispatcher.set_executors(executor, isolated_worker)
+
+    input_backend.configure(event_spacing_ms=config_manager.get_setting("input_event_spacing_ms"))
+    _configure_timer_resolution()
+    _configure_macro_admission()
+    _configure_macro_scheduler()
+    repeater.configure(max_timeout_ms=config_manager.settings.get_float("repeat_timeout_ms"))
+    mouse_mover.configure(frame_ms=config_manager.settings.get_float("mouse_move_frame_ms"))
+    _configure_axis_channel()
+    _configure_relay()
+    ack_batcher.reset()
+    _configure_trace_recording()
+    _configure_packet_capture()
+    _validate_default_macros()
+    if not _settings_subscribed:
+        config_manager.settings.subscribe(_on_settings_changed)
+        _settings_subscribed = True
+
+    while not _pending_socket_changes.empty(): # Left over from a previous run
+        _pending_socket_changes.get_nowait()
     stop_server_event.clear() 
     server_thread = threading.Thread(
         target=_server_loop_task,
@@ -261,7 +816,7 @@ def start_server(port, mdns_enabled, gui_log_cb, gui_status_cb):
     return True
 
 def stop_server():
-    global server_thread, stop_server_event, server_socket, executor
+    global server_thread, stop_server_event, server_socket, executor, isolated_worker
     global log_to_gui_callback, update_gui_status_callback
 
     logger.info("Attempting to stop server...")
@@ -295,13 +850,34 @@ def stop_server():
             logger.error(f"Error closing server socket in stop_server: {e}")
     server_socket = None
 
-    mdns_handler.unregister_mdns_service() 
+    _stop_mdns()
 
+    macro_scheduler.stop() # Releases held macros before the pools go away
+    repeater.stop() # Releases presses held by 'hold' repeats
+    mouse_mover.stop()
+    axis_output.stop() # Releases keys held by PWM
+    relay.stop()
+    _log_queue_depths()
+    packet_dispatcher.set_executors(None, None)
     if executor and not executor._shutdown:
         logger.info("Shutting down ThreadPoolExecutor...")
         executor.shutdown(wait=True) 
         logger.info("ThreadPoolExecutor shutdown complete.")
     executor = None 
+    if isolated_worker and not isolated_worker._shutdown:
+        isolated_worker.shutdown(wait=True)
+    isolated_worker = None
+    trace_recorder.close() # After the pools, so in-flight macros are still recorded
+    packet_capture.close()
+    timing = precise_timing.get_stats(reset=True)
+    if timing["waits"]:
+        logger.info(f"Timed waits: {timing['waits']}, avg {timing['avg_late_us']:.0f} us/max {timing['max_late_us']:.0f} us late, "
+                    f"{timing['spin_ms']:.0f} ms spinning")
+    _configure_timer_resolution(enabled=False) # After the pools, so running macros keep the precise timer
+
+    for packet_type, stats in packet_dispatcher.get_handler_stats().items():
+        logger.info(f"Handler stats {packet_type}: {stats['count']} run(s), avg {stats['avg_ms']:.3f} ms, "
+                    f"max {stats['max_ms']:.3f} ms, {stats['errors']} error(s)")
 
     if update_gui_status_callback:
         update_gui_status_callback("Server Stopped")
@@ -2,7 +2,7 @@
 # Main application for the StarButtonBox Server GUI using Tkinter.
 
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+from tkinter import ttk, scrolledtext, messagebox, simpledialog
 import threading
 import queue
 import logging
@@ -18,6 +18,7 @@ import server as server_control
 import mdns_handler 
 import config
 import system_tray_handler
+import session_profiler
 # import firewall_handler # Can be removed if no other part uses it. Keeping for now.
 
 logger = logging.getLogger("StarButtonBoxServer")
@@ -52,6 +53,7 @@ class ServerGUI:
         self._update_ip_display()
         self._setup_logging_to_gui()
         self.root.after(100, self._process_log_queue)
+        config_manager.settings.subscribe(self._on_settings_changed)
 
         icon_filename = "tray_icon.png"
         system_tray_handler.run_tray_icon(self.root, self, icon_filename)
@@ -92,6 +94,7 @@ class ServerGUI:
         self.status_frame = None; self.ip_label = None; self.port_status_label = None; self.mdns_status_label = None; self.overall_status_label = None
         self.config_frame = None; self.port_entry = None; self.apply_port_button = None; self.mdns_checkbutton = None
         self.autostart_checkbutton = None; self.minimize_to_tray_checkbutton = None; self.start_minimized_checkbutton = None
+        self.profile_button = None; self.record_button = None
         # self.firewall_helper_button = None # Removed
         # self.start_server_console_button = None # Removed
         self.start_stop_button = None
@@ -117,12 +120,14 @@ class ServerGUI:
 
         ttk.Label(self.config_frame, text="Server Port:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
         self.port_entry = ttk.Entry(self.config_frame, textvariable=self.server_port_var, width=10); self.port_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
-        self.apply_port_button = ttk.Button(self.config_frame, text="Apply & Restart", command=self._apply_port_settings); self.apply_port_button.grid(row=0, column=2, padx=5, pady=5)
+        self.apply_port_button = ttk.Button(self.config_frame, text="Apply", command=self._apply_port_settings); self.apply_port_button.grid(row=0, column=2, padx=5, pady=5)
         
         self.mdns_checkbutton = ttk.Checkbutton(self.config_frame, text="Enable mDNS Discovery", variable=self.mdns_enabled_var, command=self._apply_mdns_settings); self.mdns_checkbutton.grid(row=1, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
         self.autostart_checkbutton = ttk.Checkbutton(self.config_frame, text="Start Server with Windows", variable=self.autostart_enabled_var, command=self._toggle_autostart); self.autostart_checkbutton.grid(row=2, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
         self.minimize_to_tray_checkbutton = ttk.Checkbutton(self.config_frame, text="Minimize to system tray on close (X)", variable=self.minimize_to_tray_on_exit_var, command=self._apply_minimize_to_tray_setting); self.minimize_to_tray_checkbutton.grid(row=3, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
         self.start_minimized_checkbutton = ttk.Checkbutton(self.config_frame, text="Start application minimized to system tray", variable=self.start_minimized_to_tray_var, command=self._apply_start_minimized_setting); self.start_minimized_checkbutton.grid(row=4, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        self.profile_button = ttk.Button(self.config_frame, text=f"Profile Server ({session_profiler.DEFAULT_DURATION_SECONDS:.0f}s)", command=self._start_profiling); self.profile_button.grid(row=5, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        self.record_button = ttk.Button(self.config_frame, text="Record Macro...", command=self._start_macro_recording); self.record_button.grid(row=6, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
         # Firewall helper button and Start Server with Console button are removed.
 
         # Server Start/Stop Button (now directly in main_frame, perhaps below config or status)
@@ -170,27 +175,43 @@ class ServerGUI:
         try:
             new_port = int(self.server_port_var.get())
             if not (1024 <= new_port <= 65535): messagebox.showerror("Invalid Port", "Port number must be between 1024 and 65535."); self.server_port_var.set(str(self.settings.get("server_port"))); return
-            logger.info(f"GUI: Applying new port: {new_port}"); self._log_to_gui(f"INFO: Attempting to set port to {new_port} and restart server...")
-            self._restart_server_with_new_config(new_port=new_port)
+            logger.info(f"GUI: Applying new port: {new_port}"); self._log_to_gui(f"INFO: Applying port {new_port}...")
+            self._apply_server_config(new_port=new_port)
         except ValueError: messagebox.showerror("Invalid Port", "Port number must be a valid integer."); self.server_port_var.set(str(self.settings.get("server_port")))
     def _apply_mdns_settings(self):
         mdns_is_enabled = self.mdns_enabled_var.get(); logger.info(f"GUI: Applying mDNS setting: {'Enabled' if mdns_is_enabled else 'Disabled'}")
-        self._log_to_gui(f"INFO: Setting mDNS to {'Enabled' if mdns_is_enabled else 'Disabled'} and restarting server...")
-        self._restart_server_with_new_config(new_mdns_status=mdns_is_enabled)
-    def _restart_server_with_new_config(self, new_port=None, new_mdns_status=None):
-        def _actual_restart():
-            current_port_val = int(self.server_port_var.get()) if new_port is None else new_port; current_mdns_val = self.mdns_enabled_var.get() if new_mdns_status is None else new_mdns_status
-            self.settings["server_port"] = current_port_val; self.settings["mdns_enabled"] = current_mdns_val
-            config_manager.save_settings(port=current_port_val, mdns_enabled=current_mdns_val)
-            self.port_status_display_var.set(f"Port: {current_port_val}"); self.mdns_status_display_var.set(f"mDNS: {'Enabled' if current_mdns_val else 'Disabled'} (Applying...)")
-            self._toggle_server_state(start_server=True)
+        self._log_to_gui(f"INFO: Setting mDNS to {'Enabled' if mdns_is_enabled else 'Disabled'}...")
+        self._apply_server_config(new_mdns_status=mdns_is_enabled)
+    def _apply_server_config(self, new_port=None, new_mdns_status=None):
+        # A running server is reconfigured in place (no restart, no lost input); a stopped one is started with the new config
+        previous_port = self.settings.get("server_port")
+        current_port_val = int(self.server_port_var.get()) if new_port is None else new_port; current_mdns_val = self.mdns_enabled_var.get() if new_mdns_status is None else new_mdns_status
+        self.settings["server_port"] = current_port_val; self.settings["mdns_enabled"] = current_mdns_val
+        config_manager.save_settings(port=current_port_val, mdns_enabled=current_mdns_val)
+        self.port_status_display_var.set(f"Port: {current_port_val}"); self.mdns_status_display_var.set(f"mDNS: {'Enabled' if current_mdns_val else 'Disabled'} (Applying...)")
         if server_control.server_thread and server_control.server_thread.is_alive():
-            self._log_to_gui("INFO: Stopping server before applying new configuration..."); self.server_status_var.set("Server Stopping...")
-            if self.start_stop_button: self.start_stop_button.config(state='disabled')
-            if self.server_stop_thread and self.server_stop_thread.is_alive(): logger.warning("GUI: Server stop already in progress during restart."); messagebox.showwarning("Server Busy", "Server is already stopping. Please wait."); return
-            self.server_stop_thread = threading.Thread(target=self._execute_stop_and_then_restart, args=(_actual_restart,), daemon=True); self.server_stop_thread.start()
-        else: _actual_restart()
-    def _execute_stop_and_then_restart(self, restart_callback): server_control.stop_server(); self.root.after(0, restart_callback)
+            threading.Thread(target=self._execute_reconfigure, args=(current_port_val, current_mdns_val, previous_port), daemon=True).start()
+        else: self._toggle_server_state(start_server=True)
+    def _execute_reconfigure(self, port, mdns_enabled, previous_port):
+        # Runs off the Tk thread: mDNS registration can take a while
+        if server_control.reconfigure(port=port, mdns_enabled=mdns_enabled): return
+        def _revert_port():
+            self.server_port_var.set(str(previous_port)); self.settings["server_port"] = previous_port; config_manager.save_settings(port=previous_port)
+            self.port_status_display_var.set(f"Port: {previous_port}"); messagebox.showerror("Port Change Failed", f"Could not listen on port {port}. Still running on port {previous_port}.")
+        self.root.after(0, _revert_port)
+    def _on_settings_changed(self, changed):
+        # Called on the SettingsStore notifier thread (for GUI, server and external edits of the file alike); apply on the Tk thread
+        self.root.after(0, lambda: self._apply_changed_settings(changed))
+    def _apply_changed_settings(self, changed):
+        self.settings.update(changed); config_changed = False
+        if "server_port" in changed and str(changed["server_port"]) != self.server_port_var.get(): self.server_port_var.set(str(changed["server_port"])); config_changed = True
+        if "mdns_enabled" in changed and bool(changed["mdns_enabled"]) != self.mdns_enabled_var.get(): self.mdns_enabled_var.set(bool(changed["mdns_enabled"])); config_changed = True
+        for key, var in (("autostart_enabled", self.autostart_enabled_var), ("minimize_to_tray_on_exit", self.minimize_to_tray_on_exit_var), ("start_minimized_to_tray", self.start_minimized_to_tray_var)):
+            if key in changed: var.set(bool(changed[key]))
+        if config_changed and server_control.server_thread and server_control.server_thread.is_alive():
+            logger.info("GUI: Server settings changed outside the GUI. Reconfiguring server."); self._log_to_gui("INFO: Settings file changed. Applying new configuration...")
+            self._apply_server_config()
+        elif config_changed: self._update_gui_for_server_state(is_running=False)
     def _toggle_autostart(self):
         enable = self.autostart_enabled_var.get(); executable_path = ""
         if enable:
@@ -216,6 +237,13 @@ class ServerGUI:
                 if not config_manager.set_autostart_in_registry(True, executable_path): messagebox.showerror("Autostart Error", "Failed to update autostart registry for 'start minimized' change.")
                 else: messagebox.showinfo("Autostart Updated", "Autostart registry entry updated for 'start minimized' preference.")
             else: logger.warning("GUI: Cannot update autostart registry for 'start minimized' as executable path is not set.")
+    def _start_profiling(self):
+        if not (server_control.server_thread and server_control.server_thread.is_alive()): messagebox.showinfo("Profiling", "Start the server before profiling it."); return
+        server_control.start_profiling()
+    def _start_macro_recording(self):
+        name = simpledialog.askstring("Record Macro", "Recording name (letters, digits, '_' and '-'):", parent=self.root)
+        if not name: return
+        if not server_control.start_macro_recording(name.strip()): messagebox.showerror("Record Macro", "Recording could not be armed. Check the log.")
     def _toggle_server_state_button_click(self):
         if self.server_stop_thread and self.server_stop_thread.is_alive(): logger.warning("GUI: Start/Stop button clicked while a stop operation is in progress."); messagebox.showwarning("Server Busy", "Server is currently stopping. Please wait."); return
         if server_control.server_thread and server_control.server_thread.is_alive(): self._toggle_server_state(start_server=False)
@@ -236,12 +264,9 @@ class ServerGUI:
             else: logger.info("GUI: Server stop requested, but not running."); self._update_gui_for_server_state(is_running=False)
     def _execute_stop_server_and_update_gui(self): server_control.stop_server(); self.root.after(0, lambda: self._update_gui_for_server_state(is_running=False))
     def _update_gui_for_server_state(self, is_running: bool):
-        button_text = "Stop Server" if is_running else "Start Server"; controls_state = 'disabled' if is_running else 'normal'
+        button_text = "Stop Server" if is_running else "Start Server"
         if self.start_stop_button: self.start_stop_button.config(text=button_text, state='normal')
-        # self.start_server_console_button is removed, so no need to update its state
-        if self.port_entry: self.port_entry.config(state=controls_state)
-        if self.mdns_checkbutton: self.mdns_checkbutton.config(state=controls_state)
-        if self.apply_port_button: self.apply_port_button.config(state=controls_state)
+        # Port and mDNS controls stay enabled while running: changes are applied live via server.reconfigure()
         if not is_running:
             self.server_status_var.set("Server Stopped"); mdns_config_enabled = self.mdns_enabled_var.get()
             self.mdns_status_display_var.set(f"mDNS: {'Enabled' if mdns_config_enabled else 'Disabled'} (Server Stopped)")
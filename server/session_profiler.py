@@ -0,0 +1,163 @@
+# session_profiler.py
+# Time-boxed profiling of the running server, started from the GUI or a PROFILE_CONTROL packet.
+# A sampler thread periodically walks the stacks of all other threads (receive loop,
+# macro workers, background workers) via sys._current_frames(), and tracemalloc records
+# allocations for the duration of the session. Nothing is installed while no session is
+# running, so the hooks cost nothing when profiling is off.
+#
+# Each session writes two files to the output directory:
+#   profile_<time>.txt     hottest functions per thread and top allocators
+#   profile_<time>.folded  collapsed stacks ("thread;outer;...;inner count") for flame graph tools
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import logging
+
+logger = logging.getLogger("StarButtonBoxServer.Profiler")
+
+DEFAULT_DURATION_SECONDS = 30.0
+MAX_DURATION_SECONDS = 300.0
+DEFAULT_SAMPLE_INTERVAL_MS = 5.0
+TRACEMALLOC_FRAMES = 10
+TOP_FUNCTIONS = 25
+TOP_ALLOCATORS = 25
+
+_session_lock = threading.Lock()
+_session = None
+
+class _ProfileSession:
+    def __init__(self, duration_sec, sample_interval_ms, output_dir, on_finished):
+        self.duration_sec = duration_sec
+        self.sample_interval_sec = sample_interval_ms / 1000.0
+        self.output_dir = output_dir
+        self.on_finished = on_finished
+        self.stop_event = threading.Event()
+        self.stack_counts = {} # (thread_name, (frame labels outer -> inner)) -> samples
+        self.sample_rounds = 0
+        self.thread = threading.Thread(target=self._run, name="ProfilerSampler", daemon=True)
+
+    def _sample(self, own_ident):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                labels.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            labels.reverse()
+            key = (names.get(ident, str(ident)), tuple(labels))
+            self.stack_counts[key] = self.stack_counts.get(key, 0) + 1
+        self.sample_rounds += 1
+
+    def _run(self):
+        report_path = None
+        try:
+            report_path = self._profile()
+        except Exception as e:
+            logger.error(f"Profiling failed: {e}", exc_info=True)
+        finally: # A failed session must not block the next one
+            _session_finished(self)
+            if self.on_finished:
+                self.on_finished(report_path)
+
+    def _profile(self):
+        """Samples until the deadline or stop(). Returns the report path, or None if it could not be written."""
+        own_ident = threading.get_ident()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        start = time.perf_counter()
+        deadline = start + self.duration_sec
+        try:
+            baseline = tracemalloc.take_snapshot()
+            while not self.stop_event.is_set() and time.perf_counter() < deadline:
+                self._sample(own_ident)
+                self.stop_event.wait(self.sample_interval_sec)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+        elapsed = time.perf_counter() - start
+        try:
+            report_path = self._write_results(elapsed, baseline, snapshot)
+            logger.info(f"Profiling finished after {elapsed:.1f}s ({self.sample_rounds} samples). Results in '{report_path}'.")
+            return report_path
+        except Exception as e:
+            logger.error(f"Could not write profiling results: {e}", exc_info=True)
+            return None
+
+    def _write_results(self, elapsed, baseline, snapshot):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_path = os.path.join(self.output_dir, time.strftime("profile_%Y%m%d_%H%M%S"))
+
+        with open(base_path + ".folded", "w", encoding="utf-8") as f:
+            for (thread_name, labels), count in sorted(self.stack_counts.items(), key=lambda item: -item[1]):
+                f.write(f"{';'.join((thread_name,) + labels)} {count}\n")
+
+        # Per thread: samples where a function is on top of the stack (self) or anywhere on it (total)
+        per_thread = {}
+        for (thread_name, labels), count in self.stack_counts.items():
+            stats = per_thread.setdefault(thread_name, {"samples": 0, "self": {}, "total": {}})
+            stats["samples"] += count
+            functions = [label.rsplit(":", 1)[0] for label in labels]
+            if functions:
+                stats["self"][functions[-1]] = stats["self"].get(functions[-1], 0) + count
+            for function in set(functions):
+                stats["total"][function] = stats["total"].get(function, 0) + count
+
+        lines = [f"StarButtonBox profile: {elapsed:.1f}s, {self.sample_rounds} sample rounds "
+                 f"every {self.sample_interval_sec * 1000:.1f} ms", ""]
+        for thread_name, stats in sorted(per_thread.items(), key=lambda item: -item[1]["samples"]):
+            lines.append(f"== Thread {thread_name} ({stats['samples']} samples)")
+            lines.append(f"  {'self %':>7} {'total %':>8}  function")
+            for function, self_count in sorted(stats["self"].items(), key=lambda item: -item[1])[:TOP_FUNCTIONS]:
+                lines.append(f"  {self_count * 100.0 / stats['samples']:7.1f} "
+                             f"{stats['total'][function] * 100.0 / stats['samples']:8.1f}  {function}")
+            lines.append("")
+
+        lines.append(f"== Top {TOP_ALLOCATORS} allocators (growth during the session)")
+        for stat in snapshot.compare_to(baseline, "lineno")[:TOP_ALLOCATORS]:
+            lines.append(f"  {stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  {stat.traceback}")
+        with open(base_path + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return base_path + ".txt"
+
+def _session_finished(session):
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+
+def start_profiling(output_dir, duration_sec=DEFAULT_DURATION_SECONDS, sample_interval_ms=DEFAULT_SAMPLE_INTERVAL_MS,
+                    on_finished=None):
+    """
+    Starts a profiling session that stops by itself after duration_sec (capped at MAX_DURATION_SECONDS).
+    on_finished(report_path) is called from the sampler thread. Returns False if a session is already running.
+    """
+    global _session
+    duration_sec = min(max(float(duration_sec), 1.0), MAX_DURATION_SECONDS)
+    with _session_lock:
+        if _session is not None:
+            logger.warning("Profiling is already running.")
+            return False
+        _session = _ProfileSession(duration_sec, max(float(sample_interval_ms), 1.0), output_dir, on_finished)
+        _session.thread.start()
+    logger.info(f"Profiling started for {duration_sec:.0f}s (sampling every {sample_interval_ms:.0f} ms).")
+    return True
+
+def stop_profiling():
+    """Ends the running session early; results are still written. Returns False if none was running."""
+    with _session_lock:
+        session = _session
+    if session is None:
+        return False
+    session.stop_event.set()
+    return True
+
+def is_profiling():
+    return _session is not None
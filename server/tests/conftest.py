@@ -0,0 +1,16 @@
+# conftest.py
+# The server modules import each other as top-level modules (they are run from
+# the server directory), so the tests put that directory on sys.path. Settings
+# go to a temporary file instead of the developer's server_settings.json.
+
+import os
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+import config_manager
+
+config_manager.settings.file_path = os.path.join(tempfile.mkdtemp(prefix="sbb_tests_"), config_manager.SETTINGS_FILE_NAME)
@@ -0,0 +1,103 @@
+# test_ack_batcher.py
+
+import json
+import time
+
+import pytest
+
+import ack_batcher
+import config
+
+class _Socket:
+    def __init__(self):
+        self.sent = [] # (decoded ACK_BATCH payload, addr)
+
+    def sendto(self, data, addr):
+        packet = json.loads(data.decode('utf-8'))
+        assert packet["type"] == config.PACKET_TYPE_ACK_BATCH
+        self.sent.append((json.loads(packet["payload"]), addr))
+
+class _Ctx:
+    def __init__(self, sock, addr, packet_id):
+        self.sock = sock
+        self.addr = addr
+        self.packet_id = packet_id
+
+ADDR = ("192.0.2.20", 41000)
+
+@pytest.fixture(autouse=True)
+def _reset():
+    ack_batcher.reset()
+    yield
+    ack_batcher.reset()
+
+def test_clients_that_did_not_negotiate_get_direct_acks():
+    assert not ack_batcher.add(_Ctx(_Socket(), ADDR, "a"), config.PACKET_TYPE_MACRO_ACK)
+    assert not ack_batcher.has_pending()
+
+def test_window_is_clamped_and_defaulted():
+    assert ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, 10_000) == (ack_batcher.MODE_BATCHED, ack_batcher.MAX_WINDOW_MS)
+    assert ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, -5) == (ack_batcher.MODE_BATCHED, 0.0)
+    assert ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, "x") == (ack_batcher.MODE_BATCHED, ack_batcher.DEFAULT_WINDOW_MS)
+    for window_ms in (float("nan"), float("inf"), float("-inf"), True):
+        assert ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, window_ms) == (ack_batcher.MODE_BATCHED, ack_batcher.DEFAULT_WINDOW_MS)
+    assert ack_batcher.negotiate(ADDR, "SOMETHING") == (ack_batcher.MODE_PER_PACKET, 0.0)
+
+def test_batch_is_held_until_its_window_elapses():
+    sock = _Socket()
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, 20)
+    for packet_id in ("a", "b", "c"):
+        assert ack_batcher.add(_Ctx(sock, ADDR, packet_id), config.PACKET_TYPE_MACRO_ACK)
+    ack_batcher.flush_due()
+    assert sock.sent == []
+    assert 0.0 < ack_batcher.next_timeout(0.5) <= 0.02
+    time.sleep(0.03)
+    assert ack_batcher.next_timeout(0.5) == 0.0
+    ack_batcher.flush_due()
+    assert sock.sent == [({"ackType": config.PACKET_TYPE_MACRO_ACK, "ids": ["a", "b", "c"]}, ADDR)]
+    assert not ack_batcher.has_pending()
+
+def test_zero_window_flushes_on_the_next_drain():
+    sock = _Socket()
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, 0)
+    ack_batcher.add(_Ctx(sock, ADDR, "a"), config.PACKET_TYPE_MACRO_ACK)
+    ack_batcher.flush_due()
+    assert len(sock.sent) == 1
+
+def test_full_batch_is_sent_at_once():
+    sock = _Socket()
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, ack_batcher.MAX_WINDOW_MS)
+    for index in range(ack_batcher.MAX_IDS_PER_BATCH + 1):
+        ack_batcher.add(_Ctx(sock, ADDR, str(index)), config.PACKET_TYPE_MACRO_ACK)
+    assert len(sock.sent) == 1
+    assert len(sock.sent[0][0]["ids"]) == ack_batcher.MAX_IDS_PER_BATCH
+    ack_batcher.flush_all()
+    assert sock.sent[1][0]["ids"] == [str(ack_batcher.MAX_IDS_PER_BATCH)]
+
+def test_other_ack_type_or_socket_starts_a_new_batch():
+    sock, other_sock = _Socket(), _Socket()
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, ack_batcher.MAX_WINDOW_MS)
+    ack_batcher.add(_Ctx(sock, ADDR, "a"), config.PACKET_TYPE_MACRO_ACK)
+    ack_batcher.add(_Ctx(sock, ADDR, "b"), config.PACKET_TYPE_MACRO_NACK)
+    assert sock.sent == [({"ackType": config.PACKET_TYPE_MACRO_ACK, "ids": ["a"]}, ADDR)]
+    ack_batcher.add(_Ctx(other_sock, ADDR, "c"), config.PACKET_TYPE_MACRO_NACK)
+    assert sock.sent[1] == ({"ackType": config.PACKET_TYPE_MACRO_NACK, "ids": ["b"]}, ADDR)
+    assert other_sock.sent == []
+
+def test_switching_back_to_per_packet_flushes_pending_acks():
+    sock = _Socket()
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, ack_batcher.MAX_WINDOW_MS)
+    ack_batcher.add(_Ctx(sock, ADDR, "a"), config.PACKET_TYPE_MACRO_ACK)
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_PER_PACKET)
+    assert len(sock.sent) == 1
+    assert not ack_batcher.add(_Ctx(sock, ADDR, "b"), config.PACKET_TYPE_MACRO_ACK)
+
+def test_evicted_client_is_flushed_and_falls_back_to_per_packet():
+    sock = _Socket()
+    ack_batcher.negotiate(ADDR, ack_batcher.MODE_BATCHED, ack_batcher.MAX_WINDOW_MS)
+    ack_batcher.add(_Ctx(sock, ADDR, "a"), config.PACKET_TYPE_MACRO_ACK)
+    for index in range(ack_batcher.MAX_BATCHED_CLIENTS):
+        ack_batcher.negotiate(("192.0.2.21", 42000 + index), ack_batcher.MODE_BATCHED)
+    assert len(sock.sent) == 1
+    assert not ack_batcher.add(_Ctx(sock, ADDR, "b"), config.PACKET_TYPE_MACRO_ACK)
+    assert ack_batcher.get_counters()["clients"] == ack_batcher.MAX_BATCHED_CLIENTS
@@ -0,0 +1,84 @@
+# test_admission_control.py
+
+import time
+
+from admission_control import AdmissionQueue, POLICY_COALESCE, POLICY_DROP_STALE, POLICY_NACK
+from packet_dispatcher import PacketContext
+
+def _ctx(ip="192.0.2.10", received_time_ns=None):
+    return PacketContext(None, (ip, 50000), "MACRO_COMMAND", "id", 0,
+                         time.perf_counter_ns() if received_time_ns is None else received_time_ns)
+
+def _queue(policies, **kwargs):
+    return AdmissionQueue(lambda payload: policies, **kwargs)
+
+def test_identical_waiting_macro_coalesces():
+    queue = _queue({POLICY_COALESCE})
+    assert queue.admit(_ctx(), "f1") == (True, False)
+    assert queue.admit(_ctx(), "f1") == (False, False)
+    assert queue.admit(_ctx(), "f2") == (True, False)
+    assert queue.get_counters()["coalesced"] == 1
+
+def test_coalescing_is_per_client():
+    queue = _queue({POLICY_COALESCE})
+    assert queue.admit(_ctx("192.0.2.10"), "f1")[0]
+    assert queue.admit(_ctx("192.0.2.11"), "f1")[0]
+
+def test_coalescing_ends_once_the_waiting_macro_starts():
+    queue = _queue({POLICY_COALESCE})
+    ctx = _ctx()
+    assert queue.admit(ctx, "f1")[0]
+    assert queue.begin(ctx, "f1")
+    assert queue.admit(_ctx(), "f1")[0]
+    assert queue.get_counters()["pending"] == 1
+
+def test_without_coalesce_policy_duplicates_are_admitted():
+    queue = _queue(set())
+    assert queue.admit(_ctx(), "f1")[0]
+    assert queue.admit(_ctx(), "f1")[0]
+
+def test_full_queue_rejects_and_nacks_only_when_enabled_and_requested():
+    queue = _queue({POLICY_NACK}, capacity=1)
+    assert queue.admit(_ctx(), "f1") == (True, False)
+    assert queue.admit(_ctx(), "f2") == (False, False) # NACK not enabled
+    queue.configure(nack_enabled=True)
+    assert queue.admit(_ctx(), "f3") == (False, True)
+    counters = queue.get_counters()
+    assert (counters["rejected"], counters["nacked"]) == (2, 1)
+
+def test_full_queue_without_nack_policy_sheds_silently():
+    queue = _queue(set(), capacity=1, nack_enabled=True)
+    queue.admit(_ctx(), "f1")
+    assert queue.admit(_ctx(), "f2") == (False, False)
+
+def test_released_slot_is_reusable():
+    queue = _queue(set(), capacity=1)
+    ctx = _ctx()
+    queue.admit(ctx, "f1")
+    queue.release(ctx, "f1")
+    assert queue.admit(_ctx(), "f2")[0]
+
+def test_stale_macro_is_dropped_at_begin():
+    queue = _queue({POLICY_DROP_STALE}, stale_ms=50)
+    ctx = _ctx(received_time_ns=time.perf_counter_ns() - 100_000_000)
+    queue.admit(ctx, "f1")
+    assert not queue.begin(ctx, "f1")
+    counters = queue.get_counters()
+    assert (counters["stale"], counters["pending"]) == (1, 0)
+
+def test_fresh_macro_and_macro_without_stale_policy_run():
+    queue = _queue({POLICY_DROP_STALE}, stale_ms=50)
+    ctx = _ctx()
+    queue.admit(ctx, "f1")
+    assert queue.begin(ctx, "f1")
+    old_ctx = _ctx(received_time_ns=time.perf_counter_ns() - 100_000_000)
+    lenient = _queue(set(), stale_ms=50)
+    lenient.admit(old_ctx, "f1")
+    assert lenient.begin(old_ctx, "f1")
+
+def test_stale_cutoff_counts_from_scheduled_time():
+    queue = _queue({POLICY_DROP_STALE}, stale_ms=50)
+    ctx = _ctx(received_time_ns=time.perf_counter_ns() - 1_000_000_000)
+    ctx.scheduled_time_ns = time.perf_counter_ns() # Held by the playout scheduler until now
+    queue.admit(ctx, "f1")
+    assert queue.begin(ctx, "f1")
@@ -0,0 +1,91 @@
+# test_axis_channel.py
+
+import json
+import time
+
+import pytest
+
+import axis_channel
+import config
+import input_backend
+import key_codes
+from axis_channel import AxisChannel
+
+def _packet(payload):
+    return json.dumps({"packetId": "p", "timestamp": 0, "type": config.PACKET_TYPE_AXIS_UPDATE,
+                       "payload": payload}, separators=(',', ':')).encode('utf-8')
+
+@pytest.fixture
+def backend():
+    recording = input_backend.RecordingBackend()
+    input_backend.set_backend(recording)
+    return recording
+
+def test_parse_payload_clamps_values():
+    assert axis_channel.parse_payload(b"7;throttle=0.5;strafe=-3;yaw=2") == (7, [("throttle", 0.5), ("strafe", -1.0), ("yaw", 1.0)])
+    assert axis_channel.parse_payload("8") == (8, [])
+
+@pytest.mark.parametrize("value", ["nan", "NaN", "inf", "-inf"])
+def test_parse_payload_rejects_non_finite_values(value):
+    with pytest.raises(ValueError):
+        axis_channel.parse_payload(f"1;mouse={value}")
+    assert axis_channel.extract_fast(_packet(f"1;mouse={value}")) is None
+
+def test_extract_fast_ignores_other_packets_and_bad_payloads():
+    assert axis_channel.extract_fast(_packet("3;throttle=0.25")) == (3, [("throttle", 0.25)])
+    other = json.dumps({"type": config.PACKET_TYPE_MACRO_COMMAND, "payload": "3;x=1"}).encode('utf-8')
+    assert axis_channel.extract_fast(other) is None
+    assert axis_channel.extract_fast(_packet("x;throttle=0.25")) is None
+
+def test_older_sequences_are_dropped_until_the_stream_restarts(backend):
+    channel = AxisChannel()
+    channel.configure({"yaw": {"mode": "mouse_x"}})
+    addr = ("192.0.2.30", 43000)
+    try:
+        now_ns = time.perf_counter_ns()
+        channel.update(addr, 5000, [("yaw", 0.5)], now_ns)
+        channel.update(addr, 4999, [("yaw", -0.5)], now_ns)
+        channel.update(addr, 5000, [("yaw", -0.5)], now_ns) # Duplicate
+        assert channel.get_stats()["values"]["yaw"] == 0.5
+        channel.update(addr, 1, [("yaw", 0.25)], now_ns)     # Far behind: the phone restarted its stream
+        channel.update(addr, 2, [("other", 1.0)], now_ns)
+        stats = channel.get_stats()
+        assert stats["values"]["yaw"] == 0.25
+        assert (stats["stale"], stats["unknown_axes"]) == (2, 1)
+    finally:
+        channel.stop()
+
+def test_mouse_axis_carries_sub_pixel_movement(backend):
+    channel = AxisChannel()
+    channel.configure({"yaw": {"mode": "mouse_x", "speed": 100.0}})
+    axis = channel._axes["yaw"]
+    now_ns = time.perf_counter_ns()
+    axis.value, axis.updated_ns = 0.5, now_ns
+    for _ in range(10): # 0.5 * 100 px/s * 10 ms = 0.5 px per tick
+        channel._tick(now_ns, 0.01)
+    moved = sum(event[1] for _, events in backend.batches for event in events if event[0] == input_backend.EVENT_MOUSE_MOVE)
+    assert moved == 5
+
+def test_key_pwm_axis_releases_when_the_phone_goes_quiet(backend):
+    channel = AxisChannel()
+    channel.configure({"throttle": {"mode": "key_pwm", "positive": "w", "negative": "s"}}, timeout_ms=100)
+    axis = channel._axes["throttle"]
+    start_ns = time.perf_counter_ns()
+    axis.value, axis.updated_ns = 1.0, start_ns
+    channel._tick(start_ns, 0.01)
+    assert axis.held_code == key_codes.resolve_key("w")
+    channel._tick(start_ns + 200_000_000, 0.01) # Past the timeout
+    assert axis.held_code is None
+    assert backend.batches[-1][1] == (input_backend.key_up(key_codes.resolve_key("w")),)
+
+@pytest.mark.parametrize("period_ms", [0, -5, "nan", "inf"])
+def test_mapping_with_unusable_period_is_ignored(period_ms):
+    channel = AxisChannel()
+    channel.configure({"throttle": {"mode": "key_pwm", "positive": "w", "negative": "s", "periodMs": period_ms},
+                       "yaw": {"mode": "mouse_x"}})
+    assert set(channel._axes) == {"yaw"}
+
+def test_short_period_is_raised_to_the_floor():
+    channel = AxisChannel()
+    channel.configure({"throttle": {"mode": "key_pwm", "positive": "w", "negative": "s", "periodMs": 0.001}})
+    assert channel._axes["throttle"].period_ns == int(axis_channel.MIN_PWM_PERIOD_MS * 1_000_000)
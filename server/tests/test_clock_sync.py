@@ -0,0 +1,97 @@
+# test_clock_sync.py
+
+import pytest
+
+import clock_sync
+from clock_sync import ClientClock
+
+START_MS = 1_700_000_000_000.0
+
+def _exchange(clock, server_send_ms, offset_ms, drift_ppm=0.0, up_ms=5.0, down_ms=5.0, processing_ms=0.2):
+    """Feeds one PING/PONG exchange with a phone clock of offset_ms (at START_MS) plus drift."""
+    phone = lambda server_ms: server_ms + offset_ms + drift_ppm * 1e-6 * (server_ms - START_MS)
+    t2 = server_send_ms + up_ms
+    t3 = t2 + processing_ms
+    return clock.add_exchange(phone(server_send_ms), t2, t3, phone(t3 + down_ms))
+
+def test_symmetric_delay_gives_exact_offset():
+    clock = ClientClock()
+    assert _exchange(clock, START_MS, offset_ms=1234.0)
+    assert clock.offset_ms == pytest.approx(1234.0)
+    assert clock.delay_ms == pytest.approx(10.0)
+
+def test_filter_prefers_lowest_delay_sample():
+    clock = ClientClock()
+    _exchange(clock, START_MS, offset_ms=100.0, up_ms=2.0, down_ms=2.0)
+    # Queued on the way in: the naive offset of these is 40 ms off
+    for index in range(1, 5):
+        _exchange(clock, START_MS + index * 1000.0, offset_ms=100.0, up_ms=82.0, down_ms=2.0)
+    assert clock.offset_ms == pytest.approx(100.0)
+    assert clock.delay_ms == pytest.approx(4.0)
+
+def test_unusable_exchanges_are_rejected():
+    clock = ClientClock()
+    assert not _exchange(clock, START_MS, offset_ms=0.0, up_ms=600.0, down_ms=600.0)
+    assert not clock.add_exchange(100.0, 50.0, 200.0, 110.0) # Server time exceeds the round trip
+    assert clock.offset_ms is None
+    assert clock.to_server_ms(START_MS) is None
+
+def test_drift_is_fitted_once_the_window_is_long_enough():
+    clock = ClientClock()
+    for index in range(6): # 50 s: shorter than MIN_DRIFT_SPAN_MS
+        _exchange(clock, START_MS + index * 10_000.0, offset_ms=0.0, drift_ppm=80.0)
+    assert clock.drift_ppm == 0.0
+    for index in range(6, 31): # 5 minutes
+        _exchange(clock, START_MS + index * 10_000.0, offset_ms=0.0, drift_ppm=80.0)
+    assert clock.drift_ppm == pytest.approx(80.0, abs=1.0)
+    later_ms = START_MS + 600_000.0
+    phone_ms = later_ms + 80.0e-6 * 600_000.0
+    assert clock.to_server_ms(phone_ms) == pytest.approx(later_ms, abs=0.5)
+
+def test_implausible_drift_is_ignored():
+    clock = ClientClock()
+    for index in range(31):
+        _exchange(clock, START_MS + index * 10_000.0, offset_ms=0.0, drift_ppm=2000.0)
+    assert clock.drift_ppm == 0.0
+
+def test_clock_step_restarts_the_estimate():
+    clock = ClientClock()
+    for index in range(5):
+        _exchange(clock, START_MS + index * 1000.0, offset_ms=0.0)
+    _exchange(clock, START_MS + 5000.0, offset_ms=10_000.0) # Phone clock set forward by 10 s
+    assert clock.steps == 1
+    assert clock.offset_ms == pytest.approx(10_000.0)
+    assert len(clock.filtered) == 1
+
+def test_one_way_latency_is_only_recorded_once_offset_is_known():
+    addr = ("198.51.100.7", 40000)
+    now_ms = clock_sync.server_time_ms()
+    received_ns = clock_sync.perf_ns_for_server_ms(now_ms)
+    clock_sync.record_one_way(addr, now_ms - 20.0, received_ns)
+    assert addr[0] not in clock_sync.get_client_stats()
+
+    offset_ms = 5000.0
+    t2 = now_ms - 1000.0
+    assert clock_sync.record_exchange(addr, t2 - 5.0 + offset_ms, t2, t2 + 0.2, t2 + 5.2 + offset_ms)
+    clock_sync.record_one_way(addr, now_ms - 20.0 + offset_ms, received_ns, inject_start_ns=received_ns + 3_000_000)
+    stats = clock_sync.get_client_stats()[addr[0]]
+    assert stats["network"]["p50"] == pytest.approx(20.0, abs=0.01)
+    assert stats["inject"]["p50"] == pytest.approx(23.0, abs=0.01)
+
+def test_non_finite_or_negative_times_are_rejected():
+    clock = ClientClock()
+    assert not clock.add_exchange(float("nan"), START_MS, START_MS, START_MS)
+    assert not clock.add_exchange(START_MS, float("inf"), START_MS, START_MS)
+    assert not clock.add_exchange(-1.0, START_MS, START_MS, START_MS)
+    assert clock.offset_ms is None
+    assert _exchange(clock, START_MS, offset_ms=10.0)
+    assert clock.offset_ms == pytest.approx(10.0)
+
+def test_least_recently_synced_clients_are_forgotten(monkeypatch):
+    monkeypatch.setattr(clock_sync, "_clients", {})
+    t2 = clock_sync.server_time_ms()
+    for index in range(clock_sync.MAX_CLIENTS + 1):
+        clock_sync.record_exchange((f"203.0.113.{index}", 40000), t2 - 5.0, t2, t2 + 0.2, t2 + 5.2)
+    clients = clock_sync.get_client_stats()
+    assert len(clients) == clock_sync.MAX_CLIENTS
+    assert "203.0.113.0" not in clients
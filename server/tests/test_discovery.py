@@ -0,0 +1,80 @@
+# test_discovery.py
+# Discovery as the phone does it: a separate local Zeroconf resolver browses for
+# the service the running server advertises through mdns_handler, resolves it and
+# PINGs the advertised addresses until one answers with a PONG.
+
+import json
+import socket
+import threading
+import time
+import uuid
+
+import pytest
+
+zeroconf = pytest.importorskip("zeroconf")
+
+import config
+import input_backend
+import server as server_control
+
+DISCOVERY_TIMEOUT_SECONDS = 10.0
+
+class _Listener(zeroconf.ServiceListener):
+    def __init__(self):
+        self.found_event = threading.Event()
+        self.name = None
+
+    def add_service(self, zc, type_, name):
+        if self.name is None:
+            self.name = name
+            self.found_event.set()
+
+    def update_service(self, zc, type_, name):
+        self.add_service(zc, type_, name)
+
+    def remove_service(self, zc, type_, name):
+        pass
+
+def _free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('0.0.0.0', 0))
+        return sock.getsockname()[1]
+
+def _ping(ip, port):
+    """Returns the PONG packet from ip:port, or None if none came within a second."""
+    packet_id = str(uuid.uuid4())
+    packet = {"packetId": packet_id, "timestamp": int(time.time() * 1000),
+              "type": config.PACKET_TYPE_HEALTH_CHECK_PING, "payload": None}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(1.0)
+        sock.sendto(json.dumps(packet).encode('utf-8'), (ip, port))
+        try:
+            while True:
+                reply = json.loads(sock.recvfrom(config.BUFFER_SIZE)[0].decode('utf-8'))
+                if reply.get("packetId") == packet_id:
+                    return reply
+        except (socket.timeout, OSError):
+            return None
+
+@pytest.fixture
+def running_server():
+    input_backend.set_backend(input_backend.RecordingBackend())
+    port = _free_udp_port()
+    server_control.start_server(port, True, None, None)
+    yield port
+    server_control.stop_server()
+
+def test_discovered_service_answers_ping(running_server):
+    resolver = zeroconf.Zeroconf(ip_version=zeroconf.IPVersion.V4Only)
+    listener = _Listener()
+    try:
+        browser = zeroconf.ServiceBrowser(resolver, config.MDNS_SERVICE_TYPE, listener)
+        assert listener.found_event.wait(DISCOVERY_TIMEOUT_SECONDS), "service was not discovered"
+        info = resolver.get_service_info(config.MDNS_SERVICE_TYPE, listener.name, timeout=int(DISCOVERY_TIMEOUT_SECONDS * 1000))
+        browser.cancel()
+        assert info is not None, f"'{listener.name}' could not be resolved"
+        assert info.port == running_server
+        pongs = [_ping(ip, info.port) for ip in info.parsed_addresses()]
+        assert any(pong and pong.get("type") == config.PACKET_TYPE_HEALTH_CHECK_PONG for pong in pongs)
+    finally:
+        resolver.close()
@@ -0,0 +1,83 @@
+# test_input_simulator.py
+
+import json
+import threading
+
+import pytest
+
+import input_backend
+import input_simulator
+import key_codes
+import macro_compiler
+
+def _compiled(key, modifiers=()):
+    return macro_compiler.compile_payload(json.dumps({"type": "key_event", "key": key, "modifiers": list(modifiers)}))
+
+def test_concurrent_macros_keep_shared_modifier_transitions_in_order():
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    compiled = _compiled("f1", ["shiftleft"])
+
+    def tapping():
+        for _ in range(100):
+            input_simulator.tap(compiled)
+
+    def holding():
+        for _ in range(50):
+            input_simulator.release(compiled, input_simulator.press(compiled))
+
+    threads = [threading.Thread(target=target) for target in (tapping, tapping, holding, holding)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    shift = key_codes.resolve_key("shiftleft")
+    transitions = [is_down for _, batch in backend.batches for kind, code, is_down in batch
+                   if kind == input_backend.EVENT_KEY and code == shift]
+    assert all(a != b for a, b in zip(transitions, transitions[1:])) # Never down twice or up twice in a row
+    assert transitions[-1] is False
+    assert input_simulator._modifier_refcounts == {}
+
+def test_batch_without_modifiers_does_not_wait_for_a_slow_send():
+    release_slow = threading.Event()
+    started = threading.Event()
+
+    class _SlowBackend(input_backend.RecordingBackend):
+        def send(self, events):
+            if any(event[1] == key_codes.resolve_key("f2") for event in events):
+                started.set()
+                release_slow.wait(5.0)
+            super().send(events)
+
+    backend = _SlowBackend()
+    input_backend.set_backend(backend)
+    slow = threading.Thread(target=input_simulator.tap, args=(_compiled("f2", ["ctrlleft"]),))
+    slow.start()
+    assert started.wait(5.0)
+    input_simulator.tap(_compiled("f3")) # Would deadlock-wait if sent under the modifier lock
+    release_slow.set()
+    slow.join()
+    assert backend.batches[0][1][0][1] == key_codes.resolve_key("f3")
+
+def test_recorded_modifiers_share_the_reference_counts():
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    shift = key_codes.resolve_key("shiftleft")
+    held = input_simulator.press(_compiled("f1", ["shiftleft"])) # A macro holding shift meanwhile
+    backend.reset()
+
+    send = input_simulator._recorded_sender()
+    send([input_backend.key_down(shift), input_backend.key_down(shift), input_backend.key_down(0x1E)]) # Auto-repeat
+    send([input_backend.key_up(0x1E), input_backend.key_up(shift)])
+    send([input_backend.key_up(shift)]) # Never pressed by this playback
+    assert [event for _, batch in backend.batches for event in batch] == [input_backend.key_down(0x1E), input_backend.key_up(0x1E)]
+    assert input_simulator._modifier_refcounts == {shift: 1}
+
+    input_simulator.release(_compiled("f1", ["shiftleft"]), held)
+    assert input_simulator._modifier_refcounts == {}
+
+def test_recorded_macros_cannot_be_pressed_singly():
+    compiled = macro_compiler.compile_payload(json.dumps({"type": "recorded_macro", "name": "combo"}))
+    with pytest.raises(ValueError):
+        input_simulator.tap(compiled)
@@ -0,0 +1,34 @@
+# test_macro_compiler.py
+
+import json
+import os
+
+import pytest
+
+import macro_compiler
+
+def _key_event(press_type):
+    return json.dumps({"type": "key_event", "key": "f1", "pressType": press_type})
+
+def test_press_types_compile():
+    assert macro_compiler.compile_payload(_key_event({"type": "tap"}))[3:] == (macro_compiler.PRESS_TAP, 0)
+    assert macro_compiler.compile_payload(_key_event({"type": "hold", "durationMs": 250}))[3:] == (macro_compiler.PRESS_HOLD, 250)
+    assert macro_compiler.compile_payload(_key_event({"type": "hold", "durationMs": 0}))[3:] == (macro_compiler.PRESS_TAP, 0)
+
+@pytest.mark.parametrize("press_type", ["hold", ["hold"], 5, {"type": "hold"}, {"type": "hold", "durationMs": -1},
+                                        {"type": "hold", "durationMs": "500"}, {"type": "hold", "durationMs": True},
+                                        {"type": "spin"}])
+def test_invalid_press_types_raise_compile_error(press_type):
+    with pytest.raises(macro_compiler.MacroCompileError):
+        macro_compiler.compile_payload(_key_event(press_type))
+
+@pytest.mark.parametrize("duration", ["NaN", "Infinity"])
+def test_non_finite_hold_duration_raises_compile_error(duration):
+    payload = '{"type":"key_event","key":"f1","pressType":{"type":"hold","durationMs":%s}}' % duration
+    with pytest.raises(macro_compiler.MacroCompileError):
+        macro_compiler.compile_payload(payload)
+
+def test_bundled_macro_table_compiles():
+    compiled_count, errors = macro_compiler.validate_macro_file(
+        os.path.join(os.path.dirname(os.path.abspath(macro_compiler.__file__)), "default_macros_sc_411.json"))
+    assert compiled_count and not errors
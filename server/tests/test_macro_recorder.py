@@ -0,0 +1,67 @@
+# test_macro_recorder.py
+
+import threading
+
+import pytest
+
+import input_backend
+import macro_recorder
+from macro_recorder import FLAG_DOWN, REC_KEY, REC_MOUSE_BUTTON, REC_MOUSE_MOVE
+
+@pytest.fixture
+def recordings(tmp_path):
+    macro_recorder.configure(str(tmp_path))
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    return backend
+
+def test_encode_decode_round_trip():
+    records = [(0, REC_KEY, FLAG_DOWN, 0x1E, 0), (1500, REC_MOUSE_MOVE, 0, -3, 4), (250, REC_KEY, 0, 0x1E, 0)]
+    recording = macro_recorder.decode("r", macro_recorder.encode(records))
+    assert (recording.count, recording.duration_us) == (3, 1750)
+    assert list(recording.events()) == records
+
+def test_truncated_or_foreign_files_are_rejected():
+    data = macro_recorder.encode([(0, REC_KEY, FLAG_DOWN, 0x1E, 0), (10, REC_KEY, 0, 0x1E, 0)])
+    with pytest.raises(ValueError):
+        macro_recorder.decode("r", data[:-1])
+    with pytest.raises(ValueError):
+        macro_recorder.decode("r", b"NOTREC" + data[6:])
+
+@pytest.mark.parametrize("name", ["", "../escape", "a b", "x" * 65])
+def test_invalid_names_are_rejected(name):
+    with pytest.raises(ValueError):
+        macro_recorder.validate_name(name)
+
+def test_out_of_order_timestamps_never_give_negative_deltas():
+    session = macro_recorder._Session("r", macro_recorder.DEFAULT_TOGGLE_KEY, None)
+    session.add(2_000_000, REC_KEY, FLAG_DOWN, 0x1E, 0)
+    session.add(1_000_000, REC_MOUSE_MOVE, 0, 1, 0) # Timestamp taken before the previous event's
+    assert session.records[1][0] == 0
+    macro_recorder.encode(session.records) # Packs without struct.error
+
+def test_playback_batches_same_time_events_and_releases_held_input(recordings):
+    macro_recorder.save("held", [(0, REC_KEY, FLAG_DOWN, 0x1E, 0), (0, REC_MOUSE_BUTTON, FLAG_DOWN, 0, 0),
+                                 (2000, REC_MOUSE_MOVE, 0, 5, -5)])
+    result = macro_recorder.play("held")
+    assert (result["events"], result["batches"], result["aborted"]) == (3, 2, False)
+    assert result["drift_us"] < 5000
+    assert len(recordings.batches[0][1]) == 2
+    released = set(recordings.batches[-1][1])
+    assert released == {input_backend.key_up(0x1E), input_backend.mouse_up(0)}
+
+def test_mouse_moves_replay_as_absolute_positions_from_the_cursor(recordings, monkeypatch):
+    monkeypatch.setattr(macro_recorder, "_mouse_reader", lambda: lambda: (100, 200, (False, False, False)))
+    macro_recorder.save("moves", [(0, REC_MOUSE_MOVE, 0, 5, -5), (1000, REC_MOUSE_MOVE, 0, -10, 3)])
+    macro_recorder.play("moves")
+    assert [event for _, batch in recordings.batches for event in batch] == [
+        input_backend.mouse_move_to(105, 195), input_backend.mouse_move_to(95, 198)]
+
+def test_playback_stops_and_releases_when_the_stop_event_is_set(recordings):
+    macro_recorder.save("long", [(0, REC_KEY, FLAG_DOWN, 0x1E, 0), (5_000_000, REC_KEY, 0, 0x1E, 0)])
+    stop_event = threading.Event()
+    threading.Timer(0.05, stop_event.set).start()
+    sent = []
+    result = macro_recorder.play("long", stop_event, send=sent.append)
+    assert result["aborted"]
+    assert sent == [[input_backend.key_down(0x1E)], [input_backend.key_up(0x1E)]]
@@ -0,0 +1,53 @@
+# test_mouse_stream.py
+
+from mouse_stream import SEQUENCE_RESET_GAP, SEQUENCE_WINDOW, _SequenceTracker
+
+def _counters():
+    return {"lost": 0, "late": 0, "duplicates": 0, "reordered": 0}
+
+def test_gap_is_lost_until_the_packet_arrives_late():
+    tracker, counters = _SequenceTracker(), _counters()
+    assert tracker.accept(1, counters)
+    assert tracker.accept(4, counters)
+    assert counters["lost"] == 2
+    assert tracker.accept(2, counters)
+    assert (counters["lost"], counters["reordered"]) == (1, 1)
+
+def test_duplicate_within_window_is_dropped():
+    tracker, counters = _SequenceTracker(), _counters()
+    tracker.accept(1, counters)
+    tracker.accept(2, counters)
+    assert not tracker.accept(1, counters)
+    assert not tracker.accept(2, counters)
+    assert counters["duplicates"] == 2
+
+def test_packet_beyond_window_is_late_and_stays_lost():
+    tracker, counters = _SequenceTracker(), _counters()
+    tracker.accept(0, counters)
+    tracker.accept(SEQUENCE_WINDOW + 10, counters)
+    assert counters["lost"] == SEQUENCE_WINDOW + 9
+    assert not tracker.accept(5, counters)
+    assert counters == {"lost": SEQUENCE_WINDOW + 9, "late": 1, "duplicates": 0, "reordered": 0}
+
+def test_stream_restart_resets_the_tracker():
+    tracker, counters = _SequenceTracker(), _counters()
+    tracker.accept(SEQUENCE_RESET_GAP + 500, counters)
+    assert tracker.accept(0, counters)
+    assert tracker.accept(1, counters)
+    assert counters == _counters()
+
+def test_huge_forward_jump_resets_without_counting_loss():
+    tracker, counters = _SequenceTracker(), _counters()
+    tracker.accept(0, counters)
+    assert tracker.accept(10**12, counters)
+    assert counters["lost"] == 0
+    assert tracker.seen_mask == 1
+    assert not tracker.accept(10**12, counters)
+
+def test_reordered_packet_after_a_stats_reset_does_not_go_negative():
+    tracker, counters = _SequenceTracker(), _counters()
+    tracker.accept(1, counters)
+    tracker.accept(3, counters)
+    counters = _counters() # get_stats(reset=True) between the loss and the late arrival
+    assert tracker.accept(2, counters)
+    assert (counters["lost"], counters["reordered"]) == (0, 1)
@@ -0,0 +1,50 @@
+# test_playout_scheduler.py
+
+import time
+
+import clock_sync
+import packet_dispatcher
+from packet_dispatcher import PacketContext
+from playout_scheduler import PlayoutScheduler
+
+ADDR = ("192.0.2.30", 43000)
+
+def _synced_ctx():
+    """A packet from a client whose clock matches the server's, sent just now."""
+    t2 = clock_sync.server_time_ms()
+    assert clock_sync.record_exchange(ADDR, t2 - 1.0, t2, t2 + 0.1, t2 + 1.1)
+    return PacketContext(None, ADDR, "TEST_SCHEDULED", "id", clock_sync.server_time_ms(), time.perf_counter_ns())
+
+def test_packets_refused_while_stopping_are_not_counted():
+    scheduler = PlayoutScheduler()
+    scheduler.configure(enabled=True, playout_delay_ms=50)
+    scheduler._stopping = True
+    assert not scheduler.schedule(_synced_ctx(), lambda: None, lambda: None)
+    assert scheduler.get_stats()["scheduled"] == 0
+    scheduler._stopping = False
+    assert scheduler.schedule(_synced_ctx(), lambda: None, lambda: None)
+    assert scheduler.get_stats()["scheduled"] == 1
+    scheduler.stop()
+
+class _BrokenScheduler:
+    def schedule(self, ctx, job, cancel):
+        raise RuntimeError("broken")
+
+class _Admission:
+    def __init__(self):
+        self.released = []
+
+    def admit(self, ctx, payload):
+        return True, False
+
+    def release(self, ctx, payload):
+        self.released.append(payload)
+
+def test_failed_schedule_releases_the_admission_slot(monkeypatch):
+    monkeypatch.setattr(packet_dispatcher, "_handlers", {})
+    admission = _Admission()
+    packet_dispatcher.register_handler("TEST_SCHEDULED", mode=packet_dispatcher.MODE_INJECTOR,
+                                       payload_parser=str, admission=admission,
+                                       scheduler=_BrokenScheduler())(lambda ctx, payload: None)
+    assert not packet_dispatcher.dispatch(_synced_ctx(), "f1")
+    assert admission.released == ["f1"]
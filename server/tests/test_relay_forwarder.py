@@ -0,0 +1,59 @@
+# test_relay_forwarder.py
+
+import json
+import socket
+import time
+
+import pytest
+
+import config
+from packet_dispatcher import PacketContext
+from relay_forwarder import RelayForwarder
+
+class _Socket:
+    def __init__(self):
+        self.sent = [] # (packet type, addr)
+
+    def sendto(self, data, addr):
+        self.sent.append((json.loads(data.decode('utf-8'))["type"], addr))
+
+@pytest.fixture
+def target():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+@pytest.fixture
+def relay(target):
+    forwarder = RelayForwarder()
+    forwarder.configure(True, targets={"pc2": f"127.0.0.1:{target.getsockname()[1]}"},
+                        routes=[{"targets": ["*"], "local": True}])
+    yield forwarder
+    forwarder.stop()
+
+def _command(sock, addr, packet_id="cmd-1"):
+    payload = json.dumps({"type": "key_event", "key": "f1"})
+    data = json.dumps({"packetId": packet_id, "timestamp": 0, "type": config.PACKET_TYPE_MACRO_COMMAND,
+                       "payload": payload}).encode('utf-8')
+    ctx = PacketContext(sock, addr, config.PACKET_TYPE_MACRO_COMMAND, packet_id, 0, time.perf_counter_ns())
+    return ctx, data, payload
+
+def _is_ping(data):
+    return json.loads(data.decode('utf-8'))["type"] == config.PACKET_TYPE_HEALTH_CHECK_PING
+
+def test_command_coming_back_through_a_loop_is_acked_but_not_run_or_forwarded(relay, target):
+    phone_sock, hop_sock = _Socket(), _Socket()
+    assert relay.forward(*_command(phone_sock, ("192.0.2.40", 45000)))
+    while True: # Skip the receiver's PING to reach the forwarded command
+        data = target.recv(4096)
+        if not _is_ping(data):
+            break
+    assert json.loads(data.decode('utf-8'))["packetId"] == "cmd-1"
+
+    # The target relays it straight back to us
+    assert not relay.forward(*_command(hop_sock, ("127.0.0.1", target.getsockname()[1])))
+    assert hop_sock.sent == [(config.PACKET_TYPE_MACRO_ACK, ("127.0.0.1", target.getsockname()[1]))]
+    stats = relay.get_stats()
+    assert (stats["relayed"], stats["loops"], stats["targets"]["pc2"]["forwarded"]) == (1, 1, 1)
@@ -0,0 +1,18 @@
+# test_turbo_repeat.py
+
+import json
+
+import pytest
+
+import turbo_repeat
+
+def _start(macro):
+    return json.dumps({"action": turbo_repeat.ACTION_START, "repeatId": "r1", "macro": macro, "rateHz": 10})
+
+def test_key_macro_is_accepted():
+    action, repeat_id, compiled, rate_hz, _ = turbo_repeat.parse_payload(_start({"type": "key_event", "key": "f1"}))
+    assert (action, repeat_id, rate_hz) == (turbo_repeat.ACTION_START, "r1", 10.0)
+
+def test_recorded_macro_cannot_be_repeated():
+    with pytest.raises(ValueError):
+        turbo_repeat.parse_payload(_start({"type": "recorded_macro", "name": "combo"}))
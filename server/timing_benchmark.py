@@ -0,0 +1,53 @@
+# timing_benchmark.py
+# Measures how precisely waits of typical pacing lengths end: plain time.sleep next to
+# precise_timing.sleep, each with and without the high timer resolution the server
+# acquires (timeBeginPeriod(1) on Windows; elsewhere both rows match). Reports mean,
+# p99 and max overshoot past the requested time, and the CPU time each wait costs
+# (thread_time), which is what the spin trades for the precision.
+#
+# Usage: python timing_benchmark.py [--intervals-ms 0.5,1,2,5,10,16] [--waits 200]
+
+import argparse
+import sys
+import time
+
+import precise_timing
+
+def _run(wait, seconds, waits):
+    """Returns (overshoots in ms, CPU us per wait)."""
+    overshoots = []
+    cpu_start = time.thread_time_ns()
+    for _ in range(waits):
+        start = time.perf_counter_ns()
+        wait(seconds)
+        overshoots.append((time.perf_counter_ns() - start) / 1e6 - seconds * 1000.0)
+    return overshoots, (time.thread_time_ns() - cpu_start) / waits / 1000.0
+
+def _summary(overshoots):
+    ordered = sorted(overshoots)
+    p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+    return f"mean {sum(ordered) / len(ordered):6.3f} p99 {p99:6.3f} max {ordered[-1]:6.3f} ms late"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox timed wait precision benchmark")
+    parser.add_argument("--intervals-ms", default="0.5,1,2,5,10,16", help="Comma-separated wait lengths")
+    parser.add_argument("--waits", type=int, default=200, help="Waits per interval and method")
+    args = parser.parse_args()
+
+    intervals = [float(value) for value in args.intervals_ms.split(',')]
+    for high_resolution in (False, True):
+        if high_resolution and not precise_timing.acquire_high_resolution():
+            print("High timer resolution unavailable on this platform; the default timer is used for both runs.",
+                  file=sys.stderr)
+            break
+        label = "1 ms timer" if high_resolution else "default timer"
+        for interval_ms in intervals:
+            for name, wait in (("time.sleep", time.sleep), ("precise_timing", precise_timing.sleep)):
+                _run(wait, interval_ms / 1000.0, 10) # Warm up (and let the margin settle)
+                overshoots, cpu_us = _run(wait, interval_ms / 1000.0, args.waits)
+                print(f"{label:>13} {interval_ms:5.1f} ms {name:>14}: {_summary(overshoots)}, "
+                      f"CPU {cpu_us:7.1f} us/wait")
+        if high_resolution:
+            precise_timing.release_high_resolution()
+    stats = precise_timing.get_stats()
+    print(f"Margin settled at {stats['sleep_margin_us']:.0f} us", file=sys.stderr)
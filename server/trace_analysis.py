@@ -0,0 +1,130 @@
+# trace_analysis.py
+# Summarises a trace file written by trace_recorder: latency percentiles per
+# packet type and the worst stalls (packets whose receive-to-injection-end
+# time exceeded a threshold), grouped into episodes.
+#
+# Stages reported per packet:
+#   queue   receive -> handler start (decode, dispatch and executor queueing)
+#   start   receive -> injection start
+#   inject  injection start -> end (includes hold durations)
+#   total   receive -> injection end
+#
+# Usage: python trace_analysis.py [trace_file] [--stall-ms 20] [--top 10]
+
+import argparse
+import datetime
+import sys
+
+import config_manager
+import key_codes
+import macro_compiler
+import trace_recorder
+
+_STAGES = (
+    ("queue", "receive_ns", "dispatch_ns"),
+    ("start", "receive_ns", "inject_start_ns"),
+    ("inject", "inject_start_ns", "inject_end_ns"),
+    ("total", "receive_ns", "inject_end_ns"),
+)
+_PERCENTILES = (50, 90, 99)
+STALL_EPISODE_GAP_MS = 1000.0 # Stalls closer together than this are reported as one episode
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def _stage_ms(record, start_field, end_field):
+    start, end = record[start_field], record[end_field]
+    if not start or not end or end < start:
+        return None
+    return (end - start) / 1_000_000.0
+
+def describe_action(packed_action_id):
+    split = trace_recorder.split_action_id(packed_action_id)
+    if split is None:
+        return "-"
+    kind, code = split
+    if kind == macro_compiler.ACTION_KEY_EVENT:
+        return f"key '{key_codes.key_name(code)}'"
+    if kind == macro_compiler.ACTION_MOUSE_EVENT and 0 <= code < len(macro_compiler.MOUSE_BUTTON_NAMES):
+        return f"mouse '{macro_compiler.MOUSE_BUTTON_NAMES[code]}'"
+    if kind == macro_compiler.ACTION_MOUSE_SCROLL:
+        return f"scroll {code:+d}"
+    if kind == macro_compiler.ACTION_RECORDED_MACRO:
+        return f"recording #{code & 0xFFFFFF:06x}" # Name hash
+    return f"action {packed_action_id:#x}"
+
+def _wall_time(header, perf_ns):
+    return datetime.datetime.fromtimestamp((perf_ns + header["epoch_offset_ns"]) / 1e9).strftime("%H:%M:%S.%f")[:-3]
+
+def summarize(records):
+    """Returns {packet_type: {stage: sorted list of ms}}."""
+    by_type = {}
+    for record in records:
+        stages = by_type.setdefault(record["packet_type"], {name: [] for name, _, _ in _STAGES})
+        for name, start_field, end_field in _STAGES:
+            value = _stage_ms(record, start_field, end_field)
+            if value is not None:
+                stages[name].append(value)
+    for stages in by_type.values():
+        for values in stages.values():
+            values.sort()
+    return by_type
+
+def find_stalls(records, stall_ms):
+    """Returns a list of episodes; each is a list of records whose total time exceeded stall_ms."""
+    episodes = []
+    last_receive_ns = None
+    for record in sorted(records, key=lambda r: r["receive_ns"]):
+        total_ms = _stage_ms(record, "receive_ns", "inject_end_ns")
+        if total_ms is None or total_ms < stall_ms:
+            continue
+        if last_receive_ns is None or (record["receive_ns"] - last_receive_ns) / 1_000_000.0 > STALL_EPISODE_GAP_MS:
+            episodes.append([])
+        episodes[-1].append(record)
+        last_receive_ns = record["receive_ns"]
+    return episodes
+
+def print_report(header, records, stall_ms, top):
+    print(f"{len(records)} record(s) ({header['write_index']} written, ring capacity {header['capacity']})")
+    if not records:
+        return
+    print(f"From {_wall_time(header, records[0]['receive_ns'])} to {_wall_time(header, records[-1]['receive_ns'])}")
+
+    for packet_type, stages in sorted(summarize(records).items()):
+        count = max(len(values) for values in stages.values())
+        failed = sum(1 for r in records if r["packet_type"] == packet_type and r["flags"] & trace_recorder.FLAG_HANDLER_FAILED)
+        print(f"\n{packet_type}: {count} packet(s), {failed} failed")
+        print(f"  {'stage':<7}" + "".join(f"{'p' + str(p):>10}" for p in _PERCENTILES) + f"{'max':>10}  (ms)")
+        for name, _, _ in _STAGES:
+            values = stages[name]
+            if not values:
+                continue
+            print(f"  {name:<7}" + "".join(f"{percentile(values, p):10.3f}" for p in _PERCENTILES) + f"{values[-1]:10.3f}")
+
+    episodes = find_stalls(records, stall_ms)
+    print(f"\n{sum(len(e) for e in episodes)} packet(s) over {stall_ms:.1f} ms in {len(episodes)} stall episode(s)")
+    episodes.sort(key=lambda e: max(_stage_ms(r, "receive_ns", "inject_end_ns") for r in e), reverse=True)
+    for episode in episodes[:top]:
+        worst = max(episode, key=lambda r: _stage_ms(r, "receive_ns", "inject_end_ns"))
+        queue_ms = _stage_ms(worst, "receive_ns", "dispatch_ns") or 0.0
+        print(f"  {_wall_time(header, episode[0]['receive_ns'])}: {len(episode)} packet(s), worst "
+              f"{_stage_ms(worst, 'receive_ns', 'inject_end_ns'):.1f} ms (queue {queue_ms:.1f} ms) "
+              f"{worst['packet_type']} {describe_action(worst['action_id'])} from {worst['client'][0]}:{worst['client'][1]}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox trace analysis")
+    parser.add_argument("trace_file", nargs="?", default=config_manager.TRACE_FILE_PATH)
+    parser.add_argument("--stall-ms", type=float, default=20.0, help="Receive-to-injection-end time counted as a stall")
+    parser.add_argument("--top", type=int, default=10, help="Stall episodes to list")
+    args = parser.parse_args()
+
+    try:
+        trace_header, trace_records = trace_recorder.read_trace(args.trace_file)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print_report(trace_header, trace_records, args.stall_ms, args.top)
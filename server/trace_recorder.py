@@ -0,0 +1,218 @@
+# trace_recorder.py
+# Optional binary trace of per-packet timing, cheap enough to leave on during play.
+# Records are fixed-size and written into a memory-mapped ring file, so the file
+# never grows and the last `capacity` packets of a bad session can be analysed
+# afterwards with trace_analysis.py.
+#
+# File layout (little endian):
+#   header (HEADER_SIZE bytes): magic, version, record_size, capacity, write_index, epoch_offset_ns
+#   capacity * RECORD_SIZE bytes of records; record n lives in slot n % capacity
+# Timestamps are time.perf_counter_ns() values; add epoch_offset_ns to get Unix time in ns.
+
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+import logging
+
+import config
+
+logger = logging.getLogger("StarButtonBoxServer.Trace")
+
+TRACE_MAGIC = b"SBBTRACE"
+TRACE_VERSION = 1
+DEFAULT_CAPACITY = 65536 # Records kept in the ring (~3 MB)
+
+_HEADER = struct.Struct("<8sIIQQq")
+HEADER_SIZE = 64
+_WRITE_INDEX_OFFSET = 24 # Offset of write_index inside the header
+_WRITE_INDEX = struct.Struct("<Q")
+
+# receive_ns, dispatch_ns, inject_start_ns, inject_end_ns, action_id, client_ip, client_port, packet_type, flags
+_RECORD = struct.Struct("<QQQQIIHBB4x")
+RECORD_SIZE = _RECORD.size
+
+FLAG_HANDLER_FAILED = 0x01
+
+# Small codes for the packet types stored in each record; 0 is unknown
+PACKET_TYPE_CODES = {
+    config.PACKET_TYPE_HEALTH_CHECK_PING: 1,
+    config.PACKET_TYPE_MACRO_COMMAND: 2,
+    config.PACKET_TYPE_TRIGGER_IMPORT_BROWSER: 3,
+    config.PACKET_TYPE_CAPTURE_MOUSE_POSITION: 4,
+    config.PACKET_TYPE_AUTO_DRAG_LOOP_COMMAND: 5,
+    config.PACKET_TYPE_PROFILE_CONTROL: 6,
+    config.PACKET_TYPE_CLOCK_SYNC_REPORT: 7,
+    config.PACKET_TYPE_ACK_MODE: 8,
+    config.PACKET_TYPE_MOUSE_MOVE: 9,
+    config.PACKET_TYPE_AXIS_UPDATE: 10,
+    config.PACKET_TYPE_MACRO_REPEAT: 11,
+}
+PACKET_TYPE_NAMES = {code: name for name, code in PACKET_TYPE_CODES.items()}
+
+def action_id(compiled_action):
+    """Packs a compiled action's kind and code (see macro_compiler) into 32 bits. 0 means no action."""
+    code = compiled_action[1]
+    if isinstance(code, str): # Recorded macro name
+        code = zlib.crc32(code.encode('utf-8'))
+    return ((compiled_action[0] + 1) << 24) | (code & 0xFFFFFF)
+
+def split_action_id(packed_id):
+    """Inverse of action_id(): returns (kind, code) or None for 0."""
+    if not packed_id:
+        return None
+    code = packed_id & 0xFFFFFF
+    if code & 0x800000: # Negative scroll amounts
+        code -= 0x1000000
+    return (packed_id >> 24) - 1, code
+
+def client_id(addr):
+    """Returns (ip_as_u32, port) for an (ip, port) address."""
+    return int.from_bytes(socket.inet_aton(addr[0]), 'big'), addr[1]
+
+def client_addr(ip_u32, port):
+    return socket.inet_ntoa(ip_u32.to_bytes(4, 'big')), port
+
+class TraceRecorder:
+    """Appends fixed-size timing records to a memory-mapped ring file. Thread safe."""
+
+    def __init__(self, file_path, capacity=DEFAULT_CAPACITY):
+        self.file_path = file_path
+        self.capacity = max(int(capacity), 1)
+        self._lock = threading.Lock()
+        self._client_ids = {}
+        file_size = HEADER_SIZE + self.capacity * RECORD_SIZE
+
+        self._file = open(file_path, "a+b")
+        try:
+            self._file.seek(0)
+            existing_header = self._file.read(_HEADER.size)
+            write_index = 0
+            if len(existing_header) == _HEADER.size:
+                magic, version, record_size, capacity, old_index, _ = _HEADER.unpack(existing_header)
+                if (magic, version, record_size, capacity) == (TRACE_MAGIC, TRACE_VERSION, RECORD_SIZE, self.capacity):
+                    write_index = old_index # Keep appending after the previous session
+            if os.path.getsize(file_path) != file_size:
+                self._file.truncate(file_size)
+            self._map = mmap.mmap(self._file.fileno(), file_size)
+        except Exception:
+            self._file.close()
+            raise
+        self._write_index = write_index
+        epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+        _HEADER.pack_into(self._map, 0, TRACE_MAGIC, TRACE_VERSION, RECORD_SIZE, self.capacity,
+                          write_index, epoch_offset_ns)
+
+    def record(self, receive_ns, dispatch_ns, inject_start_ns, inject_end_ns,
+               packet_type_code, packed_action_id, addr, flags=0):
+        client = self._client_ids.get(addr)
+        if client is None:
+            client = self._client_ids[addr] = client_id(addr)
+        with self._lock:
+            if self._map is None:
+                return
+            index = self._write_index
+            _RECORD.pack_into(self._map, HEADER_SIZE + (index % self.capacity) * RECORD_SIZE,
+                              receive_ns, dispatch_ns, inject_start_ns, inject_end_ns,
+                              packed_action_id, client[0], client[1], packet_type_code, flags)
+            self._write_index = index + 1
+            _WRITE_INDEX.pack_into(self._map, _WRITE_INDEX_OFFSET, index + 1)
+
+    @property
+    def records_written(self):
+        return self._write_index
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+# --- Module-level recorder used by the dispatcher ---
+# `active` is checked before building a record so a disabled recorder costs one attribute read.
+active = False
+_recorder = None
+_recorder_lock = threading.Lock()
+
+def configure(enabled, file_path, capacity=DEFAULT_CAPACITY):
+    """Opens (or closes) the module-level recorder. Returns True if recording is active afterwards."""
+    global active, _recorder
+    with _recorder_lock:
+        if _recorder and (not enabled or _recorder.file_path != file_path or _recorder.capacity != capacity):
+            active = False
+            _recorder.close()
+            logger.info(f"Trace recording stopped ({_recorder.records_written} records in '{_recorder.file_path}').")
+            _recorder = None
+        if enabled and _recorder is None:
+            try:
+                _recorder = TraceRecorder(file_path, capacity)
+            except Exception as e:
+                logger.error(f"Could not open trace file '{file_path}': {e}")
+                return False
+            logger.info(f"Trace recording to '{file_path}' ({capacity} record ring).")
+        active = _recorder is not None
+        return active
+
+def close():
+    configure(False, None)
+
+def record_packet(ctx, failed=False):
+    """Writes one record for a dispatched packet (see packet_dispatcher.PacketContext)."""
+    recorder = _recorder
+    if recorder is None:
+        return
+    recorder.record(ctx.received_time_ns or 0, ctx.dispatch_time_ns, ctx.inject_start_ns, ctx.inject_end_ns,
+                    PACKET_TYPE_CODES.get(ctx.packet_type, 0), ctx.action_id, ctx.addr,
+                    FLAG_HANDLER_FAILED if failed else 0)
+
+def read_trace(file_path):
+    """
+    Reads a trace file. Returns (header, records) where header is a dict and records is a
+    list of dicts in write order (oldest first).
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"'{file_path}' is too short to be a trace file")
+    magic, version, record_size, capacity, write_index, epoch_offset_ns = _HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"'{file_path}' is not a trace file")
+    if version != TRACE_VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"Unsupported trace version {version} (record size {record_size})")
+
+    count = min(write_index, capacity)
+    records = []
+    for index in range(write_index - count, write_index):
+        (receive_ns, dispatch_ns, inject_start_ns, inject_end_ns, packed_action_id,
+         ip_u32, port, packet_type_code, flags) = _RECORD.unpack_from(data, HEADER_SIZE + (index % capacity) * RECORD_SIZE)
+        records.append({
+            "receive_ns": receive_ns, "dispatch_ns": dispatch_ns,
+            "inject_start_ns": inject_start_ns, "inject_end_ns": inject_end_ns,
+            "action_id": packed_action_id, "client": client_addr(ip_u32, port),
+            "packet_type": PACKET_TYPE_NAMES.get(packet_type_code, "UNKNOWN"), "flags": flags,
+        })
+    header = {"capacity": capacity, "write_index": write_index, "epoch_offset_ns": epoch_offset_ns}
+    return header, records
+
+if __name__ == '__main__':
+    # Measures the cost of one record() call
+    import tempfile
+    path = os.path.join(tempfile.gettempdir(), "sbb_trace_benchmark.sbbtrace")
+    recorder = TraceRecorder(path, 4096)
+    iterations = 200_000
+    addr = ("192.168.1.20", 50000)
+    start = time.perf_counter_ns()
+    for i in range(iterations):
+        now = time.perf_counter_ns()
+        recorder.record(now, now, now, now, 2, 0x01000020, addr)
+    elapsed = time.perf_counter_ns() - start
+    recorder.close()
+    header, records = read_trace(path)
+    os.remove(path)
+    print(f"{elapsed / iterations / 1000:.2f} us per record ({iterations} records, {len(records)} kept in ring)")
@@ -0,0 +1,120 @@
+# turbo_benchmark.py
+# Compares the two ways of rapid-firing a held button. Starts the UDP server
+# in-process (mDNS disabled, input only recorded) and fires the same burst twice:
+#   per-tap   the phone sends one MACRO_COMMAND per shot, each delayed by a random
+#             amount before sending to mimic Wi-Fi jitter (as in playout_benchmark)
+#   repeat    one MACRO_REPEAT START, one STOP when the button is released
+# Reports packets each way, server CPU and the spacing of the injected taps.
+#
+# Usage: python turbo_benchmark.py [--rate-hz 20] [--seconds 5] [--jitter-ms 15] [--port 58141]
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import config
+import input_backend
+import key_codes
+import server as server_control
+
+def _macro(key):
+    return json.dumps({"type": "key_event", "key": key, "modifiers": [], "pressType": {"type": "tap"}})
+
+def _packet(packet_type, payload):
+    return json.dumps({"packetId": str(uuid.uuid4()), "timestamp": int(time.time() * 1000),
+                       "type": packet_type, "payload": payload}, separators=(',', ':')).encode('utf-8')
+
+def _count_replies(sock, counts, stop_event):
+    sock.settimeout(0.1)
+    while not stop_event.is_set():
+        try:
+            sock.recvfrom(config.BUFFER_SIZE)
+            counts[0] += 1
+        except (socket.timeout, OSError):
+            pass
+
+def _tap_times_ms(backend, key):
+    code = key_codes.resolve_key(key)
+    return [perf_ns / 1e6 for perf_ns, batch in backend.batches
+            if any(kind == input_backend.EVENT_KEY and event_code == code and is_down for kind, event_code, is_down in batch)]
+
+def _cadence(times_ms, period_ms):
+    """Returns (taps, mean interval, rms and max interval error) in ms."""
+    errors = [(b - a) - period_ms for a, b in zip(times_ms, times_ms[1:])]
+    if not errors:
+        return len(times_ms), 0.0, 0.0, 0.0
+    rms = (sum(e * e for e in errors) / len(errors)) ** 0.5
+    return len(times_ms), period_ms + sum(errors) / len(errors), rms, max(abs(e) for e in errors)
+
+def _per_tap(sock, target, rate_hz, seconds, jitter_ms):
+    period = 1.0 / rate_hz
+    start = time.perf_counter()
+    for index in range(int(seconds * rate_hz)):
+        delay = start + index * period + random.uniform(0.0, jitter_ms / 1000.0) - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sock.sendto(_packet(config.PACKET_TYPE_MACRO_COMMAND, _macro("f1")), target)
+    return int(seconds * rate_hz)
+
+def _repeat(sock, target, rate_hz, seconds):
+    start = {"action": "START", "repeatId": "turbo-benchmark", "macro": _macro("f2"), "rateHz": rate_hz}
+    sock.sendto(_packet(config.PACKET_TYPE_MACRO_REPEAT, json.dumps(start)), target)
+    time.sleep(seconds - 0.5 / rate_hz) # Release between two taps, like a finger would
+    stop = {"action": "STOP", "repeatId": "turbo-benchmark"}
+    sock.sendto(_packet(config.PACKET_TYPE_MACRO_REPEAT, json.dumps(stop)), target)
+    return 2
+
+def run_benchmark(port, rate_hz, seconds, jitter_ms):
+    backend = input_backend.RecordingBackend()
+    input_backend.set_backend(backend)
+    target = ('127.0.0.1', port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    period_ms = 1000.0 / rate_hz
+    lines = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # Per-macro console output
+        server_control.start_server(port, False, None, None)
+        time.sleep(0.5)
+        try:
+            for label, key, fire in (("per-tap", "f1", lambda: _per_tap(sock, target, rate_hz, seconds, jitter_ms)),
+                                     ("repeat", "f2", lambda: _repeat(sock, target, rate_hz, seconds))):
+                replies = [0]
+                stop_event = threading.Event()
+                receiver = threading.Thread(target=_count_replies, args=(sock, replies, stop_event), daemon=True)
+                receiver.start()
+                cpu_start = time.process_time()
+                sent = fire()
+                time.sleep(0.5) # Let the last taps and ACKs through
+                cpu_ms = (time.process_time() - cpu_start) * 1000.0
+                stop_event.set()
+                receiver.join()
+                taps, mean_ms, rms_ms, max_ms = _cadence(_tap_times_ms(backend, key), period_ms)
+                lines.append(f"{label:>8}: {sent:4} packet(s) sent, {replies[0]:4} reply(ies), {taps:4} tap(s); interval mean "
+                             f"{mean_ms:6.2f} ms (target {period_ms:.2f}), error rms {rms_ms:5.2f}/max {max_ms:5.2f} ms; "
+                             f"process CPU {cpu_ms:6.1f} ms")
+            stats = server_control.repeater.get_stats()
+        finally:
+            sock.close()
+            server_control.stop_server()
+    for line in lines:
+        print(line)
+    print(f"  repeater: {stats['taps']} tap(s), {stats['skipped']} skipped, late avg {stats['late_avg_ms']:.3f}/"
+          f"p99 {stats['late_p99_ms']:.3f}/max {stats['late_max_ms']:.3f} ms, interval error {stats['interval_rms_ms']:.3f} ms rms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="StarButtonBox turbo repeat benchmark")
+    parser.add_argument("--rate-hz", type=float, default=20.0)
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long the button is held")
+    parser.add_argument("--jitter-ms", type=float, default=15.0, help="Random send delay of per-tap packets")
+    parser.add_argument("--port", type=int, default=58141)
+    args = parser.parse_args()
+    logging.getLogger("StarButtonBoxServer").setLevel(logging.WARNING)
+    print(f"{args.rate_hz:g} Hz for {args.seconds:g} s, per-tap send jitter 0-{args.jitter_ms:g} ms", file=sys.stderr)
+    run_benchmark(args.port, args.rate_hz, args.seconds, args.jitter_ms)
@@ -0,0 +1,295 @@
+# turbo_repeat.py
+# Server-side auto-repeat ("turbo") for held buttons. Instead of the phone sending a
+# MACRO_COMMAND per shot, one MACRO_REPEAT START makes the server tap the macro at
+# rateHz until the matching STOP, or until the safety timeout runs out, so a phone
+# that drops off Wi-Fi mid-burst never keeps firing. Sending START again for the same
+# repeatId extends the timeout without disturbing the cadence; a phone that holds a
+# button longer than the timeout simply resends START now and then.
+#
+# All repeats share one timeline thread: it sleeps until just before the next tap
+# (precise_timing's margin), spins the rest of the way and injects the tap itself
+# through input_simulator. Taps are due at start + n * period, so lateness of one tap
+# never shifts the next; a thread that fell more than a period behind skips the
+# missed taps instead of firing them in a burst. A 'hold' macro is pressed for its
+# duration within each period (for games that ignore zero-length taps).
+#
+# The timeline lock only covers bookkeeping: taps, presses and releases are sent
+# after it is released, so a slow SendInput (event spacing, a long macro holding
+# the shared modifiers) never stalls handle() on the receive thread. A held press
+# ended by STOP is released by the timeline thread as well.
+#
+# Payload (JSON): {"action": "START", "repeatId": "<id>", "macro": "<InputAction JSON>",
+#                  "rateHz": 15, "timeoutMs": optional}  or  {"action": "STOP", "repeatId": "<id>"}
+
+import heapq
+import itertools
+import json
+import math
+import threading
+import time
+import logging
+
+import input_simulator
+import macro_compiler
+import precise_timing
+
+logger = logging.getLogger("StarButtonBoxServer.Repeat")
+
+ACTION_START = "START"
+ACTION_STOP = "STOP"
+
+MIN_RATE_HZ = 0.5
+MAX_RATE_HZ = 50.0
+DEFAULT_TIMEOUT_MS = 10000.0
+MAX_REPEATS = 16          # Concurrent repeats over all clients
+MAX_HOLD_FRACTION = 0.9   # A held press must leave this much of the period for the release
+JITTER_WINDOW = 512       # Taps kept for the cadence statistics
+
+_PHASE_TAP = 0
+_PHASE_RELEASE = 1
+_PHASE_EXPIRE = 2
+
+def parse_payload(raw_payload):
+    """Returns (action, repeat_id, compiled macro or None, rate_hz, timeout_ms or None). Raises ValueError."""
+    try:
+        payload = json.loads(raw_payload)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid payload JSON: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be a JSON object")
+    action = payload.get("action")
+    repeat_id = payload.get("repeatId")
+    if not isinstance(repeat_id, str) or not repeat_id:
+        raise ValueError("missing 'repeatId' in payload")
+    if action == ACTION_STOP:
+        return action, repeat_id, None, 0.0, None
+    if action != ACTION_START:
+        raise ValueError(f"unknown action '{action}'")
+    macro = payload.get("macro")
+    compiled = (macro_compiler.compile_payload(macro) if isinstance(macro, str)
+                else macro_compiler.compile_action(macro)) # MacroCompileError is a ValueError
+    if compiled[0] == macro_compiler.ACTION_RECORDED_MACRO: # A whole recording per tap cannot keep a cadence
+        raise ValueError("recorded macros cannot be repeated")
+    rate_hz = payload.get("rateHz")
+    if not isinstance(rate_hz, (int, float)) or not MIN_RATE_HZ <= rate_hz <= MAX_RATE_HZ:
+        raise ValueError(f"'rateHz' must be a number from {MIN_RATE_HZ} to {MAX_RATE_HZ}, got {rate_hz}")
+    if compiled[3] == macro_compiler.PRESS_HOLD and compiled[4] > 1000.0 / rate_hz * MAX_HOLD_FRACTION:
+        raise ValueError(f"hold of {compiled[4]} ms does not fit a {1000.0 / rate_hz:.0f} ms repeat period")
+    timeout_ms = payload.get("timeoutMs")
+    if timeout_ms is not None and (not isinstance(timeout_ms, (int, float)) or timeout_ms <= 0):
+        raise ValueError(f"invalid 'timeoutMs' {timeout_ms}")
+    return action, repeat_id, compiled, float(rate_hz), timeout_ms
+
+class _Repeat:
+    """One running repeat and its position on the timeline."""
+    __slots__ = ("key", "compiled", "description", "period_ns", "hold_ns", "start_ns", "index",
+                 "expires_ns", "held_modifiers", "last_tap_ns", "taps", "active")
+
+    def __init__(self, key, compiled, rate_hz, start_ns, expires_ns):
+        self.key = key
+        self.compiled = compiled
+        self.description = macro_compiler.describe(compiled)
+        self.period_ns = int(1e9 / rate_hz)
+        self.hold_ns = compiled[4] * 1_000_000 if compiled[3] == macro_compiler.PRESS_HOLD else 0
+        self.start_ns = start_ns
+        self.index = 0          # Tap number due next
+        self.expires_ns = expires_ns
+        self.held_modifiers = None # Set while a 'hold' macro is pressed
+        self.last_tap_ns = 0
+        self.taps = 0
+        self.active = True
+
+class TurboRepeater:
+    """Runs MACRO_REPEAT taps on a dedicated timeline thread."""
+
+    def __init__(self, name="TurboRepeat"):
+        self.name = name
+        self.max_timeout_ms = DEFAULT_TIMEOUT_MS
+        self._cond = threading.Condition()
+        self._repeats = {} # (addr, repeat_id) -> _Repeat
+        self._heap = []    # (due perf_counter_ns, sequence, repeat, phase)
+        self._sequence = itertools.count()
+        self._thread = None
+        self._stopping = False
+        self._late_ms = []     # Tap injection - due time
+        self._interval_ms = [] # Tap spacing - period, consecutive taps of one repeat
+        self._counters = {"started": 0, "stopped": 0, "timed_out": 0, "rejected": 0, "taps": 0, "skipped": 0}
+
+    def configure(self, max_timeout_ms=None):
+        if max_timeout_ms is not None:
+            self.max_timeout_ms = max(float(max_timeout_ms), 100.0)
+
+    def handle(self, addr, command, received_time_ns):
+        """Called on the receive thread with a parse_payload() result."""
+        action, repeat_id, compiled, rate_hz, timeout_ms = command
+        key = (addr, repeat_id)
+        with self._cond:
+            repeat = self._repeats.get(key)
+            if action == ACTION_STOP:
+                if repeat is not None:
+                    self._finish(repeat, "stopped")
+                return
+            timeout_ms = min(timeout_ms or self.max_timeout_ms, self.max_timeout_ms)
+            expires_ns = received_time_ns + int(timeout_ms * 1_000_000)
+            if repeat is not None and repeat.compiled == compiled and repeat.period_ns == int(1e9 / rate_hz):
+                repeat.expires_ns = expires_ns # Keep-alive
+                return
+            if repeat is not None:
+                self._finish(repeat, "replaced")
+            if self._stopping or len(self._repeats) >= MAX_REPEATS:
+                self._counters["rejected"] += 1
+                logger.warning(f"Repeat '{repeat_id}' from {addr[0]} rejected "
+                               f"({'server stopping' if self._stopping else f'{MAX_REPEATS} already running'}).")
+                return
+            repeat = _Repeat(key, compiled, rate_hz, time.perf_counter_ns(), expires_ns)
+            self._repeats[key] = repeat
+            self._counters["started"] += 1
+            self._push(repeat.start_ns, repeat, _PHASE_TAP)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        logger.info(f"Repeat '{repeat_id}' from {addr[0]} started: {repeat.description} at {rate_hz:g} Hz, "
+                    f"timeout {timeout_ms:.0f} ms")
+
+    def _push(self, due_ns, repeat, phase):
+        heapq.heappush(self._heap, (due_ns, next(self._sequence), repeat, phase))
+        self._cond.notify()
+
+    def _finish(self, repeat, reason):
+        """Ends a repeat; a held press is released by the timeline thread (or stop()). Must be called with _cond held."""
+        repeat.active = False
+        self._repeats.pop(repeat.key, None)
+        if repeat.held_modifiers is not None and not self._stopping:
+            self._push(time.perf_counter_ns(), repeat, _PHASE_RELEASE)
+        self._counters["timed_out" if reason == "timed out" else "stopped"] += 1
+        logger.info(f"Repeat '{repeat.key[1]}' from {repeat.key[0][0]} {reason} after {repeat.taps} tap(s).")
+
+    def _tap(self, repeat, due_ns):
+        """Books one tap due at due_ns and queues the next one. Must be called with _cond held."""
+        now_ns = time.perf_counter_ns()
+        if repeat.hold_ns:
+            self._push(due_ns + repeat.hold_ns, repeat, _PHASE_RELEASE)
+        self._counters["taps"] += 1
+        self._late_ms.append((now_ns - due_ns) / 1_000_000.0)
+        del self._late_ms[:-JITTER_WINDOW]
+        if repeat.taps:
+            self._interval_ms.append((now_ns - repeat.last_tap_ns - repeat.period_ns) / 1_000_000.0)
+            del self._interval_ms[:-JITTER_WINDOW]
+        repeat.taps += 1
+        repeat.last_tap_ns = now_ns
+        self._schedule_next(repeat, now_ns)
+
+    def _schedule_next(self, repeat, now_ns):
+        repeat.index += 1
+        next_ns = repeat.start_ns + repeat.index * repeat.period_ns
+        if next_ns < now_ns - repeat.period_ns: # Fell behind (e.g. suspended); skip instead of bursting
+            missed = (now_ns - next_ns) // repeat.period_ns
+            self._counters["skipped"] += missed
+            repeat.index += missed
+            next_ns += missed * repeat.period_ns
+        if next_ns >= repeat.expires_ns:
+            self._push(repeat.expires_ns, repeat, _PHASE_EXPIRE)
+        else:
+            self._push(next_ns, repeat, _PHASE_TAP)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due_ns = self._heap[0][0]
+                wake_ns = due_ns - precise_timing.margin_ns(event=True)
+                remaining_ns = wake_ns - time.perf_counter_ns()
+                if remaining_ns > 0:
+                    self._cond.wait(remaining_ns / 1e9)
+                    precise_timing.observe_wake(wake_ns)
+                    continue
+                _, _, repeat, phase = heapq.heappop(self._heap)
+            precise_timing.spin_until(due_ns)
+            with self._cond:
+                held = None
+                if phase == _PHASE_RELEASE: # Also for finished repeats: a held press must come up
+                    held, repeat.held_modifiers = repeat.held_modifiers, None
+                    if held is None:
+                        continue
+                elif not repeat.active:
+                    continue
+                elif phase == _PHASE_TAP:
+                    self._tap(repeat, due_ns)
+                elif time.perf_counter_ns() >= repeat.expires_ns:
+                    self._finish(repeat, "timed out")
+                    continue
+                else: # Extended by a keep-alive START since this expiry was queued
+                    repeat.index -= 1
+                    self._schedule_next(repeat, time.perf_counter_ns())
+                    continue
+            self._inject(repeat, held)
+
+    def _inject(self, repeat, held):
+        """Sends a release (held given), or the tap or press booked by _tap(). Called without _cond held."""
+        try:
+            if held is not None:
+                input_simulator.release(repeat.compiled, held)
+            elif not repeat.hold_ns:
+                input_simulator.tap(repeat.compiled)
+            else:
+                held = input_simulator.press(repeat.compiled)
+                with self._cond:
+                    if repeat.active:
+                        repeat.held_modifiers = held
+                        return
+                input_simulator.release(repeat.compiled, held) # Stopped while the press was being sent
+        except Exception as e:
+            logger.error(f"Repeat '{repeat.key[1]}' failed: {e}", exc_info=True)
+            with self._cond:
+                if repeat.active:
+                    self._finish(repeat, "failed")
+
+    def get_stats(self, reset=False):
+        """Returns counters, "active", and tap lateness (avg/p99/max) and interval error rms (ms) over the recent window."""
+        with self._cond:
+            stats = dict(self._counters)
+            stats["active"] = len(self._repeats)
+            late = sorted(self._late_ms)
+            intervals = list(self._interval_ms)
+            if reset:
+                self._late_ms.clear()
+                self._interval_ms.clear()
+                for key in self._counters:
+                    self._counters[key] = 0
+        stats["late_avg_ms"] = sum(late) / len(late) if late else 0.0
+        stats["late_p99_ms"] = late[min(int(len(late) * 0.99), len(late) - 1)] if late else 0.0
+        stats["late_max_ms"] = late[-1] if late else 0.0
+        stats["interval_rms_ms"] = (math.sqrt(sum(v * v for v in intervals) / len(intervals)) if intervals else 0.0)
+        return stats
+
+    def stop(self):
+        """Ends every repeat (server stop), releasing held presses. Repeats can start again afterwards."""
+        with self._cond:
+            self._stopping = True
+            repeats = list(self._repeats.values())
+            repeats += [entry[2] for entry in self._heap if entry[3] == _PHASE_RELEASE] # Finished, release pending
+            for repeat in repeats:
+                if repeat.active:
+                    self._finish(repeat, "stopped by server shutdown")
+            self._heap = []
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout=1.0)
+        with self._cond:
+            released = []
+            for repeat in set(repeats):
+                if repeat.held_modifiers is not None:
+                    released.append((repeat, repeat.held_modifiers))
+                    repeat.held_modifiers = None
+            self._stopping = False
+            self._thread = None
+        for repeat, held in released:
+            try:
+                input_simulator.release(repeat.compiled, held)
+            except Exception as e:
+                logger.error(f"Releasing repeat '{repeat.key[1]}' failed: {e}")